@@ -0,0 +1,219 @@
+"""
+Unwrapping of the rolling counters reported by power meters and trainers.
+
+Several fields count up from when the device was switched on but are sent in a few bits, so they wrap around:
+
+* :obj:`~pycycling.cycling_power_service.CyclingPowerMeasurement` ``accumulated_energy`` (kJ) and
+  ``accumulated_torque`` (1/32 Nm) wrap at 65536,
+* :obj:`~pycycling.tacx_trainer_control.SpecificTrainerData` ``accumulated_power`` (W) wraps at 65536 and
+  ``update_event_count`` at 256,
+* :obj:`~pycycling.tacx_trainer_control.GeneralFEData` ``elapsed_time`` wraps every 64 s and ``distance_travelled``
+  every 256 m.
+
+A :class:`RolloverAccumulator` turns one such counter into a total which only ever increases. It also detects:
+
+* device resets, where the counter jumps back towards zero,
+* missed events of event counters, and
+* gaps in the notifications which are long enough for the counter to have wrapped unseen. The number of hidden
+  wraps is estimated by interpolating the counter's rate from before the gap.
+
+A :class:`RecordAccumulators` unwraps all the counters of a record type at once. One should be kept per device.
+
+Example
+=======
+.. code-block:: python
+
+    from pycycling.accumulators import cycling_power_accumulators
+
+    accumulators = cycling_power_accumulators()
+
+    def on_power(measurement):
+        totals = accumulators.update(measurement)
+        print(f'{totals.accumulated_energy} kJ since the power meter was switched on')
+
+    power_meter.set_cycling_power_measurement_handler(on_power)
+"""
+import time
+from collections import namedtuple
+
+from pycycling.notifications import TimestampedRecord
+
+_NANOSECONDS = 1e9
+
+CyclingPowerTotals = namedtuple('CyclingPowerTotals', ['accumulated_energy', 'accumulated_torque'])
+SpecificTrainerTotals = namedtuple('SpecificTrainerTotals', ['accumulated_power', 'update_event_count'])
+GeneralFETotals = namedtuple('GeneralFETotals', ['elapsed_time', 'distance_travelled'])
+
+
+class RolloverAccumulator:
+    """
+    Unwraps a counter which wraps at `modulus` into a monotonic total.
+
+    The total starts at the first value seen, and afterwards grows by the forward distance from each value to the
+    next. Values are given in the units of the parsed record; `resolution` is the size of one count in those units.
+
+    :param modulus: The number of counts after which the counter wraps, e.g. ``1 << 16``
+    :param resolution: The size of one count, e.g. ``0.25`` for elapsed time in quarter seconds
+    :param max_step: A forward step of more counts than this is taken as a device reset rather than progress. Defaults
+        to half the modulus. Once the counter's rate is known, a step to near zero far beyond what the rate explains is
+        also taken as a reset
+    :param event_counter: Whether the counter is expected to step by one per update, in which case larger steps are
+        counted as missed events
+    :param rate_smoothing: Weight, between 0 and 1, given to each new rate measurement
+    :param clock: Function returning the current time in nanoseconds, used when updates are not timestamped
+    """
+
+    def __init__(self, modulus, *, resolution=1, max_step=None, event_counter=False, rate_smoothing=0.2,
+                 clock=time.monotonic_ns):
+        self._modulus = modulus
+        self._resolution = resolution
+        self._max_step = max_step if max_step is not None else modulus // 2
+        self._event_counter = event_counter
+        self._rate_smoothing = rate_smoothing
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        """Forget all previous values, starting a new total"""
+        self._last = None
+        self._last_ns = None
+        self._changed_ns = None
+        self._counts = 0
+        self._rate = None
+        self.resets = 0
+        self.gaps = 0
+        self.missed_events = 0
+
+    @property
+    def total(self):
+        """The unwrapped total in the units of the record, or `None` before the first update"""
+        if self._last is None:
+            return None
+        return self._counts * self._resolution
+
+    @property
+    def rate(self):
+        """The estimated rate of the counter in units per second, or `None` if not known yet"""
+        if self._rate is None:
+            return None
+        return self._rate * self._resolution
+
+    def update(self, value, timestamp_ns=None):
+        """
+        Account for a new value of the counter.
+
+        :param value: The counter as reported by the device
+        :param timestamp_ns: Time the value was received, in nanoseconds. Defaults to the accumulator's clock
+        :return: The unwrapped total
+        """
+        if timestamp_ns is None:
+            timestamp_ns = self._clock()
+        modulus = self._modulus
+        raw = int(round(value / self._resolution)) % modulus
+
+        last = self._last
+        if last is None:
+            self._last = raw
+            self._last_ns = self._changed_ns = timestamp_ns
+            self._counts = raw
+            return self._counts * self._resolution
+
+        step = (raw - last) % modulus
+        elapsed = (timestamp_ns - self._last_ns) / _NANOSECONDS
+        expected = None if self._rate is None or elapsed <= 0 else self._rate * elapsed
+
+        measured_rate = True
+        if expected is not None and expected >= modulus - self._max_step:
+            # Long enough since the last value for the counter to have wrapped unseen
+            wraps = max(round((expected - step) / modulus), 0)
+            if wraps:
+                self.gaps += 1
+                step += wraps * modulus
+        elif step > self._max_step or (expected is not None and step > 4 * expected + 2 and raw < step):
+            # A jump back towards zero, beyond anything the counter's rate could explain
+            self.resets += 1
+            step = raw
+            measured_rate = False
+
+        if self._event_counter and step > 1:
+            self.missed_events += step - 1
+        if step:
+            # Measured from the last change, as a slow counter holds its value over several updates
+            since_change = (timestamp_ns - self._changed_ns) / _NANOSECONDS
+            if measured_rate and since_change > 0:
+                rate = step / since_change
+                self._rate = rate if self._rate is None else self._rate + self._rate_smoothing * (rate - self._rate)
+            self._changed_ns = timestamp_ns
+
+        self._counts += step
+        self._last = raw
+        self._last_ns = timestamp_ns
+        return self._counts * self._resolution
+
+
+class RecordAccumulators:
+    """
+    Unwraps several counter fields of a record type.
+
+    :param totals_type: The namedtuple type returned by :meth:`update`, whose fields name the record fields to unwrap
+    :param accumulators: A :obj:`dict` mapping each field to its :class:`RolloverAccumulator`
+    """
+
+    def __init__(self, totals_type, accumulators):
+        self._totals_type = totals_type
+        self.accumulators = accumulators
+        self._fields = [(field, accumulators[field]) for field in totals_type._fields]
+
+    def update(self, record, timestamp_ns=None):
+        """
+        Account for a new record. Fields which are `None` in the record leave their totals unchanged.
+
+        :param record: A parsed record, or a :obj:`~pycycling.notifications.TimestampedRecord` holding one
+        :param timestamp_ns: Time the record was received, in nanoseconds. Taken from the record if it is timestamped,
+            otherwise defaults to the current time
+        :return: A namedtuple of the unwrapped totals
+        """
+        if isinstance(record, TimestampedRecord):
+            record, timestamp_ns = record
+        totals = []
+        for field, accumulator in self._fields:
+            value = getattr(record, field)
+            totals.append(accumulator.total if value is None else accumulator.update(value, timestamp_ns))
+        return self._totals_type._make(totals)
+
+    def reset(self):
+        for accumulator in self.accumulators.values():
+            accumulator.reset()
+
+
+def cycling_power_accumulators(**kwargs):
+    """
+    Returns the :class:`RecordAccumulators` for :obj:`~pycycling.cycling_power_service.CyclingPowerMeasurement`,
+    producing :obj:`CyclingPowerTotals`. Keyword arguments are passed to each :class:`RolloverAccumulator`.
+    """
+    return RecordAccumulators(CyclingPowerTotals, {
+        'accumulated_energy': RolloverAccumulator(1 << 16, **kwargs),
+        'accumulated_torque': RolloverAccumulator(1 << 16, **kwargs),
+    })
+
+
+def specific_trainer_accumulators(**kwargs):
+    """
+    Returns the :class:`RecordAccumulators` for :obj:`~pycycling.tacx_trainer_control.SpecificTrainerData`,
+    producing :obj:`SpecificTrainerTotals`. Keyword arguments are passed to each :class:`RolloverAccumulator`.
+    """
+    return RecordAccumulators(SpecificTrainerTotals, {
+        'accumulated_power': RolloverAccumulator(1 << 16, **kwargs),
+        'update_event_count': RolloverAccumulator(1 << 8, event_counter=True, **kwargs),
+    })
+
+
+def general_fe_accumulators(**kwargs):
+    """
+    Returns the :class:`RecordAccumulators` for :obj:`~pycycling.tacx_trainer_control.GeneralFEData`, producing
+    :obj:`GeneralFETotals`. Keyword arguments are passed to each :class:`RolloverAccumulator`.
+    """
+    return RecordAccumulators(GeneralFETotals, {
+        'elapsed_time': RolloverAccumulator(1 << 8, resolution=0.25, **kwargs),
+        'distance_travelled': RolloverAccumulator(1 << 8, **kwargs),
+    })
@@ -0,0 +1,249 @@
+"""
+Keeps the battery levels of a fleet of devices up to date in memory.
+
+A :class:`BatteryMonitor` reads the battery level of every registered device at a low frequency, one read at a time
+and with randomized jitter so that reads of different devices do not line up and compete for the radio. Devices whose
+battery level characteristic supports notifications are not polled after the first read. Readings are cached with
+the time they were taken, so looking up a battery level is a dictionary lookup rather than a GATT read.
+
+Example
+=======
+.. code-block:: python
+
+    from pycycling.battery_monitor import BatteryMonitor
+    from pycycling.battery_service import BatteryService
+
+    monitor = BatteryMonitor(interval=600)
+    for client in clients:
+        await monitor.add(BatteryService(client))
+    monitor.start()
+    ...
+    reading = monitor.get(client.address)
+    if reading is not None:
+        print(f'{reading.level}% as of {reading.age():.0f} s ago')
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import namedtuple
+
+from pycycling.battery_service import battery_level_characteristic_id
+from pycycling.notifications import TimestampedRecord
+
+logger = logging.getLogger(__name__)
+
+_NANOSECONDS = 1e9
+
+
+class BatteryReading(namedtuple('BatteryReading', ['level', 'timestamp_ns', 'source'])):
+    """
+    A cached battery level.
+
+    :ivar level: Battery level percentage
+    :ivar timestamp_ns: The :func:`time.monotonic_ns` time at which the level was read or notified
+    :ivar source: ``'read'`` or ``'notification'``
+    """
+    __slots__ = ()
+
+    def age(self, now_ns=None):
+        """Returns the age of the reading in seconds"""
+        return ((time.monotonic_ns() if now_ns is None else now_ns) - self.timestamp_ns) / _NANOSECONDS
+
+
+def _supports_notifications(client):
+    services = getattr(client, 'services', None)
+    if services is None:
+        return None
+    try:
+        characteristic = services.get_characteristic(battery_level_characteristic_id)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    if characteristic is None:
+        return None
+    return 'notify' in characteristic.properties
+
+
+class _Device:
+    __slots__ = ('name', 'service', 'notifying', 'subscription')
+
+    def __init__(self, name, service):
+        self.name = name
+        self.service = service
+        self.notifying = False
+        self.subscription = None
+
+
+class BatteryMonitor:
+    """
+    Polls the battery levels of registered devices and caches the results.
+
+    :param interval: The mean time, in seconds, between reads of each device
+    :param jitter: The fraction of `interval` by which each read is randomly moved earlier or later
+    :param startup_spread: The first reads of devices added together are spread at random over this many seconds
+    :param on_reading: Optional callback, called with the device name and :obj:`BatteryReading` for every new reading
+    :param rng: The :class:`random.Random` used for jitter
+    """
+
+    def __init__(self, interval=300.0, jitter=0.2, startup_spread=5.0, on_reading=None, rng=None):
+        if not 0 <= jitter < 1:
+            raise ValueError('jitter must be at least 0 and less than 1')
+        self._interval = interval
+        self._jitter = jitter
+        self._startup_spread = startup_spread
+        self._on_reading = on_reading
+        self._rng = rng if rng is not None else random.Random()
+        self._devices = {}
+        self._readings = {}
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._rescheduled = None
+        self._task = None
+
+    async def add(self, service, name=None, notifications=True):
+        """
+        Register a device.
+
+        :param service: The device's :class:`~pycycling.battery_service.BatteryService`
+        :param name: Name under which readings are cached. Defaults to the address of the device's client
+        :param notifications: Whether to subscribe to battery level notifications if the device supports them
+        :return: The name of the device
+        """
+        if name is None:
+            name = getattr(service._client, 'address', None)  # pylint: disable=protected-access
+        if name is None:
+            raise ValueError('name is required for clients without an address')
+        if name in self._devices:
+            await self.remove(name)
+
+        device = _Device(name, service)
+        self._devices[name] = device
+        if notifications:
+            await self._enable_notifications(device)
+        self._schedule_read(device, self._rng.uniform(0, self._startup_spread))
+        return name
+
+    async def remove(self, name):
+        """Stop monitoring a device and discard its cached reading"""
+        device = self._devices.pop(name, None)
+        self._readings.pop(name, None)
+        if device is None:
+            return
+        if device.subscription is not None:
+            device.subscription.unsubscribe()
+        if device.notifying:
+            try:
+                await device.service.disable_battery_level_notifications()
+            except Exception:  # pylint: disable=broad-except
+                logger.debug('Could not disable battery level notifications for %s', name, exc_info=True)
+
+    def get(self, name):
+        """
+        Returns the cached :obj:`BatteryReading` of a device, or `None` if it has not been read yet.
+        """
+        return self._readings.get(name)
+
+    @property
+    def readings(self):
+        """A :obj:`dict` mapping device name to its latest :obj:`BatteryReading`"""
+        return dict(self._readings)
+
+    def start(self):
+        """
+        Start polling in a task on the running event loop.
+
+        :return: The :class:`asyncio.Task` doing the polling
+        """
+        if self._task is None or self._task.done():
+            self._rescheduled = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    def stop(self):
+        """Stop polling. Notifications continue to update the cache"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def poll(self, name):
+        """
+        Read the battery level of a device now, updating the cache.
+
+        :return: The new :obj:`BatteryReading`
+        """
+        level = await self._devices[name].service.get_battery_level()
+        return self._store(name, level, 'read')
+
+    async def _enable_notifications(self, device):
+        if _supports_notifications(device.service._client) is False:  # pylint: disable=protected-access
+            return
+        name = device.name
+
+        def on_level(level):
+            if isinstance(level, TimestampedRecord):
+                self._store(name, level.record, 'notification', level.received_ns)
+            else:
+                self._store(name, level, 'notification')
+
+        device.subscription = device.service.subscribe('battery_level', on_level)
+        try:
+            await device.service.enable_battery_level_notifications()
+        except Exception:  # pylint: disable=broad-except
+            logger.debug('Battery level notifications are not supported by %s', name, exc_info=True)
+            device.subscription.unsubscribe()
+            device.subscription = None
+            return
+        device.notifying = True
+
+    def _store(self, name, level, source, timestamp_ns=None):
+        if name not in self._devices:
+            return None
+        reading = BatteryReading(level, time.monotonic_ns() if timestamp_ns is None else timestamp_ns, source)
+        self._readings[name] = reading
+        if self._on_reading is not None:
+            self._on_reading(name, reading)
+        return reading
+
+    def _schedule_read(self, device, delay):
+        heapq.heappush(self._schedule, (time.monotonic_ns() + int(delay * _NANOSECONDS), next(self._sequence), device))
+        if self._rescheduled is not None:
+            self._rescheduled.set()
+
+    def _next_delay(self):
+        return self._interval * (1 + self._rng.uniform(-self._jitter, self._jitter))
+
+    async def _run(self):
+        schedule = self._schedule
+        while True:
+            self._rescheduled.clear()
+            if not schedule:
+                await self._rescheduled.wait()
+                continue
+            due_ns, _, device = schedule[0]
+            delay = (due_ns - time.monotonic_ns()) / _NANOSECONDS
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._rescheduled.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(schedule)
+            name = device.name
+            if self._devices.get(name) is not device:
+                continue
+            # A notifying device only needs its first read; later levels arrive as notifications
+            if device.notifying and name in self._readings:
+                continue
+            try:
+                await self.poll(name)
+            except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+                raise
+            except Exception:  # pylint: disable=broad-except
+                logger.warning('Could not read the battery level of %s', name, exc_info=True)
+            if self._devices.get(name) is device:
+                if not (device.notifying and name in self._readings):
+                    self._schedule_read(device, self._next_delay())
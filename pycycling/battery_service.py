@@ -7,7 +7,11 @@ This example prints the current battery level to the console. Please see also in
 :ref:`obtaining the Bluetooth address of your device <obtaining_device_address>`.
 
 .. literalinclude:: ../examples/battery_example.py
+
+To keep the battery levels of many devices up to date without a read on every request, see
+:mod:`pycycling.battery_monitor`.
 """
+from pycycling.notifications import NotifyingService
 
 battery_level_characteristic_id = '00002a19-0000-1000-8000-00805f9b34fb'
 
@@ -16,7 +20,7 @@ def _parse_battery_level(measurement):
     return int.from_bytes(measurement, byteorder='little')
 
 
-class BatteryService:
+class BatteryService(NotifyingService):
     """
     A wrapper around a :obj:`bleak.backends.client.BaseBleakClient` object adding Battery Service specific utility
     methods.
@@ -25,7 +29,8 @@ class BatteryService:
     """
 
     def __init__(self, client):
-        self._client = client
+        super().__init__(client)
+        self._battery_level_channel = self._add_channel('battery_level', _parse_battery_level)
 
     async def get_battery_level(self):
         """
@@ -36,3 +41,16 @@ class BatteryService:
         """
         measurement = await self._client.read_gatt_char(battery_level_characteristic_id)
         return _parse_battery_level(measurement)
+
+    async def enable_battery_level_notifications(self):
+        """
+        Receive the battery level whenever it changes. Not all devices support notifications of the battery level.
+        """
+        await self._router.start_notify(battery_level_characteristic_id,
+                                        self._battery_level_channel.notification_handler)
+
+    async def disable_battery_level_notifications(self):
+        await self._router.stop_notify(battery_level_characteristic_id)
+
+    def set_battery_level_handler(self, callback):
+        self._battery_level_channel.set_handler(callback)
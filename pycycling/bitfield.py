@@ -0,0 +1,107 @@
+"""
+Table-driven decoding of the feature bitfields which devices report.
+
+Feature characteristics such as Cycling Power Feature, CSC Feature and Fitness Machine Feature are an integer in which
+each capability is one bit, or a few bits holding an enumerated value. A :class:`BitfieldDecoder` describes each field
+once, as a :obj:`BitfieldField`, and turns a raw value into a namedtuple. Devices report the same few values again and
+again, on every reconnect and profile refresh, so the decoded records are immutable and memoized by raw value.
+
+Checking a capability does not need the record at all: :func:`BitfieldDecoder.mask` gives the bits of one or more
+fields, and :func:`has_feature` tests a raw value against them with a single integer operation.
+
+Example
+=======
+.. code-block:: python
+
+    from pycycling.bitfield import has_feature
+    from pycycling.cycling_power_service import cycling_power_feature_bitfield
+
+    crank_data = cycling_power_feature_bitfield.mask('crank_rev_supported')
+
+    raw = int.from_bytes(await client.read_gatt_char(cycling_power_feature_tx_id), 'little')
+    if has_feature(raw, crank_data):
+        ...
+    print(cycling_power_feature_bitfield.decode(raw))
+"""
+from collections import namedtuple
+
+_FLAG = (False, True)
+
+
+class BitfieldField(namedtuple('BitfieldField', ['name', 'offset', 'width', 'values'])):
+    """
+    A field of a bitfield.
+
+    :param name: The name of the field in the decoded record
+    :param offset: The bit position of the field's least significant bit
+    :param width: The number of bits in the field
+    :param values: The decoded value of each raw field value, indexed by raw value. `None` for a 1 bit flag, which
+        decodes to a bool
+    """
+    __slots__ = ()
+
+    def __new__(cls, name, offset, width=1, values=None):
+        if values is None:
+            if width != 1:
+                raise ValueError(f'field {name} of {width} bits needs values')
+            values = _FLAG
+        elif len(values) != 1 << width:
+            raise ValueError(f'field {name} of {width} bits needs {1 << width} values')
+        return super().__new__(cls, name, offset, width, tuple(values))
+
+
+def has_feature(value, mask):
+    """Returns whether all of the bits of `mask`, from :func:`BitfieldDecoder.mask`, are set in the raw `value`"""
+    return value & mask == mask
+
+
+class BitfieldDecoder:
+    """
+    Decodes raw bitfield values into records.
+
+    :param record_type: The namedtuple type of decoded records. Its fields are filled from `fields` in order
+    :param fields: A :obj:`BitfieldField` for each field of `record_type`
+    :param cache_size: The most decoded records memoized. Values beyond it are decoded every time, which bounds the
+        memory used by a misbehaving device
+    """
+
+    def __init__(self, record_type, fields, cache_size=64):
+        fields = tuple(fields)
+        if tuple(field.name for field in fields) != record_type._fields:
+            raise ValueError(f'fields do not match those of {record_type.__name__}')
+        self.record_type = record_type
+        self.fields = fields
+        self.cache_size = cache_size
+        self._masks = {field.name: ((1 << field.width) - 1) << field.offset for field in fields}
+        self._table = tuple((field.offset, (1 << field.width) - 1, field.values) for field in fields)
+        self._cache = {}
+
+    def decode(self, value):
+        """Returns the record for the raw integer `value`"""
+        record = self._cache.get(value)
+        if record is None:
+            record = self.record_type._make([values[(value >> offset) & bits] for offset, bits, values in self._table])
+            if len(self._cache) < self.cache_size:
+                self._cache[value] = record
+        return record
+
+    def from_bytes(self, data, byteorder='little'):
+        """Returns the record for the raw value in the bytes `data`"""
+        return self.decode(int.from_bytes(data, byteorder))
+
+    def mask(self, *names):
+        """Returns the bits of the named fields, for :func:`has_feature`"""
+        mask = 0
+        for name in names:
+            try:
+                mask |= self._masks[name]
+            except KeyError:
+                raise ValueError(f'{self.record_type.__name__} has no field {name}') from None
+        return mask
+
+    def encode(self, record):
+        """Returns the raw integer value of a record, the inverse of :func:`decode`"""
+        value = 0
+        for field, decoded in zip(self.fields, record):
+            value |= field.values.index(decoded) << field.offset
+        return value
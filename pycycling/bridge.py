@@ -0,0 +1,338 @@
+"""
+A local publish/subscribe bridge, sharing the records of one set of device connections with other processes.
+
+A :class:`RecordBridge` listens on a UNIX domain socket and forwards the records of any services attached to it to
+every connected subscriber, so several processes on a host can use the same devices without each connecting to them.
+Records are published on a topic per device and characteristic and sent in the frames of :mod:`pycycling.framing`:
+the records published during each flush interval are batched into one frame, which is encoded once and sent to every
+subscriber wanting all topics.
+
+Subscribers may ask for a subset of topics with patterns like ``'trainer-1/*'`` or ``'*/hr_measurement'``, matched
+with :func:`fnmatch.fnmatchcase` against ``device/characteristic``.
+
+Backpressure
+============
+Each subscriber has a queue of at most `max_queued_frames` frames waiting to be written to its socket, and a task
+which writes them, waiting for the socket to drain. When a slow subscriber's queue is full, its oldest batch of
+records is dropped and counted in :attr:`SubscriberStatus.dropped_frames`, so a slow subscriber falls behind on its
+own without delaying the others or growing memory without bound. Topic declarations are never dropped.
+
+Example
+=======
+In the process connected to the devices:
+
+.. code-block:: python
+
+    bridge = RecordBridge('/tmp/pycycling.sock')
+    await bridge.start()
+    bridge.attach(FitnessMachineService(trainer_client), 'trainer-1')
+    bridge.attach(HeartRateService(hr_client), 'hr-1')
+
+In any number of other processes:
+
+.. code-block:: python
+
+    subscriber = await BridgeSubscriber.connect('/tmp/pycycling.sock', ['trainer-1/indoor_bike_data'])
+    async for topic, received_ns, record in subscriber:
+        print(topic.device, record.instant_power)
+"""
+import asyncio
+import fnmatch
+import os
+import time
+from collections import deque, namedtuple
+
+from pycycling.framing import FRAME_RECORDS, FRAME_SUBSCRIBE, FRAME_TOPICS, TopicTable, encode_frame, read_frame
+from pycycling.notifications import TimestampedRecord
+
+SubscriberStatus = namedtuple('SubscriberStatus', ['id', 'patterns', 'queued_frames', 'sent_frames',
+                                                   'dropped_frames'])
+
+
+class _Subscriber:
+    __slots__ = ('id', 'reader', 'writer', 'patterns', 'queue', 'ready', 'sent_frames', 'dropped_frames', 'tasks')
+
+    def __init__(self, subscriber_id, reader, writer):
+        self.id = subscriber_id
+        self.reader = reader
+        self.writer = writer
+        self.patterns = None
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.tasks = ()
+
+    def wants(self, topic):
+        if self.patterns is None:
+            return True
+        name = f'{topic.device}/{topic.characteristic}'
+        # The patterns are set from subscribe frames, which pylint cannot see
+        return any(fnmatch.fnmatchcase(name, pattern) for pattern in self.patterns)  # pylint: disable=not-an-iterable
+
+
+class RecordBridge:
+    """
+    Publishes records to subscribers connected to a UNIX domain socket.
+
+    :param path: Path of the socket. An existing socket file at the path is replaced
+    :param flush_interval: How often, in seconds, the records published since the last flush are sent
+    :param max_queued_frames: The most frames waiting to be written to each subscriber
+    """
+
+    def __init__(self, path, flush_interval=0.02, max_queued_frames=64):
+        if max_queued_frames < 2:
+            raise ValueError('max_queued_frames must be at least 2')
+        self.path = path
+        self._flush_interval = flush_interval
+        self._max_queued_frames = max_queued_frames
+        self._topics = TopicTable()
+        self._batch = []
+        self._subscribers = {}
+        self._next_subscriber_id = 0
+        self._server = None
+        self._flush_task = None
+        self._subscriptions = []
+
+    async def start(self):
+        """Start listening on the socket and flushing batches in a task on the running event loop"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._accept, self.path)
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Flush the pending records, disconnect every subscriber and stop listening"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for subscriber in list(self._subscribers.values()):
+            await self._drain_and_close(subscriber)
+        for subscription in self._subscriptions:
+            subscription.unsubscribe()
+        self._subscriptions = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        await self.stop()
+
+    def attach(self, service, device=None, characteristics=None):
+        """
+        Publish the records of a service.
+
+        :param service: A service object, e.g. a :class:`~pycycling.fitness_machine_service.FitnessMachineService`
+        :param device: The device name used in topics. Defaults to the address of the service's client
+        :param characteristics: The characteristics to publish, or `None` for all of them
+        :return: The list of :class:`~pycycling.notifications.Subscription` made
+        """
+        if device is None:
+            device = getattr(service._client, 'address', None)  # pylint: disable=protected-access
+            if device is None:
+                raise ValueError('device must be given for a client without an address')
+        subscriptions = []
+        for characteristic in service.characteristics if characteristics is None else characteristics:
+            subscriptions.append(service.subscribe(characteristic,
+                                                   self._publisher(self._topics.topic_id(device, characteristic))))
+        self._subscriptions.extend(subscriptions)
+        return subscriptions
+
+    def publish(self, device, characteristic, record, received_ns=None):
+        """
+        Publish one record, e.g. from :class:`~pycycling.sharding.ShardedRunner`'s `on_record` callback.
+
+        :param received_ns: The :func:`time.monotonic_ns` time at which the record was received. Defaults to now
+        """
+        self._batch.append((self._topics.topic_id(device, characteristic),
+                            time.monotonic_ns() if received_ns is None else received_ns, record))
+
+    def flush(self):
+        """Send the records published since the last flush to the subscribers"""
+        new_topics = self._topics.take_new()
+        if new_topics:
+            topics_frame = encode_frame(FRAME_TOPICS, new_topics)
+            for subscriber in self._subscribers.values():
+                self._enqueue(subscriber, FRAME_TOPICS, topics_frame)
+
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        frames = {}
+        for subscriber in self._subscribers.values():
+            key = subscriber.patterns
+            frame = frames.get(key)
+            if frame is None:
+                if key is None:
+                    records = batch
+                else:
+                    topic = self._topics.topic
+                    records = [entry for entry in batch if subscriber.wants(topic(entry[0]))]
+                frame = frames[key] = encode_frame(FRAME_RECORDS, records) if records else b''
+            if frame:
+                self._enqueue(subscriber, FRAME_RECORDS, frame)
+
+    @property
+    def subscribers(self):
+        """A :obj:`SubscriberStatus` for each connected subscriber"""
+        return [SubscriberStatus(id=subscriber.id, patterns=subscriber.patterns, queued_frames=len(subscriber.queue),
+                                 sent_frames=subscriber.sent_frames, dropped_frames=subscriber.dropped_frames)
+                for subscriber in self._subscribers.values()]
+
+    def _publisher(self, topic_id):
+        append = self._batch_append
+
+        def publish(record):
+            if isinstance(record, TimestampedRecord):
+                append((topic_id, record.received_ns, record.record))
+            else:
+                append((topic_id, time.monotonic_ns(), record))
+
+        return publish
+
+    def _batch_append(self, entry):
+        self._batch.append(entry)
+
+    def _enqueue(self, subscriber, kind, frame):
+        queue = subscriber.queue
+        if len(queue) >= self._max_queued_frames:
+            for index, (queued_kind, _) in enumerate(queue):
+                if queued_kind == FRAME_RECORDS:
+                    del queue[index]
+                    subscriber.dropped_frames += 1
+                    break
+        queue.append((kind, frame))
+        subscriber.ready.set()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            self.flush()
+
+    async def _accept(self, reader, writer):
+        subscriber = _Subscriber(self._next_subscriber_id, reader, writer)
+        self._next_subscriber_id += 1
+        entries = self._topics.entries()
+        if entries:
+            self._enqueue(subscriber, FRAME_TOPICS, encode_frame(FRAME_TOPICS, entries))
+        self._subscribers[subscriber.id] = subscriber
+        loop = asyncio.get_running_loop()
+        subscriber.tasks = (loop.create_task(self._write(subscriber)), loop.create_task(self._read(subscriber)))
+
+    async def _write(self, subscriber):
+        queue = subscriber.queue
+        writer = subscriber.writer
+        try:
+            while True:
+                await subscriber.ready.wait()
+                while queue:
+                    _, frame = queue.popleft()
+                    writer.write(frame)
+                    await writer.drain()
+                    subscriber.sent_frames += 1
+                subscriber.ready.clear()
+        except (ConnectionError, OSError):
+            self._remove(subscriber)
+
+    async def _read(self, subscriber):
+        try:
+            while True:
+                frame = await read_frame(subscriber.reader)
+                if frame.kind == FRAME_SUBSCRIBE:
+                    subscriber.patterns = None if frame.payload is None else tuple(frame.payload)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+            pass
+        self._remove(subscriber)
+
+    def _remove(self, subscriber):
+        if self._subscribers.pop(subscriber.id, None) is None:
+            return
+        for task in subscriber.tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        subscriber.writer.close()
+
+    async def _drain_and_close(self, subscriber):
+        try:
+            while subscriber.queue:
+                _, frame = subscriber.queue.popleft()
+                subscriber.writer.write(frame)
+            await subscriber.writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        self._remove(subscriber)
+
+
+class BridgeSubscriber:
+    """
+    Receives records from a :class:`RecordBridge`. Create with :meth:`connect`.
+
+    Iterating asynchronously yields ``(topic, received_ns, record)`` for each record, where `topic` is a
+    :obj:`~pycycling.framing.Topic`, until the bridge closes the connection.
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._topics = TopicTable()
+        self._pending = deque()
+
+    @classmethod
+    async def connect(cls, path, patterns=None):
+        """
+        Connect to a bridge.
+
+        :param path: Path of the bridge's socket
+        :param patterns: Topic patterns, e.g. ``['trainer-1/*']``, or `None` to receive every topic
+        """
+        reader, writer = await asyncio.open_unix_connection(path)
+        subscriber = cls(reader, writer)
+        if patterns is not None:
+            await subscriber.subscribe(patterns)
+        return subscriber
+
+    async def subscribe(self, patterns):
+        """Replace the topic patterns received, or receive every topic if `patterns` is `None`"""
+        self._writer.write(encode_frame(FRAME_SUBSCRIBE, None if patterns is None else list(patterns)))
+        await self._writer.drain()
+
+    async def receive(self):
+        """
+        Wait for the next batch of records.
+
+        :return: A list of ``(topic, received_ns, record)``
+        :raises asyncio.IncompleteReadError: If the bridge closed the connection
+        """
+        while True:
+            frame = await read_frame(self._reader)
+            if frame.kind == FRAME_TOPICS:
+                self._topics.update(frame.payload)
+            elif frame.kind == FRAME_RECORDS:
+                topic = self._topics.topic
+                return [(topic(topic_id), received_ns, record) for topic_id, received_ns, record in frame.payload]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._pending:
+            try:
+                self._pending.extend(await self.receive())
+            except asyncio.IncompleteReadError:
+                raise StopAsyncIteration  # pylint: disable=raise-missing-from
+        return self._pending.popleft()
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
@@ -10,9 +10,14 @@ information on :ref:`obtaining the Bluetooth address of your device <obtaining_d
 
 .. literalinclude:: ../examples/cycling_power_service_example.py
 """
+import struct
 from collections import namedtuple
 from enum import Enum
 
+from pycycling.bitfield import BitfieldDecoder, BitfieldField
+from pycycling.encoding import FlaggedLayout
+from pycycling.notifications import NotifyingService
+
 cycling_power_measurement_tx_id = '00002a63-0000-1000-8000-00805f9b34fb'
 cycling_power_vector_tx_id = '00002a64-0000-1000-8000-00805f9b34fb'
 cycling_power_feature_tx_id = '00002a65-0000-1000-8000-00805f9b34fb'
@@ -64,63 +69,31 @@ def _parse_sensor_location(measurement):
         return SensorLocation(value + 1)
 
 
+cycling_power_feature_bitfield = BitfieldDecoder(CyclingPowerFeature, [
+    BitfieldField('pedal_power_balance_supported', 0),
+    BitfieldField('accumulated_torque_supported', 1),
+    BitfieldField('wheel_rev_supported', 2),
+    BitfieldField('crank_rev_supported', 3),
+    BitfieldField('extreme_magnitudes_supported', 4),
+    BitfieldField('dead_spot_angles_supported', 5),
+    BitfieldField('accumulated_energy_supported', 6),
+    BitfieldField('offset_compensation_supported', 7),
+    BitfieldField('cycling_power_measurement_content_masking_supported', 8),
+    BitfieldField('multiple_locations_supported', 9),
+    BitfieldField('crank_length_adjustment_supported', 10),
+    BitfieldField('chain_length_adjustment_supported', 11),
+    BitfieldField('chain_weight_adjustment_supported', 12),
+    BitfieldField('span_length_adjustment_supported', 13),
+    BitfieldField('sensor_measurement_context', 14, 1, list(SensorMeasurementContext)),
+    BitfieldField('instantaneous_measurement_direction_supported', 15),
+    BitfieldField('factory_calibration_date_supported', 16),
+    BitfieldField('enhanced_offset_compensation_supported', 17),
+    BitfieldField('distribute_system_support', 20, 2, list(DistributeSystemSupport)),
+])
+
+
 def _parse_cycling_power_feature(measurement):
-    value = int.from_bytes(measurement, byteorder='little')
-
-    pedal_power_balance_supported = bool(value & (1))
-    accumulated_torque_supported = bool(value & (1 << 1))
-    wheel_rev_supported = bool(value & (1 << 2))
-    crank_rev_supported = bool(value & (1 << 3))
-    extreme_magnitudes_supported = bool(value & (1 << 4))
-    dead_spot_angles_supported = bool(value & (1 << 5))
-    accumulated_energy_supported = bool(value & (1 << 6))
-    offset_compensation_supported = bool(value & (1 << 7))
-    cycling_power_measurement_content_masking_supported = bool(value & (1 << 8))
-    multiple_locations_supported = bool(value & (1 << 9))
-    crank_length_adjustment_supported = bool(value & (1 << 10))
-    chain_length_adjustment_supported = bool(value & (1 << 11))
-    chain_weight_adjustment_supported = bool(value & (1 << 12))
-    span_length_adjustment_supported = bool(value & (1 << 13))
-    sensor_measurement_context_value = bool(value & (1 << 14))
-
-    sensor_measurement_context = SensorMeasurementContext.force_based
-    if sensor_measurement_context_value:
-        sensor_measurement_context = SensorMeasurementContext.torque_based
-
-    instantaneous_measurement_direction_supported = bool(value & (1 << 15))
-    factory_calibration_date_supported = bool(value & (1 << 16))
-    enhanced_offset_compensation_supported = bool(value & (1 << 17))
-
-    distribute_system_support_value = (value & 0b11000000000000000000) >> 20
-    distribute_system_support = DistributeSystemSupport.unspecified
-    if distribute_system_support_value == 1:
-        distribute_system_support = DistributeSystemSupport.no_distributed_system_support
-    elif distribute_system_support_value == 2:
-        distribute_system_support = DistributeSystemSupport.distributed_system_support
-    elif distribute_system_support_value == 3:
-        distribute_system_support = DistributeSystemSupport.rfu
-
-    return CyclingPowerFeature(
-        pedal_power_balance_supported=pedal_power_balance_supported,
-        accumulated_torque_supported=accumulated_torque_supported,
-        wheel_rev_supported=wheel_rev_supported,
-        crank_rev_supported=crank_rev_supported,
-        extreme_magnitudes_supported=extreme_magnitudes_supported,
-        dead_spot_angles_supported=dead_spot_angles_supported,
-        accumulated_energy_supported=accumulated_energy_supported,
-        offset_compensation_supported=offset_compensation_supported,
-        cycling_power_measurement_content_masking_supported=cycling_power_measurement_content_masking_supported,
-        multiple_locations_supported=multiple_locations_supported,
-        crank_length_adjustment_supported=crank_length_adjustment_supported,
-        chain_length_adjustment_supported=chain_length_adjustment_supported,
-        chain_weight_adjustment_supported=chain_weight_adjustment_supported,
-        span_length_adjustment_supported=span_length_adjustment_supported,
-        sensor_measurement_context=sensor_measurement_context,
-        instantaneous_measurement_direction_supported=instantaneous_measurement_direction_supported,
-        factory_calibration_date_supported=factory_calibration_date_supported,
-        enhanced_offset_compensation_supported=enhanced_offset_compensation_supported,
-        distribute_system_support=distribute_system_support
-    )
+    return cycling_power_feature_bitfield.from_bytes(measurement)
 
 
 def _parse_cycling_power_measurement(data):
@@ -270,31 +243,103 @@ def _parse_cycling_power_vector(data):
                               instantaneous_torque_magnitudes=instantaneous_torque_magnitudes)
 
 
-class CyclingPowerService:
+_cycling_power_measurement_layout = FlaggedLayout('H', [('instantaneous_power', 'H', 1)], [
+    (1, [('pedal_power_balance', 'B', 1)]),
+    (1 << 2, [('accumulated_torque', 'H', 1)]),
+    (1 << 4, [('cumulative_wheel_revs', 'I', 1), ('last_wheel_event_time', 'H', 1)]),
+    (1 << 5, [('cumulative_crank_revs', 'H', 1), ('last_crank_event_time', 'H', 1)]),
+    (1 << 6, [('maximum_force_magnitude', 'H', 1), ('minimum_force_magnitude', 'H', 1)]),
+    (1 << 7, [('maximum_torque_magnitude', 'H', 1), ('minimum_torque_magnitude', 'H', 1)]),
+    (1 << 9, [('top_dead_spot_angle', 'H', 1)]),
+    (1 << 10, [('bottom_dead_spot_angle', 'H', 1)]),
+    (1 << 11, [('accumulated_energy', 'H', 1)]),
+])
+
+_cycling_power_vector_layout = FlaggedLayout('B', [], [
+    (0b1, [('cumulative_crank_revs', 'H', 1), ('last_crank_event_time', 'H', 1)]),
+    (0b10, [('first_crank_measurement_angle', 'H', 1)]),
+])
+
+_magnitude_structs = {}
+
+
+def pack_cycling_power_measurement_into(buffer, offset, measurement):
+    """
+    Write a :class:`CyclingPowerMeasurement` into a buffer as a cycling power measurement characteristic value. The
+    flags are set for the fields which are not `None`.
+
+    :return: The number of bytes written
+    """
+    return _cycling_power_measurement_layout.pack_into(buffer, offset, measurement)
+
+
+def encode_cycling_power_measurement(measurement):
+    """Returns a :class:`CyclingPowerMeasurement` encoded as a cycling power measurement characteristic value"""
+    return _cycling_power_measurement_layout.encode(measurement)
+
+
+def pack_cycling_power_vector_into(buffer, offset, vector):
+    """
+    Write a :class:`CyclingPowerVector` into a buffer as a cycling power vector characteristic value. The force
+    magnitudes are written if there are any, and the torque magnitudes otherwise.
+
+    :return: The number of bytes written
+    """
+    direction = vector.instantaneous_measurement_direction
+    flags = (direction.value - 1) << 4 if direction is not None else 0
+    magnitudes = vector.instantaneous_force_magnitudes
+    if magnitudes:
+        flags |= 0b100
+    else:
+        magnitudes = vector.instantaneous_torque_magnitudes or ()
+        if magnitudes:
+            flags |= 0b1000
+
+    size = _cycling_power_vector_layout.pack_into(buffer, offset, vector, flags)
+    count = len(magnitudes)
+    if count:
+        compiled = _magnitude_structs.get(count)
+        if compiled is None:
+            compiled = _magnitude_structs[count] = struct.Struct(f'<{count}h')
+        compiled.pack_into(buffer, offset + size, *magnitudes)
+        size += compiled.size
+    return size
+
+
+def encode_cycling_power_vector(vector):
+    """Returns a :class:`CyclingPowerVector` encoded as a cycling power vector characteristic value"""
+    magnitudes = vector.instantaneous_force_magnitudes or vector.instantaneous_torque_magnitudes or ()
+    buffer = bytearray(_cycling_power_vector_layout.max_size + 2 * len(magnitudes))
+    size = pack_cycling_power_vector_into(buffer, 0, vector)
+    return bytes(buffer[:size])
+
+
+class CyclingPowerService(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._cycling_power_measurement_callback = None
-        self._cycling_power_vector_callback = None
+        super().__init__(client)
+        self._cycling_power_measurement_channel = self._add_channel('cycling_power_measurement',
+                                                                    _parse_cycling_power_measurement)
+        self._cycling_power_vector_channel = self._add_channel('cycling_power_vector', _parse_cycling_power_vector)
 
     async def enable_cycling_power_measurement_notifications(self):
-        await self._client.start_notify(cycling_power_measurement_tx_id,
-                                        self._cycling_power_measurement_notification_handler)
+        await self._router.start_notify(cycling_power_measurement_tx_id,
+                                        self._cycling_power_measurement_channel.notification_handler)
 
     async def disable_cycling_power_measurement_notifications(self):
-        await self._client.stop_notify(cycling_power_measurement_tx_id)
+        await self._router.stop_notify(cycling_power_measurement_tx_id)
 
     def set_cycling_power_measurement_handler(self, callback):
-        self._cycling_power_measurement_callback = callback
+        self._cycling_power_measurement_channel.set_handler(callback)
 
     async def enable_cycling_power_vector_notifications(self):
-        await self._client.start_notify(cycling_power_vector_tx_id,
-                                        self._cycling_power_vector_notification_handler)
+        await self._router.start_notify(cycling_power_vector_tx_id,
+                                        self._cycling_power_vector_channel.notification_handler)
 
     async def disable_cycling_power_vector_notifications(self):
-        await self._client.stop_notify(cycling_power_vector_tx_id)
+        await self._router.stop_notify(cycling_power_vector_tx_id)
 
     def set_cycling_power_vector_handler(self, callback):
-        self._cycling_power_vector_callback = callback
+        self._cycling_power_vector_channel.set_handler(callback)
 
     async def get_sensor_location(self):
         measurement = await self._client.read_gatt_char(sensor_location_tx_id)
@@ -303,11 +348,3 @@ class CyclingPowerService:
     async def get_cycling_power_feature(self):
         measurement = await self._client.read_gatt_char(cycling_power_feature_tx_id)
         return _parse_cycling_power_feature(measurement)
-
-    def _cycling_power_measurement_notification_handler(self, sender, data):  # pylint: disable=unused-argument
-        if self._cycling_power_measurement_callback is not None:
-            self._cycling_power_measurement_callback(_parse_cycling_power_measurement(data))
-
-    def _cycling_power_vector_notification_handler(self, sender, data):  # pylint: disable=unused-argument
-        if self._cycling_power_vector_callback is not None:
-            self._cycling_power_vector_callback(_parse_cycling_power_vector(data))
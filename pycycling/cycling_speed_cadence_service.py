@@ -1,5 +1,9 @@
 from collections import namedtuple
 
+from pycycling.bitfield import BitfieldDecoder, BitfieldField
+from pycycling.encoding import FlaggedLayout
+from pycycling.notifications import NotifyingService
+
 csc_measurement_tx_id = '00002a5b-0000-1000-8000-00805f9b34fb'
 csc_feature_tx_id = '00002a5c-0000-1000-8000-00805f9b34fb'
 
@@ -10,14 +14,15 @@ CSCMeasurement = namedtuple('CSCMeasurement',
 CSCFeature = namedtuple('CSCFeature', ['wheel_rev_supported', 'crank_rev_supported', 'multiple_locations_supported'])
 
 
+csc_feature_bitfield = BitfieldDecoder(CSCFeature, [
+    BitfieldField('wheel_rev_supported', 0),
+    BitfieldField('crank_rev_supported', 1),
+    BitfieldField('multiple_locations_supported', 2),
+])
+
+
 def _parse_csc_feature(measurement):
-    value = int.from_bytes(measurement, byteorder='little')
-    wheel_rev_supported = bool(value & 0b1)
-    crank_rev_supported = bool(value & 0b10)
-    multiple_locations_supported = bool(value & 0b100)
-    return CSCFeature(wheel_rev_supported=wheel_rev_supported,
-                      crank_rev_supported=crank_rev_supported,
-                      multiple_locations_supported=multiple_locations_supported)
+    return csc_feature_bitfield.from_bytes(measurement)
 
 
 def _parse_csc_measurement(data):
@@ -47,24 +52,41 @@ def _parse_csc_measurement(data):
                           last_crank_event_time=last_crank_event_time)
 
 
-class CyclingSpeedCadenceService:
+_csc_measurement_layout = FlaggedLayout('B', [], [
+    (1, [('cumulative_wheel_revs', 'I', 1), ('last_wheel_event_time', 'H', 1)]),
+    (2, [('cumulative_crank_revs', 'H', 1), ('last_crank_event_time', 'H', 1)]),
+])
+
+
+def pack_csc_measurement_into(buffer, offset, measurement):
+    """
+    Write a :class:`CSCMeasurement` into a buffer as a CSC measurement characteristic value. The flags are set for
+    the revolution data which is not `None`.
+
+    :return: The number of bytes written
+    """
+    return _csc_measurement_layout.pack_into(buffer, offset, measurement)
+
+
+def encode_csc_measurement(measurement):
+    """Returns a :class:`CSCMeasurement` encoded as a CSC measurement characteristic value"""
+    return _csc_measurement_layout.encode(measurement)
+
+
+class CyclingSpeedCadenceService(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._csc_measurement_callback = None
+        super().__init__(client)
+        self._csc_measurement_channel = self._add_channel('csc_measurement', _parse_csc_measurement)
 
     async def enable_csc_measurement_notifications(self):
-        await self._client.start_notify(csc_measurement_tx_id, self._csc_measurement_notification_handler)
+        await self._router.start_notify(csc_measurement_tx_id, self._csc_measurement_channel.notification_handler)
 
     async def disable_csc_measurement_notifications(self):
-        await self._client.stop_notify(csc_measurement_tx_id)
+        await self._router.stop_notify(csc_measurement_tx_id)
 
     def set_csc_measurement_handler(self, callback):
-        self._csc_measurement_callback = callback
+        self._csc_measurement_channel.set_handler(callback)
 
     async def get_csc_feature(self):
         measurement = await self._client.read_gatt_char(csc_feature_tx_id)
         return _parse_csc_feature(measurement)
-
-    def _csc_measurement_notification_handler(self, sender, data):  # pylint: disable=unused-argument
-        if self._csc_measurement_callback is not None:
-            self._csc_measurement_callback(_parse_csc_measurement(data))
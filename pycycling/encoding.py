@@ -0,0 +1,108 @@
+"""
+Helpers for encoding records back into characteristic payloads.
+
+Most measurement characteristics start with a flags field whose bits say which optional fields follow. A
+:class:`FlaggedLayout` describes such a payload once; encoding a record then works out the flags from which fields are
+not `None`, and writes the payload with a single :meth:`struct.Struct.pack_into` call using a :class:`struct.Struct`
+compiled once per combination of flags.
+"""
+import struct
+
+# A 24 bit unsigned integer, written as a 16 bit and an 8 bit field
+UINT24 = 'U24'
+
+_UNSIGNED_MASKS = {'B': 0xFF, 'H': 0xFFFF, 'I': 0xFFFFFFFF}
+
+
+class FlaggedLayout:
+    """
+    The layout of a payload made of a flags field, fields which are always present, and optional groups of fields
+    each signalled by a flag bit.
+
+    Each field is a tuple of ``(name, format, scale)``: the record attribute, a :mod:`struct` format character or
+    :data:`UINT24`, and the factor which turns the record's value into the encoded integer. Unsigned fields are masked
+    to their width, so values which the parsers read as unsigned round trip even if they were signed on the wire.
+
+    :param flags_format: The :mod:`struct` format of the flags field
+    :param fields: The fields which are always present, after the flags
+    :param groups: A sequence of ``(flag, fields)`` or ``(flag, fields, inverted)``. A group is present when none of
+        the record's values for its fields are `None`, and absent when all of them are. Its flag is set when it is
+        present, or when it is absent if `inverted` is true
+    """
+
+    def __init__(self, flags_format, fields=(), groups=()):
+        self._flags_format = flags_format
+        self._fields = tuple(fields)
+        self._groups = tuple((group[0], tuple(group[1]), group[2] if len(group) > 2 else False) for group in groups)
+        self._inverted_flags = 0
+        for flag, _, inverted in self._groups:
+            if inverted:
+                self._inverted_flags |= flag
+        self._structs = {}
+
+    def pack_into(self, buffer, offset, record, flags=0):
+        """
+        Write a record into a buffer.
+
+        :param buffer: A writable buffer, e.g. a :obj:`bytearray`
+        :param offset: Where in the buffer to start writing
+        :param record: The record to encode
+        :param flags: Flag bits to set in addition to those of the present groups
+        :return: The number of bytes written
+        :raises ValueError: If only some of the fields of a group are `None`
+        """
+        values = []
+        flags |= self._inverted_flags
+        for field in self._fields:
+            _append(values, getattr(record, field[0]), field)
+        for flag, fields, inverted in self._groups:
+            group_values = [getattr(record, field[0]) for field in fields]
+            if None in group_values:
+                if any(value is not None for value in group_values):
+                    missing = fields[group_values.index(None)][0]
+                    raise ValueError(f'{missing} must not be None when the other fields of its group are set')
+                continue
+            flags = flags & ~flag if inverted else flags | flag
+            for value, field in zip(group_values, fields):
+                _append(values, value, field)
+
+        compiled = self._structs.get(flags)
+        if compiled is None:
+            compiled = self._compile(flags)
+        compiled.pack_into(buffer, offset, flags, *values)
+        return compiled.size
+
+    def encode(self, record, flags=0):
+        """Returns a record encoded as :obj:`bytes`"""
+        buffer = bytearray(self.max_size)
+        size = self.pack_into(buffer, 0, record, flags)
+        return bytes(buffer[:size])
+
+    @property
+    def max_size(self):
+        """The size of the payload with every group present"""
+        return struct.calcsize(self._format(self._fields + tuple(field for _, fields, _ in self._groups
+                                                                   for field in fields)))
+
+    def _compile(self, flags):
+        fields = list(self._fields)
+        for flag, group_fields, inverted in self._groups:
+            if bool(flags & flag) != inverted:
+                fields.extend(group_fields)
+        compiled = struct.Struct(self._format(fields))
+        self._structs[flags] = compiled
+        return compiled
+
+    def _format(self, fields):
+        return '<' + self._flags_format + ''.join('HB' if field[1] == UINT24 else field[1] for field in fields)
+
+
+def _append(values, value, field):
+    _, field_format, scale = field
+    value = int(round(value * scale)) if scale != 1 else int(value)
+    if field_format == UINT24:
+        values.append(value & 0xFFFF)
+        values.append((value >> 16) & 0xFF)
+        return
+    mask = _UNSIGNED_MASKS.get(field_format)
+    values.append(value & mask if mask is not None else value)
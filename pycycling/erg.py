@@ -0,0 +1,275 @@
+"""
+Closed loop control of a trainer's target power (ERG mode).
+
+A trainer in target power mode regulates its resistance to hold the power it was last sent, but the power it measures
+often settles a few watts away from the target, and a step change in target is felt as a sudden wall of resistance.
+An :class:`ErgController` drives the ``set_target_power`` method of a
+:class:`~pycycling.fitness_machine_service.FitnessMachineService` or
+:class:`~pycycling.tacx_trainer_control.TacxTrainerControl` from the power and cadence the trainer reports:
+
+* target changes can be ramped linearly over a number of seconds,
+* a proportional-integral correction, limited to `max_correction` watts, removes the trainer's steady state error,
+* while the cadence jumps away from its recent average, e.g. when the rider sprints or shifts, the power reading
+  is dominated by the flywheel accelerating rather than the resistance, so the integral is frozen and the
+  proportional correction dropped until the cadence settles,
+* a command is only sent when it differs from the last one sent by at least `threshold` watts, so a steady target
+  does not cost a Bluetooth write every tick.
+
+The controller runs at a fixed tick, scheduled with :meth:`asyncio.loop.call_at <asyncio.loop.call_at>` at deadlines
+computed from the start time, so the rate does not drift with the time spent in each tick. At most one command is in
+flight per trainer; a tick which falls due while a command is being written sends the newest command afterwards.
+
+Example
+=======
+.. code-block:: python
+
+    trainer = FitnessMachineService(client)
+    await trainer.enable_indoor_bike_data_notify()
+    await trainer.enable_control_point_indicate()
+    await trainer.request_control()
+
+    controller = ErgController(trainer)
+    controller.start()
+    controller.set_target(150)
+    await asyncio.sleep(300)
+    controller.set_target(250, ramp_time=10)
+"""
+import asyncio
+import logging
+from collections import namedtuple
+
+from pycycling.notifications import TimestampedRecord
+
+logger = logging.getLogger(__name__)
+
+# The power and cadence fields of each trainer characteristic which can be used as feedback
+_FEEDBACK_FIELDS = {
+    'indoor_bike_data': ('instant_power', 'instant_cadence'),
+    'specific_trainer_data_page': ('instantaneous_power', 'instantaneous_cadence'),
+}
+
+ErgStatus = namedtuple('ErgStatus', ['target', 'setpoint', 'power', 'cadence', 'correction', 'command', 'frozen',
+                                     'commands_sent'])
+
+
+class ErgController:
+    """
+    Holds a trainer at a target power using the trainer's own power and cadence readings.
+
+    :param trainer: A :class:`~pycycling.fitness_machine_service.FitnessMachineService` or
+        :class:`~pycycling.tacx_trainer_control.TacxTrainerControl`, or a supervised proxy of one. Its indoor bike
+        data or specific trainer data notifications should be enabled for closed loop control
+    :param tick_interval: Seconds between control ticks
+    :param threshold: The least change, in watts, from the last command sent for a new command to be sent
+    :param proportional_gain: Watts of correction per watt of error
+    :param integral_gain: Watts of correction per watt second of accumulated error
+    :param max_correction: The largest correction, in watts, added to or subtracted from the target
+    :param smoothing: Weight of each new reading in the exponential moving averages of power and cadence
+    :param cadence_spike: The difference, in rpm, between a cadence reading and the average cadence at which the
+        integral is frozen
+    :param min_cadence: Below this cadence, in rpm, the rider is taken to be coasting and no correction is applied
+    :param max_power: The largest command, in watts
+    """
+
+    def __init__(self, trainer, *, tick_interval=0.25, threshold=2.0, proportional_gain=0.2, integral_gain=0.4,
+                 max_correction=50.0, smoothing=0.3, cadence_spike=12.0, min_cadence=30.0, max_power=2000.0):
+        if tick_interval <= 0:
+            raise ValueError('tick_interval must be positive')
+        if not 0 < smoothing <= 1:
+            raise ValueError('smoothing must be greater than 0 and at most 1')
+        self._trainer = trainer
+        self._tick_interval = tick_interval
+        self._threshold = threshold
+        self._proportional_gain = proportional_gain
+        self._integral_gain = integral_gain
+        self._max_correction = max_correction
+        self._smoothing = smoothing
+        self._cadence_spike = cadence_spike
+        self._min_cadence = min_cadence
+        self._max_power = max_power
+
+        self._target = None
+        self._ramp = None
+        self._setpoint = None
+        self._power = None
+        self._cadence = None
+        self._spike = False
+        self._integral = 0.0
+        self._correction = 0.0
+        self._last_time = None
+        self._command = None
+        self._pending = None
+        self.commands_sent = 0
+
+        self._loop = None
+        self._start_time = None
+        self._ticks = 0
+        self._handle = None
+        self._send_task = None
+        self._subscriptions = []
+
+    def start(self):
+        """Subscribe to the trainer's feedback and start ticking on the running event loop"""
+        if self._handle is not None:
+            return
+        for characteristic in self._trainer.characteristics:
+            fields = _FEEDBACK_FIELDS.get(characteristic)
+            if fields is not None:
+                self._subscriptions.append(self._trainer.subscribe(characteristic, self._feedback_handler(*fields)))
+        self._loop = asyncio.get_running_loop()
+        self._start_time = self._loop.time()
+        self._ticks = 0
+        self._schedule()
+
+    def stop(self):
+        """Stop ticking and unsubscribe. A command being written is cancelled"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._send_task is not None:
+            self._send_task.cancel()
+            self._send_task = None
+        for subscription in self._subscriptions:
+            subscription.unsubscribe()
+        self._subscriptions = []
+
+    def set_target(self, power, ramp_time=0.0):
+        """
+        Set the target power.
+
+        :param power: Target power, in watts
+        :param ramp_time: Seconds over which to ramp linearly from the current setpoint to the new target
+        """
+        if power < 0 or power > self._max_power:
+            raise ValueError(f'power must be between 0 and {self._max_power}')
+        if ramp_time > 0 and self._setpoint is not None:
+            # The ramp starts from the setpoint at the next tick
+            self._ramp = (None, None, ramp_time, float(power))
+        else:
+            self._ramp = None
+            self._setpoint = float(power)
+        self._target = float(power)
+
+    def feed(self, power, cadence=None):
+        """
+        Add a power and cadence reading. Readings from the trainer are added automatically; use this for readings
+        from another source, e.g. a power meter.
+        """
+        if cadence is not None:
+            average = self._cadence
+            if average is None:
+                self._cadence = float(cadence)
+            else:
+                self._spike = abs(cadence - average) > self._cadence_spike
+                self._cadence = average + self._smoothing * (cadence - average)
+        if power is not None:
+            if self._power is None:
+                self._power = float(power)
+            else:
+                self._power += self._smoothing * (power - self._power)
+
+    def step(self, now):
+        """
+        Advance the controller to time `now`, in the seconds of the event loop's clock.
+
+        :return: The command to send, in whole watts, or `None` if no command need be sent
+        """
+        if self._target is None:
+            return None
+        elapsed = 0.0 if self._last_time is None else now - self._last_time
+        self._last_time = now
+
+        ramp = self._ramp
+        if ramp is not None:
+            start_time, start_power, end_time, end_power = ramp
+            if start_time is None:
+                start_time, start_power, end_time = now, self._setpoint, now + end_time
+                self._ramp = (start_time, start_power, end_time, end_power)
+            if now >= end_time:
+                self._ramp = None
+                self._setpoint = end_power
+            else:
+                self._setpoint = start_power + (end_power - start_power) * (now - start_time) / (end_time - start_time)
+        setpoint = self._setpoint
+
+        power = self._power
+        if power is None or (self._cadence is not None and self._cadence < self._min_cadence):
+            self._correction = 0.0
+        else:
+            limit = self._max_correction
+            if self._spike:
+                # Hold the accumulated correction rather than chase the flywheel
+                self._correction = max(-limit, min(limit, self._integral_gain * self._integral))
+            else:
+                error = setpoint - power
+                if self._integral_gain:
+                    integral_limit = limit / self._integral_gain
+                    self._integral = max(-integral_limit, min(integral_limit, self._integral + error * elapsed))
+                self._correction = max(-limit, min(limit, self._proportional_gain * error
+                                                   + self._integral_gain * self._integral))
+
+        command = int(round(max(0.0, min(self._max_power, setpoint + self._correction))))
+        if self._command is not None and abs(command - self._command) < self._threshold:
+            return None
+        self._command = command
+        return command
+
+    @property
+    def target(self):
+        """The target power, in watts, or `None` if no target has been set"""
+        return self._target
+
+    @property
+    def status(self):
+        """An :obj:`ErgStatus` with the controller's current state"""
+        return ErgStatus(target=self._target, setpoint=self._setpoint, power=self._power, cadence=self._cadence,
+                         correction=self._correction, command=self._command, frozen=self._spike,
+                         commands_sent=self.commands_sent)
+
+    def _feedback_handler(self, power_field, cadence_field):
+        feed = self.feed
+
+        def handle(record):
+            if isinstance(record, TimestampedRecord):
+                record = record.record
+            feed(getattr(record, power_field), getattr(record, cadence_field))
+
+        return handle
+
+    def _schedule(self):
+        loop = self._loop
+        interval = self._tick_interval
+        self._ticks += 1
+        deadline = self._start_time + self._ticks * interval
+        now = loop.time()
+        if deadline < now:
+            # Fell more than a tick behind; skip the missed ticks rather than bursting to catch up
+            self._ticks = int((now - self._start_time) // interval) + 1
+            deadline = self._start_time + self._ticks * interval
+        self._handle = loop.call_at(deadline, self._tick)
+
+    def _tick(self):
+        self._schedule()
+        command = self.step(self._loop.time())
+        if command is None:
+            return
+        self._pending = command
+        if self._send_task is None:
+            self._send_task = self._loop.create_task(self._send())
+
+    async def _send(self):
+        try:
+            while self._pending is not None:
+                command, self._pending = self._pending, None
+                try:
+                    await self._trainer.set_target_power(command)
+                    self.commands_sent += 1
+                except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                    # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+                    raise
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.warning('Failed to set target power to %d W: %s', command, error)
+                    # Resend on the next tick
+                    self._command = None
+        finally:
+            self._send_task = None
@@ -37,6 +37,7 @@ from pycycling.ftms_parsers import (
     FitnessMachineFeature,
     TargetSettingFeature,
 )
+from pycycling.notifications import NotifyingService
 
 # read: Supported Resistance Level Range
 ftms_supported_resistance_level_range_characteristic_id = (
@@ -87,13 +88,21 @@ def _parse_supported_power_range(message: bytearray) -> SupportedPowerRange:
     return SupportedPowerRange(minimum_power, maximum_power, minimum_increment)
 
 
-class FitnessMachineService:
+class FitnessMachineService(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._control_point_response_callback = None
-        self._indoor_bike_data_callback = None
-        self._fitness_machine_status_callback = None
-        self._training_status_callback = None
+        super().__init__(client)
+        self._control_point_response_channel = self._add_channel(
+            "control_point_response", parse_control_point_response
+        )
+        self._indoor_bike_data_channel = self._add_channel(
+            "indoor_bike_data", parse_indoor_bike_data
+        )
+        self._fitness_machine_status_channel = self._add_channel(
+            "fitness_machine_status", parse_fitness_machine_status
+        )
+        self._training_status_channel = self._add_channel(
+            "training_status", parse_training_status
+        )
 
     # === READ Characteristics ===
     async def get_supported_resistance_level_range(
@@ -125,82 +134,58 @@ class FitnessMachineService:
     # === NOTIFY Characteristics ===
     # ====== Indoor Bike Data ======
     async def enable_indoor_bike_data_notify(self) -> None:
-        await self._client.start_notify(
+        await self._router.start_notify(
             ftms_indoor_bike_data_characteristic_id,
-            self._indoor_bike_data_notification_handler,
+            self._indoor_bike_data_channel.notification_handler,
         )
 
     async def disable_indoor_bike_data_notify(self):
-        await self._client.stop_notify(ftms_indoor_bike_data_characteristic_id)
+        await self._router.stop_notify(ftms_indoor_bike_data_characteristic_id)
 
     def set_indoor_bike_data_handler(self, callback):
-        self._indoor_bike_data_callback = callback
-
-    def _indoor_bike_data_notification_handler(
-        self, sender, data
-    ):  # pylint: disable=unused-argument
-        if self._indoor_bike_data_callback is not None:
-            self._indoor_bike_data_callback(parse_indoor_bike_data(data))
+        self._indoor_bike_data_channel.set_handler(callback)
 
     # ====== Fitness Machine Status ======
     async def enable_fitness_machine_status_notify(self) -> None:
-        await self._client.start_notify(
+        await self._router.start_notify(
             ftms_fitness_machine_status_characteristic_id,
-            self._fitness_machine_status_notification_handler,
+            self._fitness_machine_status_channel.notification_handler,
         )
 
     async def disable_fitness_machine_status_notify(self):
-        await self._client.stop_notify(ftms_fitness_machine_status_characteristic_id)
+        await self._router.stop_notify(ftms_fitness_machine_status_characteristic_id)
 
     def set_fitness_machine_status_handler(self, callback):
-        self._fitness_machine_status_callback = callback
-
-    def _fitness_machine_status_notification_handler(
-        self, sender, data
-    ):  # pylint: disable=unused-argument
-        if self._fitness_machine_status_callback is not None:
-            self._fitness_machine_status_callback(parse_fitness_machine_status(data))
+        self._fitness_machine_status_channel.set_handler(callback)
 
     # ====== Training Status ======
     async def enable_training_status_notify(self) -> None:
-        await self._client.start_notify(
+        await self._router.start_notify(
             ftms_training_status_characteristic_id,
-            self._training_status_notification_handler,
+            self._training_status_channel.notification_handler,
         )
 
     async def disable_training_status_notify(self):
-        await self._client.stop_notify(ftms_training_status_characteristic_id)
+        await self._router.stop_notify(ftms_training_status_characteristic_id)
 
     def set_training_status_handler(self, callback):
-        self._training_status_callback = callback
-
-    def _training_status_notification_handler(
-        self, sender, data
-    ):  # pylint: disable=unused-argument
-        if self._training_status_callback is not None:
-            self._training_status_callback(parse_training_status(data))
+        self._training_status_channel.set_handler(callback)
 
     # === WRITE/INDICATE Characteristics ===
     # ====== Fitness Machine Control Point ======
     async def enable_control_point_indicate(self) -> None:
-        await self._client.start_notify(
+        await self._router.start_notify(
             ftms_fitness_machine_control_point_characteristic_id,
-            self._control_point_response_handler,
+            self._control_point_response_channel.notification_handler,
         )
 
     async def disable_control_point_indicate(self):
-        await self._client.stop_notify(
+        await self._router.stop_notify(
             ftms_fitness_machine_control_point_characteristic_id
         )
 
     def set_control_point_response_handler(self, callback):
-        self._control_point_response_callback = callback
-
-    def _control_point_response_handler(
-        self, sender, data
-    ):  # pylint: disable=unused-argument
-        if self._control_point_response_callback is not None:
-            self._control_point_response_callback(parse_control_point_response(data))
+        self._control_point_response_channel.set_handler(callback)
 
     # ====== Control Point Commands ======
     async def request_control(self) -> None:
@@ -0,0 +1,158 @@
+"""
+A compact framing of parsed records, for passing them between processes.
+
+Records are sent in frames, each a 5 byte header followed by a payload. The header holds the length of the payload as
+a 32 bit little endian integer and the kind of frame as a byte. Records are sent in batches: a
+:data:`FRAME_RECORDS` frame holds a list of ``(topic_id, received_ns, record)`` tuples, pickled together so that the
+record types and enums they use are written once per batch rather than once per record.
+
+Each topic is a device and characteristic, e.g. ``Topic('trainer-1', 'indoor_bike_data')``. Topics are given small
+integer ids by a :class:`TopicTable`, and a :data:`FRAME_TOPICS` frame declares the ids before records using them are
+sent, so each record carries an integer rather than two strings. A :data:`FRAME_SUBSCRIBE` frame, sent by a
+subscriber, holds the list of topic patterns it wants to receive.
+
+The payloads are pickled, so frames must only be read from trusted processes, e.g. ones on the same host run by the
+same user.
+"""
+import pickle
+import struct
+from collections import namedtuple
+
+# Frame kinds
+FRAME_TOPICS = 1
+FRAME_RECORDS = 2
+FRAME_STATUS = 3
+FRAME_SUBSCRIBE = 4
+
+HEADER = struct.Struct('<IB')
+
+# The largest payload accepted by a FrameReader, to bound memory use on a corrupt stream
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+Frame = namedtuple('Frame', ['kind', 'payload'])
+
+Topic = namedtuple('Topic', ['device', 'characteristic'])
+
+
+def encode_frame(kind, payload):
+    """
+    Returns a frame as :obj:`bytes`.
+
+    :param kind: One of :data:`FRAME_TOPICS`, :data:`FRAME_RECORDS`, :data:`FRAME_STATUS` or
+        :data:`FRAME_SUBSCRIBE`
+    :param payload: The object to send. For :data:`FRAME_RECORDS`, a list of ``(topic_id, received_ns, record)``
+    """
+    data = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(data), kind) + data
+
+
+def decode_frame(data):
+    """
+    Returns the :obj:`Frame` encoded in `data`, which must hold exactly one frame, e.g. a message received with
+    :meth:`multiprocessing.connection.Connection.recv_bytes`.
+    """
+    size, kind = HEADER.unpack_from(data)
+    if len(data) != HEADER.size + size:
+        raise ValueError(f'frame length {len(data)} does not match header length {HEADER.size + size}')
+    return Frame(kind, pickle.loads(memoryview(data)[HEADER.size:]))
+
+
+class FrameReader:
+    """Splits a byte stream, e.g. from a socket, into frames"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add data received from the stream.
+
+        :return: A list of the :obj:`Frame` objects completed by the data
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        offset = 0
+        while len(buffer) - offset >= HEADER.size:
+            size, kind = HEADER.unpack_from(buffer, offset)
+            if size > MAX_PAYLOAD_SIZE:
+                raise ValueError(f'frame payload of {size} bytes exceeds {MAX_PAYLOAD_SIZE}')
+            end = offset + HEADER.size + size
+            if len(buffer) < end:
+                break
+            frames.append(Frame(kind, pickle.loads(buffer[offset + HEADER.size:end])))
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+    @property
+    def pending(self):
+        """The number of bytes received which do not yet complete a frame"""
+        return len(self._buffer)
+
+
+async def read_frame(reader):
+    """
+    Read one frame from an :class:`asyncio.StreamReader`.
+
+    :return: The :obj:`Frame`
+    :raises asyncio.IncompleteReadError: If the stream ends first
+    """
+    size, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if size > MAX_PAYLOAD_SIZE:
+        raise ValueError(f'frame payload of {size} bytes exceeds {MAX_PAYLOAD_SIZE}')
+    return Frame(kind, pickle.loads(await reader.readexactly(size)))
+
+
+class TopicTable:
+    """
+    Maps topics to the integer ids used in frames.
+
+    The sending side assigns ids with :meth:`topic_id` and sends the new topics, from :meth:`take_new`, in a
+    :data:`FRAME_TOPICS` frame. The receiving side adds them with :meth:`update` and looks ids up with :meth:`topic`.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._topics = {}
+        self._new = []
+
+    def topic_id(self, device, characteristic):
+        """Returns the id of a topic, assigning one if the topic is new"""
+        topic = Topic(device, characteristic)
+        topic_id = self._ids.get(topic)
+        if topic_id is None:
+            topic_id = len(self._ids)
+            self._ids[topic] = topic_id
+            self._topics[topic_id] = topic
+            self._new.append((topic_id, topic.device, topic.characteristic))
+        return topic_id
+
+    def take_new(self):
+        """Returns the ``(topic_id, device, characteristic)`` of topics assigned since the last call"""
+        new, self._new = self._new, []
+        return new
+
+    def entries(self):
+        """Returns the ``(topic_id, device, characteristic)`` of every topic"""
+        return [(topic_id, topic.device, topic.characteristic) for topic_id, topic in self._topics.items()]
+
+    def update(self, entries):
+        """Add topics received in a :data:`FRAME_TOPICS` frame"""
+        for topic_id, device, characteristic in entries:
+            topic = Topic(device, characteristic)
+            self._ids[topic] = topic_id
+            self._topics[topic_id] = topic
+
+    def topic(self, topic_id):
+        """Returns the :obj:`Topic` with an id, or `None` if it is unknown"""
+        return self._topics.get(topic_id)
+
+    def clear(self):
+        self._ids.clear()
+        self._topics.clear()
+        self._new = []
+
+    def __len__(self):
+        return len(self._topics)
@@ -1,3 +1,4 @@
+import struct
 from enum import Enum
 from collections import namedtuple
 
@@ -82,148 +83,176 @@ class SpinDownStatusValue(Enum):
     STOP_PEDALING = 0x04
 
 
+def _scaled(scale, mask=None):
+    def values(value):
+        encoded = int(round(value * scale))
+        return (encoded & mask if mask is not None else encoded,)
+
+    return values
+
+
+def _uint24(value):
+    value = int(value)
+    return (value & 0xFFFF, (value >> 16) & 0xFF)
+
+
+def _simulation_parameters(value):
+    # Unsigned, as parse_fitness_machine_status reads them
+    return (
+        int(round(value.wind_speed * 1000)) & 0xFFFF,
+        int(round(value.grade * 100)) & 0xFFFF,
+        int(round(value.coefficient_of_rolling_resistance * 1000)) & 0xFF,
+        int(round(value.wind_resistance_coefficient * 100)) & 0xFF,
+    )
+
+
+# Status: (op code and fixed bytes, struct of the parameter or None, function returning the parameter's values)
+_STATUS_LAYOUTS = {
+    FitnessMachineStatus.RESERVED_FOR_FUTURE_USE: (b"\x00", None, None),
+    FitnessMachineStatus.RESET: (b"\x01", None, None),
+    FitnessMachineStatus.STOPPED_BY_USER: (b"\x02\x01", None, None),
+    FitnessMachineStatus.PAUSED_BY_USER: (b"\x02\x02", None, None),
+    FitnessMachineStatus.STOPPED_BY_SAFETY_KEY: (b"\x03", None, None),
+    FitnessMachineStatus.STARTED_BY_USER: (b"\x04", None, None),
+    FitnessMachineStatus.NEW_SPEED: (b"\x05", struct.Struct("<H"), _scaled(100, 0xFFFF)),
+    FitnessMachineStatus.NEW_INCLINATION: (b"\x06", struct.Struct("<h"), _scaled(10)),
+    FitnessMachineStatus.NEW_RESISTANCE: (b"\x07", struct.Struct("<h"), _scaled(1)),
+    FitnessMachineStatus.NEW_POWER: (b"\x08", struct.Struct("<h"), _scaled(1)),
+    FitnessMachineStatus.NEW_HEART_RATE: (b"\x09", struct.Struct("<B"), _scaled(1, 0xFF)),
+    FitnessMachineStatus.NEW_EXPENDED_ENERGY: (b"\x0a", struct.Struct("<H"), _scaled(1, 0xFFFF)),
+    FitnessMachineStatus.NEW_NUMBER_OF_STEPS: (b"\x0b", struct.Struct("<H"), _scaled(1, 0xFFFF)),
+    FitnessMachineStatus.NEW_NUMBER_OF_STRIDES: (b"\x0c", struct.Struct("<H"), _scaled(1, 0xFFFF)),
+    FitnessMachineStatus.NEW_DISTANCE: (b"\x0d", struct.Struct("<HB"), _uint24),
+    FitnessMachineStatus.NEW_TRAINING_TIME: (b"\x0e", struct.Struct("<H"), _scaled(1, 0xFFFF)),
+    FitnessMachineStatus.NEW_TWO_HEART_RATE_ZONE_TARGET_TIME: (b"\x0f", struct.Struct("<2H"), tuple),
+    FitnessMachineStatus.NEW_THREE_HEART_RATE_ZONE_TARGET_TIME: (b"\x10", struct.Struct("<3H"), tuple),
+    FitnessMachineStatus.NEW_FIVE_HEART_RATE_ZONE_TARGET_TIME: (b"\x11", struct.Struct("<5H"), tuple),
+    FitnessMachineStatus.NEW_INDOOR_BIKE_SIMULATION_PARAMETERS: (
+        b"\x12",
+        struct.Struct("<HHBB"),
+        _simulation_parameters,
+    ),
+    FitnessMachineStatus.NEW_WHEEL_CIRCUMFERENCE: (b"\x13", struct.Struct("<H"), _scaled(1, 0xFFFF)),
+    FitnessMachineStatus.NEW_SPIN_DOWN_STATUS: (b"\x14", struct.Struct("<B"), lambda value: (value.value,)),
+    FitnessMachineStatus.NEW_TARGET_CADENCE: (b"\x15", struct.Struct("<H"), _scaled(1, 0xFFFF)),
+    FitnessMachineStatus.CONTROL_PERMISSION_LOST: (b"\xff", None, None),
+}
+
+
+# Status: (unit, function converting the unpacked parameter to the parsed value, or None to use it as it is)
+_STATUS_VALUES = {
+    FitnessMachineStatus.NEW_SPEED: ("km/h", lambda speed: speed / 100),
+    FitnessMachineStatus.NEW_INCLINATION: ("%", lambda inclination: inclination / 10),
+    FitnessMachineStatus.NEW_RESISTANCE: ("%", None),
+    FitnessMachineStatus.NEW_POWER: ("W", None),
+    FitnessMachineStatus.NEW_HEART_RATE: ("bpm", None),
+    FitnessMachineStatus.NEW_EXPENDED_ENERGY: ("kcal", None),
+    FitnessMachineStatus.NEW_NUMBER_OF_STEPS: ("steps", None),
+    FitnessMachineStatus.NEW_NUMBER_OF_STRIDES: ("strides", None),
+    FitnessMachineStatus.NEW_DISTANCE: ("m", lambda low, high: low | high << 16),
+    FitnessMachineStatus.NEW_TRAINING_TIME: ("s", None),
+    FitnessMachineStatus.NEW_TWO_HEART_RATE_ZONE_TARGET_TIME: ("bpm", TwoZoneHR),
+    FitnessMachineStatus.NEW_THREE_HEART_RATE_ZONE_TARGET_TIME: ("bpm", ThreeZoneHR),
+    FitnessMachineStatus.NEW_FIVE_HEART_RATE_ZONE_TARGET_TIME: ("bpm", FiveZoneHR),
+    FitnessMachineStatus.NEW_INDOOR_BIKE_SIMULATION_PARAMETERS: (
+        "m/s, %, unitless, kg/m",
+        lambda wind_speed, grade, crr, cw: IndoorBikeSimulationParameters(
+            wind_speed=wind_speed / 1000,
+            grade=grade / 100,
+            coefficient_of_rolling_resistance=crr / 1000,
+            wind_resistance_coefficient=cw / 100,
+        ),
+    ),
+    FitnessMachineStatus.NEW_WHEEL_CIRCUMFERENCE: ("m", None),
+    FitnessMachineStatus.NEW_SPIN_DOWN_STATUS: ("unitless", SpinDownStatusValue),
+    FitnessMachineStatus.NEW_TARGET_CADENCE: ("rpm", None),
+}
+
+_UNKNOWN_STATUS = FitnessMachineStatusMessage(status=None, value=None, unit=None)
+
+
+def _value_decoder(status, parameter, unit, convert):
+    unpack_from = parameter.unpack_from
+    size = 1 + parameter.size
+
+    def decode(message):
+        if len(message) < size:
+            # Missing high bytes read as zero
+            message = bytes(message).ljust(size, b"\x00")
+        values = unpack_from(message, 1)
+        if convert is None:
+            return FitnessMachineStatusMessage(status, values[0], unit)
+        return FitnessMachineStatusMessage(status, convert(*values), unit)
+
+    return decode
+
+
+def _stopped_or_paused_decoder(results):
+    reserved = FitnessMachineStatusMessage(FitnessMachineStatus.RESERVED_FOR_FUTURE_USE, None, None)
+
+    def decode(message):
+        return results.get(message[1], reserved) if len(message) > 1 else reserved
+
+    return decode
+
+
+def _build_status_tables():
+    # Statuses without a parameter are parsed to a shared, prebuilt result; the others by a decoder per op code
+    results = [None] * 256
+    decoders = [None] * 256
+    stopped_or_paused = {}
+    for status, (prefix, parameter, _) in _STATUS_LAYOUTS.items():
+        op_code = prefix[0]
+        if parameter is not None:
+            decoders[op_code] = _value_decoder(status, parameter, *_STATUS_VALUES[status])
+        elif len(prefix) == 1:
+            results[op_code] = FitnessMachineStatusMessage(status, None, None)
+        else:
+            stopped_or_paused[prefix[1]] = FitnessMachineStatusMessage(status, None, None)
+            decoders[op_code] = _stopped_or_paused_decoder(stopped_or_paused)
+    return tuple(results), tuple(decoders)
+
+
+_STATUS_RESULTS, _STATUS_DECODERS = _build_status_tables()
+
+
 def parse_fitness_machine_status(message: bytearray) -> FitnessMachineStatusMessage:
     """
     A tuple with three items:
     1. A FitnessMachineStatus enum
     2. Associated data (dictionary or namedtuple())
     3. Units
+
+    Unknown op codes give a tuple of three Nones.
     """
-    parsed_status = (None, None, None)
-    if message[0] == 0x00:
-        parsed_status = (FitnessMachineStatus.RESERVED_FOR_FUTURE_USE, None, None)
-    elif message[0] == 0x01:
-        parsed_status = (FitnessMachineStatus.RESET, None, None)
-    elif message[0] == 0x02:
-        if message[1] == 0x01:
-            parsed_status = (FitnessMachineStatus.STOPPED_BY_USER, None, None)
-        elif message[1] == 0x02:
-            parsed_status = (FitnessMachineStatus.PAUSED_BY_USER, None, None)
-        else:
-            parsed_status = (FitnessMachineStatus.RESERVED_FOR_FUTURE_USE, None, None)
-    elif message[0] == 0x03:
-        parsed_status = (FitnessMachineStatus.STOPPED_BY_SAFETY_KEY, None, None)
-    elif message[0] == 0x04:
-        parsed_status = (FitnessMachineStatus.STARTED_BY_USER, None, None)
-    elif message[0] == 0x05:
-        speed = int.from_bytes(message[1:3], byteorder="little", signed=False) / 100
-        parsed_status = (FitnessMachineStatus.NEW_SPEED, speed, "km/h")
-    elif message[0] == 0x06:
-        inclination = int.from_bytes(message[1:3], byteorder="little", signed=True) / 10
-        parsed_status = (FitnessMachineStatus.NEW_INCLINATION, inclination, "%")
-    elif message[0] == 0x07:
-        resistance_level = int.from_bytes(message[1:3], byteorder="little", signed=True)
-        parsed_status = (FitnessMachineStatus.NEW_RESISTANCE, resistance_level, "%")
-    elif message[0] == 0x08:
-        power = int.from_bytes(message[1:3], byteorder="little", signed=True)
-        parsed_status = (FitnessMachineStatus.NEW_POWER, power, "W")
-    elif message[0] == 0x09:
-        heart_rate = int.from_bytes(message[1], byteorder="little", signed=False)
-        parsed_status = (FitnessMachineStatus.NEW_HEART_RATE, heart_rate, "bpm")
-    elif message[0] == 0x0A:
-        expended_energy = int.from_bytes(message[1:3], byteorder="little", signed=False)
-        parsed_status = (
-            FitnessMachineStatus.NEW_EXPENDED_ENERGY,
-            expended_energy,
-            "kcal",
-        )
-    elif message[0] == 0x0B:
-        number_of_steps = int.from_bytes(message[1:3], byteorder="little", signed=False)
-        parsed_status = (
-            FitnessMachineStatus.NEW_NUMBER_OF_STEPS,
-            number_of_steps,
-            "steps",
-        )
-    elif message[0] == 0x0C:
-        number_of_strides = int.from_bytes(
-            message[1:3], byteorder="little", signed=False
-        )
-        parsed_status = (
-            FitnessMachineStatus.NEW_NUMBER_OF_STRIDES,
-            number_of_strides,
-            "strides",
-        )
-    elif message[0] == 0x0D:
-        distance = int.from_bytes(message[1:4], byteorder="little", signed=False)
-        parsed_status = (FitnessMachineStatus.NEW_DISTANCE, distance, "m")
-    elif message[0] == 0x0E:
-        training_time = int.from_bytes(message[1:3], byteorder="little", signed=False)
-        parsed_status = (FitnessMachineStatus.NEW_TRAINING_TIME, training_time, "s")
-    elif message[0] == 0x0F:
-        parameter = TwoZoneHR(
-            fat_burn=int.from_bytes(message[1:3], byteorder="little", signed=False),
-            fitness=int.from_bytes(message[3:5], byteorder="little", signed=False),
-        )
-        parsed_status = (
-            FitnessMachineStatus.NEW_TWO_HEART_RATE_ZONE_TARGET_TIME,
-            parameter,
-            "bpm",
-        )
-    elif message[0] == 0x10:
-        parameter = ThreeZoneHR(
-            very_light=int.from_bytes(message[1:3], byteorder="little", signed=False),
-            light=int.from_bytes(message[3:5], byteorder="little", signed=False),
-            moderate=int.from_bytes(message[5:7], byteorder="little", signed=False),
-        )
-        parsed_status = (
-            FitnessMachineStatus.NEW_THREE_HEART_RATE_ZONE_TARGET_TIME,
-            parameter,
-            "bpm",
-        )
-    elif message[0] == 0x11:
-        parameter = FiveZoneHR(
-            very_light=int.from_bytes(message[1:3], byteorder="little", signed=False),
-            light=int.from_bytes(message[3:5], byteorder="little", signed=False),
-            moderate=int.from_bytes(message[5:7], byteorder="little", signed=False),
-            hard=int.from_bytes(message[7:9], byteorder="little", signed=False),
-            maximum=int.from_bytes(message[9:11], byteorder="little", signed=False),
-        )
-        parsed_status = (
-            FitnessMachineStatus.NEW_FIVE_HEART_RATE_ZONE_TARGET_TIME,
-            parameter,
-            "bpm",
-        )
-    elif message[0] == 0x12:
-        parameter = IndoorBikeSimulationParameters(
-            wind_speed=int.from_bytes(message[1:3], byteorder="little", signed=False) / 1000,
-            grade=int.from_bytes(message[3:5], byteorder="little", signed=False) / 100,
-            coefficient_of_rolling_resistance=int.from_bytes(
-                message[5:6], byteorder="little", signed=False
-            ) / 1000,
-            wind_resistance_coefficient=int.from_bytes(
-                message[6:7], byteorder="little", signed=False
-            ) / 100,
-        )
-        parsed_status = (
-            FitnessMachineStatus.NEW_INDOOR_BIKE_SIMULATION_PARAMETERS,
-            parameter,
-            "m/s, %, unitless, kg/m",
-        )
-    elif message[0] == 0x13:
-        wheel_circumference = int.from_bytes(
-            message[1:3], byteorder="little", signed=False
-        )
-        parsed_status = (
-            FitnessMachineStatus.NEW_WHEEL_CIRCUMFERENCE,
-            wheel_circumference,
-            "m",
-        )
-    elif message[0] == 0x14:
-        spin_down_status = int.from_bytes(
-            message[1:2], byteorder="little", signed=False
-        )
-        parsed_status = (
-            FitnessMachineStatus.NEW_SPIN_DOWN_STATUS,
-            SpinDownStatusValue(spin_down_status),
-            "unitless",
-        )
-    elif message[0] == 0x15:
-        target_cadence = int.from_bytes(message[1:3], byteorder="little", signed=False)
-        parsed_status = (FitnessMachineStatus.NEW_TARGET_CADENCE, target_cadence, "rpm")
-    elif message[0] == 0xFF:
-        parsed_status = (FitnessMachineStatus.CONTROL_PERMISSION_LOST, None, None)
-    return FitnessMachineStatusMessage(
-        status=parsed_status[0],
-        value=parsed_status[1],
-        unit=parsed_status[2],
-    )
+    op_code = message[0]
+    result = _STATUS_RESULTS[op_code]
+    if result is not None:
+        return result
+    decoder = _STATUS_DECODERS[op_code]
+    if decoder is None:
+        return _UNKNOWN_STATUS
+    return decoder(message)
+
+
+def pack_fitness_machine_status_into(buffer, offset, message: FitnessMachineStatusMessage) -> int:
+    """
+    Write a FitnessMachineStatusMessage into a buffer as a fitness machine
+    status characteristic value. The unit is implied by the status and is
+    not written. Returns the number of bytes written.
+    """
+    prefix, parameter, values = _STATUS_LAYOUTS[message.status]
+    end = offset + len(prefix)
+    buffer[offset:end] = prefix
+    if parameter is None:
+        return len(prefix)
+    parameter.pack_into(buffer, end, *values(message.value))
+    return len(prefix) + parameter.size
+
+
+def encode_fitness_machine_status(message: FitnessMachineStatusMessage) -> bytes:
+    """Returns a FitnessMachineStatusMessage encoded as a fitness machine status characteristic value"""
+    prefix, parameter, _ = _STATUS_LAYOUTS[message.status]
+    buffer = bytearray(len(prefix) + (parameter.size if parameter is not None else 0))
+    pack_fitness_machine_status_into(buffer, 0, message)
+    return bytes(buffer)
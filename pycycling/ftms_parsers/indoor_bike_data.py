@@ -1,5 +1,7 @@
 from collections import namedtuple
 
+from pycycling.encoding import UINT24, FlaggedLayout
+
 IndoorBikeData = namedtuple(
     "IndoorBikeData",
     [
@@ -122,3 +124,42 @@ def parse_indoor_bike_data(message) -> IndoorBikeData:
         elapsed_time,
         remaining_time,
     )
+
+
+_indoor_bike_data_layout = FlaggedLayout(
+    "H",
+    [],
+    [
+        # The instant speed is present when the "more data" flag is not set
+        (0x0001, [("instant_speed", "H", 100)], True),
+        (0x0002, [("average_speed", "H", 100)]),
+        (0x0004, [("instant_cadence", "H", 2)]),
+        (0x0008, [("average_cadence", "H", 2)]),
+        (0x0010, [("total_distance", UINT24, 1)]),
+        (0x0020, [("resistance_level", "h", 1)]),
+        (0x0040, [("instant_power", "h", 1)]),
+        (0x0080, [("average_power", "h", 1)]),
+        (
+            0x0100,
+            [("total_energy", "H", 1), ("energy_per_hour", "H", 1), ("energy_per_minute", "B", 1)],
+        ),
+        (0x0200, [("heart_rate", "B", 1)]),
+        (0x0400, [("metabolic_equivalent", "B", 10)]),
+        (0x0800, [("elapsed_time", "H", 1)]),
+        (0x1000, [("remaining_time", "H", 1)]),
+    ],
+)
+
+
+def pack_indoor_bike_data_into(buffer, offset, data: IndoorBikeData) -> int:
+    """
+    Write IndoorBikeData into a buffer as an indoor bike data characteristic
+    value, with the flags set for the fields which are not None. Returns the
+    number of bytes written.
+    """
+    return _indoor_bike_data_layout.pack_into(buffer, offset, data)
+
+
+def encode_indoor_bike_data(data: IndoorBikeData) -> bytes:
+    """Returns IndoorBikeData encoded as an indoor bike data characteristic value"""
+    return _indoor_bike_data_layout.encode(data)
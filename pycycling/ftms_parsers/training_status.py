@@ -1,3 +1,4 @@
+import struct
 from collections import namedtuple
 from enum import Enum
 
@@ -39,7 +40,7 @@ def parse_training_status(message: bytearray) -> TrainingStatusMessage:
     string_exists = message[0] & 0b00000010
 
     if string_exists:
-        string = message[2].decode("utf-8")
+        string = bytes(message[2:]).decode("utf-8")
 
     if param_exists:
         ts_byte = message[1]
@@ -78,3 +79,34 @@ def parse_training_status(message: bytearray) -> TrainingStatusMessage:
         elif ts_byte == 0x10:
             param = TrainingStatus.RESERVED
     return TrainingStatusMessage(param, string)
+
+
+_training_status_header = struct.Struct("<BB")
+
+
+def pack_training_status_into(buffer, offset, message: TrainingStatusMessage) -> int:
+    """
+    Write a TrainingStatusMessage into a buffer as a training status
+    characteristic value. The training status byte is always written, as the
+    string follows it. Returns the number of bytes written.
+    """
+    flags = 0
+    param = 0
+    if message.param is not None:
+        flags |= 0b00000001
+        param = message.param.value
+    string = message.string.encode("utf-8") if message.string is not None else b""
+    if message.string is not None:
+        flags |= 0b00000010
+    _training_status_header.pack_into(buffer, offset, flags, param)
+    end = offset + _training_status_header.size + len(string)
+    buffer[offset + _training_status_header.size : end] = string
+    return end - offset
+
+
+def encode_training_status(message: TrainingStatusMessage) -> bytes:
+    """Returns a TrainingStatusMessage encoded as a training status characteristic value"""
+    string = message.string.encode("utf-8") if message.string is not None else b""
+    buffer = bytearray(_training_status_header.size + len(string))
+    pack_training_status_into(buffer, 0, message)
+    return bytes(buffer)
@@ -1,5 +1,8 @@
+import struct
 from collections import namedtuple
 
+from pycycling.notifications import NotifyingService
+
 heart_rate_measurement_characteristic_id = '00002a37-0000-1000-8000-00805f9b34fb'
 
 HeartRateMeasurement = namedtuple('HeartRateMeasurement', ['sensor_contact', 'bpm', 'rr_interval', 'energy_expended'])
@@ -43,21 +46,57 @@ def _parse_hr_measurement(data):
                                 energy_expended=energy_expended)
 
 
-class HeartRateService:
+_hr_measurement_structs = {}
+
+
+def pack_hr_measurement_into(buffer, offset, measurement):
+    """
+    Write a :class:`HeartRateMeasurement` into a buffer as a heart rate measurement characteristic value. The heart
+    rate is written as 16 bits only if it does not fit in 8, and the energy expended and RR intervals only if present.
+
+    :return: The number of bytes written
+    """
+    flags = 0x06 if measurement.sensor_contact else 0
+    values = []
+    bpm = int(round(measurement.bpm))
+    if bpm > 0xFF:
+        flags |= 0x01
+    values.append(bpm)
+    if measurement.energy_expended is not None:
+        flags |= 0x08
+        values.append(int(measurement.energy_expended) & 0xFFFF)
+    rr_interval = measurement.rr_interval or ()
+    if rr_interval:
+        flags |= 0x10
+        values.extend(int(interval) & 0xFFFF for interval in rr_interval)
+
+    key = (flags, len(rr_interval))
+    compiled = _hr_measurement_structs.get(key)
+    if compiled is None:
+        compiled = _hr_measurement_structs[key] = struct.Struct(
+            '<B' + ('H' if flags & 0x01 else 'B') + ('H' if flags & 0x08 else '') + 'H' * len(rr_interval))
+    compiled.pack_into(buffer, offset, flags, *values)
+    return compiled.size
+
+
+def encode_hr_measurement(measurement):
+    """Returns a :class:`HeartRateMeasurement` encoded as a heart rate measurement characteristic value"""
+    buffer = bytearray(5 + 2 * len(measurement.rr_interval or ()))
+    size = pack_hr_measurement_into(buffer, 0, measurement)
+    return bytes(buffer[:size])
+
+
+class HeartRateService(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._hr_measurement_callback = None
+        super().__init__(client)
+        self._hr_measurement_channel = self._add_channel('hr_measurement', _parse_hr_measurement)
 
     async def enable_hr_measurement_notifications(self):
-        await self._client.start_notify(heart_rate_measurement_characteristic_id,
-                                        self._hr_measurement_notification_handler)
+        await self._router.start_notify(heart_rate_measurement_characteristic_id,
+                                        self._hr_measurement_channel.notification_handler)
 
     async def disable_hr_measurement_notifications(self):
-        await self._client.stop_notify(heart_rate_measurement_characteristic_id)
+        await self._router.stop_notify(heart_rate_measurement_characteristic_id)
 
     def set_hr_measurement_handler(self, callback):
-        self._hr_measurement_callback = callback
-
-    def _hr_measurement_notification_handler(self, sender, data):  # pylint: disable=unused-argument
-        if self._hr_measurement_callback is not None:
-            self._hr_measurement_callback(_parse_hr_measurement(data))
+        self._hr_measurement_channel.set_handler(callback)
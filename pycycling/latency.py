@@ -0,0 +1,106 @@
+"""
+A compact latency histogram in the style of HdrHistogram.
+
+Values (typically nanoseconds) are counted in log-linear buckets: every power of two is split into the same number of
+linear sub-buckets, which bounds the relative error of any reported value while keeping recording to a few integer
+operations and the memory use to a few thousand counters regardless of how many values are recorded.
+"""
+
+
+class LatencyHistogram:
+    """
+    Records non-negative integer values and reports percentiles with a bounded relative error.
+
+    :param significant_bits: Number of bits of precision kept for each value. The default of 8 keeps the relative
+        error of reported values below 1%
+    """
+
+    def __init__(self, significant_bits=8):
+        if significant_bits < 2:
+            raise ValueError('significant_bits must be at least 2')
+        self._significant_bits = significant_bits
+        self._half_sub_bucket_count = 1 << (significant_bits - 1)
+        self._counts = [0] * (1 << significant_bits)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """Record a single value"""
+        value = max(int(value), 0)
+        index = self._index_of(value)
+        counts = self._counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def percentile(self, percentile):
+        """
+        Returns the value at the given percentile.
+
+        :param percentile: A percentile between 0 and 100
+        :return: The highest value equivalent (within the histogram's precision) to the value at the percentile, or
+            `None` if nothing has been recorded
+        """
+        if self.count == 0:
+            return None
+        if percentile < 0 or percentile > 100:
+            raise ValueError('percentile must be between 0 and 100')
+
+        target = max(1, -(-self.count * percentile // 100))
+        running = 0
+        for index, bucket_count in enumerate(self._counts):
+            running += bucket_count
+            if running >= target:
+                return min(self._highest_equivalent_value(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """Add the values recorded by another histogram with the same precision to this one"""
+        # pylint: disable=protected-access
+        if other._significant_bits != self._significant_bits:
+            raise ValueError('histograms must have the same significant_bits to be merged')
+        if len(other._counts) > len(self._counts):
+            self._counts.extend([0] * (len(other._counts) - len(self._counts)))
+        for index, bucket_count in enumerate(other._counts):
+            self._counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def reset(self):
+        self._counts = [0] * (1 << self._significant_bits)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index_of(self, value):
+        shift = value.bit_length() - self._significant_bits
+        if shift <= 0:
+            return value
+        return (shift << (self._significant_bits - 1)) + (value >> shift)
+
+    def _highest_equivalent_value(self, index):
+        if index < (1 << self._significant_bits):
+            return index
+        shift = index // self._half_sub_bucket_count - 1
+        sub_bucket = index - shift * self._half_sub_bucket_count
+        return ((sub_bucket + 1) << shift) - 1
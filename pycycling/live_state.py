@@ -0,0 +1,412 @@
+"""
+Live per-device state in shared memory, readable from other processes without copying or serialization.
+
+A :class:`LiveStatePublisher` keeps the latest power, cadence, heart rate, speed, steering angle and radar threats of
+each device in a :class:`multiprocessing.shared_memory.SharedMemory` block, updated from the service callbacks. Other
+processes, e.g. a dashboard, a recorder or a game engine, open the block by name with a :class:`LiveStateReader` and
+read the state directly from shared memory.
+
+Layout
+======
+All values are little endian. The block starts with a 16 byte header::
+
+    magic b'PCLS' | version u16 | depth u16 | slots u32 | slot size u32
+
+followed by `slots` device slots. Each slot is a 40 byte header, holding the device name as 32 bytes of NUL padded
+UTF-8 and the number of states written as a u64, followed by a ring of `depth` 64 byte entries::
+
+    sequence u64 | timestamp_ns i64 | power f32 | cadence f32 | heart_rate f32 | speed f32 | steering_angle f32 |
+    threat count u8 | 3 padding bytes | 8 threats of (threat_id u8, speed u8, distance u8)
+
+Unknown values are NaN. Each update writes the next entry of the ring and then the count of states written.
+
+Consistent reads
+================
+Each entry is guarded by a seqlock. Its sequence number is odd while the entry is being written and ``2 * n`` once
+the n-th state of the device has been written to it. A reader reads the sequence number, the entry and the sequence
+number again, and retries if they differ or are odd, so it never sees a half written state and never blocks the
+writer. There must be only one writing process per block.
+
+Example
+=======
+In the process connected to the devices:
+
+.. code-block:: python
+
+    publisher = LiveStatePublisher('studio-live', devices=32)
+    publisher.attach(FitnessMachineService(trainer_client), 'trainer-1')
+    publisher.attach(HeartRateService(hr_client), 'trainer-1')
+    publisher.attach(RearViewRadarService(radar_client), 'radar-1')
+
+In a dashboard process:
+
+.. code-block:: python
+
+    reader = LiveStateReader('studio-live')
+    state = reader.read('trainer-1')
+    if state is not None:
+        print(state.power, state.cadence, state.heart_rate)
+"""
+import math
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from pycycling.notifications import TimestampedRecord
+from pycycling.rear_view_radar import RadarMeasurement
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python 3.7
+    resource_tracker = shared_memory = None
+
+MAGIC = b'PCLS'
+VERSION = 1
+MAX_THREATS = 8
+NAME_SIZE = 32
+
+_HEADER = struct.Struct('<4sHHII')
+_SLOT_HEADER = struct.Struct(f'<{NAME_SIZE}sQ')
+_COUNT = struct.Struct('<Q')
+_ENTRY = struct.Struct(f'<QqfffffB3x{3 * MAX_THREATS}B')
+_SEQUENCE = struct.Struct('<Q')
+_VALUES = struct.Struct(f'<qfffffB3x{3 * MAX_THREATS}B')
+
+_NAN = float('nan')
+_NO_THREATS = (0,) * (3 * MAX_THREATS)
+
+_attach_lock = threading.Lock()
+
+FIELDS = ('power', 'cadence', 'heart_rate', 'speed', 'steering_angle')
+
+LiveState = namedtuple('LiveState', ['device', 'sequence', 'timestamp_ns', 'power', 'cadence', 'heart_rate', 'speed',
+                                     'steering_angle', 'threats'])
+
+
+def _optional(value):
+    return _NAN if value is None else value
+
+
+def _indoor_bike_data_fields(data):
+    return (('power', data.instant_power), ('cadence', data.instant_cadence), ('speed', data.instant_speed),
+            ('heart_rate', data.heart_rate))
+
+
+def _general_fe_data_fields(data):
+    return (('speed', None if data.speed is None else data.speed * 3.6), ('heart_rate', data.heart_rate))
+
+
+# Characteristic: function returning the (field, value) pairs of a record. Speeds are in km/h
+_CHARACTERISTIC_FIELDS = {
+    'cycling_power_measurement': lambda measurement: (('power', measurement.instantaneous_power),),
+    'indoor_bike_data': _indoor_bike_data_fields,
+    'hr_measurement': lambda measurement: (('heart_rate', measurement.bpm),),
+    'steering_measurement': lambda angle: (('steering_angle', angle),),
+    'radar_measurement': lambda threats: (('threats', threats),),
+    'general_fe_data_page': _general_fe_data_fields,
+    'specific_trainer_data_page': lambda data: (('power', data.instantaneous_power),
+                                                ('cadence', data.instantaneous_cadence)),
+}
+
+
+def _check_available():
+    if shared_memory is None:
+        raise RuntimeError('live state requires multiprocessing.shared_memory, added in Python 3.8')
+
+
+def _slot_size(depth):
+    return _SLOT_HEADER.size + depth * _ENTRY.size
+
+
+class LiveStatePublisher:
+    """
+    Writes the live state of devices to a new shared memory block.
+
+    :param name: Name of the shared memory block, or `None` for a unique name, available as :attr:`name`
+    :param devices: The number of device slots
+    :param depth: The number of states kept per device
+    :param clock: Function returning the time, in nanoseconds, of updates made without a receive timestamp
+    """
+
+    def __init__(self, name=None, devices=64, depth=8, clock=time.monotonic_ns):
+        _check_available()
+        if devices < 1 or depth < 1 or depth > 0xFFFF:
+            raise ValueError('devices must be at least 1 and depth between 1 and 65535')
+        self._depth = depth
+        self._slot_count = devices
+        self._slot_size = _slot_size(depth)
+        self._clock = clock
+        self._memory = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=_HEADER.size + devices * self._slot_size)
+        self._buffer = self._memory.buf
+        self._buffer[:_HEADER.size + devices * self._slot_size] = bytes(_HEADER.size + devices * self._slot_size)
+        _HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, depth, devices, self._slot_size)
+        self._slots = {}
+        self._states = []
+        self._counts = []
+        self._subscriptions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+        self.unlink()
+
+    @property
+    def name(self):
+        """The name by which readers open the shared memory block"""
+        return self._memory.name
+
+    @property
+    def devices(self):
+        """The names of the devices with a slot, in slot order"""
+        return list(self._slots)
+
+    def add_device(self, device):
+        """
+        Give a device a slot, if it does not have one already.
+
+        :return: The slot index
+        """
+        slot = self._slots.get(device)
+        if slot is not None:
+            return slot
+        encoded = device.encode('utf-8')
+        if len(encoded) > NAME_SIZE:
+            raise ValueError(f'device name must be at most {NAME_SIZE} bytes of UTF-8')
+        if len(self._slots) == self._slot_count:
+            raise ValueError(f'all {self._slot_count} device slots are in use')
+        slot = len(self._slots)
+        _SLOT_HEADER.pack_into(self._buffer, self._slot_offset(slot), encoded, 0)
+        self._slots[device] = slot
+        self._states.append({'power': None, 'cadence': None, 'heart_rate': None, 'speed': None,
+                             'steering_angle': None, 'threats': ()})
+        self._counts.append(0)
+        return slot
+
+    def update(self, device, timestamp_ns=None, **fields):
+        """
+        Update some of the fields of a device's state, keeping the others, and publish the new state.
+
+        :param device: The device name. A slot is added for a new device
+        :param timestamp_ns: The :func:`time.monotonic_ns` time of the update. Defaults to the current time
+        :param fields: New values of any of :data:`FIELDS`, or ``threats``: a sequence of
+            :obj:`~pycycling.rear_view_radar.RadarMeasurement`, of which the first :data:`MAX_THREATS` are kept
+        """
+        slot = self._slots.get(device)
+        if slot is None:
+            slot = self.add_device(device)
+        state = self._states[slot]
+        for field, value in fields.items():
+            if field not in state:
+                raise ValueError(f'{field} is not one of {", ".join(state)}')
+            state[field] = value
+        self._write(slot, self._clock() if timestamp_ns is None else timestamp_ns)
+
+    def attach(self, service, device=None):
+        """
+        Publish the records of a service, by subscribing to each of its characteristics which carries live state.
+
+        :param service: A service object, e.g. a :class:`~pycycling.heart_rate_service.HeartRateService`
+        :param device: The device name. Defaults to the address of the service's client. Services of different
+            devices, e.g. a trainer and a heart rate strap, may share a name to publish one combined state
+        :return: The list of :class:`~pycycling.notifications.Subscription` made
+        """
+        if device is None:
+            device = getattr(service._client, 'address', None)  # pylint: disable=protected-access
+            if device is None:
+                raise ValueError('device must be given for a client without an address')
+        slot = self.add_device(device)
+        subscriptions = []
+        for characteristic in service.characteristics:
+            fields = _CHARACTERISTIC_FIELDS.get(characteristic)
+            if fields is not None:
+                subscriptions.append(service.subscribe(characteristic, self._handler(slot, fields)))
+        self._subscriptions.extend(subscriptions)
+        return subscriptions
+
+    def close(self):
+        """Remove the subscriptions made by :meth:`attach` and close this process's view of the shared memory"""
+        for subscription in self._subscriptions:
+            subscription.unsubscribe()
+        self._subscriptions = []
+        self._buffer = None
+        self._memory.close()
+
+    def unlink(self):
+        """Destroy the shared memory block, once readers no longer need it"""
+        self._memory.unlink()
+
+    def _handler(self, slot, fields):
+        state = self._states[slot]
+        write = self._write
+        clock = self._clock
+
+        def handle(record):
+            if isinstance(record, TimestampedRecord):
+                record, timestamp_ns = record
+            else:
+                timestamp_ns = clock()
+            for field, value in fields(record):
+                state[field] = value
+            write(slot, timestamp_ns)
+
+        return handle
+
+    def _slot_offset(self, slot):
+        return _HEADER.size + slot * self._slot_size
+
+    def _write(self, slot, timestamp_ns):
+        state = self._states[slot]
+        threats = _NO_THREATS
+        threat_count = 0
+        if state['threats']:
+            threat_count = min(len(state['threats']), MAX_THREATS)
+            threats = [0] * (3 * MAX_THREATS)
+            for index, threat in enumerate(state['threats'][:MAX_THREATS]):
+                threats[3 * index:3 * index + 3] = (threat[0] & 0xFF, threat[1] & 0xFF, threat[2] & 0xFF)
+
+        count = self._counts[slot] + 1
+        slot_offset = self._slot_offset(slot)
+        entry_offset = slot_offset + _SLOT_HEADER.size + ((count - 1) % self._depth) * _ENTRY.size
+        buffer = self._buffer
+        _SEQUENCE.pack_into(buffer, entry_offset, 2 * count - 1)
+        _VALUES.pack_into(buffer, entry_offset + _SEQUENCE.size, timestamp_ns, _optional(state['power']),
+                          _optional(state['cadence']), _optional(state['heart_rate']), _optional(state['speed']),
+                          _optional(state['steering_angle']), threat_count, *threats)
+        _SEQUENCE.pack_into(buffer, entry_offset, 2 * count)
+        _COUNT.pack_into(buffer, slot_offset + NAME_SIZE, count)
+        self._counts[slot] = count
+
+
+class LiveStateReader:
+    """
+    Reads live device state from a shared memory block written by a :class:`LiveStatePublisher`, usually in another
+    process.
+
+    :param name: Name of the shared memory block
+    :param max_retries: How many times a read is retried while the entry is being rewritten
+    """
+
+    def __init__(self, name, max_retries=100):
+        _check_available()
+        self._memory = _attach(name)
+        self._buffer = self._memory.buf
+        magic, version, depth, slot_count, slot_size = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION or slot_size != _slot_size(depth):
+            self._memory.close()
+            raise ValueError(f'{name} is not a version {VERSION} live state block')
+        self._depth = depth
+        self._slot_count = slot_count
+        self._slot_size = slot_size
+        self._max_retries = max_retries
+        self._slots = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    @property
+    def depth(self):
+        """The number of states kept per device"""
+        return self._depth
+
+    def devices(self):
+        """Returns the names of the devices with a slot, in slot order"""
+        self._refresh_slots()
+        return list(self._slots)
+
+    def read(self, device):
+        """
+        Returns the latest :obj:`LiveState` of a device, or `None` if the device has no state yet.
+
+        :raises TimeoutError: If the entry was being rewritten on every attempt
+        """
+        slot = self._slot(device)
+        if slot is None:
+            return None
+        slot_offset = _HEADER.size + slot * self._slot_size
+        for _ in range(self._max_retries):
+            [count] = _COUNT.unpack_from(self._buffer, slot_offset + NAME_SIZE)
+            if count == 0:
+                return None
+            state = self._read_entry(device, slot_offset, count)
+            if state is not None:
+                return state
+        raise TimeoutError(f'no consistent state of {device} after {self._max_retries} attempts')
+
+    def read_all(self):
+        """Returns a :obj:`dict` of the latest :obj:`LiveState` of every device with a state"""
+        states = {}
+        for device in self.devices():
+            state = self.read(device)
+            if state is not None:
+                states[device] = state
+        return states
+
+    def history(self, device):
+        """Returns the states of a device still in its ring, oldest first. States being overwritten are skipped"""
+        slot = self._slot(device)
+        if slot is None:
+            return []
+        slot_offset = _HEADER.size + slot * self._slot_size
+        [count] = _COUNT.unpack_from(self._buffer, slot_offset + NAME_SIZE)
+        states = []
+        for number in range(max(count - self._depth + 1, 1), count + 1):
+            state = self._read_entry(device, slot_offset, number)
+            if state is not None:
+                states.append(state)
+        return states
+
+    def close(self):
+        self._buffer = None
+        self._memory.close()
+
+    def _read_entry(self, device, slot_offset, number):
+        """Returns the number-th state of a device, or `None` if its entry no longer or does not yet hold it"""
+        buffer = self._buffer
+        entry_offset = slot_offset + _SLOT_HEADER.size + ((number - 1) % self._depth) * _ENTRY.size
+        values = _ENTRY.unpack_from(buffer, entry_offset)
+        [sequence] = _SEQUENCE.unpack_from(buffer, entry_offset)
+        if values[0] != 2 * number or sequence != values[0]:
+            return None
+        threat_count = values[7]
+        threats = tuple(RadarMeasurement(values[8 + 3 * index], values[9 + 3 * index], values[10 + 3 * index])
+                        for index in range(threat_count))
+        return LiveState(device, number, values[1], *(None if math.isnan(value) else value for value in values[2:7]),
+                         threats)
+
+    def _slot(self, device):
+        slot = self._slots.get(device)
+        if slot is None:
+            self._refresh_slots()
+            slot = self._slots.get(device)
+        return slot
+
+    def _refresh_slots(self):
+        for slot in range(len(self._slots), self._slot_count):
+            name, _ = _SLOT_HEADER.unpack_from(self._buffer, _HEADER.size + slot * self._slot_size)
+            name = name.rstrip(b'\0')
+            if not name:
+                break
+            self._slots[name.decode('utf-8')] = slot
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        # track is new in Python 3.13, which pylint does not know of when run on an older version
+        return shared_memory.SharedMemory(name=name, track=False)  # pylint: disable=unexpected-keyword-arg
+    # Before Python 3.13, attaching registers the block with the resource tracker, which unlinks it when this process
+    # exits if it has a tracker of its own, or forgets the creator's registration if the tracker is shared
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
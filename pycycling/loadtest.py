@@ -0,0 +1,262 @@
+"""
+Load test of the notification path, using simulated devices in place of Bluetooth hardware.
+
+The load test connects the real service classes to simulated devices from :mod:`pycycling.sim`, adds subscribers to
+every device and measures, after a warm-up:
+
+* the notifications delivered per second, against the rate the devices were asked for, counted by the simulated
+  devices so that they do not depend on the subscribers,
+* the 50th and 99th percentile latency from a notification arriving to its callbacks returning,
+* the CPU time and resident memory used per device,
+* the lag of the event loop, sampled by a probe task.
+
+With ``--ramp`` the test is repeated with twice as many devices each step until the event loop lags by more than
+``--max-lag`` at the 99th percentile or cannot keep up with the notification rate, giving the number of devices a host
+can handle. Results are printed as JSON.
+
+Example
+=======
+.. code-block:: console
+
+    $ python -m pycycling.loadtest --devices 50 --rate 4 --subscribers 3 --duration 20
+    $ python -m pycycling.loadtest --devices 25 --rate 4 --ramp --max-devices 3200 --output capacity.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from pycycling.cycling_power_service import CyclingPowerService
+from pycycling.cycling_speed_cadence_service import CyclingSpeedCadenceService
+from pycycling.fitness_machine_service import FitnessMachineService
+from pycycling.heart_rate_service import HeartRateService
+from pycycling.latency import LatencyHistogram
+from pycycling.sim import Rider, SimulatedHeartRateMonitor, SimulatedPowerMeter, SimulatedSpeedCadenceSensor, \
+    SimulatedTrainer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+async def _enable_trainer(service):
+    await service.enable_indoor_bike_data_notify()
+    await service.enable_control_point_indicate()
+    await service.request_control()
+    await service.set_target_power(200)
+
+
+async def _enable_power_meter(service):
+    await service.enable_cycling_power_measurement_notifications()
+
+
+async def _enable_heart_rate(service):
+    await service.enable_hr_measurement_notifications()
+
+
+async def _enable_speed_cadence(service):
+    await service.enable_csc_measurement_notifications()
+
+
+# Device type: (simulated client, service, notifying characteristic, coroutine enabling notifications)
+DEVICE_TYPES = {
+    'trainer': (SimulatedTrainer, FitnessMachineService, 'indoor_bike_data', _enable_trainer),
+    'power': (SimulatedPowerMeter, CyclingPowerService, 'cycling_power_measurement', _enable_power_meter),
+    'hr': (SimulatedHeartRateMonitor, HeartRateService, 'hr_measurement', _enable_heart_rate),
+    'csc': (SimulatedSpeedCadenceSensor, CyclingSpeedCadenceService, 'csc_measurement', _enable_speed_cadence),
+}
+
+
+def _rss_bytes():
+    """Returns the current resident set size, or `None` if it cannot be found"""
+    try:
+        with open('/proc/self/statm', encoding='ascii') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # Only the peak is available; ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _nanoseconds_to_milliseconds(value):
+    return None if value is None else value / 1e6
+
+
+async def _probe_loop_lag(histogram, interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        histogram.record(max(loop.time() - expected, 0) * 1e9)
+
+
+async def run_load_test(*, devices=10, rate=4.0, subscribers=1, duration=10.0, warmup=2.0, device_type='trainer',
+                        lag_probe_interval=0.01, seed=None):
+    """
+    Run one load test.
+
+    :param devices: Number of simulated devices
+    :param rate: Notifications per second of each device
+    :param subscribers: Subscribers added to the notifying characteristic of each device
+    :param duration: Length of the measurement, in seconds, after the warm-up
+    :param warmup: Time, in seconds, for which the devices run before measuring
+    :param device_type: One of the keys of :data:`DEVICE_TYPES`, or ``'mixed'`` to cycle through them
+    :param lag_probe_interval: How often, in seconds, the event loop lag is sampled
+    :param seed: Seed for the random variation of the simulated riders
+    :return: A :obj:`dict` of results, suitable for JSON
+    """
+    if device_type == 'mixed':
+        types = list(DEVICE_TYPES)
+    elif device_type in DEVICE_TYPES:
+        types = [device_type]
+    else:
+        raise ValueError(f'device_type must be mixed or one of {", ".join(DEVICE_TYPES)}')
+
+    rng = random.Random(seed)
+    rss_before = _rss_bytes()
+    clients = []
+    services = []
+    for index in range(devices):
+        client_type, service_type, characteristic, enable = DEVICE_TYPES[types[index % len(types)]]
+        client = client_type(f'sim-{index}', Rider(power=rng.uniform(100, 300), rng=rng), rate=rate)
+        await client.connect()
+        service = service_type(client)
+        for _ in range(subscribers):
+            service.subscribe(characteristic, lambda record: None)
+        service.enable_latency_histograms()
+        # Start the devices spread over one notification interval, as real devices are not in step
+        await asyncio.sleep(rng.uniform(0, 1 / rate / max(devices, 1)))
+        await enable(service)
+        clients.append(client)
+        services.append(service)
+
+    lag = LatencyHistogram()
+    probe = asyncio.get_running_loop().create_task(_probe_loop_lag(lag, lag_probe_interval))
+    try:
+        await asyncio.sleep(warmup)
+        for service in services:
+            for histogram in service.get_latency_histograms().values():
+                histogram.reset()
+        lag.reset()
+        sent_before = sum(client.notifications_sent for client in clients)
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await asyncio.sleep(duration)
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        notifications = sum(client.notifications_sent for client in clients) - sent_before
+    finally:
+        probe.cancel()
+        for client in clients:
+            await client.disconnect()
+
+    latency = LatencyHistogram()
+    for service in services:
+        for histogram in service.get_latency_histograms().values():
+            latency.merge(histogram)
+    rss_after = _rss_bytes()
+
+    notifications_per_second = notifications / elapsed
+    expected_per_second = devices * rate
+    return {
+        'devices': devices,
+        'device_type': device_type,
+        'rate': rate,
+        'subscribers': subscribers,
+        'duration': elapsed,
+        'notifications': notifications,
+        'notifications_per_second': notifications_per_second,
+        'expected_notifications_per_second': expected_per_second,
+        'delivery_ratio': notifications_per_second / expected_per_second if expected_per_second else None,
+        'latency_ms': {
+            'p50': _nanoseconds_to_milliseconds(latency.percentile(50)),
+            'p99': _nanoseconds_to_milliseconds(latency.percentile(99)),
+            'max': _nanoseconds_to_milliseconds(latency.max),
+        },
+        'loop_lag_ms': {
+            'p50': _nanoseconds_to_milliseconds(lag.percentile(50)),
+            'p99': _nanoseconds_to_milliseconds(lag.percentile(99)),
+            'max': _nanoseconds_to_milliseconds(lag.max),
+        },
+        'cpu_percent': 100 * cpu / elapsed,
+        'cpu_percent_per_device': 100 * cpu / elapsed / devices if devices else None,
+        'rss_bytes': rss_after,
+        'rss_bytes_per_device': (rss_after - rss_before) / devices
+        if devices and rss_after is not None and rss_before is not None else None,
+    }
+
+
+def _saturated(result, max_lag, min_delivery_ratio):
+    lag_p99 = result['loop_lag_ms']['p99']
+    return ((lag_p99 is not None and lag_p99 > max_lag)
+            or (result['delivery_ratio'] is not None and result['delivery_ratio'] < min_delivery_ratio))
+
+
+async def run_ramp(devices=10, max_devices=10000, max_lag=20.0, min_delivery_ratio=0.95, **kwargs):
+    """
+    Run load tests with twice as many devices each step until the event loop saturates.
+
+    :param devices: Number of devices in the first step
+    :param max_devices: The most devices tested
+    :param max_lag: 99th percentile event loop lag, in milliseconds, beyond which the loop is saturated
+    :param min_delivery_ratio: Fraction of the requested notification rate below which the loop is saturated
+    :param kwargs: Passed to :func:`run_load_test`
+    :return: A :obj:`dict` holding the results of every step and the largest number of devices handled
+    """
+    steps = []
+    capacity = None
+    while devices <= max_devices:
+        result = await run_load_test(devices=devices, **kwargs)
+        steps.append(result)
+        if _saturated(result, max_lag, min_delivery_ratio):
+            return {'steps': steps, 'capacity': capacity, 'saturated_at': devices}
+        capacity = devices
+        devices *= 2
+    return {'steps': steps, 'capacity': capacity, 'saturated_at': None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pycycling.loadtest',
+                                     description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('--devices', type=int, default=10, help='number of simulated devices')
+    parser.add_argument('--rate', type=float, default=4.0, help='notifications per second of each device')
+    parser.add_argument('--subscribers', type=int, default=1, help='subscribers per device')
+    parser.add_argument('--duration', type=float, default=10.0, help='length of each measurement, in seconds')
+    parser.add_argument('--warmup', type=float, default=2.0, help='warm-up before each measurement, in seconds')
+    parser.add_argument('--device-type', default='trainer', choices=['mixed'] + list(DEVICE_TYPES),
+                        help='type of simulated device')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the simulated riders')
+    parser.add_argument('--ramp', action='store_true',
+                        help='double the number of devices each step until the event loop saturates')
+    parser.add_argument('--max-devices', type=int, default=10000, help='the most devices tested with --ramp')
+    parser.add_argument('--max-lag', type=float, default=20.0,
+                        help='p99 event loop lag, in milliseconds, at which --ramp stops')
+    parser.add_argument('--output', default=None, help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    options = {'rate': args.rate, 'subscribers': args.subscribers, 'duration': args.duration, 'warmup': args.warmup,
+               'device_type': args.device_type, 'seed': args.seed}
+    if args.ramp:
+        report = asyncio.run(run_ramp(devices=args.devices, max_devices=args.max_devices, max_lag=args.max_lag,
+                                      **options))
+    else:
+        report = asyncio.run(run_load_test(devices=args.devices, **options))
+
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
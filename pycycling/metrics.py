@@ -0,0 +1,217 @@
+"""
+Per-device, per-characteristic notification metrics with a Prometheus text format exporter.
+
+Every notifying characteristic of every service object registers with a shared :class:`MetricsRegistry`. Collection is
+off by default, in which case the notification path only checks a single flag. Once enabled, the registry counts for
+each device and characteristic:
+
+* notifications and payload bytes received (also reported per second),
+* time spent parsing payloads and in user callbacks,
+* parse errors,
+* notifications dropped because no callback was set,
+* the time since the last notification was received.
+
+Example
+=======
+This example enables metrics collection and serves them for Prometheus on http://127.0.0.1:9464/metrics.
+
+.. code-block:: python
+
+    from pycycling import metrics
+
+    metrics.default_registry.enable()
+    server = metrics.start_http_server(9464)
+    ...
+    server.shutdown()
+"""
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_NANOSECONDS = 1e9
+
+
+class CharacteristicMetrics:
+    """
+    The counters collected for one characteristic of one device.
+    """
+    __slots__ = ('device', 'service', 'characteristic', 'notifications', 'bytes', 'parse_ns', 'callback_ns',
+                 'parse_errors', 'dropped', 'last_seen_ns', 'notification_rate', 'byte_rate', '_rate_state')
+
+    def __init__(self, device, service, characteristic):
+        self.device = device
+        self.service = service
+        self.characteristic = characteristic
+        self.notifications = 0
+        self.bytes = 0
+        self.parse_ns = 0
+        self.callback_ns = 0
+        self.parse_errors = 0
+        self.dropped = 0
+        self.last_seen_ns = None
+        self.notification_rate = 0.0
+        self.byte_rate = 0.0
+        self._rate_state = None
+
+    def update_rates(self, now_ns, min_interval_ns):
+        """Recompute the per-second rates if at least `min_interval_ns` has passed since they were last computed"""
+        if self._rate_state is None:
+            self._rate_state = (now_ns, self.notifications, self.bytes)
+            return
+        then_ns, notifications, byte_count = self._rate_state
+        elapsed_ns = now_ns - then_ns
+        if elapsed_ns < min_interval_ns:
+            return
+        self.notification_rate = (self.notifications - notifications) * _NANOSECONDS / elapsed_ns
+        self.byte_rate = (self.bytes - byte_count) * _NANOSECONDS / elapsed_ns
+        self._rate_state = (now_ns, self.notifications, self.bytes)
+
+
+class MetricsRegistry:
+    """
+    Collects :class:`CharacteristicMetrics` for every registered notification channel.
+
+    :param rate_interval: The shortest interval, in seconds, over which the per-second rates are computed
+    """
+
+    def __init__(self, rate_interval=1.0):
+        self.enabled = False
+        self._rate_interval_ns = int(rate_interval * _NANOSECONDS)
+        self._metrics = {}
+        self._channels = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def register_channel(self, channel):
+        """
+        Register a notification channel. Channels are held weakly, so registering does not keep services alive.
+
+        :param channel: A :class:`~pycycling.notifications.NotificationChannel`
+        """
+        self._channels.add(channel)
+        if self.enabled:
+            channel.set_metrics(self.metrics_for(channel))
+
+    def enable(self):
+        """Start collecting metrics for all current and future channels"""
+        self.enabled = True
+        for channel in list(self._channels):
+            channel.set_metrics(self.metrics_for(channel))
+
+    def disable(self):
+        """Stop collecting metrics. Metrics collected so far are kept"""
+        self.enabled = False
+        for channel in list(self._channels):
+            channel.set_metrics(None)
+
+    def reset(self):
+        """Discard all metrics collected so far"""
+        with self._lock:
+            self._metrics = {}
+        if self.enabled:
+            self.enable()
+
+    def collect(self):
+        """
+        Returns a list of the metrics for every device and characteristic seen while enabled, updating the
+        per-second rates.
+        """
+        now_ns = time.monotonic_ns()
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for characteristic_metrics in metrics:
+            characteristic_metrics.update_rates(now_ns, self._rate_interval_ns)
+        return metrics
+
+    def metrics_for(self, channel):
+        """Returns the :class:`CharacteristicMetrics` of a notification channel, creating them on first use"""
+        key = (channel.device, channel.service, channel.name)
+        with self._lock:
+            characteristic_metrics = self._metrics.get(key)
+            if characteristic_metrics is None:
+                characteristic_metrics = CharacteristicMetrics(*key)
+                self._metrics[key] = characteristic_metrics
+        return characteristic_metrics
+
+
+default_registry = MetricsRegistry()
+
+_METRIC_DEFINITIONS = [
+    ('pycycling_notifications_total', 'counter', 'Notifications received',
+     lambda m, now: m.notifications),
+    ('pycycling_notification_bytes_total', 'counter', 'Notification payload bytes received',
+     lambda m, now: m.bytes),
+    ('pycycling_notifications_per_second', 'gauge', 'Notifications received per second',
+     lambda m, now: m.notification_rate),
+    ('pycycling_notification_bytes_per_second', 'gauge', 'Notification payload bytes received per second',
+     lambda m, now: m.byte_rate),
+    ('pycycling_parse_seconds_total', 'counter', 'Time spent parsing notification payloads',
+     lambda m, now: m.parse_ns / _NANOSECONDS),
+    ('pycycling_callback_seconds_total', 'counter', 'Time spent in notification callbacks',
+     lambda m, now: m.callback_ns / _NANOSECONDS),
+    ('pycycling_parse_errors_total', 'counter', 'Notification payloads which failed to parse',
+     lambda m, now: m.parse_errors),
+    ('pycycling_dropped_notifications_total', 'counter', 'Notifications received with no callback set',
+     lambda m, now: m.dropped),
+    ('pycycling_last_seen_age_seconds', 'gauge', 'Time since the last notification was received',
+     lambda m, now: float('nan') if m.last_seen_ns is None else (now - m.last_seen_ns) / _NANOSECONDS),
+]
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def generate_prometheus_text(registry=default_registry):
+    """
+    Render the metrics of a registry in the Prometheus text exposition format.
+
+    :param registry: The :class:`MetricsRegistry` to export
+    :return: A :obj:`str` in Prometheus text format (version 0.0.4)
+    """
+    metrics = registry.collect()
+    now_ns = time.monotonic_ns()
+    labels = [
+        f'device="{_escape_label_value(m.device)}",service="{_escape_label_value(m.service)}",'
+        f'characteristic="{_escape_label_value(m.characteristic)}"'
+        for m in metrics
+    ]
+
+    lines = []
+    for name, metric_type, description, value_of in _METRIC_DEFINITIONS:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for characteristic_metrics, label in zip(metrics, labels):
+            lines.append(f'{name}{{{label}}} {value_of(characteristic_metrics, now_ns)}')
+    return '\n'.join(lines) + '\n'
+
+
+def start_http_server(port=9464, address='127.0.0.1', registry=default_registry):
+    """
+    Serve the metrics of a registry in Prometheus text format from a background thread.
+
+    :param port: The TCP port to listen on
+    :param address: The address to listen on. Defaults to the local host only
+    :param registry: The :class:`MetricsRegistry` to serve
+    :return: The :class:`http.server.ThreadingHTTPServer`. Call its `shutdown` method to stop serving
+    """
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = generate_prometheus_text(registry).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = ThreadingHTTPServer((address, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='pycycling-metrics', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,707 @@
+"""
+Plumbing shared by the service classes for delivering characteristic notifications to user callbacks.
+
+Each notifying characteristic of a service is represented by a :class:`NotificationChannel`, which parses the raw
+notification payload and passes the resulting record to the callback set on the service. Channels can optionally
+attach receive timestamps to records and measure the latency from a notification arriving to its callback completing.
+
+Receive timestamps
+==================
+By default callbacks receive the parsed record only. After calling
+:func:`enable_receive_timestamps <pycycling.notifications.NotifyingService.enable_receive_timestamps>` on a service,
+callbacks instead receive a :obj:`TimestampedRecord` holding the record and the :func:`time.monotonic_ns` time at which
+the notification arrived.
+
+Latency histograms
+==================
+:func:`enable_latency_histograms <pycycling.notifications.NotifyingService.enable_latency_histograms>` records the
+time from a notification arriving to its callback returning in a :class:`~pycycling.latency.LatencyHistogram` per
+characteristic. For example:
+
+.. code-block:: python
+
+    trainer = FitnessMachineService(client)
+    trainer.enable_latency_histograms()
+    ...
+    for name, histogram in trainer.get_latency_histograms().items():
+        print(name, histogram.percentile(50), histogram.percentile(99))
+
+Multiple subscribers
+====================
+The ``set_*_handler`` methods of a service replace a single callback. Any number of further callbacks can be added
+with :func:`subscribe <pycycling.notifications.NotifyingService.subscribe>`. Each notification is parsed once and the
+same record is passed to every subscriber, so records must not be modified by subscribers. Each subscriber can have a
+predicate which filters the records it receives, and the returned :class:`Subscription` removes it again:
+
+.. code-block:: python
+
+    subscription = trainer.subscribe('indoor_bike_data', recorder.write)
+    dashboard = trainer.subscribe('indoor_bike_data', show_power, lambda data: data.instant_power is not None)
+    ...
+    subscription.unsubscribe()
+
+An exception raised by one of several subscribers is logged and does not prevent delivery to the others.
+
+Routers and middleware
+======================
+All the services of one Bluetooth client share a :class:`NotificationRouter`, see :func:`router_for`, which enables
+and disables notifications by characteristic UUID and holds the channels of every service. :class:`Middleware` added
+to the router applies to every channel of the client, whichever service it belongs to:
+
+.. code-block:: python
+
+    recording = []
+    router = router_for(client)
+    router.add_middleware(Dedupe())
+    router.add_middleware(Recording(recording.append))
+
+    trainer = FitnessMachineService(client)
+    heart_rate = HeartRateService(client)
+
+Middleware can act on raw payloads, see :meth:`Middleware.wrap_payload`, and on parsed records, see
+:meth:`Middleware.wrap_record`. Receive timestamps, latency histograms, metrics and profiling hooks are themselves
+middleware. Whenever the middleware of a channel changes, the channel composes it into a single handler, so a
+notification costs one call to that handler however many features are enabled, and a channel without middleware only
+parses the payload and calls the callback.
+
+Metrics
+=======
+Every channel also registers with :data:`pycycling.metrics.default_registry`, which collects per-device counters once
+enabled. See :mod:`pycycling.metrics`.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from collections import namedtuple
+
+from pycycling.latency import LatencyHistogram
+from pycycling.metrics import default_registry
+
+logger = logging.getLogger(__name__)
+
+TimestampedRecord = namedtuple('TimestampedRecord', ['record', 'received_ns'])
+
+RecordedNotification = namedtuple('RecordedNotification',
+                                  ['device', 'service', 'characteristic', 'received_ns', 'data'])
+
+_channels = weakref.WeakSet()
+_profiling_hooks = ()
+_routers = weakref.WeakKeyDictionary()
+
+
+def set_profiling_hooks(hooks):
+    """
+    Install profiling hooks on every current and future notification channel, replacing any installed before. Use
+    :func:`pycycling.profiling.install_hook` rather than calling this directly.
+
+    :param hooks: A sequence of :class:`~pycycling.profiling.ProfilingHook` objects
+    """
+    global _profiling_hooks
+    _profiling_hooks = tuple(hooks)
+    for channel in list(_channels):
+        channel.set_hooks(_profiling_hooks)
+
+
+def get_profiling_hooks():
+    return _profiling_hooks
+
+
+class Subscription:
+    """
+    A callback subscribed to a :class:`NotificationChannel`. Can be used as a context manager, which unsubscribes on
+    exit.
+    """
+    __slots__ = ('channel', 'callback', 'predicate')
+
+    def __init__(self, channel, callback, predicate):
+        self.channel = channel
+        self.callback = callback
+        self.predicate = predicate
+
+    def unsubscribe(self):
+        """Stop delivering records to the callback. Unsubscribing more than once has no effect"""
+        self.channel.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.unsubscribe()
+
+
+class _FanOut:
+    __slots__ = ('subscriptions',)
+
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+
+    def __call__(self, record):
+        for subscription in self.subscriptions:
+            predicate = subscription.predicate
+            if predicate is not None and not predicate(record):
+                continue
+            try:
+                subscription.callback(record)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Exception in %s subscriber %r', subscription.channel.name, subscription.callback)
+
+    def __repr__(self):
+        return f'fan-out to {[subscription.callback for subscription in self.subscriptions]!r}'
+
+
+class Middleware:
+    """
+    Base class for middleware, which wraps the delivery of the notifications of every channel it is applied to.
+
+    Both methods are called once whenever a channel composes its handler, not per notification, and return the
+    function to call in place of the one they are given. Returning the given function unchanged adds no cost.
+
+    While a payload is being handled, :attr:`NotificationChannel.parsed_ns` and
+    :attr:`NotificationChannel.completed_ns` hold the :func:`time.monotonic_ns` times at which it was parsed and at
+    which its callbacks returned, if it got that far.
+    """
+
+    def wrap_payload(self, channel, handler):  # pylint: disable=unused-argument
+        """
+        Wrap the handling of raw payloads.
+
+        :param channel: The :class:`NotificationChannel`
+        :param handler: A function ``handler(data, received_ns)`` which parses the payload ``data`` and delivers the
+            record. ``received_ns`` is the :func:`time.monotonic_ns` time at which the payload arrived
+        :return: The function to call in place of `handler`, taking the same arguments
+        """
+        return handler
+
+    def wrap_record(self, channel, deliver):  # pylint: disable=unused-argument
+        """
+        Wrap the delivery of parsed records, including those published with :meth:`NotificationChannel.publish`.
+
+        :param channel: The :class:`NotificationChannel`
+        :param deliver: A function ``deliver(record, received_ns)`` which passes the record to the callbacks.
+            ``received_ns`` can be `None` for a published record
+        :return: The function to call in place of `deliver`, taking the same arguments
+        """
+        return deliver
+
+
+class ReceiveTimestamps(Middleware):
+    """Pass records to callbacks as a :obj:`TimestampedRecord` holding the time at which their data arrived"""
+
+    def wrap_record(self, channel, deliver):
+        def timestamp(record, received_ns):
+            if received_ns is None:
+                received_ns = time.monotonic_ns()
+            deliver(TimestampedRecord(record=record, received_ns=received_ns), received_ns)
+
+        return timestamp
+
+
+class Dedupe(Middleware):
+    """
+    Drop payloads which repeat the previous payload of the same channel, before they are parsed. Devices often send
+    unchanged data at a fixed rate, e.g. while the rider is stopped.
+
+    :param window: Only drop repeats which arrive within this many seconds of the first copy. `None` drops every
+        repeat however late it is
+    """
+
+    def __init__(self, window=None):
+        self.window_ns = None if window is None else int(window * 1e9)
+        self.dropped = 0
+
+    def wrap_payload(self, channel, handler):
+        window_ns = self.window_ns
+        last = [None, 0]
+
+        def dedupe(data, received_ns):
+            if data == last[0] and (window_ns is None or received_ns - last[1] < window_ns):
+                self.dropped += 1
+                return
+            last[0] = bytes(data)
+            last[1] = received_ns
+            handler(data, received_ns)
+
+        return dedupe
+
+
+def _count_metrics(channel, handler, metrics):
+    def count(data, received_ns):
+        metrics.notifications += 1
+        metrics.bytes += len(data)
+        metrics.last_seen_ns = received_ns
+        if channel.callback is None:
+            metrics.dropped += 1
+            # Middleware further in, e.g. Recording, still sees the payload
+            handler(data, received_ns)
+            return
+
+        channel.parsed_ns = channel.completed_ns = None
+        try:
+            handler(data, received_ns)
+        except Exception:
+            if channel.parsed_ns is None:
+                metrics.parse_errors += 1
+            raise
+        # Nothing to time if the payload was dropped or deferred by other middleware
+        if channel.completed_ns is not None:
+            metrics.parse_ns += channel.parsed_ns - received_ns
+            metrics.callback_ns += channel.completed_ns - channel.parsed_ns
+
+    return count
+
+
+class Metrics(Middleware):
+    """
+    Count the notifications of every channel in a :class:`~pycycling.metrics.MetricsRegistry`. The registry need not
+    be enabled, which is only needed for :data:`~pycycling.metrics.default_registry` to count every channel.
+
+    :param registry: The :class:`~pycycling.metrics.MetricsRegistry` to count in
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def wrap_payload(self, channel, handler):
+        return _count_metrics(channel, handler, self.registry.metrics_for(channel))
+
+
+class Recording(Middleware):
+    """
+    Record every raw payload, e.g. to replay a ride through :meth:`NotificationChannel.deliver` later.
+
+    :param write: Called with a :obj:`RecordedNotification` for each payload, before it is parsed
+    """
+
+    def __init__(self, write):
+        self.write = write
+
+    def wrap_payload(self, channel, handler):
+        write = self.write
+
+        def record(data, received_ns):
+            write(RecordedNotification(channel.device, channel.service, channel.name, received_ns, bytes(data)))
+            handler(data, received_ns)
+
+        return record
+
+
+class Batching(Middleware):
+    """
+    Queue payloads and handle them together in one event loop callback, rather than each as it arrives. A burst of
+    notifications then wakes the consumers of their records once, and the Bluetooth callback returns immediately.
+    Payloads arriving outside a running event loop are handled immediately.
+
+    :param max_delay: The longest time, in seconds, a payload is held before it is handled
+    """
+
+    def __init__(self, max_delay=0.0):
+        self.max_delay = max_delay
+
+    def wrap_payload(self, channel, handler):
+        max_delay = self.max_delay
+        pending = []
+
+        def flush():
+            batch = pending[:]
+            pending.clear()
+            for data, received_ns in batch:
+                try:
+                    handler(data, received_ns)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception('Exception handling a batched %s notification', channel.name)
+
+        def batch(data, received_ns):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                handler(data, received_ns)
+                return
+            pending.append((bytes(data), received_ns))
+            if len(pending) == 1:
+                if max_delay > 0:
+                    loop.call_later(max_delay, flush)
+                else:
+                    loop.call_soon(flush)
+
+        return batch
+
+
+class _ProfilingHooks(Middleware):
+    def __init__(self, hooks):
+        self.hooks = hooks
+
+    def wrap_payload(self, channel, handler):
+        hooks = self.hooks
+
+        def profile(data, received_ns):
+            if channel.callback is None:
+                handler(data, received_ns)
+                return
+            for hook in hooks:
+                hook.before_notification(channel)
+            channel.parsed_ns = channel.completed_ns = None
+            try:
+                handler(data, received_ns)
+            finally:
+                parsed_ns = channel.parsed_ns
+                completed_ns = channel.completed_ns
+                parse_ns = None if parsed_ns is None else parsed_ns - received_ns
+                callback_ns = None if completed_ns is None or parsed_ns is None else completed_ns - parsed_ns
+                for hook in hooks:
+                    hook.after_notification(channel, parse_ns, callback_ns)
+
+        return profile
+
+
+class _LatencyRecording(Middleware):
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def wrap_payload(self, channel, handler):
+        histogram = self.histogram
+
+        def measure(data, received_ns):
+            channel.completed_ns = None
+            handler(data, received_ns)
+            if channel.completed_ns is not None:
+                histogram.record(channel.completed_ns - received_ns)
+
+        return measure
+
+
+class _CountingMetrics(Middleware):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def wrap_payload(self, channel, handler):
+        return _count_metrics(channel, handler, self.metrics)
+
+
+class NotificationRouter:
+    """
+    Routes the notifications of one Bluetooth client, shared by all the services of the client. Use
+    :func:`router_for` rather than creating routers directly.
+
+    :param client: A valid :obj:`bleak.backends.client.BaseBleakClient` object
+    """
+
+    def __init__(self, client):
+        try:
+            self._client_ref = weakref.ref(client)
+        except TypeError:
+            self._client_ref = lambda: client
+        self._routes = {}
+        self._channels = weakref.WeakSet()
+        self.middleware = ()
+
+    @property
+    def client(self):
+        return self._client_ref()
+
+    @property
+    def routes(self):
+        """A :obj:`dict` mapping the UUID of each characteristic with notifications enabled to its handler"""
+        return dict(self._routes)
+
+    @property
+    def channels(self):
+        """The channels of every service of the client"""
+        return list(self._channels)
+
+    def add_channel(self, channel):
+        """Apply the router's middleware to a :class:`NotificationChannel`"""
+        self._channels.add(channel)
+        channel.set_router(self)
+
+    def add_middleware(self, middleware):
+        """
+        Add middleware to every current and future channel of the client. Middleware added later wraps that added
+        earlier, so sees payloads first.
+
+        :param middleware: A :class:`Middleware`
+        """
+        self._set_middleware((middleware,) + self.middleware)
+
+    def remove_middleware(self, middleware):
+        self._set_middleware(tuple(existing for existing in self.middleware if existing is not middleware))
+
+    def _set_middleware(self, middleware):
+        self.middleware = middleware
+        for channel in list(self._channels):
+            channel.set_router(self)
+
+    async def start_notify(self, characteristic_uuid, handler):
+        """
+        Enable notifications of a characteristic.
+
+        :param characteristic_uuid: The characteristic's UUID
+        :param handler: Called with ``(sender, data)`` for each notification, usually
+            :meth:`NotificationChannel.notification_handler`
+        """
+        self._routes[characteristic_uuid] = handler
+        await self.client.start_notify(characteristic_uuid, handler)
+
+    async def stop_notify(self, characteristic_uuid):
+        """Disable notifications of a characteristic"""
+        self._routes.pop(characteristic_uuid, None)
+        await self.client.stop_notify(characteristic_uuid)
+
+
+def router_for(client):
+    """
+    Returns the :class:`NotificationRouter` shared by the services of a client, creating it on first use.
+
+    :param client: A valid :obj:`bleak.backends.client.BaseBleakClient` object. Clients which cannot be weakly
+        referenced, and `None`, get a new router each time
+    """
+    try:
+        router = _routers.get(client)
+    except TypeError:
+        return NotificationRouter(client)
+    if router is None:
+        router = NotificationRouter(client)
+        _routers[client] = router
+    return router
+
+
+class NotificationChannel:
+    """
+    Parses notifications from one characteristic and delivers the records to a callback.
+
+    :param name: Name of the channel, e.g. ``'indoor_bike_data'``
+    :param parser: A function which takes the raw notification payload and returns the parsed record, or `None` if the
+        payload does not complete a record (in which case nothing is delivered)
+    :param device: Label of the device the channel belongs to, used for metrics
+    :param service: Label of the service the channel belongs to, used for metrics
+    """
+
+    def __init__(self, name, parser, device=None, service=None):
+        self.name = name
+        self.parser = parser
+        self.device = device
+        self.service = service
+        self.callback = None
+        self.subscriptions = ()
+        self._handler_subscription = None
+        self.timestamps = False
+        self.latency_histogram = None
+        self.metrics = None
+        self.hooks = _profiling_hooks
+        self.router = None
+        self.middleware = ()
+        self.parsed_ns = None
+        self.completed_ns = None
+        self._instrumented = False
+        self._handle = self._parse_and_call
+        self._deliver = self._call
+        self._compose()
+        _channels.add(self)
+
+    def notification_handler(self, sender, data):  # pylint: disable=unused-argument
+        """A handler suitable for passing to :meth:`bleak.BleakClient.start_notify`"""
+        self._handle(data, None)
+
+    def deliver(self, data, received_ns=None):
+        """
+        Parse a payload and pass the record to the callback.
+
+        :param data: The raw payload
+        :param received_ns: The :func:`time.monotonic_ns` time at which the payload was received. If omitted and
+            timing is enabled, the current time is used
+        """
+        self._handle(data, received_ns)
+
+    def publish(self, record, received_ns=None):
+        """
+        Deliver an already parsed record to the subscribers, e.g. one completed by a timer rather than a payload.
+
+        :param record: The record
+        :param received_ns: The :func:`time.monotonic_ns` time at which the record's data was received, used when
+            receive timestamps are enabled. Defaults to the current time
+        """
+        self._deliver(record, received_ns)
+
+    def set_handler(self, callback):
+        """
+        Replace the callback set by the service's ``set_*_handler`` method, leaving other subscribers in place.
+
+        :param callback: The new callback, or `None` to remove it
+        """
+        if self._handler_subscription is not None:
+            self.unsubscribe(self._handler_subscription)
+            self._handler_subscription = None
+        if callback is not None:
+            self._handler_subscription = self.subscribe(callback)
+
+    def subscribe(self, callback, predicate=None):
+        """
+        Add a callback which receives every record parsed from this channel.
+
+        :param callback: Called with each record
+        :param predicate: If set, the callback only receives records for which `predicate(record)` is true
+        :return: A :class:`Subscription`
+        """
+        subscription = Subscription(self, callback, predicate)
+        self._set_subscriptions(self.subscriptions + (subscription,))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._set_subscriptions(tuple(existing for existing in self.subscriptions if existing is not subscription))
+
+    def _set_subscriptions(self, subscriptions):
+        # The hot path only ever calls self.callback, so work out the cheapest callable for the subscribers now.
+        self.subscriptions = subscriptions
+        if not subscriptions:
+            self.callback = None
+        elif len(subscriptions) == 1 and subscriptions[0].predicate is None:
+            self.callback = subscriptions[0].callback
+        else:
+            self.callback = _FanOut(subscriptions)
+
+    def set_timing(self, timestamps, latency_histogram):
+        self.timestamps = timestamps
+        self.latency_histogram = latency_histogram
+        self._compose()
+
+    def set_metrics(self, characteristic_metrics):
+        self.metrics = characteristic_metrics
+        self._compose()
+
+    def set_hooks(self, hooks):
+        self.hooks = hooks
+        self._compose()
+
+    def set_router(self, router):
+        self.router = router
+        self._compose()
+
+    def _compose(self):
+        # Middleware is listed outermost first: metrics count every payload, the router's middleware sees payloads
+        # before they are timed, and receive timestamps are attached last so that other middleware sees bare records.
+        middleware = []
+        if self.metrics is not None:
+            middleware.append(_CountingMetrics(self.metrics))
+        if self.router is not None:
+            middleware.extend(self.router.middleware)
+        if self.hooks:
+            middleware.append(_ProfilingHooks(self.hooks))
+        if self.latency_histogram is not None:
+            middleware.append(_LatencyRecording(self.latency_histogram))
+        if self.timestamps and not any(isinstance(existing, ReceiveTimestamps) for existing in middleware):
+            middleware.append(ReceiveTimestamps())
+        self.middleware = tuple(middleware)
+        self._instrumented = bool(middleware)
+
+        deliver = self._call
+        for existing in reversed(middleware):
+            deliver = existing.wrap_record(self, deliver)
+        self._deliver = deliver
+        if not middleware:
+            self._handle = self._parse_and_call
+            return
+
+        handler = self._parse_and_deliver
+        for existing in reversed(middleware):
+            handler = existing.wrap_payload(self, handler)
+
+        def handle(data, received_ns):
+            handler(data, time.monotonic_ns() if received_ns is None else received_ns)
+
+        self._handle = handle
+
+    def _parse_and_call(self, data, received_ns):  # pylint: disable=unused-argument
+        callback = self.callback
+        if callback is not None:
+            record = self.parser(data)
+            if record is not None:
+                callback(record)
+
+    def _parse_and_deliver(self, data, received_ns):
+        if self.callback is None:
+            return
+        record = self.parser(data)
+        self.parsed_ns = time.monotonic_ns()
+        if record is not None:
+            self._deliver(record, received_ns)
+        self.completed_ns = time.monotonic_ns()
+
+    def _call(self, record, received_ns):  # pylint: disable=unused-argument
+        callback = self.callback
+        if callback is not None:
+            callback(record)
+
+
+class NotifyingService:
+    """
+    Base class for the service classes which deliver characteristic notifications to callbacks.
+
+    :param client: A valid :obj:`bleak.backends.client.BaseBleakClient` object
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._router = router_for(client)
+        self._channels = {}
+
+    def _add_channel(self, name, parser):
+        channel = NotificationChannel(name, parser, device=getattr(self._client, 'address', None),
+                                      service=type(self).__name__)
+        self._channels[name] = channel
+        self._router.add_channel(channel)
+        default_registry.register_channel(channel)
+        return channel
+
+    @property
+    def router(self):
+        """The :class:`NotificationRouter` shared by the services of this service's client"""
+        return self._router
+
+    def subscribe(self, characteristic, callback, predicate=None):
+        """
+        Add a subscriber to a characteristic's records, in addition to the callback set with its ``set_*_handler``
+        method.
+
+        :param characteristic: Name of the characteristic, e.g. ``'indoor_bike_data'``. See :attr:`characteristics`
+        :param callback: Called with each record
+        :param predicate: If set, the callback only receives records for which `predicate(record)` is true
+        :return: A :class:`Subscription` which can be used to unsubscribe
+        """
+        channel = self._channels.get(characteristic)
+        if channel is None:
+            raise ValueError(f'{characteristic} is not one of {", ".join(self._channels)}')
+        return channel.subscribe(callback, predicate)
+
+    @property
+    def characteristics(self):
+        """The names of the characteristics which can be subscribed to"""
+        return list(self._channels)
+
+    def enable_receive_timestamps(self, enabled=True):
+        """
+        Attach receive timestamps to the records passed to this service's callbacks.
+
+        :param enabled: When `True`, callbacks receive a :obj:`TimestampedRecord` rather than the bare record
+        """
+        for channel in self._channels.values():
+            channel.set_timing(enabled, channel.latency_histogram)
+
+    def enable_latency_histograms(self, enabled=True):
+        """
+        Record the latency from each notification arriving to its callback returning.
+
+        :param enabled: When `True`, a new :class:`~pycycling.latency.LatencyHistogram` is started for each
+            characteristic. When `False`, latency is no longer recorded
+        """
+        for channel in self._channels.values():
+            channel.set_timing(channel.timestamps, LatencyHistogram() if enabled else None)
+
+    def get_latency_histograms(self):
+        """
+        Returns the latency histograms of this service.
+
+        :return: A :obj:`dict` mapping characteristic name to :class:`~pycycling.latency.LatencyHistogram`, in
+            nanoseconds. Empty if latency histograms are not enabled
+        """
+        return {name: channel.latency_histogram for name, channel in self._channels.items()
+                if channel.latency_histogram is not None}
@@ -0,0 +1,242 @@
+"""
+Opt-in profiling of the notification path.
+
+User callbacks (e.g. those set with ``set_hr_measurement_handler`` or ``set_indoor_bike_data_handler``) run
+synchronously inside the Bluetooth notification handler, so one slow consumer delays every other device on the event
+loop. The hooks in this module wrap the parsing and callback of every notification, for every service object, without
+changes to the code which sets up the services:
+
+* :class:`SlowCallbackDetector` reports callbacks which run over a time budget, together with samples of the
+  offending callback's stack taken while it was still running.
+* :class:`CallbackProfiler` hands off to :mod:`cProfile` (or `yappi <https://github.com/sumerc/yappi>`_, if
+  installed) for a fixed time window.
+
+Hooks are installed globally with :func:`install_hook` and apply to all current and future services. When no hooks are
+installed the notification path is unchanged.
+
+Example
+=======
+.. code-block:: python
+
+    from pycycling import profiling
+
+    profiling.install_hook(profiling.SlowCallbackDetector(budget=0.005))
+    profiling.install_hook(profiling.CallbackProfiler(duration=60, on_complete=lambda stats: stats.print_stats(20)))
+"""
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from pycycling.notifications import get_profiling_hooks, set_profiling_hooks
+
+logger = logging.getLogger(__name__)
+
+SlowCallbackReport = namedtuple('SlowCallbackReport',
+                                ['device', 'service', 'characteristic', 'callback', 'parse_ns', 'callback_ns',
+                                 'stack_samples'])
+
+
+class ProfilingHook:
+    """
+    Base class for hooks called around the parsing and callback of every notification.
+    """
+
+    def before_notification(self, channel):
+        """
+        Called before a notification is parsed.
+
+        :param channel: The :class:`~pycycling.notifications.NotificationChannel` the notification was received on
+        """
+
+    def after_notification(self, channel, parse_ns, callback_ns):
+        """
+        Called after the callback has returned, or raised.
+
+        :param channel: The :class:`~pycycling.notifications.NotificationChannel` the notification was received on
+        :param parse_ns: Time spent parsing, in nanoseconds, or `None` if parsing raised
+        :param callback_ns: Time spent in the callback, in nanoseconds, or `None` if parsing or the callback raised
+        """
+
+    def installed(self):
+        """Called when the hook is installed"""
+
+    def removed(self):
+        """Called when the hook is removed"""
+
+
+def install_hook(hook):
+    """Install a :class:`ProfilingHook` on all current and future notification channels"""
+    hooks = get_profiling_hooks()
+    if hook in hooks:
+        return
+    hook.installed()
+    set_profiling_hooks(hooks + (hook,))
+
+
+def remove_hook(hook):
+    """Remove a previously installed :class:`ProfilingHook`"""
+    hooks = get_profiling_hooks()
+    if hook not in hooks:
+        return
+    set_profiling_hooks(tuple(installed for installed in hooks if installed is not hook))
+    hook.removed()
+
+
+def _callback_name(callback):
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+
+class _InFlight:
+    __slots__ = ('channel', 'started_ns', 'stack_samples')
+
+    def __init__(self, channel, started_ns):
+        self.channel = channel
+        self.started_ns = started_ns
+        self.stack_samples = []
+
+
+class SlowCallbackDetector(ProfilingHook):
+    """
+    Reports notification callbacks which take longer than a budget.
+
+    While a callback is running, a watchdog thread checks it every `sample_interval` seconds; once it is over budget
+    the watchdog samples the stack of the thread running it. When the callback returns, a :obj:`SlowCallbackReport`
+    is passed to `on_slow`, or logged as a warning if `on_slow` is not set.
+
+    :param budget: The time budget for parsing and callback, in seconds
+    :param on_slow: Called with a :obj:`SlowCallbackReport` for every callback over budget
+    :param sample_interval: How often, in seconds, the watchdog checks running callbacks
+    :param max_stack_samples: The most stack samples kept for a single callback
+    """
+
+    def __init__(self, budget=0.01, on_slow=None, sample_interval=None, max_stack_samples=5):
+        self._budget_ns = int(budget * 1e9)
+        self._on_slow = on_slow
+        self._sample_interval = sample_interval if sample_interval is not None else max(budget / 2, 0.001)
+        self._max_stack_samples = max_stack_samples
+        self._in_flight = {}
+        self._stop = threading.Event()
+        self._watchdog = None
+        self.slow_callbacks = 0
+
+    def installed(self):
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name='pycycling-slow-callback-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def removed(self):
+        self._stop.set()
+        self._watchdog.join()
+        self._watchdog = None
+
+    def before_notification(self, channel):
+        self._in_flight[threading.get_ident()] = _InFlight(channel, time.monotonic_ns())
+
+    def after_notification(self, channel, parse_ns, callback_ns):
+        in_flight = self._in_flight.pop(threading.get_ident(), None)
+        if in_flight is None:
+            return
+        elapsed_ns = (parse_ns or 0) + (callback_ns or 0)
+        if elapsed_ns <= self._budget_ns:
+            return
+
+        self.slow_callbacks += 1
+        report = SlowCallbackReport(device=channel.device, service=channel.service,
+                                    characteristic=channel.name, callback=_callback_name(channel.callback),
+                                    parse_ns=parse_ns, callback_ns=callback_ns,
+                                    stack_samples=list(in_flight.stack_samples))
+        if self._on_slow is not None:
+            self._on_slow(report)
+        else:
+            stack = ''.join(report.stack_samples[-1].format()) if report.stack_samples else ''
+            logger.warning('Slow %s callback %s for %s on device %s took %.1f ms\n%s', report.service,
+                           report.callback, report.characteristic, report.device, elapsed_ns / 1e6, stack)
+
+    def _watch(self):
+        while not self._stop.wait(self._sample_interval):
+            now_ns = time.monotonic_ns()
+            frames = None
+            for thread_id, in_flight in list(self._in_flight.items()):
+                if now_ns - in_flight.started_ns <= self._budget_ns:
+                    continue
+                if len(in_flight.stack_samples) >= self._max_stack_samples:
+                    continue
+                if frames is None:
+                    frames = sys._current_frames()  # pylint: disable=protected-access
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    in_flight.stack_samples.append(traceback.extract_stack(frame))
+
+
+class CallbackProfiler(ProfilingHook):
+    """
+    Profiles notification handling for a time window, starting when the hook is installed.
+
+    With the ``'cprofile'`` backend only the parsing and callbacks of notifications are profiled. The ``'yappi'``
+    backend profiles every thread of the process for the window, as yappi cannot cheaply be switched on and off
+    around each callback. The window ends at the first notification after `duration` seconds, or when :meth:`stop`
+    is called, after which the hook removes itself.
+
+    :param duration: Length of the profiling window, in seconds
+    :param backend: ``'cprofile'`` or ``'yappi'``
+    :param on_complete: Called with the results when the window ends: a :class:`pstats.Stats` object for cProfile, or
+        the yappi function stats for yappi. Not called if no notification arrived in the window, in which case
+        :attr:`results` is `None`
+    """
+
+    def __init__(self, duration=30.0, backend='cprofile', on_complete=None):
+        if backend not in ('cprofile', 'yappi'):
+            raise ValueError("backend must be 'cprofile' or 'yappi'")
+        self._duration_ns = int(duration * 1e9)
+        self._backend = backend
+        self._on_complete = on_complete
+        self._profiler = None
+        self._yappi = None
+        self._deadline_ns = None
+        self.notifications = 0
+        self.results = None
+
+    def installed(self):
+        self._deadline_ns = time.monotonic_ns() + self._duration_ns
+        self.notifications = 0
+        if self._backend == 'yappi':
+            import yappi  # pylint: disable=import-outside-toplevel
+            self._yappi = yappi
+            yappi.clear_stats()
+            yappi.start()
+        else:
+            self._profiler = cProfile.Profile()
+
+    def before_notification(self, channel):
+        self.notifications += 1
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    def after_notification(self, channel, parse_ns, callback_ns):
+        if self._profiler is not None:
+            self._profiler.disable()
+        if time.monotonic_ns() >= self._deadline_ns:
+            self.stop()
+
+    def stop(self):
+        """End the profiling window early"""
+        remove_hook(self)
+
+    def removed(self):
+        if self._yappi is not None:
+            self._yappi.stop()
+        if not self.notifications:
+            # pstats cannot be built from a profiler which never ran
+            self.results = None
+            return
+        if self._yappi is not None:
+            self.results = self._yappi.get_func_stats()
+        else:
+            self.results = pstats.Stats(self._profiler)
+        if self._on_complete is not None:
+            self._on_complete(self.results)
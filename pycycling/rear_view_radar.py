@@ -15,9 +15,31 @@ This example prints radar information broadcast from the Bluetooth device to the
 information on :ref:`obtaining the Bluetooth address of your device <obtaining_device_address>`.
 
 .. literalinclude:: ../examples/rear_view_radar_example.py
+
+Threat tracking
+===============
+Each radar packet is a full snapshot of the threats in view. When only changes are of interest,
+:func:`set_threat_event_handler <pycycling.rear_view_radar.RearViewRadarService.set_threat_event_handler>` delivers
+a list of :obj:`ThreatEvent` for every snapshot in which a threat appeared, moved or disappeared. Events carry an
+estimate of each threat's closing speed and the time until it reaches the rider.
+
+Multi-packet frames
+===================
+A notification has room for six threats, so a radar scan with more threats in view is split across several packets
+which share the identifier in byte 0. By default every packet is delivered as it arrives. After
+:func:`set_frame_reassembly <pycycling.rear_view_radar.RearViewRadarService.set_frame_reassembly>` the service
+reassembles these packets and delivers one list of :obj:`RadarMeasurement` per scan, so that callbacks and threat
+tracking always see a complete snapshot. A frame is complete when a packet with room to spare arrives, or when the next
+scan starts. A frame which is still incomplete after a timeout is delivered as it is, so a scan which exactly fills its
+packets is delivered when the next scan starts, or at the latest after the timeout.
 """
 
+import asyncio
+import time
 from collections import namedtuple
+from enum import Enum
+
+from pycycling.notifications import NotifyingService, TimestampedRecord
 
 radar_characteristic_id = '6a4e3203-667b-11e3-949a-0800200c9a66'
 
@@ -37,33 +59,321 @@ def _parse_radar_measurement(data: bytearray) -> RadarMeasurement:
     byte 3 (6, 9, ...): speed of threat in km/h
 
     See source for this reverse-engineering in repo README
+
+    Returns `None` for a payload of any other length, which can happen while the radar is starting up.
     """
-    radar_measurements = []
-    try:
-        for i in range(1, len(data), 3):
-            threat_id = int(data[i])
-            distance = int(data[i+1])
-            speed = int(data[i+2])
-            radar_measurements.append(RadarMeasurement(threat_id, speed, distance))
-    except IndexError:
-        print('pycycling:rear_view_radar.py IndexError: probably starting up and not all data is available yet')
+    if len(data) % 3 != 1:
         return None
-    return radar_measurements
+    return [RadarMeasurement(threat_id, speed, distance)
+            for threat_id, distance, speed in zip(data[1::3], data[2::3], data[3::3])]
+
+
+class RadarFrameAssembler:
+    """
+    Groups radar packets into one frame per scan.
+
+    :param timeout: Time, in seconds, after the first packet of a frame at which the frame is considered complete even
+        if more packets were expected
+    :param threats_per_packet: The number of threats which fit in a full packet. A packet holding fewer completes the
+        frame
+    :param clock: Function returning the current time in nanoseconds
+    """
+
+    def __init__(self, timeout=0.5, threats_per_packet=6, clock=time.monotonic_ns):
+        self._timeout_ns = int(timeout * 1e9)
+        self._threats_per_packet = threats_per_packet
+        self._clock = clock
+        self._frame = None
+        self._identifier = None
+        self._threat_ids = set()
+        self.started_ns = None
+        self.frames = 0
+        self.timed_out_frames = 0
+
+    @property
+    def pending(self):
+        """`True` if packets of an incomplete frame are held"""
+        return self._frame is not None
+
+    @property
+    def timeout_ns(self):
+        return self._timeout_ns
+
+    def add(self, data):
+        """
+        Add a packet.
+
+        :param data: The raw packet
+        :return: A list of the frames completed by this packet, each a list of :obj:`RadarMeasurement`, oldest first.
+            Empty if the packet did not complete a frame. A packet can complete two frames: the held frame of the
+            previous scan, and a frame of its own if it starts a new scan with room to spare
+        """
+        measurements = _parse_radar_measurement(data)
+        if measurements is None:
+            return []
+        now_ns = self._clock()
+        completed = []
+
+        if self._frame is not None:
+            if now_ns - self.started_ns >= self._timeout_ns:
+                completed.append(self._take())
+                self.timed_out_frames += 1
+            elif data[0] != self._identifier or any(m.threat_id in self._threat_ids for m in measurements):
+                # A new scan has started, so the held packets were the whole of the previous one
+                completed.append(self._take())
+
+        if self._frame is None:
+            self._frame = measurements
+            self._identifier = data[0]
+            self.started_ns = now_ns
+        else:
+            self._frame.extend(measurements)
+        self._threat_ids.update(m.threat_id for m in measurements)
+
+        if len(measurements) < self._threats_per_packet:
+            completed.append(self._take())
+
+        self.frames += len(completed)
+        return completed
+
+    def expire(self):
+        """
+        Complete the held frame if it is older than the timeout.
+
+        :return: The list of :obj:`RadarMeasurement` of the expired frame, or `None`
+        """
+        if self._frame is None or self._clock() - self.started_ns < self._timeout_ns:
+            return None
+        self.timed_out_frames += 1
+        self.frames += 1
+        return self._take()
+
+    def reset(self):
+        """Discard any held packets"""
+        self._take()
+
+    def _take(self):
+        frame = self._frame
+        self._frame = None
+        self._identifier = None
+        self._threat_ids = set()
+        return frame
+
+
+ThreatEventType = Enum('ThreatEventType', 'appeared updated disappeared')
+
+ThreatEvent = namedtuple('ThreatEvent', [
+    'event',
+    'threat_id',
+    'distance',  # m
+    'speed',  # km/h, as reported by the radar
+    'closing_speed',  # km/h, estimated
+    'time_to_reach',  # s, or None if the threat is not closing
+])
+
+
+class _ThreatState:
+    __slots__ = ('distance', 'speed', 'closing_speed', 'distance_changed_ns', 'generation')
 
-class RearViewRadarService:
+    def __init__(self, distance, speed, timestamp_ns, generation):
+        self.distance = distance
+        self.speed = speed
+        self.closing_speed = float(speed)
+        self.distance_changed_ns = timestamp_ns
+        self.generation = generation
+
+
+class RadarThreatTracker:
+    """
+    Tracks radar threats by `threat_id` across snapshots and reports only what changed.
+
+    The closing speed of a threat starts at the speed reported by the radar and is then blended with the rate at which
+    its distance shrinks, which makes the time-to-reach estimate robust to the coarse speed readings.
+
+    :param smoothing: Weight, between 0 and 1, given to each new distance-based closing speed measurement
+    :param clock: Function returning the current time in nanoseconds, used when snapshots are not timestamped
+    """
+
+    def __init__(self, smoothing=0.5, clock=time.monotonic_ns):
+        if smoothing <= 0 or smoothing > 1:
+            raise ValueError('smoothing must be greater than 0 and at most 1')
+        self._smoothing = smoothing
+        self._clock = clock
+        self._threats = {}
+        self._generation = 0
+
+    @property
+    def threat_ids(self):
+        """The ids of the threats currently in view"""
+        return list(self._threats)
+
+    def update(self, measurements, timestamp_ns=None):
+        """
+        Update the tracked threats from a snapshot.
+
+        :param measurements: A list of :obj:`RadarMeasurement` holding every threat currently in view
+        :param timestamp_ns: Time of the snapshot, in nanoseconds. Defaults to the tracker's clock
+        :return: A list of :obj:`ThreatEvent`, empty if nothing changed
+        """
+        if timestamp_ns is None:
+            timestamp_ns = self._clock()
+        self._generation += 1
+        generation = self._generation
+        threats = self._threats
+        events = []
+        seen = 0
+
+        for measurement in measurements:
+            state = threats.get(measurement.threat_id)
+            if state is None:
+                state = _ThreatState(measurement.distance, measurement.speed, timestamp_ns, generation)
+                threats[measurement.threat_id] = state
+                seen += 1
+                events.append(self._event(ThreatEventType.appeared, measurement.threat_id, state))
+                continue
+
+            if state.generation != generation:
+                state.generation = generation
+                seen += 1
+            if state.distance == measurement.distance and state.speed == measurement.speed:
+                continue
+
+            if state.distance != measurement.distance:
+                elapsed_ns = timestamp_ns - state.distance_changed_ns
+                if elapsed_ns > 0:
+                    measured = (state.distance - measurement.distance) * 3.6e9 / elapsed_ns
+                    state.closing_speed += self._smoothing * (measured - state.closing_speed)
+                state.distance_changed_ns = timestamp_ns
+                state.distance = measurement.distance
+            state.speed = measurement.speed
+            events.append(self._event(ThreatEventType.updated, measurement.threat_id, state))
+
+        if len(threats) > seen:
+            for threat_id, state in list(threats.items()):
+                if state.generation != generation:
+                    del threats[threat_id]
+                    events.append(self._event(ThreatEventType.disappeared, threat_id, state))
+
+        return events
+
+    def reset(self):
+        """Forget all tracked threats"""
+        self._threats = {}
+
+    @staticmethod
+    def _event(event_type, threat_id, state):
+        time_to_reach = None
+        if state.closing_speed > 0:
+            time_to_reach = state.distance * 3.6 / state.closing_speed
+        return ThreatEvent(event=event_type, threat_id=threat_id, distance=state.distance, speed=state.speed,
+                           closing_speed=state.closing_speed, time_to_reach=time_to_reach)
+
+
+class RearViewRadarService(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._radar_measurement_callback = None
+        super().__init__(client)
+        self._radar_measurement_channel = self._add_channel('radar_measurement', _parse_radar_measurement)
+        self._threat_event_subscription = None
+        self._frame_assembler = None
+        self._frame_timer = None
+
+    def set_frame_reassembly(self, enabled=True, timeout=0.5):
+        """
+        Deliver one list of measurements per radar scan rather than one per packet. Disabled by default.
+
+        :param enabled: When `False`, every packet is delivered as it arrives
+        :param timeout: Time, in seconds, after which an incomplete frame is delivered as it is
+        """
+        self._cancel_frame_timer()
+        if enabled:
+            self._frame_assembler = RadarFrameAssembler(timeout)
+            self._radar_measurement_channel.parser = self._assemble_radar_packet
+        else:
+            self._frame_assembler = None
+            self._radar_measurement_channel.parser = _parse_radar_measurement
+
+    @property
+    def frame_assembler(self):
+        """The :class:`RadarFrameAssembler` in use, or `None` if frame reassembly is disabled"""
+        return self._frame_assembler
+
+    def _assemble_radar_packet(self, data):
+        assembler = self._frame_assembler
+        frames = assembler.add(data)
+        if not assembler.pending:
+            self._cancel_frame_timer()
+        elif self._frame_timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # Without a loop the timeout is only checked when the next packet arrives
+                loop = None
+            if loop is not None:
+                self._frame_timer = loop.call_later(assembler.timeout_ns / 1e9, self._expire_frame)
+        if not frames:
+            return None
+        # The held frame of the previous scan is delivered before the frame completed by this packet
+        for frame in frames[:-1]:
+            self._radar_measurement_channel.publish(frame)
+        return frames[-1]
+
+    def _expire_frame(self):
+        self._frame_timer = None
+        assembler = self._frame_assembler
+        if assembler is None:
+            return
+        started_ns = assembler.started_ns
+        frame = assembler.expire()
+        if frame is not None:
+            self._radar_measurement_channel.publish(frame, started_ns)
+        elif assembler.pending:
+            # The frame was completed and a new one started since the timer was set
+            remaining_ns = started_ns + assembler.timeout_ns - time.monotonic_ns()
+            self._frame_timer = asyncio.get_running_loop().call_later(max(remaining_ns, 0) / 1e9,
+                                                                      self._expire_frame)
+
+    def _cancel_frame_timer(self):
+        if self._frame_timer is not None:
+            self._frame_timer.cancel()
+            self._frame_timer = None
 
     async def enable_radar_measurement_notifications(self):
-        await self._client.start_notify(radar_characteristic_id, self._radar_measurement_notification_handler)
+        await self._router.start_notify(radar_characteristic_id,
+                                        self._radar_measurement_channel.notification_handler)
 
     async def disable_radar_measurement_notifications(self):
-        await self._client.stop_notify(radar_characteristic_id)
+        await self._router.stop_notify(radar_characteristic_id)
+        self._cancel_frame_timer()
+        if self._frame_assembler is not None:
+            self._frame_assembler.reset()
 
     def set_radar_measurement_handler(self, callback):
-        self._radar_measurement_callback = callback
+        self._radar_measurement_channel.set_handler(callback)
+
+    def set_threat_event_handler(self, callback, tracker=None):
+        """
+        Deliver threat changes rather than full snapshots.
+
+        :param callback: Called with a list of :obj:`ThreatEvent` whenever a threat appears, moves or disappears, or
+            `None` to stop
+        :param tracker: The :class:`RadarThreatTracker` to use. A new tracker is created if not given
+        """
+        if self._threat_event_subscription is not None:
+            self._threat_event_subscription.unsubscribe()
+            self._threat_event_subscription = None
+        if callback is None:
+            return
+
+        tracker = tracker if tracker is not None else RadarThreatTracker()
+
+        def track(measurements):
+            timestamp_ns = None
+            if isinstance(measurements, TimestampedRecord):
+                measurements, timestamp_ns = measurements
+            if measurements is None:
+                return
+            events = tracker.update(measurements, timestamp_ns)
+            if events:
+                callback(events)
 
-    def _radar_measurement_notification_handler(self, sender, data): # pylint: disable=unused-argument
-        if self._radar_measurement_callback is not None:
-            self._radar_measurement_callback(_parse_radar_measurement(data))
+        self._threat_event_subscription = self._radar_measurement_channel.subscribe(track)
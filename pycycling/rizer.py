@@ -1,31 +1,176 @@
+"""
+A module for interacting with the Wahoo Kickr Rizer.
+
+Adaptive transmission rate
+==========================
+The Rizer can send steering measurements at 8, 16 or 32 Hz. Rather than fixing the rate with
+:func:`set_transmission_rate <pycycling.rizer.Rizer.set_transmission_rate>`,
+:func:`start_adaptive_transmission_rate <pycycling.rizer.Rizer.start_adaptive_transmission_rate>` runs a task which
+watches the end-to-end latency of the steering callbacks, the lag of the event loop and, optionally, the depth of a
+consumer's queue. The rate is stepped down while the host is overloaded or nobody is steering, and back up once there
+is headroom again. See :class:`AdaptiveRateController` for the thresholds.
+"""
+import asyncio
+import logging
 import struct
+import time
+
+from pycycling.latency import LatencyHistogram
+from pycycling.notifications import NotifyingService, TimestampedRecord
+from pycycling.steering import conditioned_parser
+
+logger = logging.getLogger(__name__)
 
 rizer_measurement_id = "347b0030-7635-408b-8918-8ff3949ce592"
 rizer_control_point_id = "347b0031-7635-408b-8918-8ff3949ce592"
 
 
-class Rizer:
+def _parse_steering_measurement(data):
+    [steering_angle] = struct.unpack("<f", data)
+    return steering_angle
+
+
+class AdaptiveRateController:
+    """
+    Decides the Rizer transmission rate from measurements taken once per window.
+
+    The rate is stepped down one level after `down_after` consecutive overloaded windows, and up one level after
+    `up_after` consecutive windows with headroom. Windows between the low and high thresholds reset both counts, so
+    the rate does not oscillate around a threshold.
+
+    :param min_rate: The lowest rate used, as accepted by :meth:`Rizer.set_transmission_rate`
+    :param max_rate: The highest rate used
+    :param high_latency: Callback latency (99th percentile), in seconds, above which the host is overloaded
+    :param low_latency: Callback latency (99th percentile), in seconds, below which there is headroom
+    :param high_loop_lag: Event loop lag, in seconds, above which the host is overloaded
+    :param low_loop_lag: Event loop lag, in seconds, below which there is headroom
+    :param high_queue_depth: Consumer queue depth above which the host is overloaded
+    :param low_queue_depth: Consumer queue depth at or below which there is headroom
+    :param down_after: Consecutive overloaded windows before stepping down
+    :param up_after: Consecutive windows with headroom before stepping up
+    :param idle_rate: The rate used while nobody is steering, or `None` to ignore activity
+    """
+
+    def __init__(
+        self,
+        *,
+        min_rate=0,
+        max_rate=2,
+        high_latency=0.02,
+        low_latency=0.005,
+        high_loop_lag=0.05,
+        low_loop_lag=0.01,
+        high_queue_depth=8,
+        low_queue_depth=1,
+        down_after=2,
+        up_after=5,
+        idle_rate=0,
+    ):
+        if not 0 <= min_rate <= max_rate <= 2:
+            raise ValueError("Rates must satisfy 0 <= min_rate <= max_rate <= 2")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._high_latency_ns = high_latency * 1e9
+        self._low_latency_ns = low_latency * 1e9
+        self._high_loop_lag_ns = high_loop_lag * 1e9
+        self._low_loop_lag_ns = low_loop_lag * 1e9
+        self._high_queue_depth = high_queue_depth
+        self._low_queue_depth = low_queue_depth
+        self._down_after = down_after
+        self._up_after = up_after
+        self._idle_rate = idle_rate
+        self.rate = max_rate
+        self._overloaded_windows = 0
+        self._headroom_windows = 0
+        self._resume_rate = None
+
+    def update(self, latency_ns=None, loop_lag_ns=0, queue_depth=0, active=True):
+        """
+        Account for one window of measurements.
+
+        :param latency_ns: The 99th percentile callback latency in the window, in nanoseconds, or `None` if there were
+            no callbacks
+        :param loop_lag_ns: How late the event loop ran the monitoring task, in nanoseconds
+        :param queue_depth: The depth of the consumer's queue
+        :param active: Whether the steering angle changed recently
+        :return: The new rate if it changed, otherwise `None`
+        """
+        latency_ns = latency_ns or 0
+        overloaded = (
+            latency_ns > self._high_latency_ns
+            or loop_lag_ns > self._high_loop_lag_ns
+            or queue_depth > self._high_queue_depth
+        )
+        headroom = (
+            latency_ns < self._low_latency_ns
+            and loop_lag_ns < self._low_loop_lag_ns
+            and queue_depth <= self._low_queue_depth
+        )
+
+        ceiling = self.max_rate
+        if self._idle_rate is not None:
+            if not active:
+                if self._resume_rate is None:
+                    self._resume_rate = self.rate
+                ceiling = max(self.min_rate, min(self._idle_rate, self.max_rate))
+                if self.rate > ceiling:
+                    return self._change(ceiling)
+            elif self._resume_rate is not None:
+                # Going back to the rate used before idling is not a sign of headroom, so it happens at once
+                rate, self._resume_rate = self._resume_rate, None
+                if not overloaded and rate > self.rate:
+                    return self._change(rate)
+
+        if overloaded:
+            self._headroom_windows = 0
+            self._overloaded_windows += 1
+            if self._overloaded_windows >= self._down_after and self.rate > self.min_rate:
+                return self._change(self.rate - 1)
+        elif headroom and self.rate < ceiling:
+            self._overloaded_windows = 0
+            self._headroom_windows += 1
+            if self._headroom_windows >= self._up_after:
+                return self._change(self.rate + 1)
+        else:
+            self._overloaded_windows = 0
+            self._headroom_windows = 0
+        return None
+
+    def _change(self, rate):
+        self.rate = rate
+        self._overloaded_windows = 0
+        self._headroom_windows = 0
+        return rate
+
+
+class Rizer(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._steering_measurement_callback = None
+        super().__init__(client)
+        self._steering_measurement_channel = self._add_channel(
+            "steering_measurement", _parse_steering_measurement
+        )
         self._latest_challenge = None
+        self._adaptive_rate_task = None
 
     async def enable_steering_measurement_notifications(self):
-        await self._client.start_notify(
-            rizer_measurement_id, self._steering_measurement_notification_handler
+        await self._router.start_notify(
+            rizer_measurement_id,
+            self._steering_measurement_channel.notification_handler,
         )
 
     async def disable_steering_measurement_notifications(self):
-        await self._client.stop_notify(rizer_measurement_id)
+        await self._router.stop_notify(rizer_measurement_id)
 
     def set_steering_measurement_callback(self, callback):
-        self._steering_measurement_callback = callback
+        self._steering_measurement_channel.set_handler(callback)
 
-    def _steering_measurement_notification_handler(
-        self, sender, data
-    ):  # pylint: disable=unused-argument
-        [steering_angle] = struct.unpack("<f", data)
-        self._steering_measurement_callback(steering_angle)
+    def set_steering_conditioner(self, conditioner):
+        """
+        Condition steering angles before they are delivered to callbacks.
+
+        :param conditioner: A :class:`~pycycling.steering.SteeringConditioner`, or `None` to deliver raw angles
+        """
+        self._steering_measurement_channel.parser = conditioned_parser(_parse_steering_measurement, conditioner)
 
     async def set_transmission_rate(self, rate: int):
         """sets the transmission rate of the rizer to 8, 16, or 32 Hz"""
@@ -39,3 +184,81 @@ class Rizer:
     async def set_center(self):
         """sets the zero position of the rizer"""
         await self._client.write_gatt_char(rizer_control_point_id, b"\x01")
+
+    def start_adaptive_transmission_rate(
+        self,
+        controller=None,
+        interval=1.0,
+        queue_depth=None,
+        idle_threshold=1.0,
+        idle_after=10.0,
+    ):
+        """
+        Adjust the transmission rate to the load on the host until
+        :meth:`stop_adaptive_transmission_rate` is called. Must be called from a running event loop.
+
+        While running, this replaces the latency histogram of the steering measurements.
+
+        :param controller: The :class:`AdaptiveRateController` to use. A new one is created if not given
+        :param interval: The measurement window, in seconds
+        :param queue_depth: Optional function returning the depth of the consumer's queue
+        :param idle_threshold: The change in steering angle, in degrees, which counts as steering
+        :param idle_after: Time, in seconds, without steering after which the rider is considered idle
+        :return: The :class:`asyncio.Task` adjusting the rate
+        """
+        self.stop_adaptive_transmission_rate()
+        controller = controller if controller is not None else AdaptiveRateController()
+        self._adaptive_rate_task = asyncio.get_running_loop().create_task(
+            self._adapt_transmission_rate(controller, interval, queue_depth, idle_threshold, idle_after)
+        )
+        return self._adaptive_rate_task
+
+    def stop_adaptive_transmission_rate(self):
+        """Stop adjusting the transmission rate, leaving it at its current value"""
+        if self._adaptive_rate_task is not None:
+            self._adaptive_rate_task.cancel()
+            self._adaptive_rate_task = None
+
+    async def _adapt_transmission_rate(self, controller, interval, queue_depth, idle_threshold, idle_after):
+        channel = self._steering_measurement_channel
+        histogram = LatencyHistogram()
+        channel.set_timing(channel.timestamps, histogram)
+        steering = {"reference": None, "changed_ns": time.monotonic_ns()}
+
+        def watch_angle(angle):
+            if isinstance(angle, TimestampedRecord):
+                angle = angle.record
+            reference = steering["reference"]
+            if reference is None or abs(angle - reference) >= idle_threshold:
+                steering["reference"] = angle
+                steering["changed_ns"] = time.monotonic_ns()
+
+        subscription = channel.subscribe(watch_angle)
+        applied_rate = None
+        try:
+            while True:
+                if controller.rate != applied_rate:
+                    try:
+                        await self.set_transmission_rate(controller.rate)
+                        applied_rate = controller.rate
+                    except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                        # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+                        raise
+                    except Exception as error:  # pylint: disable=broad-except
+                        # Try again after the next interval
+                        logger.warning("Failed to set transmission rate %d: %s", controller.rate, error)
+                started_ns = time.monotonic_ns()
+                await asyncio.sleep(interval)
+                now_ns = time.monotonic_ns()
+                loop_lag_ns = max(now_ns - started_ns - int(interval * 1e9), 0)
+                controller.update(
+                    latency_ns=histogram.percentile(99),
+                    loop_lag_ns=loop_lag_ns,
+                    queue_depth=queue_depth() if queue_depth is not None else 0,
+                    active=now_ns - steering["changed_ns"] < idle_after * 1e9,
+                )
+                histogram.reset()
+        finally:
+            subscription.unsubscribe()
+            if channel.latency_histogram is histogram:
+                channel.set_timing(channel.timestamps, None)
@@ -0,0 +1,391 @@
+"""
+Riding GPX routes in a trainer's simulation mode.
+
+A :class:`RouteProfile` is computed once when a route is loaded. The route's elevation is resampled every `spacing`
+metres, the grade between samples is smoothed with a moving average over `smoothing` metres to remove GPS noise, and
+then quantized to `grade_step` percent. Runs of equal quantized grade are merged into :obj:`GradeSegment` objects, so
+a route of hundreds of kilometres is usually a few thousand segments. Road surfaces, given per track point by a
+``surface`` extension element (e.g. from OpenStreetMap ``surface`` tags), are merged into :obj:`SurfaceSegment`
+objects in the same way.
+
+During a ride, a :class:`RouteCursor` finds the segment at a distance by moving from the previous segment, which takes
+constant time as the rider moves forward, falling back to a binary search after a jump.
+
+A :class:`RouteFollower` drives a trainer along a route from the distance the trainer reports: the indoor bike data
+``total_distance`` of an FTMS trainer, or the general FE data ``distance_travelled`` of a Tacx trainer, which wraps
+every 256 m and is unwrapped with :func:`~pycycling.accumulators.general_fe_accumulators`. A command is only sent
+when the rider enters a segment of a different grade or surface:
+:meth:`~pycycling.fitness_machine_service.FitnessMachineService.set_simulation_parameters` for an FTMS trainer, or
+:meth:`~pycycling.tacx_trainer_control.TacxTrainerControl.set_track_resistance` and, with road feel enabled,
+:meth:`~pycycling.tacx_trainer_control.TacxTrainerControl.set_neo_modes` for a Tacx trainer.
+
+Example
+=======
+.. code-block:: python
+
+    route = RouteProfile.from_gpx('alpe-d-huez.gpx')
+    print(f'{route.length / 1000:.1f} km, {route.climbing:.0f} m of climbing')
+
+    trainer = FitnessMachineService(client)
+    await trainer.enable_indoor_bike_data_notify()
+    await trainer.request_control()
+
+    follower = RouteFollower(route, trainer)
+    follower.start()
+"""
+import asyncio
+import bisect
+import logging
+import math
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from pycycling.accumulators import general_fe_accumulators
+from pycycling.notifications import TimestampedRecord
+from pycycling.tacx_trainer_control import RoadSurface
+
+logger = logging.getLogger(__name__)
+
+_EARTH_RADIUS = 6371008.8  # m
+
+RoutePoint = namedtuple('RoutePoint', ['latitude', 'longitude', 'elevation', 'surface'])
+
+GradeSegment = namedtuple('GradeSegment', ['start', 'grade'])
+
+SurfaceSegment = namedtuple('SurfaceSegment', ['start', 'surface'])
+
+# OpenStreetMap surface values with a matching road feel pattern. RoadSurface names are also accepted
+_OSM_SURFACES = {
+    'concrete:plates': RoadSurface.CONCRETE_PLATES,
+    'concrete:lanes': RoadSurface.CONCRETE_PLATES,
+    'sett': RoadSurface.COBBLESTONES_HARD,
+    'cobblestone': RoadSurface.COBBLESTONES_HARD,
+    'unhewn_cobblestone': RoadSurface.COBBLESTONES_HARD,
+    'cobblestone:flattened': RoadSurface.COBBLESTONES_SOFT,
+    'paving_stones': RoadSurface.BRICK_ROAD,
+    'bricks': RoadSurface.BRICK_ROAD,
+    'unpaved': RoadSurface.OFF_ROAD,
+    'dirt': RoadSurface.OFF_ROAD,
+    'earth': RoadSurface.OFF_ROAD,
+    'ground': RoadSurface.OFF_ROAD,
+    'grass': RoadSurface.OFF_ROAD,
+    'mud': RoadSurface.OFF_ROAD,
+    'gravel': RoadSurface.GRAVEL,
+    'fine_gravel': RoadSurface.GRAVEL,
+    'compacted': RoadSurface.GRAVEL,
+    'pebblestone': RoadSurface.GRAVEL,
+    'ice': RoadSurface.ICE,
+    'wood': RoadSurface.WOODEN_BOARDS,
+}
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _road_surface(value):
+    if value is None:
+        return RoadSurface.SIMULATION_OFF
+    value = value.strip().lower()
+    surface = _OSM_SURFACES.get(value)
+    if surface is None:
+        surface = RoadSurface.__members__.get(value.upper(), RoadSurface.SIMULATION_OFF)
+    return surface
+
+
+def parse_gpx(source):
+    """
+    Read the points of a GPX file's tracks, or its routes if it has no tracks.
+
+    :param source: A file name or file object
+    :return: A list of :obj:`RoutePoint`. The elevation is in metres, or `None` if the point has none, and the surface
+        is a :obj:`~pycycling.tacx_trainer_control.RoadSurface`
+    """
+    root = ET.parse(source).getroot()
+    points = {'trkpt': [], 'rtept': []}
+    for element in root.iter():
+        name = _local_name(element.tag)
+        if name not in points:
+            continue
+        elevation = None
+        surface = None
+        for child in element.iter():
+            child_name = _local_name(child.tag)
+            if child_name == 'ele' and child.text:
+                elevation = float(child.text)
+            elif child_name == 'surface':
+                surface = child.text
+        points[name].append(RoutePoint(float(element.get('lat')), float(element.get('lon')), elevation,
+                                       _road_surface(surface)))
+    return points['trkpt'] or points['rtept']
+
+
+def _distance(start, end):
+    latitude_1, latitude_2 = math.radians(start.latitude), math.radians(end.latitude)
+    half_chord = (math.sin((latitude_2 - latitude_1) / 2) ** 2
+                  + math.cos(latitude_1) * math.cos(latitude_2)
+                  * math.sin(math.radians(end.longitude - start.longitude) / 2) ** 2)
+    return 2 * _EARTH_RADIUS * math.asin(math.sqrt(min(1.0, half_chord)))
+
+
+class RouteProfile:
+    """
+    The grade and surface of a route, indexed by distance.
+
+    :param points: A list of :obj:`RoutePoint`, e.g. from :func:`parse_gpx`
+    :param spacing: Distance, in metres, between elevation samples
+    :param smoothing: Length, in metres, of the moving average applied to the grade
+    :param grade_step: The grade is rounded to a multiple of this, in percent
+    :param max_grade: The grade is limited to this many percent up or down
+    """
+
+    def __init__(self, points, spacing=10.0, smoothing=50.0, grade_step=0.5, max_grade=25.0):
+        if len(points) < 2:
+            raise ValueError('a route needs at least two points')
+        if spacing <= 0 or grade_step <= 0:
+            raise ValueError('spacing and grade_step must be positive')
+
+        distances = [0.0]
+        for start, end in zip(points, points[1:]):
+            distances.append(distances[-1] + _distance(start, end))
+        self.length = distances[-1]
+        if self.length <= 0:
+            raise ValueError('the route has no length')
+
+        known = [(distance, point.elevation) for distance, point in zip(distances, points)
+                 if point.elevation is not None]
+        elevations = self._resample(known, spacing)
+        self.climbing = sum(max(0.0, end - start) for start, end in zip(elevations, elevations[1:]))
+
+        grades = [(end - start) / spacing * 100 for start, end in zip(elevations, elevations[1:])] or [0.0]
+        grades = self._smooth(grades, max(1, int(round(smoothing / spacing))))
+
+        self.segments = []
+        for index, grade in enumerate(grades):
+            grade = max(-max_grade, min(max_grade, round(grade / grade_step) * grade_step))
+            if not self.segments or self.segments[-1].grade != grade:
+                self.segments.append(GradeSegment(index * spacing, grade))
+        self._grade_starts = [segment.start for segment in self.segments]
+
+        self.surfaces = []
+        for distance, point in zip(distances, points):
+            if not self.surfaces or self.surfaces[-1].surface != point.surface:
+                self.surfaces.append(SurfaceSegment(distance, point.surface))
+        self._surface_starts = [segment.start for segment in self.surfaces]
+
+    @classmethod
+    def from_gpx(cls, source, **kwargs):
+        """Load a route from a GPX file name or file object. Keyword arguments are passed to :class:`RouteProfile`"""
+        return cls(parse_gpx(source), **kwargs)
+
+    @staticmethod
+    def _resample(known, spacing):
+        # Elevation every `spacing` metres, linearly interpolated between the points which have one
+        if not known:
+            return [0.0, 0.0]
+        count = max(2, int(known[-1][0] // spacing) + 1)
+        elevations = []
+        index = 0
+        for sample in range(count):
+            distance = sample * spacing
+            while index < len(known) - 1 and known[index + 1][0] < distance:
+                index += 1
+            start_distance, start_elevation = known[index]
+            if index == len(known) - 1 or distance <= start_distance:
+                elevations.append(start_elevation)
+            else:
+                end_distance, end_elevation = known[index + 1]
+                fraction = (distance - start_distance) / (end_distance - start_distance)
+                elevations.append(start_elevation + fraction * (end_elevation - start_elevation))
+        return elevations
+
+    @staticmethod
+    def _smooth(values, window):
+        # Centred moving average, using a running sum; the window shrinks at the ends of the route
+        prefix = [0.0]
+        for value in values:
+            prefix.append(prefix[-1] + value)
+        half = window // 2
+        count = len(values)
+        smoothed = []
+        for index in range(count):
+            start, end = max(0, index - half), min(count, index + window - half)
+            smoothed.append((prefix[end] - prefix[start]) / (end - start))
+        return smoothed
+
+    def segment_index(self, distance):
+        """Returns the index of the :obj:`GradeSegment` at a distance, in metres, by binary search"""
+        return max(0, bisect.bisect_right(self._grade_starts, distance) - 1)
+
+    def grade_at(self, distance):
+        """Returns the smoothed, quantized grade, in percent, at a distance in metres"""
+        return self.segments[self.segment_index(distance)].grade
+
+    def surface_index(self, distance):
+        """Returns the index of the :obj:`SurfaceSegment` at a distance, in metres, by binary search"""
+        return max(0, bisect.bisect_right(self._surface_starts, distance) - 1)
+
+    def surface_at(self, distance):
+        """Returns the :obj:`~pycycling.tacx_trainer_control.RoadSurface` at a distance in metres"""
+        return self.surfaces[self.surface_index(distance)].surface
+
+    def cursor(self):
+        """Returns a new :class:`RouteCursor` at the start of the route"""
+        return RouteCursor(self)
+
+
+class RouteCursor:
+    """
+    Finds the segments at a distance which mostly moves forward, in amortized constant time.
+
+    Created with :meth:`RouteProfile.cursor`.
+    """
+
+    def __init__(self, route):
+        self._route = route
+        self.grade_index = 0
+        self.surface_index = 0
+
+    def move(self, distance):
+        """
+        Move to a distance, in metres.
+
+        :return: The :obj:`GradeSegment` and :obj:`SurfaceSegment` at the distance
+        """
+        route = self._route
+        self.grade_index = self._advance(route.segments, self.grade_index, distance, route.segment_index)
+        self.surface_index = self._advance(route.surfaces, self.surface_index, distance, route.surface_index)
+        return route.segments[self.grade_index], route.surfaces[self.surface_index]
+
+    @staticmethod
+    def _advance(segments, index, distance, search):
+        if distance < segments[index].start:
+            return search(distance)
+        # Step forward a few segments before giving up and searching
+        for _ in range(4):
+            if index + 1 >= len(segments) or distance < segments[index + 1].start:
+                return index
+            index += 1
+        return search(distance)
+
+
+class RouteFollower:
+    """
+    Sets a trainer's simulated grade, and optionally road surface, from its position on a route.
+
+    :param route: A :class:`RouteProfile`
+    :param trainer: A :class:`~pycycling.fitness_machine_service.FitnessMachineService` or
+        :class:`~pycycling.tacx_trainer_control.TacxTrainerControl`, or a supervised proxy of one. Its indoor bike
+        data or general FE data notifications should be enabled
+    :param start_distance: Distance along the route, in metres, at which the ride starts
+    :param crr: Coefficient of rolling resistance
+    :param wind_speed: Head wind, in metres per second. FTMS trainers only; Tacx wind is set separately with
+        :meth:`~pycycling.tacx_trainer_control.TacxTrainerControl.set_wind_resistance`
+    :param cw: Wind resistance coefficient, in kg/m. FTMS trainers only
+    :param road_feel_intensity: Intensity, from 0 to 100, of the road surface patterns sent to Tacx NEO trainers, or
+        `None` to not send road surfaces. Ignored for FTMS trainers
+    """
+
+    def __init__(self, route, trainer, *, start_distance=0.0, crr=0.004, wind_speed=0.0, cw=0.51,
+                 road_feel_intensity=None):
+        self._route = route
+        self._trainer = trainer
+        self._cursor = route.cursor()
+        self._start_distance = start_distance
+        self._crr = crr
+        self._wind_speed = wind_speed
+        self._cw = cw
+        self._road_feel_intensity = road_feel_intensity
+
+        self._origin = None
+        self._accumulators = general_fe_accumulators()
+        self.distance = None
+        self._grade = None
+        self._surface = None
+        self._pending = []
+        self._send_task = None
+        self._subscriptions = []
+        self.commands_sent = 0
+
+    @property
+    def finished(self):
+        """Whether the rider has reached the end of the route"""
+        return self.distance is not None and self.distance >= self._route.length
+
+    def start(self):
+        """Subscribe to the trainer's distance"""
+        characteristics = self._trainer.characteristics
+        if 'indoor_bike_data' in characteristics:
+            self._subscriptions.append(self._trainer.subscribe('indoor_bike_data', self._on_indoor_bike_data))
+        if 'general_fe_data_page' in characteristics:
+            self._subscriptions.append(self._trainer.subscribe('general_fe_data_page', self._on_general_fe_data))
+
+    def stop(self):
+        """Unsubscribe. A command being written is cancelled"""
+        for subscription in self._subscriptions:
+            subscription.unsubscribe()
+        self._subscriptions = []
+        if self._send_task is not None:
+            self._send_task.cancel()
+            self._send_task = None
+        self._pending = []
+
+    def update(self, trainer_distance):
+        """
+        Move to the position given by the trainer's total distance, in metres. Called automatically with the
+        trainer's readings; the first distance given is taken as the start of the route.
+        """
+        if self._origin is None:
+            self._origin = trainer_distance
+        distance = self.distance = self._start_distance + trainer_distance - self._origin
+        grade_segment, surface_segment = self._cursor.move(distance)
+
+        commands = self._pending
+        if grade_segment.grade != self._grade:
+            self._grade = grade_segment.grade
+            commands.append(self._grade_command(self._grade))
+        if self._road_feel_intensity is not None and surface_segment.surface != self._surface \
+                and 'general_fe_data_page' in self._trainer.characteristics:
+            self._surface = surface_segment.surface
+            commands.append(('set_neo_modes', (), {'road_surface_pattern': self._surface,
+                                                   'road_surface_pattern_intensity': self._road_feel_intensity}))
+        if commands and self._send_task is None:
+            self._send_task = asyncio.get_running_loop().create_task(self._send())
+
+    def _grade_command(self, grade):
+        if 'general_fe_data_page' in self._trainer.characteristics:
+            return 'set_track_resistance', (grade, self._crr), {}
+        return 'set_simulation_parameters', (int(round(self._wind_speed * 1000)), int(round(grade * 100)),
+                                             int(round(self._crr * 10000)), int(round(self._cw * 100))), {}
+
+    def _on_indoor_bike_data(self, record):
+        if isinstance(record, TimestampedRecord):
+            record = record.record
+        if record.total_distance is not None:
+            self.update(record.total_distance)
+
+    def _on_general_fe_data(self, record):
+        self.update(self._accumulators.update(record).distance_travelled)
+
+    async def _send(self):
+        try:
+            while self._pending:
+                name, args, kwargs = self._pending.pop(0)
+                # A newer command of the same kind supersedes this one
+                if any(pending[0] == name for pending in self._pending):
+                    continue
+                try:
+                    await getattr(self._trainer, name)(*args, **kwargs)
+                    self.commands_sent += 1
+                except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                    # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+                    raise
+                except Exception as error:  # pylint: disable=broad-except
+                    logger.warning('Failed to send %s%s: %s', name, args, error)
+                    # Resend when the rider next moves
+                    if name == 'set_neo_modes':
+                        self._surface = None
+                    else:
+                        self._grade = None
+        finally:
+            self._send_task = None
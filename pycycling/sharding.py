@@ -0,0 +1,480 @@
+"""
+Runs the devices of a manifest in several worker processes, aggregating their records in the parent process.
+
+One process handling every connection, parse and callback is limited to one CPU core. A :class:`ShardedRunner` splits
+a device manifest between worker processes. Each worker runs its own event loop with the usual service classes,
+keeps its devices connected with a :class:`~pycycling.supervisor.ConnectionSupervisor`, and sends the parsed records
+to the parent in batches over a pipe, using the frames of :mod:`pycycling.framing`. The parent passes each record to
+a callback. A worker which exits is restarted, with exponential backoff if it keeps exiting.
+
+A manifest is a list of :obj:`DeviceSpec`, or a JSON file holding a list of objects with the same fields. The service
+of each device is one of the keys of :data:`SERVICES`.
+
+Example
+=======
+.. code-block:: python
+
+    from pycycling.sharding import DeviceSpec, ShardedRunner
+
+    def on_record(topic, received_ns, record):
+        print(topic.device, topic.characteristic, record)
+
+    if __name__ == '__main__':
+        manifest = [
+            DeviceSpec('trainer-1', 'CD:E5:C8:5A:1B:77', 'fitness_machine'),
+            DeviceSpec('hr-1', 'F1:22:AB:04:9C:10', 'heart_rate'),
+            ...
+        ]
+        with ShardedRunner(manifest, workers=4, on_record=on_record) as runner:
+            runner.run()
+
+From the command line, with simulated devices in place of the addresses:
+
+.. code-block:: console
+
+    $ python -m pycycling.sharding manifest.json --workers 4 --simulate
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from multiprocessing.connection import wait
+
+from pycycling.battery_service import BatteryService
+from pycycling.cycling_power_service import CyclingPowerService
+from pycycling.cycling_speed_cadence_service import CyclingSpeedCadenceService
+from pycycling.fitness_machine_service import FitnessMachineService
+from pycycling.framing import FRAME_RECORDS, FRAME_STATUS, FRAME_TOPICS, TopicTable, decode_frame, encode_frame
+from pycycling.heart_rate_service import HeartRateService
+from pycycling.rear_view_radar import RearViewRadarService
+from pycycling.rizer import Rizer
+from pycycling.sterzo import Sterzo
+from pycycling.supervisor import ConnectionSupervisor
+from pycycling.tacx_trainer_control import TacxTrainerControl
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceSpec(namedtuple('DeviceSpec', ['name', 'address', 'service', 'characteristics'], defaults=(None,))):
+    """
+    A device of a manifest.
+
+    :ivar name: A unique name for the device, used in the topics of its records
+    :ivar address: The Bluetooth address of the device
+    :ivar service: One of the keys of :data:`SERVICES`
+    :ivar characteristics: The characteristics to enable, or `None` for all those of the service
+    """
+    __slots__ = ()
+
+
+# Service name: (service class, {characteristic: method enabling its notifications})
+SERVICES = {
+    'battery': (BatteryService, {'battery_level': 'enable_battery_level_notifications'}),
+    'cycling_power': (CyclingPowerService, {
+        'cycling_power_measurement': 'enable_cycling_power_measurement_notifications',
+        'cycling_power_vector': 'enable_cycling_power_vector_notifications',
+    }),
+    'cycling_speed_cadence': (CyclingSpeedCadenceService, {
+        'csc_measurement': 'enable_csc_measurement_notifications',
+    }),
+    'fitness_machine': (FitnessMachineService, {
+        'indoor_bike_data': 'enable_indoor_bike_data_notify',
+        'fitness_machine_status': 'enable_fitness_machine_status_notify',
+        'training_status': 'enable_training_status_notify',
+        'control_point_response': 'enable_control_point_indicate',
+    }),
+    'heart_rate': (HeartRateService, {'hr_measurement': 'enable_hr_measurement_notifications'}),
+    'rear_view_radar': (RearViewRadarService, {'radar_measurement': 'enable_radar_measurement_notifications'}),
+    'rizer': (Rizer, {'steering_measurement': 'enable_steering_measurement_notifications'}),
+    'sterzo': (Sterzo, {'steering_measurement': 'enable_steering_measurement_notifications'}),
+    'tacx': (TacxTrainerControl, {
+        'general_fe_data_page': 'enable_fec_notifications',
+        'specific_trainer_data_page': 'enable_fec_notifications',
+        'command_status_data_page': 'enable_fec_notifications',
+    }),
+}
+
+WorkerStatus = namedtuple('WorkerStatus', ['shard', 'pid', 'alive', 'devices', 'records', 'restarts'])
+
+
+def load_manifest(path):
+    """Returns the list of :obj:`DeviceSpec` in a JSON manifest file"""
+    with open(path, encoding='utf-8') as manifest:
+        entries = json.load(manifest)
+    return [DeviceSpec(**entry) for entry in entries]
+
+
+def shard_manifest(manifest, shards):
+    """
+    Split a manifest into shards of nearly equal size, keeping the order of devices within each shard.
+
+    :return: A list of `shards` lists of :obj:`DeviceSpec`
+    """
+    return [list(manifest[index::shards]) for index in range(shards)]
+
+
+def bleak_client(spec, disconnected_callback):
+    """The default client factory, returning a :class:`bleak.BleakClient` for a device"""
+    from bleak import BleakClient  # pylint: disable=import-outside-toplevel
+    return BleakClient(spec.address, disconnected_callback=disconnected_callback)
+
+
+def simulated_client(spec, disconnected_callback):
+    """A client factory returning a simulated device from :mod:`pycycling.sim`, for trying out a manifest"""
+    from pycycling import sim  # pylint: disable=import-outside-toplevel
+    simulated_types = {
+        'cycling_power': sim.SimulatedPowerMeter,
+        'cycling_speed_cadence': sim.SimulatedSpeedCadenceSensor,
+        'fitness_machine': sim.SimulatedTrainer,
+        'heart_rate': sim.SimulatedHeartRateMonitor,
+    }
+    if spec.service not in simulated_types:
+        raise ValueError(f'no simulated device for {spec.service}')
+    return simulated_types[spec.service](spec.address, disconnected_callback=disconnected_callback)
+
+
+def _characteristics(spec):
+    _, enable_methods = SERVICES[spec.service]
+    return list(enable_methods) if spec.characteristics is None else list(spec.characteristics)
+
+
+def _validate(manifest):
+    names = set()
+    for spec in manifest:
+        if spec.service not in SERVICES:
+            raise ValueError(f'service of {spec.name} must be one of {", ".join(SERVICES)}')
+        _, enable_methods = SERVICES[spec.service]
+        for characteristic in _characteristics(spec):
+            if characteristic not in enable_methods:
+                raise ValueError(f'{characteristic} is not a characteristic of {spec.service}')
+        if spec.name in names:
+            raise ValueError(f'device name {spec.name} is not unique')
+        names.add(spec.name)
+
+
+class _Worker:
+    """The event loop side of a worker process"""
+
+    def __init__(self, devices, connection, stop_event, client_factory, flush_interval):
+        self._devices = devices
+        self._connection = connection
+        self._stop_event = stop_event
+        self._client_factory = client_factory
+        self._flush_interval = flush_interval
+        self._topics = TopicTable()
+        self._batch = []
+        self._clients = []
+        self._supervisors = []
+
+    async def run(self):
+        for spec in self._devices:
+            for characteristic in _characteristics(spec):
+                self._topics.topic_id(spec.name, characteristic)
+        self._send(FRAME_TOPICS, self._topics.take_new())
+        tasks = [asyncio.get_running_loop().create_task(self._start_device(spec)) for spec in self._devices]
+        try:
+            while not self._stop_event.is_set():
+                await asyncio.sleep(self._flush_interval)
+                self._flush()
+        finally:
+            for task in tasks:
+                task.cancel()
+            for supervisor in self._supervisors:
+                supervisor.stop()
+            for client in self._clients:
+                try:
+                    await client.disconnect()
+                except Exception:  # pylint: disable=broad-except
+                    logger.debug('Disconnecting %s failed', getattr(client, 'address', None), exc_info=True)
+            self._flush()
+
+    async def _start_device(self, spec):
+        service_type, enable_methods = SERVICES[spec.service]
+        supervisor = ConnectionSupervisor()
+        client = self._client_factory(spec, supervisor.disconnected_callback)
+        supervisor.set_client(client)
+        self._supervisors.append(supervisor)
+        self._clients.append(client)
+
+        service = service_type(client)
+        service.enable_receive_timestamps()
+        supervised = supervisor.supervise(service)
+        enables = []
+        for characteristic in _characteristics(spec):
+            service.subscribe(characteristic, self._recorder(self._topics.topic_id(spec.name, characteristic)))
+            if enable_methods[characteristic] not in enables:
+                enables.append(enable_methods[characteristic])
+
+        enabled = False
+        try:
+            await supervisor.reconnect()
+            for enable in enables:
+                await getattr(supervised, enable)()
+            enabled = True
+        except asyncio.CancelledError:  # pylint: disable=try-except-raise
+            # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+            raise
+        except Exception:  # pylint: disable=broad-except
+            # The enables are recorded, so the supervisor restores them when it next reconnects
+            logger.warning('Enabling notifications of %s failed', spec.name, exc_info=True)
+        supervisor.start()
+        if enabled:
+            self._send(FRAME_STATUS, {'device': spec.name, 'connected': True})
+
+    def _recorder(self, topic_id):
+        append = self._batch.append
+
+        def record(timestamped):
+            append((topic_id, timestamped.received_ns, timestamped.record))
+
+        return record
+
+    def _flush(self):
+        if self._batch:
+            self._send(FRAME_RECORDS, self._batch)
+            self._batch.clear()
+
+    def _send(self, kind, payload):
+        self._connection.send_bytes(encode_frame(kind, payload))
+
+
+def _worker_main(devices, connection, stop_event, client_factory, flush_interval):
+    try:
+        asyncio.run(_Worker(devices, connection, stop_event, client_factory, flush_interval).run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+
+
+class _Shard:
+    __slots__ = ('index', 'devices', 'process', 'connection', 'topics', 'records', 'restarts', 'failures',
+                 'started', 'restart_at')
+
+    def __init__(self, index, devices):
+        self.index = index
+        self.devices = devices
+        self.process = None
+        self.connection = None
+        self.topics = TopicTable()
+        self.records = 0
+        self.restarts = 0
+        self.failures = 0
+        self.started = None
+        self.restart_at = None
+
+
+class ShardedRunner:
+    """
+    Runs the devices of a manifest in worker processes and passes their records to a callback.
+
+    :param manifest: A list of :obj:`DeviceSpec`
+    :param workers: The number of worker processes. Defaults to the number of CPUs, but no more than the number of
+        devices
+    :param on_record: Called in the parent process with the :obj:`~pycycling.framing.Topic`, the
+        :func:`time.monotonic_ns` receive time and the record, for each record
+    :param client_factory: A function taking a :obj:`DeviceSpec` and a disconnected callback, and returning an
+        unconnected client for the device. Must be picklable, i.e. defined at the top level of a module. Defaults to
+        :func:`bleak_client`
+    :param flush_interval: How often, in seconds, each worker sends its batch of records
+    :param restart_backoff: Delay, in seconds, before restarting a worker which exited. Doubles each time the worker
+        exits again within `max_backoff` seconds of starting
+    :param max_backoff: The longest delay, in seconds, before restarting a worker
+    :param on_status: Optional callback, called with the device name and status :obj:`dict` reported by workers, e.g.
+        when a device first connects
+    :param context: The :mod:`multiprocessing` context or start method name used to start workers
+    """
+
+    def __init__(self, manifest, *, workers=None, on_record=None, client_factory=bleak_client, flush_interval=0.05,
+                 restart_backoff=1.0, max_backoff=30.0, on_status=None, context=None):
+        manifest = list(manifest)
+        _validate(manifest)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(manifest)))
+        self._shards = [_Shard(index, devices) for index, devices in enumerate(shard_manifest(manifest, workers))]
+        self._on_record = on_record
+        self._client_factory = client_factory
+        self._flush_interval = flush_interval
+        self._restart_backoff = restart_backoff
+        self._max_backoff = max_backoff
+        self._on_status = on_status
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+        self._context = context
+        self._stop_event = context.Event()
+        self._running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop()
+
+    def start(self):
+        """Start every worker process"""
+        self._stop_event.clear()
+        self._running = True
+        for shard in self._shards:
+            self._start_worker(shard)
+
+    def stop(self, timeout=5.0):
+        """
+        Ask the workers to disconnect their devices and exit, terminating any still running after `timeout` seconds.
+        Records sent before the workers exit are still delivered.
+        """
+        self._running = False
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for shard in self._shards:
+            if shard.process is None:
+                continue
+            while shard.process.is_alive() and time.monotonic() < deadline:
+                self._receive(shard, min(0.05, max(deadline - time.monotonic(), 0)))
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.process.join()
+            self._receive(shard, 0)
+            shard.connection.close()
+            shard.process = None
+            shard.connection = None
+
+    def run(self, duration=None):
+        """
+        Receive and dispatch records until :meth:`stop` is called from a callback, or for `duration` seconds.
+        """
+        deadline = None if duration is None else time.monotonic() + duration
+        while self._running:
+            timeout = 0.5 if deadline is None else min(deadline - time.monotonic(), 0.5)
+            if timeout < 0:
+                return
+            self.poll(timeout)
+
+    def poll(self, timeout=0.0):
+        """
+        Dispatch the records received from workers, waiting up to `timeout` seconds for some to arrive, and restart
+        workers which have exited.
+
+        :return: The number of records dispatched
+        """
+        if not self._running:
+            return 0
+        now = time.monotonic()
+        waiting = {}
+        for shard in self._shards:
+            if shard.process is None:
+                if shard.restart_at is not None and now >= shard.restart_at:
+                    self._start_worker(shard)
+                continue
+            waiting[shard.connection] = shard
+            waiting[shard.process.sentinel] = shard
+
+        restart_times = [shard.restart_at for shard in self._shards if shard.process is None]
+        if restart_times:
+            timeout = max(min([timeout] + [restart_at - now for restart_at in restart_times]), 0)
+
+        dispatched = 0
+        for ready in wait(list(waiting), timeout):
+            shard = waiting[ready]
+            if ready is shard.connection:
+                dispatched += self._receive(shard, 0)
+            elif shard.process is not None and not shard.process.is_alive():
+                dispatched += self._receive(shard, 0)
+                self._worker_exited(shard)
+        return dispatched
+
+    @property
+    def workers(self):
+        """A :obj:`WorkerStatus` for each worker"""
+        return [WorkerStatus(shard=shard.index,
+                             pid=shard.process.pid if shard.process is not None else None,
+                             alive=shard.process is not None and shard.process.is_alive(),
+                             devices=[spec.name for spec in shard.devices],
+                             records=shard.records,
+                             restarts=shard.restarts) for shard in self._shards]
+
+    def _start_worker(self, shard):
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_worker_main, name=f'pycycling-shard-{shard.index}', daemon=True,
+                                        args=(shard.devices, sender, self._stop_event, self._client_factory,
+                                              self._flush_interval))
+        process.start()
+        sender.close()
+        shard.process = process
+        shard.connection = receiver
+        shard.topics.clear()
+        shard.started = time.monotonic()
+        shard.restart_at = None
+
+    def _worker_exited(self, shard):
+        shard.connection.close()
+        shard.process.join()
+        exit_code = shard.process.exitcode
+        shard.process = None
+        shard.connection = None
+        if not self._running:
+            return
+        if time.monotonic() - shard.started > self._max_backoff:
+            shard.failures = 0
+        delay = min(self._max_backoff, self._restart_backoff * 2 ** shard.failures)
+        shard.failures += 1
+        shard.restarts += 1
+        shard.restart_at = time.monotonic() + delay
+        logger.warning('Worker %d exited with code %s, restarting in %.1f s', shard.index, exit_code, delay)
+
+    def _receive(self, shard, timeout):
+        connection = shard.connection
+        dispatched = 0
+        try:
+            while connection.poll(timeout):
+                timeout = 0
+                frame = decode_frame(connection.recv_bytes())
+                if frame.kind == FRAME_RECORDS:
+                    dispatched += self._dispatch(shard, frame.payload)
+                elif frame.kind == FRAME_TOPICS:
+                    shard.topics.update(frame.payload)
+                elif frame.kind == FRAME_STATUS and self._on_status is not None:
+                    self._on_status(frame.payload.get('device'), frame.payload)
+        except (EOFError, OSError):
+            pass
+        return dispatched
+
+    def _dispatch(self, shard, records):
+        shard.records += len(records)
+        on_record = self._on_record
+        if on_record is None:
+            return len(records)
+        topic = shard.topics.topic
+        for topic_id, received_ns, record in records:
+            on_record(topic(topic_id), received_ns, record)
+        return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pycycling.sharding',
+                                     description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('manifest', help='JSON file listing the devices')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--duration', type=float, default=None, help='stop after this many seconds')
+    parser.add_argument('--simulate', action='store_true', help='use simulated devices in place of the addresses')
+    args = parser.parse_args(argv)
+
+    def on_record(topic, received_ns, record):
+        print(topic.device, topic.characteristic, received_ns, record, flush=False)
+
+    runner = ShardedRunner(load_manifest(args.manifest), workers=args.workers, on_record=on_record,
+                           client_factory=simulated_client if args.simulate else bleak_client)
+    with runner:
+        try:
+            runner.run(args.duration)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
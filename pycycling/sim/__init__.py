@@ -0,0 +1,41 @@
+"""
+Simulated devices for testing without Bluetooth hardware.
+
+The simulated devices are fake clients with the subset of the :class:`bleak.BleakClient` interface used by the
+services, so they can be passed to the service classes in place of a real client. They send correctly encoded
+notifications at a configurable rate from a task on the event loop:
+
+* :class:`SimulatedTrainer`: a Fitness Machine Service indoor bike with a physics model, which responds to control
+  point commands and indicates a control point response for each,
+* :class:`SimulatedPowerMeter`: a Cycling Power Service crank power meter,
+* :class:`SimulatedHeartRateMonitor`: a Heart Rate Service chest strap,
+* :class:`SimulatedSpeedCadenceSensor`: a Cycling Speed and Cadence Service sensor.
+
+Devices given the same :class:`Rider` report consistent power, cadence and heart rate. Each device runs a single
+task, so hundreds of them can share one process.
+
+Example
+=======
+.. code-block:: python
+
+    import asyncio
+
+    from pycycling.fitness_machine_service import FitnessMachineService
+    from pycycling.sim import Rider, SimulatedTrainer
+
+    async def run():
+        async with SimulatedTrainer('sim-trainer-1', Rider(power=180)) as client:
+            trainer = FitnessMachineService(client)
+            trainer.set_indoor_bike_data_handler(print)
+            await trainer.enable_indoor_bike_data_notify()
+            await trainer.enable_control_point_indicate()
+            await trainer.request_control()
+            await trainer.set_target_power(250)
+            await asyncio.sleep(10)
+
+    asyncio.run(run())
+"""
+from pycycling.sim.client import SimulatedClient
+from pycycling.sim.devices import SimulatedHeartRateMonitor, SimulatedPowerMeter, SimulatedSpeedCadenceSensor, \
+    SimulatedTrainer
+from pycycling.sim.rider import Rider, resistance_force, steady_state_speed
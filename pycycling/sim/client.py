@@ -0,0 +1,170 @@
+"""
+A base class for simulated devices with the subset of the :class:`bleak.BleakClient` interface used by the services.
+"""
+import asyncio
+import time
+
+
+class SimulatedClient:
+    """
+    A fake Bluetooth client which produces notifications from a model instead of a radio.
+
+    Subclasses register their characteristics with :meth:`_add_readable` and :meth:`_add_writable`, advance their model
+    in :meth:`_advance` and send notifications with :meth:`_notify`. While connected and with at least one notification
+    enabled, a task on the event loop advances the model `rate` times per second, at fixed deadlines so that the rate
+    does not drift.
+
+    :param address: The address reported by the client
+    :param rate: Notifications per second of each enabled characteristic
+    :param disconnected_callback: Called with the client when it is disconnected by :meth:`drop`
+    :param clock: Function returning the current time in seconds
+    """
+
+    def __init__(self, address, rate=4.0, disconnected_callback=None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.address = address
+        self.rate = rate
+        self.is_connected = False
+        self.notifications_sent = 0
+        self._disconnected_callback = disconnected_callback
+        self._clock = clock
+        self._handlers = {}
+        self._readable = {}
+        self._writable = {}
+        self._task = None
+        self._last_advanced = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        await self.disconnect()
+
+    async def connect(self, **kwargs):  # pylint: disable=unused-argument
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        self._disconnect()
+        return True
+
+    def drop(self):
+        """Simulate a loss of the connection, as if the device went out of range"""
+        self._disconnect()
+        if self._disconnected_callback is not None:
+            self._disconnected_callback(self)
+
+    def set_disconnected_callback(self, callback):
+        self._disconnected_callback = callback
+
+    async def start_notify(self, char_specifier, callback, **kwargs):  # pylint: disable=unused-argument
+        self._check_connected()
+        if char_specifier not in self._notifiable_characteristics():
+            raise ValueError(f'Characteristic {char_specifier} does not support notifications')
+        self._handlers[char_specifier] = callback
+        if self._task is None:
+            self._last_advanced = self._clock()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop_notify(self, char_specifier):
+        self._handlers.pop(char_specifier, None)
+        if not self._handlers:
+            self._stop_task()
+
+    async def read_gatt_char(self, char_specifier, **kwargs):  # pylint: disable=unused-argument
+        self._check_connected()
+        read = self._readable.get(char_specifier)
+        if read is None:
+            raise ValueError(f'Characteristic {char_specifier} is not readable')
+        return bytearray(read())
+
+    async def write_gatt_char(self, char_specifier, data, response=None):  # pylint: disable=unused-argument
+        self._check_connected()
+        write = self._writable.get(char_specifier)
+        if write is None:
+            raise ValueError(f'Characteristic {char_specifier} is not writable')
+        write(bytes(data))
+
+    def set_notification_handler(self, char_specifier, callback):
+        """
+        Send the notifications of a characteristic to `callback` without starting the notification task, for driving
+        the model with :meth:`advance` alone.
+
+        :param char_specifier: The UUID of the characteristic
+        :param callback: Called with the UUID and a :obj:`bytearray` for each notification, or `None` to stop
+        """
+        if char_specifier not in self._notifiable_characteristics():
+            raise ValueError(f'Characteristic {char_specifier} does not support notifications')
+        if callback is None:
+            self._handlers.pop(char_specifier, None)
+        else:
+            self._handlers[char_specifier] = callback
+
+    def advance(self, elapsed=None):
+        """
+        Advance the model and send notifications, as the notification task does on every tick.
+
+        :param elapsed: Seconds to advance the model by. Defaults to the time since the model was last advanced
+        """
+        now = self._clock()
+        if elapsed is None:
+            elapsed = 0.0 if self._last_advanced is None else now - self._last_advanced
+        self._last_advanced = now
+        self._advance(elapsed)
+
+    def _notifiable_characteristics(self):
+        """The UUIDs of the characteristics which support notifications or indications"""
+        raise NotImplementedError
+
+    def _advance(self, elapsed):
+        raise NotImplementedError
+
+    def _add_readable(self, uuid, read):
+        self._readable[uuid] = read
+
+    def _add_writable(self, uuid, write):
+        self._writable[uuid] = write
+
+    def _notifying(self, uuid):
+        return uuid in self._handlers
+
+    def _notify(self, uuid, payload):
+        handler = self._handlers.get(uuid)
+        if handler is None:
+            return
+        self.notifications_sent += 1
+        handler(uuid, bytearray(payload))
+
+    def _notify_soon(self, uuid, payload):
+        # Indications in response to a write arrive after the write has completed
+        asyncio.get_running_loop().call_soon(self._notify, uuid, payload)
+
+    def _check_connected(self):
+        if not self.is_connected:
+            raise ConnectionError(f'Simulated device {self.address} is not connected')
+
+    def _disconnect(self):
+        self.is_connected = False
+        self._handlers.clear()
+        self._stop_task()
+
+    def _stop_task(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.rate
+        deadline = loop.time()
+        while True:
+            deadline += interval
+            delay = deadline - loop.time()
+            if delay < 0:
+                # Fell more than a tick behind; skip the missed ticks rather than bursting to catch up
+                deadline -= (delay // interval) * interval
+                delay = deadline - loop.time()
+            await asyncio.sleep(delay)
+            self.advance()
@@ -0,0 +1,310 @@
+"""
+Simulated trainers and sensors.
+"""
+import math
+import struct
+
+from pycycling.cycling_power_service import CyclingPowerMeasurement, cycling_power_feature_tx_id, \
+    cycling_power_measurement_tx_id, encode_cycling_power_measurement, sensor_location_tx_id
+from pycycling.cycling_speed_cadence_service import CSCMeasurement, csc_feature_tx_id, csc_measurement_tx_id, \
+    encode_csc_measurement
+from pycycling.fitness_machine_service import ftms_fitness_machine_control_point_characteristic_id, \
+    ftms_fitness_machine_feature_characteristic_id, ftms_fitness_machine_status_characteristic_id, \
+    ftms_indoor_bike_data_characteristic_id, ftms_supported_power_range_characteristic_id, \
+    ftms_supported_resistance_level_range_characteristic_id, ftms_training_status_characteristic_id
+from pycycling.ftms_parsers import FitnessMachineStatus, FitnessMachineStatusMessage, FTMSControlPointOpCode, \
+    FTMSControlPointResponseResultCode, IndoorBikeData, encode_fitness_machine_status, encode_indoor_bike_data
+from pycycling.heart_rate_service import HeartRateMeasurement, encode_hr_measurement, \
+    heart_rate_measurement_characteristic_id
+from pycycling.sim.client import SimulatedClient
+from pycycling.sim.rider import Rider, resistance_force, steady_state_speed
+
+_EVENT_TIME_UNITS = 1024
+
+
+def _status(status, value=None):
+    return encode_fitness_machine_status(FitnessMachineStatusMessage(status=status, value=value, unit=None))
+
+
+class _Crank:
+    """Cumulative revolutions and the time of the last one, in 1/1024 s, for crank or wheel revolution data"""
+    __slots__ = ('position', 'elapsed', 'last_event_time')
+
+    def __init__(self):
+        self.position = 0.0
+        self.elapsed = 0.0
+        self.last_event_time = 0
+
+    def advance(self, elapsed, revolutions_per_second):
+        self.elapsed += elapsed
+        self.position += revolutions_per_second * elapsed
+        if revolutions_per_second > 0 and int(self.position) != int(self.position - revolutions_per_second * elapsed):
+            since_event = (self.position % 1) / revolutions_per_second
+            self.last_event_time = int((self.elapsed - since_event) * _EVENT_TIME_UNITS) & 0xFFFF
+
+    @property
+    def revolutions(self):
+        return int(self.position)
+
+
+class SimulatedTrainer(SimulatedClient):
+    """
+    A Fitness Machine Service indoor bike.
+
+    The trainer notifies indoor bike data and accepts control point commands, indicating a response to each and
+    notifying the resulting fitness machine status. Its power follows the target power in ERG mode, the rider's cadence
+    times the resistance level in resistance mode, and the rider otherwise. Speed follows from the power and the
+    simulation parameters.
+
+    :param address: The address reported by the client
+    :param rider: The :class:`~pycycling.sim.rider.Rider` on the trainer. A new one is created if not given
+    :param rate: Indoor bike data notifications per second
+    :param kwargs: Passed to :class:`~pycycling.sim.client.SimulatedClient`
+    """
+
+    def __init__(self, address, rider=None, rate=4.0, **kwargs):
+        super().__init__(address, rate, **kwargs)
+        self.rider = rider if rider is not None else Rider()
+        self.has_control = False
+        self.running = False
+        self.mode = None
+        self.target_power = None
+        self.resistance_level = 0
+        self.wind_speed = 0.0
+        self.grade = 0.0
+        self.crr = 0.004
+        self.cw = 0.51
+        self.power = 0.0
+        self.speed = 0.0
+        self.distance = 0.0
+        self.elapsed_time = 0.0
+        self._add_readable(ftms_fitness_machine_feature_characteristic_id, self._read_feature)
+        self._add_readable(ftms_supported_power_range_characteristic_id, lambda: struct.pack('<hhH', 0, 2000, 1))
+        self._add_readable(ftms_supported_resistance_level_range_characteristic_id,
+                           lambda: struct.pack('<hhH', 0, 100, 1))
+        self._add_writable(ftms_fitness_machine_control_point_characteristic_id, self._write_control_point)
+
+    def _notifiable_characteristics(self):
+        return (ftms_indoor_bike_data_characteristic_id, ftms_fitness_machine_status_characteristic_id,
+                ftms_training_status_characteristic_id, ftms_fitness_machine_control_point_characteristic_id)
+
+    @staticmethod
+    def _read_feature():
+        # Cadence, total distance, resistance level, elapsed time and power measurement; resistance, power and
+        # simulation parameter targets
+        fitness_machine_features = (1 << 1) | (1 << 2) | (1 << 7) | (1 << 12) | (1 << 14)
+        target_setting_features = (1 << 2) | (1 << 3) | (1 << 13)
+        return struct.pack('<II', fitness_machine_features, target_setting_features)
+
+    def _advance(self, elapsed):
+        rider = self.rider
+        rider.update()
+        if elapsed > 0:
+            if self.mode == 'power' and self.target_power is not None:
+                # Trainers ramp to a new target over about a second
+                pedalling = rider.cadence > 0
+                target = self.target_power if pedalling else 0.0
+                self.power += (target - self.power) * (1 - math.exp(-elapsed))
+            elif self.mode == 'resistance':
+                self.power = 0.1 * self.resistance_level * rider.cadence
+            else:
+                self.power = rider.power
+
+            force = resistance_force(self.speed, rider.mass, grade=self.grade, crr=self.crr, cw=self.cw,
+                                     wind_speed=self.wind_speed)
+            acceleration = (self.power / max(self.speed, 1.0) - force) / rider.mass
+            self.speed = max(self.speed + acceleration * elapsed, 0.0)
+            self.distance += self.speed * elapsed
+            self.elapsed_time += elapsed
+
+        if self._notifying(ftms_indoor_bike_data_characteristic_id):
+            self._notify(ftms_indoor_bike_data_characteristic_id, encode_indoor_bike_data(IndoorBikeData(
+                instant_speed=min(self.speed * 3.6, 655.35),
+                average_speed=None,
+                instant_cadence=min(int(rider.cadence * 2) / 2, 32767.5),
+                average_cadence=None,
+                total_distance=int(self.distance),
+                resistance_level=self.resistance_level,
+                instant_power=int(self.power),
+                average_power=None,
+                total_energy=None,
+                energy_per_hour=None,
+                energy_per_minute=None,
+                heart_rate=None,
+                metabolic_equivalent=None,
+                elapsed_time=min(int(self.elapsed_time), 0xFFFF),
+                remaining_time=None,
+            )))
+
+    def _write_control_point(self, data):
+        opcode = data[0]
+        result = FTMSControlPointResponseResultCode.SUCCESS
+        status = None
+
+        if opcode == FTMSControlPointOpCode.REQUEST_CONTROL.value:
+            self.has_control = True
+        elif not self.has_control:
+            result = FTMSControlPointResponseResultCode.CONTROL_NOT_PERMITTED
+        elif opcode == FTMSControlPointOpCode.RESET.value:
+            self.has_control = False
+            self.running = False
+            self.mode = None
+            self.target_power = None
+            self.resistance_level = 0
+            status = _status(FitnessMachineStatus.RESET)
+        elif opcode == FTMSControlPointOpCode.SET_TARGET_RESISTANCE_LEVEL.value and len(data) == 2:
+            self.mode = 'resistance'
+            self.resistance_level = data[1]
+            status = _status(FitnessMachineStatus.NEW_RESISTANCE, data[1])
+        elif opcode == FTMSControlPointOpCode.SET_TARGET_POWER.value and len(data) == 3:
+            self.mode = 'power'
+            [self.target_power] = struct.unpack_from('<h', data, 1)
+            status = _status(FitnessMachineStatus.NEW_POWER, self.target_power)
+        elif opcode == FTMSControlPointOpCode.START_OR_RESUME.value:
+            self.running = True
+            status = _status(FitnessMachineStatus.STARTED_BY_USER)
+        elif opcode == FTMSControlPointOpCode.STOP_OR_PAUSE.value and len(data) == 2:
+            self.running = False
+            status = _status(FitnessMachineStatus.STOPPED_BY_USER if data[1] == 0x01
+                             else FitnessMachineStatus.PAUSED_BY_USER)
+        elif opcode == FTMSControlPointOpCode.SET_INDOOR_BIKE_SIMULATION_PARAMETERS.value and len(data) == 7:
+            wind_speed, grade, crr, cw = struct.unpack_from('<hhBB', data, 1)
+            self.mode = 'simulation'
+            self.wind_speed = wind_speed / 1000
+            self.grade = grade / 100
+            self.crr = crr / 10000
+            self.cw = cw / 100
+            # Echoed as written, as the status uses the control point's resolution for the coefficients
+            status = b'\x12' + data[1:7]
+        elif opcode in (FTMSControlPointOpCode.SET_TARGET_RESISTANCE_LEVEL.value,
+                        FTMSControlPointOpCode.SET_TARGET_POWER.value,
+                        FTMSControlPointOpCode.STOP_OR_PAUSE.value,
+                        FTMSControlPointOpCode.SET_INDOOR_BIKE_SIMULATION_PARAMETERS.value):
+            result = FTMSControlPointResponseResultCode.INCORRECT_PARAMETER
+        else:
+            result = FTMSControlPointResponseResultCode.NOT_SUPPORTED
+
+        if self._notifying(ftms_fitness_machine_control_point_characteristic_id):
+            self._notify_soon(ftms_fitness_machine_control_point_characteristic_id,
+                              bytes([FTMSControlPointOpCode.RESPONSE_CODE.value, opcode, result.value]))
+        if status is not None and self._notifying(ftms_fitness_machine_status_characteristic_id):
+            self._notify_soon(ftms_fitness_machine_status_characteristic_id, status)
+
+
+class SimulatedPowerMeter(SimulatedClient):
+    """
+    A Cycling Power Service crank power meter, notifying power, crank revolution data and accumulated energy.
+
+    :param address: The address reported by the client
+    :param rider: The :class:`~pycycling.sim.rider.Rider` on the bicycle. A new one is created if not given
+    :param rate: Notifications per second
+    :param kwargs: Passed to :class:`~pycycling.sim.client.SimulatedClient`
+    """
+
+    def __init__(self, address, rider=None, rate=4.0, **kwargs):
+        super().__init__(address, rate, **kwargs)
+        self.rider = rider if rider is not None else Rider()
+        self.energy = 0.0
+        self._crank = _Crank()
+        # Crank revolution data and accumulated energy supported
+        self._add_readable(cycling_power_feature_tx_id, lambda: struct.pack('<I', (1 << 3) | (1 << 6)))
+        # Left crank
+        self._add_readable(sensor_location_tx_id, lambda: b'\x05')
+
+    def _notifiable_characteristics(self):
+        return (cycling_power_measurement_tx_id,)
+
+    def _advance(self, elapsed):
+        rider = self.rider
+        rider.update()
+        self.energy += rider.power * elapsed
+        self._crank.advance(elapsed, rider.cadence / 60)
+        self._notify(cycling_power_measurement_tx_id, encode_cycling_power_measurement(CyclingPowerMeasurement(
+            instantaneous_power=int(rider.power),
+            accumulated_energy=int(self.energy / 1000),
+            pedal_power_balance=None,
+            accumulated_torque=None,
+            cumulative_wheel_revs=None,
+            last_wheel_event_time=None,
+            cumulative_crank_revs=self._crank.revolutions,
+            last_crank_event_time=self._crank.last_event_time,
+            maximum_force_magnitude=None,
+            minimum_force_magnitude=None,
+            maximum_torque_magnitude=None,
+            minimum_torque_magnitude=None,
+            top_dead_spot_angle=None,
+            bottom_dead_spot_angle=None,
+        )))
+
+
+class SimulatedHeartRateMonitor(SimulatedClient):
+    """
+    A Heart Rate Service chest strap, notifying the heart rate with the RR intervals of the beats since the last
+    notification.
+
+    :param address: The address reported by the client
+    :param rider: The :class:`~pycycling.sim.rider.Rider` wearing the strap. A new one is created if not given
+    :param rate: Notifications per second
+    :param kwargs: Passed to :class:`~pycycling.sim.client.SimulatedClient`
+    """
+
+    def __init__(self, address, rider=None, rate=1.0, **kwargs):
+        super().__init__(address, rate, **kwargs)
+        self.rider = rider if rider is not None else Rider()
+        self._beats = 0.0
+
+    def _notifiable_characteristics(self):
+        return (heart_rate_measurement_characteristic_id,)
+
+    def _advance(self, elapsed):
+        rider = self.rider
+        rider.update()
+        heart_rate = rider.heart_rate
+        previous_beats = self._beats
+        self._beats += heart_rate / 60 * elapsed
+        beats = min(int(self._beats) - int(previous_beats), 8)
+        rr_interval = int(60 / heart_rate * _EVENT_TIME_UNITS) if heart_rate > 0 else 0
+        self._notify(heart_rate_measurement_characteristic_id, encode_hr_measurement(HeartRateMeasurement(
+            sensor_contact=True,
+            bpm=int(round(heart_rate)),
+            rr_interval=[rr_interval] * beats,
+            energy_expended=None,
+        )))
+
+
+class SimulatedSpeedCadenceSensor(SimulatedClient):
+    """
+    A Cycling Speed and Cadence Service sensor, notifying wheel and crank revolution data. The wheel speed is the
+    speed at which the rider's power balances the resistance on a flat road.
+
+    :param address: The address reported by the client
+    :param rider: The :class:`~pycycling.sim.rider.Rider` on the bicycle. A new one is created if not given
+    :param wheel_circumference: Wheel circumference in m
+    :param rate: Notifications per second
+    :param kwargs: Passed to :class:`~pycycling.sim.client.SimulatedClient`
+    """
+
+    def __init__(self, address, rider=None, wheel_circumference=2.105, rate=4.0, **kwargs):
+        super().__init__(address, rate, **kwargs)
+        self.rider = rider if rider is not None else Rider()
+        self.wheel_circumference = wheel_circumference
+        self._wheel = _Crank()
+        self._crank = _Crank()
+        # Wheel and crank revolution data supported
+        self._add_readable(csc_feature_tx_id, lambda: struct.pack('<H', 0b11))
+
+    def _notifiable_characteristics(self):
+        return (csc_measurement_tx_id,)
+
+    def _advance(self, elapsed):
+        rider = self.rider
+        rider.update()
+        speed = steady_state_speed(rider.power, rider.mass)
+        self._wheel.advance(elapsed, speed / self.wheel_circumference)
+        self._crank.advance(elapsed, rider.cadence / 60)
+        self._notify(csc_measurement_tx_id, encode_csc_measurement(CSCMeasurement(
+            cumulative_wheel_revs=self._wheel.revolutions,
+            last_wheel_event_time=self._wheel.last_event_time,
+            cumulative_crank_revs=self._crank.revolutions,
+            last_crank_event_time=self._crank.last_event_time,
+        )))
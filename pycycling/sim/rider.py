@@ -0,0 +1,87 @@
+"""
+A simple model of a rider and of the forces on a bicycle.
+"""
+import math
+import random
+import time
+
+GRAVITY = 9.81
+
+
+def resistance_force(speed, mass, *, grade=0.0, crr=0.004, cw=0.51, wind_speed=0.0):
+    """
+    Returns the force, in newtons, resisting a bicycle.
+
+    :param speed: Speed in m/s
+    :param mass: Mass of rider and bicycle in kg
+    :param grade: Grade in percent
+    :param crr: Coefficient of rolling resistance
+    :param cw: Wind resistance coefficient in kg/m, i.e. half the air density times the drag area
+    :param wind_speed: Head wind in m/s
+    """
+    angle = math.atan(grade / 100)
+    air_speed = speed + wind_speed
+    return (mass * GRAVITY * (crr * math.cos(angle) + math.sin(angle))
+            + cw * air_speed * abs(air_speed))
+
+
+def steady_state_speed(power, mass, *, grade=0.0, crr=0.004, cw=0.51, wind_speed=0.0):
+    """Returns the speed, in m/s, at which `power` watts balances the resistance, found by bisection"""
+    low, high = 0.0, 40.0
+    for _ in range(40):
+        speed = (low + high) / 2
+        if speed * resistance_force(speed, mass, grade=grade, crr=crr, cw=cw, wind_speed=wind_speed) > power:
+            high = speed
+        else:
+            low = speed
+    return low
+
+
+class Rider:
+    """
+    A rider whose power, cadence and heart rate vary randomly around targets. A rider can be shared by several
+    simulated devices, which then report consistent values.
+
+    :param power: Target power in W
+    :param cadence: Target cadence in rpm
+    :param heart_rate: Resting heart rate in bpm. The heart rate rises towards this plus 0.3 bpm per W of power
+    :param mass: Mass of rider and bicycle in kg
+    :param variability: Relative standard deviation of power and cadence
+    :param rng: The :class:`random.Random` used for variation
+    :param clock: Function returning the current time in seconds
+    """
+
+    def __init__(self, *, power=200.0, cadence=90.0, heart_rate=60.0, mass=80.0, variability=0.03, rng=None,
+                 clock=time.monotonic):
+        self.target_power = power
+        self.target_cadence = cadence
+        self.resting_heart_rate = heart_rate
+        self.mass = mass
+        self.variability = variability
+        self._rng = rng if rng is not None else random.Random()
+        self._clock = clock
+        self._updated = None
+        self.power = float(power)
+        self.cadence = float(cadence)
+        self.heart_rate = float(heart_rate)
+
+    def update(self, now=None):
+        """
+        Move the rider on to `now`. Calls from several devices for the same time only move the rider once.
+
+        :param now: The current time in seconds. Defaults to the rider's clock
+        """
+        now = self._clock() if now is None else now
+        if self._updated is None:
+            self._updated = now
+            return
+        elapsed = now - self._updated
+        if elapsed <= 0:
+            return
+        self._updated = now
+
+        gauss = self._rng.gauss
+        self.power = max(self.target_power * (1 + gauss(0, self.variability)), 0.0)
+        self.cadence = max(self.target_cadence * (1 + gauss(0, self.variability)), 0.0) if self.target_power else 0.0
+        target_heart_rate = self.resting_heart_rate + 0.3 * self.power
+        self.heart_rate += (target_heart_rate - self.heart_rate) * (1 - math.exp(-elapsed / 30))
@@ -0,0 +1,149 @@
+"""
+Conditioning of the steering angles reported by the Elite Sterzo and Wahoo Kickr Rizer.
+
+Steering measurements arrive at up to 32 Hz and are noisy around the centre. A :class:`SteeringConditioner` can be
+set on either service with ``set_steering_conditioner``, after which the callback receives conditioned angles:
+
+1. Outlier rejection drops single readings which jump further than is physically plausible.
+2. A deadband reports angles close to the centre as exactly 0.
+3. Exponential or `One Euro <https://gery.casiez.net/1euro/>`_ smoothing reduces jitter. The One Euro filter smooths
+   strongly while the bars are held still and follows quickly when they are turned.
+4. Decimation limits callbacks to the rate the consumer needs, e.g. the frame rate of a game, always delivering the
+   most recent conditioned angle.
+
+Readings which are dropped or decimated do not reach the callback at all.
+
+Example
+=======
+.. code-block:: python
+
+    from pycycling.steering import Smoothing, SteeringConditioner
+
+    sterzo = Sterzo(client)
+    sterzo.set_steering_conditioner(SteeringConditioner(deadband=1.0, smoothing=Smoothing.one_euro, output_rate=20))
+    sterzo.set_steering_measurement_callback(steer)
+"""
+import math
+import time
+from enum import Enum
+
+Smoothing = Enum('Smoothing', 'none exponential one_euro')
+
+_NANOSECONDS = 1e9
+
+
+def _smoothing_factor(elapsed, cutoff):
+    return 1.0 / (1.0 + 1.0 / (2 * math.pi * cutoff * elapsed))
+
+
+class SteeringConditioner:
+    """
+    Conditions a stream of steering angles. The state is a handful of floats, so each reading costs a few arithmetic
+    operations.
+
+    :param deadband: Angles, in degrees, with a magnitude below this are reported as 0
+    :param smoothing: A :obj:`Smoothing` member
+    :param alpha: Weight given to each new reading by exponential smoothing, between 0 and 1
+    :param min_cutoff: One Euro filter cutoff frequency, in Hz, while the angle is steady. Lower values smooth more
+    :param beta: One Euro filter speed coefficient. Higher values reduce lag while the angle is changing
+    :param derivative_cutoff: One Euro filter cutoff frequency, in Hz, for the rate of change of the angle
+    :param max_rate: Readings implying a rate of change above this, in degrees per second, are rejected as outliers.
+        `None` disables outlier rejection
+    :param max_rejections: After this many consecutive rejected readings the next one is accepted, so that a genuine
+        fast movement is not ignored
+    :param output_rate: The most conditioned angles delivered per second. `None` delivers every reading
+    :param clock: Function returning the current time in nanoseconds
+    """
+
+    def __init__(self, deadband=0.0, smoothing=Smoothing.none, *, alpha=0.5, min_cutoff=1.0, beta=0.05,
+                 derivative_cutoff=1.0, max_rate=None, max_rejections=2, output_rate=None, clock=time.monotonic_ns):
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be greater than 0 and at most 1')
+        if output_rate is not None and output_rate <= 0:
+            raise ValueError('output_rate must be positive')
+        self._deadband = deadband
+        self._smoothing = smoothing
+        self._alpha = alpha
+        self._min_cutoff = min_cutoff
+        self._beta = beta
+        self._derivative_cutoff = derivative_cutoff
+        self._max_rate = max_rate
+        self._max_rejections = max_rejections
+        self._output_interval_ns = None if output_rate is None else int(_NANOSECONDS / output_rate)
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        """Forget all previous readings"""
+        self._last_ns = None
+        self._last_raw = 0.0
+        self._rejections = 0
+        self._value = 0.0
+        self._derivative = 0.0
+        self._next_output_ns = None
+        self.rejected = 0
+
+    def __call__(self, angle, timestamp_ns=None):
+        """
+        Condition a reading.
+
+        :param angle: The steering angle, in degrees
+        :param timestamp_ns: Time of the reading, in nanoseconds. Defaults to the conditioner's clock
+        :return: The conditioned angle, or `None` if the reading was rejected or decimated
+        """
+        if timestamp_ns is None:
+            timestamp_ns = self._clock()
+        last_ns = self._last_ns
+        elapsed = None if last_ns is None else (timestamp_ns - last_ns) / _NANOSECONDS
+
+        if self._max_rate is not None and elapsed:
+            if abs(angle - self._last_raw) > self._max_rate * elapsed and self._rejections < self._max_rejections:
+                self._rejections += 1
+                self.rejected += 1
+                return None
+        self._rejections = 0
+        self._last_raw = angle
+
+        if -self._deadband < angle < self._deadband:
+            angle = 0.0
+
+        if elapsed is None or self._smoothing is Smoothing.none:
+            value = angle
+        elif self._smoothing is Smoothing.exponential:
+            value = self._value + self._alpha * (angle - self._value)
+        elif elapsed <= 0:
+            value = self._value
+        else:
+            derivative = (angle - self._value) / elapsed
+            self._derivative += _smoothing_factor(elapsed, self._derivative_cutoff) * (derivative - self._derivative)
+            cutoff = self._min_cutoff + self._beta * abs(self._derivative)
+            value = self._value + _smoothing_factor(elapsed, cutoff) * (angle - self._value)
+        self._value = value
+        self._last_ns = timestamp_ns
+
+        interval_ns = self._output_interval_ns
+        if interval_ns is not None:
+            next_output_ns = self._next_output_ns
+            if next_output_ns is not None and timestamp_ns < next_output_ns:
+                return None
+            # Keep to the output rate's grid unless the readings fell behind it
+            if next_output_ns is None or timestamp_ns - next_output_ns >= interval_ns:
+                self._next_output_ns = timestamp_ns + interval_ns
+            else:
+                self._next_output_ns = next_output_ns + interval_ns
+        return value
+
+
+def conditioned_parser(parser, conditioner):
+    """
+    Combine a steering measurement parser with a :class:`SteeringConditioner`.
+
+    :return: A parser returning the conditioned angle, or `None` when nothing should be delivered
+    """
+    if conditioner is None:
+        return parser
+
+    def parse(data):
+        return conditioner(parser(data))
+
+    return parse
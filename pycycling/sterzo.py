@@ -3,21 +3,29 @@ import asyncio
 import struct
 import importlib.resources
 import pycycling.data
+from pycycling.notifications import NotifyingService
+from pycycling.steering import conditioned_parser
 
 sterzo_measurement_id = '347b0030-7635-408b-8918-8ff3949ce592'
 sterzo_control_point_id = '347b0031-7635-408b-8918-8ff3949ce592'
 sterzo_challenge_code_id = '347b0032-7635-408b-8918-8ff3949ce592'
 
 
-class Sterzo:
+def _parse_steering_measurement(data):
+    [steering_angle] = struct.unpack('<f', data)
+    return steering_angle
+
+
+class Sterzo(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._steering_measurement_callback = None
+        super().__init__(client)
+        self._steering_measurement_channel = self._add_channel('steering_measurement', _parse_steering_measurement)
         self._latest_challenge = None
 
     async def enable_steering_measurement_notifications(self):
-        await self._client.start_notify(sterzo_challenge_code_id, self._challenge_code_indication_handler)
-        await self._client.start_notify(sterzo_measurement_id, self._steering_measurement_notification_handler)
+        await self._router.start_notify(sterzo_challenge_code_id, self._challenge_code_indication_handler)
+        await self._router.start_notify(sterzo_measurement_id,
+                                        self._steering_measurement_channel.notification_handler)
         await self._client.write_gatt_char(sterzo_control_point_id, bytearray([0x03, 0x10]))
         while self._latest_challenge is None:
             await asyncio.sleep(2)
@@ -41,14 +49,18 @@ class Sterzo:
         await self._client.write_gatt_char(sterzo_control_point_id, bytearray([0x02, 0x02]))
 
     async def disable_steering_measurement_notifications(self):
-        await self._client.stop_notify(sterzo_measurement_id)
+        await self._router.stop_notify(sterzo_measurement_id)
 
     def set_steering_measurement_callback(self, callback):
-        self._steering_measurement_callback = callback
+        self._steering_measurement_channel.set_handler(callback)
+
+    def set_steering_conditioner(self, conditioner):
+        """
+        Condition steering angles before they are delivered to callbacks.
+
+        :param conditioner: A :class:`~pycycling.steering.SteeringConditioner`, or `None` to deliver raw angles
+        """
+        self._steering_measurement_channel.parser = conditioned_parser(_parse_steering_measurement, conditioner)
 
     def _challenge_code_indication_handler(self, sender, data):  # pylint: disable=unused-argument
         self._latest_challenge = int.from_bytes(data[2:4], 'big')
-
-    def _steering_measurement_notification_handler(self, sender, data):  # pylint: disable=unused-argument
-        [steering_angle] = struct.unpack('<f', data)
-        self._steering_measurement_callback(steering_angle)
@@ -0,0 +1,290 @@
+"""
+Automatic reconnection of a Bluetooth device, restoring its notifications and control state.
+
+When a device drops, the service objects keep their callbacks but the device forgets which notifications were enabled
+and which target it was following. A :class:`ConnectionSupervisor` watches a client and, when it disconnects,
+reconnects with exponential backoff and jitter. It then re-enables every notification and re-sends the latest control
+commands of every supervised service, restoring all services concurrently.
+
+Services are supervised by calling their methods through the proxy returned by
+:func:`supervise <pycycling.supervisor.ConnectionSupervisor.supervise>`. The proxy records:
+
+* calls to ``enable_*`` methods, until the matching ``disable_*`` method is called,
+* the latest call to each asynchronous ``set_*`` method, e.g. the user configuration and the wind resistance of a Tacx
+  trainer. Setting one kind of target (power, resistance, simulation parameters, ...) forgets any other kind of
+  target set before it,
+* :meth:`~pycycling.fitness_machine_service.FitnessMachineService.request_control` and
+  :meth:`~pycycling.fitness_machine_service.FitnessMachineService.start_or_resume`, which are re-sent before the
+  targets.
+
+Example
+=======
+Disconnections are detected by polling the client every `check_interval` seconds. For recovery within a connection
+interval, also pass the supervisor's :meth:`~ConnectionSupervisor.disconnected_callback` to the client:
+
+.. code-block:: python
+
+    supervisor = ConnectionSupervisor()
+    async with BleakClient(address, disconnected_callback=supervisor.disconnected_callback) as client:
+        supervisor.set_client(client)
+        trainer = supervisor.supervise(FitnessMachineService(client))
+        await trainer.enable_indoor_bike_data_notify()
+        await trainer.enable_control_point_indicate()
+        await trainer.request_control()
+        await trainer.set_target_power(200)
+        supervisor.start()
+        ...
+"""
+import asyncio
+import inspect
+import logging
+import random
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+ConnectionState = Enum('ConnectionState', 'connected reconnecting restoring stopped failed')
+
+# Control commands which select what the trainer is targeting; only the latest one is restored
+_TARGET_COMMANDS = frozenset([
+    'set_target_power',
+    'set_target_resistance_level',
+    'set_target_speed',
+    'set_target_incline',
+    'set_target_heart_rate',
+    'set_simulation_parameters',
+    'set_basic_resistance',
+    'set_track_resistance',
+])
+
+# Commands restored before any set_* command, in this order
+_SESSION_COMMANDS = ('request_control', 'start_or_resume')
+
+
+class _ServiceState:
+    __slots__ = ('service', 'notifications', 'session', 'settings')
+
+    def __init__(self, service):
+        self.service = service
+        self.notifications = {}
+        self.session = {}
+        self.settings = {}
+
+    def record(self, name, args, kwargs):
+        if name.startswith('enable_'):
+            self.notifications[name] = (args, kwargs)
+        elif name.startswith('disable_'):
+            self.notifications.pop('enable_' + name[len('disable_'):], None)
+        elif name == 'reset':
+            self.session.clear()
+            self.settings.clear()
+        elif name == 'stop_or_pause':
+            self.session.pop('start_or_resume', None)
+        elif name in _SESSION_COMMANDS:
+            self.session[name] = (args, kwargs)
+        elif name.startswith('set_'):
+            if name in _TARGET_COMMANDS:
+                for target in _TARGET_COMMANDS.intersection(self.settings):
+                    del self.settings[target]
+            self.settings.pop(name, None)
+            self.settings[name] = (args, kwargs)
+
+    async def restore(self):
+        service = self.service
+        await asyncio.gather(*(getattr(service, name)(*args, **kwargs)
+                               for name, (args, kwargs) in list(self.notifications.items())))
+        # Control commands depend on each other, e.g. control must be requested before a target is set
+        for name in _SESSION_COMMANDS:
+            if name in self.session:
+                args, kwargs = self.session[name]
+                await getattr(service, name)(*args, **kwargs)
+        for name, (args, kwargs) in list(self.settings.items()):
+            await getattr(service, name)(*args, **kwargs)
+
+
+class SupervisedService:
+    """
+    A proxy for a service object which records the calls needed to restore the service after a reconnection. All
+    attributes of the service are available through the proxy.
+    """
+
+    def __init__(self, state):
+        object.__setattr__(self, '_state', state)
+
+    @property
+    def service(self):
+        """The supervised service object"""
+        return self._state.service
+
+    def __getattr__(self, name):
+        attribute = getattr(self._state.service, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+        state = self._state
+
+        async def call(*args, **kwargs):
+            # Recorded before the call, so that a command sent while disconnected still takes effect on reconnection
+            state.record(name, args, kwargs)
+            return await attribute(*args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = attribute.__doc__
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._state.service, name, value)
+
+
+class ConnectionSupervisor:
+    """
+    Reconnects a client when it disconnects and restores the state of its supervised services.
+
+    :param client: A :obj:`bleak.backends.client.BaseBleakClient` object. May instead be set later with
+        :meth:`set_client`
+    :param initial_backoff: Delay, in seconds, before the second connection attempt. The first attempt is immediate
+    :param max_backoff: The longest delay, in seconds, between connection attempts
+    :param multiplier: Factor by which the delay grows after each failed attempt
+    :param jitter: The fraction by which each delay is randomly shortened or lengthened
+    :param check_interval: How often, in seconds, the client's connection is polled
+    :param connect_timeout: Time limit, in seconds, for each connection attempt
+    :param max_restore_attempts: How many times in a row restoring the services may fail while the client is
+        connected before the supervisor gives up, or `None` to retry for ever. Failures to connect are always retried
+    :param on_state_change: Optional callback, called with a :obj:`ConnectionState` whenever the state changes
+    :param rng: The :class:`random.Random` used for jitter
+    """
+
+    def __init__(self, client=None, *, initial_backoff=0.25, max_backoff=30.0, multiplier=2.0, jitter=0.5,
+                 check_interval=1.0, connect_timeout=10.0, max_restore_attempts=5, on_state_change=None, rng=None):
+        if not 0 <= jitter < 1:
+            raise ValueError('jitter must be at least 0 and less than 1')
+        self._client = client
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._multiplier = multiplier
+        self._jitter = jitter
+        self._check_interval = check_interval
+        self._connect_timeout = connect_timeout
+        self._max_restore_attempts = max_restore_attempts
+        self._on_state_change = on_state_change
+        self._rng = rng if rng is not None else random.Random()
+        self._services = []
+        self._disconnected = None
+        self._task = None
+        self.state = ConnectionState.stopped
+        self.reconnections = 0
+        self.last_error = None
+
+    def set_client(self, client):
+        self._client = client
+
+    def supervise(self, service):
+        """
+        Start recording the state of a service.
+
+        :param service: A service object using the supervisor's client
+        :return: A :class:`SupervisedService` through which the service's methods should be called
+        """
+        state = _ServiceState(service)
+        self._services.append(state)
+        return SupervisedService(state)
+
+    def disconnected_callback(self, client):  # pylint: disable=unused-argument
+        """A callback suitable for the `disconnected_callback` argument of :class:`bleak.BleakClient`"""
+        if self._disconnected is not None:
+            self._disconnected.set()
+
+    def start(self):
+        """
+        Start watching the connection in a task on the running event loop.
+
+        :return: The :class:`asyncio.Task` watching the connection
+        """
+        if self._task is None or self._task.done():
+            self._disconnected = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+        return self._task
+
+    def stop(self):
+        """Stop watching the connection"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._set_state(ConnectionState.stopped)
+
+    async def restore(self):
+        """Re-enable the notifications and re-send the control commands of every supervised service"""
+        await asyncio.gather(*(state.restore() for state in self._services))
+
+    async def reconnect(self):
+        """
+        Connect the client, retrying with exponential backoff until it succeeds, then restore all services.
+
+        :raises Exception: The last error, once restoring the services has failed `max_restore_attempts` times in a
+            row while the client was connected. The state is then :obj:`ConnectionState.failed`
+        """
+        delay = 0.0
+        restore_failures = 0
+        while True:
+            if delay:
+                await asyncio.sleep(delay * (1 + self._rng.uniform(-self._jitter, self._jitter)))
+            delay = min(self._max_backoff, delay * self._multiplier if delay else self._initial_backoff)
+
+            self._set_state(ConnectionState.reconnecting)
+            restoring = False
+            try:
+                if not self._client.is_connected:
+                    await asyncio.wait_for(self._client.connect(), self._connect_timeout)
+                if self._disconnected is not None:
+                    self._disconnected.clear()
+                self._set_state(ConnectionState.restoring)
+                restoring = True
+                await self.restore()
+            except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+                raise
+            except Exception as error:  # pylint: disable=broad-except
+                self.last_error = error
+                address = getattr(self._client, 'address', None)
+                if not restoring or not self._client.is_connected:
+                    restore_failures = 0
+                    logger.warning('Reconnection to %s failed', address, exc_info=True)
+                    continue
+                restore_failures += 1
+                if self._max_restore_attempts is None or restore_failures < self._max_restore_attempts:
+                    logger.warning('Restoring %s failed', address, exc_info=True)
+                    continue
+                logger.error('Restoring %s failed %d times, giving up', address, restore_failures, exc_info=True)
+                self._set_state(ConnectionState.failed)
+                raise
+
+            self.reconnections += 1
+            self._set_state(ConnectionState.connected)
+            return
+
+    async def _watch(self):
+        self._set_state(ConnectionState.connected if self._client.is_connected else ConnectionState.reconnecting)
+        while True:
+            if self._client.is_connected:
+                try:
+                    await asyncio.wait_for(self._disconnected.wait(), self._check_interval)
+                except asyncio.TimeoutError:
+                    continue
+                self._disconnected.clear()
+                if self._client.is_connected:
+                    continue
+            logger.info('Device %s disconnected, reconnecting', getattr(self._client, 'address', None))
+            try:
+                await self.reconnect()
+            except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+                raise
+            except Exception:  # pylint: disable=broad-except
+                # Already logged and reported through the failed state
+                return
+
+    def _set_state(self, state):
+        if state is self.state:
+            return
+        self.state = state
+        if self._on_state_change is not None:
+            self._on_state_change(state)
@@ -62,9 +62,12 @@ information on :ref:`obtaining the Bluetooth address of your device <obtaining_d
 
 .. literalinclude:: ../examples/tacx_trainer_control_example.py
 """
+import struct
 from collections import namedtuple
 from enum import Enum
 
+from pycycling.notifications import NotifyingService
+
 # The GATT Characteristic used for sending FE-C messages to Tacx trainer
 tacx_uart_rx_id = '6e40fec3-b5a3-f393-e0a9-e50e24dcca9e'
 # The GATT Characteristic used for receiving FE-C messages from Tacx trainer
@@ -109,38 +112,369 @@ SpecificTrainerData = namedtuple('SpecificTrainerData',
 CommandStatusData = namedtuple('CommandStatusData', ['last_received_command', 'command_status', 'data'])
 
 
-class TacxTrainerControl:
+def _equipment_type_from_code(equipment_type_code):
+    equipment_type = None
+    if equipment_type_code == 19:
+        equipment_type = EquipmentType.treadmill
+    elif equipment_type_code == 20:
+        equipment_type = EquipmentType.elliptical
+    elif equipment_type_code == 21:
+        equipment_type = EquipmentType.reserved
+    elif equipment_type_code == 22:
+        equipment_type = EquipmentType.rower
+    elif equipment_type_code == 23:
+        equipment_type = EquipmentType.climber
+    elif equipment_type_code == 24:
+        equipment_type = EquipmentType.nordic_skier
+    elif equipment_type_code == 25:
+        equipment_type = EquipmentType.trainer
+    return equipment_type
+
+
+def _parse_fe_state_nibble(fe_state_nibble):
+    lap_toggle = bool(fe_state_nibble & 0x8)
+    code = fe_state_nibble & 0x7
+    fe_state = None
+    if code == 0:
+        fe_state = FEState.reserved
+    elif code == 1:
+        fe_state = FEState.asleep
+    elif code == 2:
+        fe_state = FEState.ready
+    elif code == 3:
+        fe_state = FEState.in_use
+    elif code == 4:
+        fe_state = FEState.finished
+    return fe_state, lap_toggle
+
+
+def _parse_general_fe_data_page(message_data):
+    equipment_type_code = message_data[1]
+    equipment_type = _equipment_type_from_code(equipment_type_code)
+
+    elapsed_time = message_data[2] * 0.25
+
+    distance_traveled = message_data[3]
+
+    speed_raw = int.from_bytes(message_data[4:6], 'little')
+    speed = None
+    if speed_raw != 65535:
+        speed = speed_raw * 0.001
+
+    heart_rate = message_data[6]
+    if heart_rate == 255:
+        heart_rate = None
+
+    fe_state, lap_toggle = _parse_fe_state_nibble((message_data[7] >> 4))
+
+    return GeneralFEData(equipment_type=equipment_type, elapsed_time=elapsed_time,
+                         distance_travelled=distance_traveled, speed=speed,
+                         heart_rate=heart_rate, fe_state=fe_state,
+                         lap_toggle=lap_toggle)
+
+
+def _parse_specific_trainer_data_page(message_data):
+    update_event_count = message_data[1]
+
+    instantaneous_cadence = message_data[2]
+    if instantaneous_cadence == 255:
+        instantaneous_cadence = None
+
+    accumulated_power = int.from_bytes(message_data[3:5], 'little')
+
+    power_lsb = message_data[5]
+    power_msb = message_data[6]
+    instantaneous_power = power_lsb + ((power_msb & 0xf) << 8)
+
+    if instantaneous_power == 4095:
+        instantaneous_power = None
+
+    trainer_status_flags = (power_msb >> 4) & 0xf
+
+    power_calibration_required = bool(trainer_status_flags & 0x1)
+    resistance_calibration_required = bool(trainer_status_flags & 0x2)
+    user_configuration_required = bool(trainer_status_flags & 0x4)
+
+    fe_state, lap_toggle = _parse_fe_state_nibble((message_data[7] >> 4))
+    target_power_limits = None
+
+    flags = message_data[7] & 0x7
+
+    if flags == 0:
+        target_power_limits = TargetPowerLimit.operating_at_target_or_no_target_set
+    elif flags == 1:
+        target_power_limits = TargetPowerLimit.user_speed_too_low
+    elif flags == 2:
+        target_power_limits = TargetPowerLimit.user_speed_too_high
+    elif flags == 3:
+        target_power_limits = TargetPowerLimit.limit_reached
+
+    return SpecificTrainerData(update_event_count=update_event_count,
+                               instantaneous_cadence=instantaneous_cadence,
+                               accumulated_power=accumulated_power,
+                               instantaneous_power=instantaneous_power,
+                               trainer_status=None,
+                               target_power_limits=target_power_limits,
+                               fe_state=fe_state, lap_toggle=lap_toggle,
+                               power_calibration_required=power_calibration_required,
+                               resistance_calibration_required=resistance_calibration_required,
+                               user_configuration_required=user_configuration_required)
+
+
+def _parse_command_status_data_page(message_data):
+    last_received_command = message_data[1]
+    command_status = None
+    command_status_byte = message_data[3]
+
+    if command_status_byte == 0:
+        command_status = CommandStatus.success
+    elif command_status_byte == 1:
+        command_status = CommandStatus.fail
+    elif command_status_byte == 2:
+        command_status = CommandStatus.not_supported
+    elif command_status_byte == 3:
+        command_status = CommandStatus.rejected
+    elif command_status_byte == 255:
+        command_status = CommandStatus.uninitialized
+
+    return CommandStatusData(last_received_command=last_received_command, command_status=command_status,
+                             data=message_data[4:8])
+
+
+_general_fe_data_page = struct.Struct('<BBBBHBB')
+_specific_trainer_data_page = struct.Struct('<BBBHBBB')
+_command_status_data_page = struct.Struct('<BBBB4s')
+
+_FE_STATE_CODES = {FEState.reserved: 0, FEState.ready: 2, FEState.in_use: 3, FEState.finished: 4}
+
+_COMMAND_STATUS_CODES = {CommandStatus.success: 0, CommandStatus.fail: 1, CommandStatus.not_supported: 2,
+                         CommandStatus.rejected: 3, CommandStatus.uninitialized: 255}
+
+
+def _fe_state_nibble(fe_state, lap_toggle):
+    return _FE_STATE_CODES.get(fe_state, 0) | (0x8 if lap_toggle else 0)
+
+
+def pack_general_fe_data_page_into(buffer, offset, data):
+    """
+    Write a :class:`GeneralFEData` into a buffer as general FE data (page 16). The elapsed time and distance roll
+    over as they do on the trainer, and a speed or heart rate of `None` is written as invalid.
+
+    :return: The number of bytes written
+    """
+    equipment_type = data.equipment_type.value + 18 if data.equipment_type is not None else 0
+    speed = 0xFFFF if data.speed is None else int(round(data.speed / 0.001)) & 0xFFFF
+    heart_rate = 0xFF if data.heart_rate is None else int(data.heart_rate) & 0xFF
+    _general_fe_data_page.pack_into(buffer, offset, 16, equipment_type, int(round(data.elapsed_time / 0.25)) & 0xFF,
+                                    int(data.distance_travelled) & 0xFF, speed, heart_rate,
+                                    _fe_state_nibble(data.fe_state, data.lap_toggle) << 4)
+    return _general_fe_data_page.size
+
+
+def encode_general_fe_data_page(data):
+    """Returns a :class:`GeneralFEData` encoded as general FE data (page 16)"""
+    buffer = bytearray(_general_fe_data_page.size)
+    pack_general_fe_data_page_into(buffer, 0, data)
+    return bytes(buffer)
+
+
+def pack_specific_trainer_data_page_into(buffer, offset, data):
+    """
+    Write a :class:`SpecificTrainerData` into a buffer as specific trainer data (page 25). A cadence or power of
+    `None` is written as invalid.
+
+    :return: The number of bytes written
+    """
+    cadence = 0xFF if data.instantaneous_cadence is None else int(data.instantaneous_cadence) & 0xFF
+    power = 4095 if data.instantaneous_power is None else min(max(int(round(data.instantaneous_power)), 0), 4094)
+    trainer_status_flags = ((0x1 if data.power_calibration_required else 0)
+                            | (0x2 if data.resistance_calibration_required else 0)
+                            | (0x4 if data.user_configuration_required else 0))
+    target_power_limits = data.target_power_limits.value - 1 if data.target_power_limits is not None else 0
+    _specific_trainer_data_page.pack_into(buffer, offset, 25, data.update_event_count & 0xFF, cadence,
+                                          int(data.accumulated_power) & 0xFFFF, power & 0xFF,
+                                          (trainer_status_flags << 4) | (power >> 8),
+                                          (_fe_state_nibble(data.fe_state, data.lap_toggle) << 4) | target_power_limits)
+    return _specific_trainer_data_page.size
+
+
+def encode_specific_trainer_data_page(data):
+    """Returns a :class:`SpecificTrainerData` encoded as specific trainer data (page 25)"""
+    buffer = bytearray(_specific_trainer_data_page.size)
+    pack_specific_trainer_data_page_into(buffer, 0, data)
+    return bytes(buffer)
+
+
+def pack_command_status_data_page_into(buffer, offset, data, sequence_number=0xFF):
+    """
+    Write a :class:`CommandStatusData` into a buffer as command status (page 71).
+
+    :param sequence_number: The sequence number of the last received command, which is not part of the record
+    :return: The number of bytes written
+    """
+    command_status = _COMMAND_STATUS_CODES.get(data.command_status, 255)
+    command_data = bytes(data.data) if data.data is not None else b'\xff\xff\xff\xff'
+    _command_status_data_page.pack_into(buffer, offset, 71, data.last_received_command & 0xFF, sequence_number,
+                                        command_status, command_data)
+    return _command_status_data_page.size
+
+
+def encode_command_status_data_page(data, sequence_number=0xFF):
+    """Returns a :class:`CommandStatusData` encoded as command status (page 71)"""
+    buffer = bytearray(_command_status_data_page.size)
+    pack_command_status_data_page_into(buffer, 0, data, sequence_number)
+    return bytes(buffer)
+
+
+def _fec_checksum(fec_bytes):
+    return sum(fec_bytes[1:]) & 0xFF
+
+
+def encode_fec_message(data_page, message_type=0x4E, channel=0x05):
+    """
+    Wrap an encoded data page in an FE-C message, as notified by the trainer.
+
+    :param data_page: The encoded data page, e.g. from :func:`encode_general_fe_data_page`
+    :param message_type: The ANT message type. Broadcast data by default
+    :param channel: The ANT channel number
+    """
+    fec_bytes = bytearray([0xA4, len(data_page) + 1, message_type, channel])
+    fec_bytes += data_page
+    fec_bytes.append(_fec_checksum(fec_bytes))
+    return bytes(fec_bytes)
+
+
+def _form_basic_resistance(resistance):
+    if resistance < 0 or resistance > 200:
+        raise ValueError('resistance must be between 0 and 200')
+
+    data_page = bytearray([0x30, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF])
+    data_page.append(int((resistance / 200) * 200))
+    return encode_fec_message(data_page, message_type=0x4F)
+
+
+def _form_target_power(target_power):
+    if target_power < 0 or target_power > 4000:
+        raise ValueError('target_power must be between 0 and 4000')
+
+    data_page = bytearray([0x31, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF])
+    data_page += int(target_power / 0.25).to_bytes(2, byteorder='little')
+    return encode_fec_message(data_page, message_type=0x4F)
+
+
+def _form_wind_resistance(wind_resistance_coefficient, wind_speed, drafting_factor):
+    if wind_resistance_coefficient < 0 or wind_resistance_coefficient > 1.86:
+        raise ValueError('wind_resistance_coefficient must be between 0 and 1.86')
+
+    if wind_speed < -127 or wind_speed > 127:
+        raise ValueError('wind_speed must be between -127 and 127')
+
+    if drafting_factor < 0 or drafting_factor > 1:
+        raise ValueError('drafting_factor must be between 0 and 1')
+
+    data_page = bytearray([0x32, 0xFF, 0xFF, 0xFF, 0xFF])
+    data_page.append(int(wind_resistance_coefficient / 0.01))
+    data_page.append(int(wind_speed + 127))
+    data_page.append(int(drafting_factor / 0.01))
+    return encode_fec_message(data_page, message_type=0x4F)
+
+
+def _form_track_resistance(grade, coefficient_of_rolling_resistance):
+    if grade < -200 or grade > 200:
+        raise ValueError('grade must be between -200 and 200')
+
+    if coefficient_of_rolling_resistance < 0 or coefficient_of_rolling_resistance > 0.0127:
+        raise ValueError('coefficient_of_rolling_resistance must be between 0 and 0.0127')
+
+    data_page = bytearray([0x33, 0xFF, 0xFF, 0xFF, 0xFF])
+    data_page += int((grade + 200) / 0.01).to_bytes(2, byteorder='little')
+    data_page.append(int(coefficient_of_rolling_resistance / 5e-5))
+    return encode_fec_message(data_page, message_type=0x4F)
+
+
+def _form_user_configuration(user_weight, bicycle_weight, bicycle_wheel_diameter, gear_ratio):
+    if user_weight < 0 or user_weight > 655.34:
+        raise ValueError('user_weight must be between 0 and 655.34')
+
+    if bicycle_weight < 0 or bicycle_weight > 50:
+        raise ValueError('bicycle_weight must be between 0 and 50')
+
+    if bicycle_wheel_diameter < 0 or bicycle_wheel_diameter > 2.54:
+        raise ValueError('bicycle_wheel_diameter must be between 0 and 2.54')
+
+    if gear_ratio < 0.03 or gear_ratio > 7.65:
+        raise ValueError('gear_ratio must be between 0.03 and 7.65')
+
+    data_page = bytearray([0x37])
+    data_page += int(user_weight / 0.01).to_bytes(2, byteorder='little')
+    data_page.append(0xff)
+    bicycle_wheel_diameter_offset = int(round((bicycle_wheel_diameter - round(bicycle_wheel_diameter, 2)) / 0.001))
+    bicycle_weight_bytes = int(bicycle_weight / 0.05).to_bytes(2, byteorder='little')
+    data_page.append(bicycle_wheel_diameter_offset + ((bicycle_weight_bytes[0] << 4) & 0xff))
+    data_page.append((bicycle_weight_bytes[0] >> 4) + (bicycle_weight_bytes[1] << 4))
+    data_page.append(int(round(bicycle_wheel_diameter, 2) / 0.01))
+    data_page.append(int(gear_ratio / 0.03))
+    return encode_fec_message(data_page, message_type=0x4F)
+
+
+def _form_neo_modes(isokinetic_mode=False, isokinetic_speed=4.2, road_surface_pattern=RoadSurface.SIMULATION_OFF,
+                    road_surface_pattern_intensity=255):
+    if isokinetic_speed < 4.2 or isokinetic_speed > 8.4:
+        raise ValueError('isokinetic_speed must be between 4.2 and 8.4')
+
+    if road_surface_pattern_intensity != 255 and (
+            road_surface_pattern_intensity < 0 or road_surface_pattern_intensity > 100):
+        raise ValueError('road_surface_pattern_intensity must be between 0 and 100, or set to 255')
+
+    data_page = bytearray([0xFC, 0x00])
+    if isokinetic_mode:
+        data_page.append(1)
+        data_page.append(int(isokinetic_speed / 0.05))
+    else:
+        data_page.append(0x00)
+        data_page.append(0x00)
+
+    data_page.append(0)
+    data_page.append(road_surface_pattern.value)
+    data_page.append(road_surface_pattern_intensity)
+    data_page.append(0x00)
+    return encode_fec_message(data_page, message_type=0x4F)
+
+
+def _form_request_data_page(page_number):
+    data_page = bytearray([0x46, 0xFF, 0xFF, 0xFF, 0xFF, 0x80])
+    data_page.append(page_number)
+    data_page.append(0x01)
+    return encode_fec_message(data_page, message_type=0x4F)
+
+
+class TacxTrainerControl(NotifyingService):
     def __init__(self, client):
-        self._client = client
-        self._general_fe_data_page_callback = None
-        self._specific_trainer_data_page_callback = None
-        self._command_status_data_page_callback = None
+        super().__init__(client)
+        self._general_fe_data_page_channel = self._add_channel('general_fe_data_page', _parse_general_fe_data_page)
+        self._specific_trainer_data_page_channel = self._add_channel('specific_trainer_data_page',
+                                                                     _parse_specific_trainer_data_page)
+        self._command_status_data_page_channel = self._add_channel('command_status_data_page',
+                                                                   _parse_command_status_data_page)
+        self._data_page_channels = {
+            16: self._general_fe_data_page_channel,
+            25: self._specific_trainer_data_page_channel,
+            71: self._command_status_data_page_channel,
+        }
 
     async def set_basic_resistance(self, resistance):
         """Activate basic resistance mode, with specified resistance
 
         :param resistance: Resistance to apply to trainer, in newtons
         """
-        if resistance < 0 or resistance > 200:
-            raise ValueError('resistance must be between 0 and 200')
-
-        write_value = bytearray([0xA4, 0x09, 0x4F, 0x05, 0x30, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF])
-        write_value.append(int((resistance / 200) * 200))
-        await self._send_fec_cmd(write_value)
+        await self._send_fec_cmd(_form_basic_resistance(resistance))
 
     async def set_target_power(self, target_power):
         """Activate target power mode, with specified target power
 
         :param target_power: Target power, in watts
         """
-        if target_power < 0 or target_power > 4000:
-            raise ValueError('target_power must be between 0 and 4000')
-
-        write_value = bytearray([0xA4, 0x09, 0x4F, 0x05, 0x31, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF])
-        target_power_bytes = int(target_power / 0.25).to_bytes(2, byteorder='little')
-        write_value.append(target_power_bytes[0])
-        write_value.append(target_power_bytes[1])
-        await self._send_fec_cmd(write_value)
+        await self._send_fec_cmd(_form_target_power(target_power))
 
     async def set_wind_resistance(self, wind_resistance_coefficient, wind_speed, drafting_factor):
         """Activate simulation mode, specifying wind parameters
@@ -151,20 +485,7 @@ class TacxTrainerControl:
             wind while a negative value represents a tail wind
         :param drafting_factor: Use parameter to scale wind resistance to simulate drafting behind a virtual opponent
         """
-        if wind_resistance_coefficient < 0 or wind_resistance_coefficient > 1.86:
-            raise ValueError('wind_resistance_coefficient must be between 0 and 1.86')
-
-        if wind_speed < -127 or wind_speed > 127:
-            raise ValueError('wind_speed must be between -127 and 127')
-
-        if drafting_factor < 0 or drafting_factor > 1:
-            raise ValueError('drafting_factor must be between 0 and 1')
-
-        write_value = bytearray([0xA4, 0x09, 0x4F, 0x05, 0x32, 0xFF, 0xFF, 0xFF, 0xFF])
-        write_value.append(int(wind_resistance_coefficient / 0.01))
-        write_value.append(int(wind_speed + 127))
-        write_value.append(int(drafting_factor / 0.01))
-        await self._send_fec_cmd(write_value)
+        await self._send_fec_cmd(_form_wind_resistance(wind_resistance_coefficient, wind_speed, drafting_factor))
 
     async def set_track_resistance(self, grade, coefficient_of_rolling_resistance):
         """Activate simulation mode, specifying track resistance parameters
@@ -172,18 +493,7 @@ class TacxTrainerControl:
         :param grade: The grade (slope) of simulated track, in %.
         :param coefficient_of_rolling_resistance: The coefficient of rolling resistance, in dimensionless units
         """
-        if grade < -200 or grade > 200:
-            raise ValueError('grade must be between -200 and 200')
-
-        if coefficient_of_rolling_resistance < 0 or coefficient_of_rolling_resistance > 0.0127:
-            raise ValueError('coefficient_of_rolling_resistance must be between 0 and 0.0127')
-
-        write_value = bytearray([0xA4, 0x09, 0x4F, 0x05, 0x33, 0xFF, 0xFF, 0xFF, 0xFF])
-        grade_bytes = int((grade + 200) / 0.01).to_bytes(2, byteorder='little')
-        write_value.append(grade_bytes[0])
-        write_value.append(grade_bytes[1])
-        write_value.append(int(coefficient_of_rolling_resistance / 5e-5))
-        await self._send_fec_cmd(write_value)
+        await self._send_fec_cmd(_form_track_resistance(grade, coefficient_of_rolling_resistance))
 
     async def set_user_configuration(self, user_weight, bicycle_weight,
                                      bicycle_wheel_diameter, gear_ratio):
@@ -194,31 +504,8 @@ class TacxTrainerControl:
         :param bicycle_wheel_diameter: Diameter of bike wheel, in metres
         :param gear_ratio: The bike gear ratio (front chain ring teeth:rear wheel cog teeth)
         """
-        if user_weight < 0 or user_weight > 655.34:
-            raise ValueError('user_weight must be between 0 and 655.34')
-
-        if bicycle_weight < 0 or bicycle_weight > 50:
-            raise ValueError('bicycle_weight must be between 0 and 50')
-
-        if bicycle_wheel_diameter < 0 or bicycle_wheel_diameter > 2.54:
-            raise ValueError('bicycle_wheel_diameter must be between 0 and 2.54')
-
-        if gear_ratio < 0.03 or gear_ratio > 7.65:
-            raise ValueError('gear_ratio must be between 0.03 and 7.65')
-
-        write_value = bytearray([0xA4, 0x09, 0x4F, 0x05, 0x37])
-
-        user_weight_bytes = int(user_weight / 0.01).to_bytes(2, byteorder='little')
-        write_value.append(user_weight_bytes[0])
-        write_value.append(user_weight_bytes[1])
-        write_value.append(0xff)
-        bicycle_wheel_diameter_offset = int(round((bicycle_wheel_diameter - round(bicycle_wheel_diameter, 2)) / 0.001))
-        bicycle_weight_bytes = int(bicycle_weight / 0.05).to_bytes(2, byteorder='little')
-        write_value.append(bicycle_wheel_diameter_offset + ((bicycle_weight_bytes[0] << 4) & 0xff))
-        write_value.append((bicycle_weight_bytes[0] >> 4) + (bicycle_weight_bytes[1] << 4))
-        write_value.append(int(round(bicycle_wheel_diameter, 2) / 0.01))
-        write_value.append(int(gear_ratio / 0.03))
-        await self._send_fec_cmd(write_value)
+        await self._send_fec_cmd(_form_user_configuration(user_weight, bicycle_weight, bicycle_wheel_diameter,
+                                                          gear_ratio))
 
     async def set_neo_modes(self, isokinetic_mode=False, isokinetic_speed=4.2,
                             road_surface_pattern=RoadSurface.SIMULATION_OFF,
@@ -231,52 +518,29 @@ class TacxTrainerControl:
         :param road_surface_pattern_intensity: The intensity of the feeling of the road surface. Note that even 50%
             feels fairly intense, 100% is untested and may damage the trainer!
         """
-        if isokinetic_speed < 4.2 or isokinetic_speed > 8.4:
-            raise ValueError('isokinetic_speed must be between 4.2 and 8.4')
-
-        if road_surface_pattern_intensity != 255 and (
-                road_surface_pattern_intensity < 0 or road_surface_pattern_intensity > 100):
-            raise ValueError('road_surface_pattern_intensity must be between 0 and 100, or set to 255')
-
-        write_value = bytearray([0xA4, 0x09, 0x4F, 0x05, 0xFC, 0x00])
-        if isokinetic_mode:
-            write_value.append(1)
-            write_value.append(int(isokinetic_speed / 0.05))
-        else:
-            write_value.append(0x00)
-            write_value.append(0x00)
-
-        write_value.append(0)
-        write_value.append(road_surface_pattern.value)
-        write_value.append(road_surface_pattern_intensity)
-        write_value.append(0x00)
-        await self._send_fec_cmd(write_value)
+        await self._send_fec_cmd(_form_neo_modes(isokinetic_mode, isokinetic_speed, road_surface_pattern,
+                                                 road_surface_pattern_intensity))
 
     async def request_data_page(self, page_number):
-        write_value = bytearray([0xA4, 0x09, 0x4F, 0x05, 0x46, 0xFF, 0xFF, 0xFF, 0xFF, 0x80])
-        write_value.append(page_number)
-        write_value.append(0x01)
-        await self._send_fec_cmd(write_value)
+        await self._send_fec_cmd(_form_request_data_page(page_number))
 
     def set_general_fe_data_page_handler(self, callback):
-        self._general_fe_data_page_callback = callback
+        self._general_fe_data_page_channel.set_handler(callback)
 
     def set_specific_trainer_data_page_handler(self, callback):
-        self._specific_trainer_data_page_callback = callback
+        self._specific_trainer_data_page_channel.set_handler(callback)
 
     def set_command_status_data_page_handler(self, callback):
-        self._command_status_data_page_callback = callback
+        self._command_status_data_page_channel.set_handler(callback)
 
     async def _send_fec_cmd(self, fec_bytes):
-        checksum = sum(fec_bytes[1:]) & 0xFF
-        fec_bytes.append(checksum)
         await self._client.write_gatt_char(tacx_uart_rx_id, fec_bytes)
 
     async def enable_fec_notifications(self):
-        await self._client.start_notify(tacx_uart_tx_id, self._fec_notification_handler)
+        await self._router.start_notify(tacx_uart_tx_id, self._fec_notification_handler)
 
     async def disable_fec_notifications(self):
-        await self._client.stop_notify(tacx_uart_tx_id)
+        await self._router.stop_notify(tacx_uart_tx_id)
 
     def _fec_notification_handler(self, sender, data):  # pylint: disable=unused-argument
         message_length = data[1]
@@ -285,140 +549,6 @@ class TacxTrainerControl:
         message_data = data[4:4 + message_length - 1]
         data_page_no = message_data[0]
 
-        if data_page_no == 16:
-            self._general_fe_data_page_handler(message_data)
-        elif data_page_no == 25:
-            self._specific_trainer_data_page_handler(message_data)
-        elif data_page_no == 71:
-            self._command_status_data_page_handler(message_data)
-
-    def _general_fe_data_page_handler(self, message_data):
-        equipment_type_code = message_data[1]
-        equipment_type = self._equipment_type_from_code(equipment_type_code)
-
-        elapsed_time = message_data[2] * 0.25
-
-        distance_traveled = message_data[3]
-
-        speed_raw = int.from_bytes(message_data[4:6], 'little')
-        speed = None
-        if speed_raw != 65535:
-            speed = speed_raw * 0.001
-
-        heart_rate = message_data[6]
-        if heart_rate == 255:
-            heart_rate = None
-
-        fe_state, lap_toggle = self._parse_fe_state_nibble((message_data[7] >> 4))
-
-        if self._general_fe_data_page_callback is not None:
-            self._general_fe_data_page_callback(GeneralFEData(equipment_type=equipment_type, elapsed_time=elapsed_time,
-                                                              distance_travelled=distance_traveled, speed=speed,
-                                                              heart_rate=heart_rate, fe_state=fe_state,
-                                                              lap_toggle=lap_toggle))
-
-    @staticmethod
-    def _equipment_type_from_code(equipment_type_code):
-        equipment_type = None
-        if equipment_type_code == 19:
-            equipment_type = EquipmentType.treadmill
-        elif equipment_type_code == 20:
-            equipment_type = EquipmentType.elliptical
-        elif equipment_type_code == 21:
-            equipment_type = EquipmentType.reserved
-        elif equipment_type_code == 22:
-            equipment_type = EquipmentType.rower
-        elif equipment_type_code == 23:
-            equipment_type = EquipmentType.climber
-        elif equipment_type_code == 24:
-            equipment_type = EquipmentType.nordic_skier
-        elif equipment_type_code == 25:
-            equipment_type = EquipmentType.trainer
-        return equipment_type
-
-    @staticmethod
-    def _parse_fe_state_nibble(fe_state_nibble):
-        lap_toggle = bool(fe_state_nibble & 0x8)
-        code = fe_state_nibble & 0x7
-        fe_state = None
-        if code == 0:
-            fe_state = FEState.reserved
-        elif code == 1:
-            fe_state = FEState.asleep
-        elif code == 2:
-            fe_state = FEState.ready
-        elif code == 3:
-            fe_state = FEState.in_use
-        elif code == 4:
-            fe_state = FEState.finished
-        return fe_state, lap_toggle
-
-    def _specific_trainer_data_page_handler(self, message_data):
-        update_event_count = message_data[1]
-
-        instantaneous_cadence = message_data[2]
-        if instantaneous_cadence == 255:
-            instantaneous_cadence = None
-
-        accumulated_power = int.from_bytes(message_data[3:5], 'little')
-
-        power_lsb = message_data[5]
-        power_msb = message_data[6]
-        instantaneous_power = power_lsb + ((power_msb & 0xf) << 8)
-
-        if instantaneous_power == 4095:
-            instantaneous_power = None
-
-        trainer_status_flags = (power_msb >> 4) & 0xf
-
-        power_calibration_required = bool(trainer_status_flags & 0x1)
-        resistance_calibration_required = bool(trainer_status_flags & 0x2)
-        user_configuration_required = bool(trainer_status_flags & 0x4)
-
-        fe_state, lap_toggle = self._parse_fe_state_nibble((message_data[7] >> 4))
-        target_power_limits = None
-
-        flags = message_data[7] & 0x7
-
-        if flags == 0:
-            target_power_limits = TargetPowerLimit.operating_at_target_or_no_target_set
-        elif flags == 1:
-            target_power_limits = TargetPowerLimit.user_speed_too_low
-        elif flags == 2:
-            target_power_limits = TargetPowerLimit.user_speed_too_high
-        elif flags == 3:
-            target_power_limits = TargetPowerLimit.limit_reached
-
-        if self._specific_trainer_data_page_callback is not None:
-            self._specific_trainer_data_page_callback(
-                SpecificTrainerData(update_event_count=update_event_count,
-                                    instantaneous_cadence=instantaneous_cadence,
-                                    accumulated_power=accumulated_power,
-                                    instantaneous_power=instantaneous_power,
-                                    trainer_status=None,
-                                    target_power_limits=target_power_limits,
-                                    fe_state=fe_state, lap_toggle=lap_toggle,
-                                    power_calibration_required=power_calibration_required,
-                                    resistance_calibration_required=resistance_calibration_required,
-                                    user_configuration_required=user_configuration_required))
-
-    def _command_status_data_page_handler(self, message_data):
-        last_received_command = message_data[1]
-        command_status = None
-        command_status_byte = message_data[3]
-
-        if command_status_byte == 0:
-            command_status = CommandStatus.success
-        elif command_status_byte == 1:
-            command_status = CommandStatus.fail
-        elif command_status_byte == 2:
-            command_status = CommandStatus.not_supported
-        elif command_status_byte == 3:
-            command_status = CommandStatus.rejected
-        elif command_status_byte == 255:
-            command_status = CommandStatus.uninitialized
-
-        if self._command_status_data_page_callback is not None:
-            self._command_status_data_page_callback(
-                CommandStatusData(last_received_command=last_received_command, command_status=command_status,
-                                  data=message_data[4:8]))
+        channel = self._data_page_channels.get(data_page_no)
+        if channel is not None:
+            channel.deliver(message_data)
@@ -0,0 +1,251 @@
+"""
+A streaming stage which aligns records from several services onto a common fixed-rate timeline.
+
+Heart rate straps, power meters, speed/cadence sensors and trainers all notify at their own (and rather jittery) rates,
+each on a separate callback. :class:`StreamAligner` merges these streams as they arrive and emits one fused row per tick
+of a fixed-rate timeline (e.g. 1 Hz or 4 Hz). Each field of each stream can either be linearly interpolated between
+the samples either side of a tick, or hold the most recent sample.
+
+Samples are merged in timestamp order through a heap, which tolerates records being pushed slightly out of order (for
+instance when receive timestamps are taken on one thread and pushed from another). A sample may arrive up to
+``max_lateness`` seconds after newer samples from other streams; anything later than that is counted and dropped.
+A tick is emitted as soon as every stream has a sample at or after it, or at the latest once ``lookahead`` seconds of
+newer data have been seen, in which case streams without a newer sample hold their last value. Only the previous
+sample is kept per stream, so memory use does not grow with the length of the session.
+
+Example
+=======
+This example fuses power and heart rate onto a 1 Hz timeline and prints each row.
+
+.. code-block:: python
+
+    aligner = StreamAligner(rate=1)
+    aligner.add_stream('power', {'instantaneous_power': Interpolation.LINEAR})
+    aligner.add_stream('hr', {'bpm': Interpolation.HOLD})
+    aligner.set_row_handler(print)
+
+    power_service.set_cycling_power_measurement_handler(aligner.stream_handler('power'))
+    hr_service.set_hr_measurement_handler(aligner.stream_handler('hr'))
+"""
+import heapq
+import time
+from collections import deque, namedtuple
+from enum import Enum
+
+from pycycling.notifications import TimestampedRecord
+
+
+class Interpolation(Enum):
+    """
+    How the value of a field is computed at a tick
+    """
+    HOLD = 'hold'
+    LINEAR = 'linear'
+
+
+class StreamAligner:
+    """
+    Merges independently timed record streams into rows on a fixed-rate timeline.
+
+    Timestamps are integer nanoseconds, as returned by :func:`time.monotonic_ns`. Ticks lie on multiples of the tick
+    period, so aligners with the same rate produce rows at the same timestamps.
+
+    :param rate: Number of rows per second
+    :param lookahead: The longest time, in seconds, a tick waits for later samples before holding the last values
+    :param max_lateness: How far behind the newest sample, in seconds, a sample may be pushed and still be merged
+    :param stale_after: If set, a held value older than this many seconds is emitted as `None`
+    """
+
+    def __init__(self, rate=1.0, lookahead=2.0, max_lateness=0.25, stale_after=None):
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        if lookahead < 0 or max_lateness < 0:
+            raise ValueError('lookahead and max_lateness must be non-negative')
+
+        self._period = int(round(1e9 / rate))
+        self._lookahead = int(lookahead * 1e9)
+        self._max_lateness = int(max_lateness * 1e9)
+        self._stale_after = None if stale_after is None else int(stale_after * 1e9)
+
+        self._streams = {}
+        self._stream_list = []
+        self._columns = []
+        self.row_type = None
+        self._row_callback = None
+
+        self._heap = []
+        self._sequence = 0
+        self._newest = None
+
+        # Rows waiting for streams to provide a sample after their tick. _pending[0] is for tick _first_pending_tick.
+        self._pending = deque()
+        self._first_pending_tick = None
+
+        self.late_samples = 0
+
+    def add_stream(self, name, fields):
+        """
+        Register a stream. All streams must be registered before the first sample is pushed.
+
+        :param name: Name of the stream, used as a prefix for the columns of the fused rows
+        :param fields: A mapping of record field name to :class:`Interpolation`. Records which are plain numbers (such
+            as steering angles) must be registered with a single field, which takes the record's value
+        """
+        if self._newest is not None:
+            raise ValueError('streams must be added before samples are pushed')
+        if name in self._streams:
+            raise ValueError(f'stream {name} already added')
+        if not fields:
+            raise ValueError('at least one field is required')
+
+        column_offset = len(self._columns)
+        stream = _StreamState(len(self._stream_list), column_offset, fields)
+        self._streams[name] = stream
+        self._stream_list.append(stream)
+        self._columns.extend(f'{name}_{field}' for field in fields)
+        self.row_type = namedtuple('AlignedRow', ['timestamp'] + self._columns)
+
+    def set_row_handler(self, callback):
+        self._row_callback = callback
+
+    def stream_handler(self, name, clock=time.monotonic_ns):
+        """
+        Returns a callback which timestamps each record with `clock` on arrival and pushes it to the named stream.
+        It can be passed directly to the ``set_*_handler`` methods of the service classes. Records which already carry
+        a receive timestamp (see :obj:`~pycycling.notifications.TimestampedRecord`) keep their timestamp.
+        """
+        def handler(record):
+            if isinstance(record, TimestampedRecord):
+                self.push(name, record.received_ns, record.record)
+            else:
+                self.push(name, clock(), record)
+
+        return handler
+
+    def push(self, name, timestamp, record):
+        """
+        Add a sample to a stream.
+
+        :param name: The name of the stream
+        :param timestamp: The time the record was received, in integer nanoseconds
+        :param record: A namedtuple (or plain number) holding the stream's fields
+        """
+        stream = self._streams[name]
+        if self._newest is not None and timestamp < self._newest - self._max_lateness:
+            self.late_samples += 1
+            return
+
+        heapq.heappush(self._heap, (timestamp, self._sequence, stream.index, stream.extract(record)))
+        self._sequence += 1
+        if self._newest is None or timestamp > self._newest:
+            self._newest = timestamp
+
+        self._merge(self._newest - self._max_lateness)
+        self._emit_ready(self._newest - self._max_lateness - self._lookahead, force=False)
+
+    def flush(self):
+        """
+        Merge all buffered samples and emit every remaining row, holding values where no later sample exists.
+        """
+        if self._newest is None:
+            return
+        self._merge(self._newest)
+        self._emit_ready(self._newest, force=True)
+
+    def _merge(self, watermark):
+        heap = self._heap
+        streams = self._stream_list
+        while heap and heap[0][0] <= watermark:
+            timestamp, _, index, values = heapq.heappop(heap)
+            self._apply(streams[index], timestamp, values)
+
+    def _apply(self, stream, timestamp, values):
+        tick = timestamp // self._period
+        if self._first_pending_tick is None:
+            self._first_pending_tick = -(-timestamp // self._period)
+
+        # Open rows for every tick this sample reaches
+        last_open = self._first_pending_tick + len(self._pending) - 1
+        for _ in range(last_open, tick):
+            self._pending.append(_PendingRow(len(self._columns)))
+
+        # Fill this stream's column for every open tick between its previous sample and this one
+        first = max(stream.next_tick, self._first_pending_tick)
+        for row_tick in range(first, tick + 1):
+            row = self._pending[row_tick - self._first_pending_tick]
+            stream.fill(row, row_tick * self._period, timestamp, values, self._stale_after)
+
+        stream.next_tick = max(stream.next_tick, tick + 1)
+        stream.previous_timestamp = timestamp
+        stream.previous_values = values
+
+    def _emit_ready(self, deadline, force):
+        streams = self._stream_list
+        stream_count = len(streams)
+        while self._pending:
+            row = self._pending[0]
+            tick_time = self._first_pending_tick * self._period
+            if row.filled < stream_count:
+                if not force and tick_time > deadline:
+                    return
+                for stream in streams:
+                    if stream.next_tick <= self._first_pending_tick:
+                        stream.hold(row, tick_time, self._stale_after)
+                        stream.next_tick = self._first_pending_tick + 1
+
+            self._pending.popleft()
+            self._first_pending_tick += 1
+            if self._row_callback is not None:
+                self._row_callback(self.row_type(tick_time, *row.values))
+
+
+class _PendingRow:
+    __slots__ = ('values', 'filled')
+
+    def __init__(self, width):
+        self.values = [None] * width
+        self.filled = 0
+
+
+class _StreamState:
+    __slots__ = ('index', 'column_offset', 'fields', 'modes', 'next_tick', 'previous_timestamp', 'previous_values')
+
+    def __init__(self, index, column_offset, fields):
+        self.index = index
+        self.column_offset = column_offset
+        self.fields = tuple(fields)
+        self.modes = tuple(fields[field] for field in self.fields)
+        self.next_tick = 0
+        self.previous_timestamp = None
+        self.previous_values = None
+
+    def extract(self, record):
+        if isinstance(record, (int, float)):
+            return (record,) * len(self.fields)
+        return tuple(getattr(record, field) for field in self.fields)
+
+    def fill(self, row, tick_time, timestamp, values, stale_after):
+        offset = self.column_offset
+        previous = self.previous_values
+        if timestamp == tick_time:
+            row.values[offset:offset + len(values)] = values
+        elif previous is None:
+            pass
+        elif stale_after is not None and tick_time - self.previous_timestamp > stale_after:
+            pass
+        else:
+            fraction = (tick_time - self.previous_timestamp) / (timestamp - self.previous_timestamp)
+            for i, mode in enumerate(self.modes):
+                before = previous[i]
+                after = values[i]
+                if mode is Interpolation.LINEAR and before is not None and after is not None:
+                    row.values[offset + i] = before + (after - before) * fraction
+                else:
+                    row.values[offset + i] = before
+        row.filled += 1
+
+    def hold(self, row, tick_time, stale_after):
+        if self.previous_values is not None and (
+                stale_after is None or tick_time - self.previous_timestamp <= stale_after):
+            row.values[self.column_offset:self.column_offset + len(self.previous_values)] = self.previous_values
+        row.filled += 1
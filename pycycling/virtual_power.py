@@ -0,0 +1,239 @@
+"""
+Virtual power for trainers which only report wheel speed.
+
+A classic fluid or magnetic trainer has a fixed resistance curve, so the rider's power follows from the wheel speed
+measured by a Cycling Speed and Cadence sensor, or from the speed reported by an FE-C trainer. A :class:`PowerCurve`
+holds a trainer model's curve as a lookup table of power every `resolution` km/h, so each reading costs one index
+calculation and a linear interpolation. Curves are built from a polynomial, e.g. a manufacturer's published curve, or
+from ``(speed, power)`` points measured with a power meter. :data:`POWER_CURVES` holds some published curves.
+
+A :class:`VirtualPowerMeter` turns live :obj:`~pycycling.cycling_speed_cadence_service.CSCMeasurement` records into
+power. :func:`session_power` recomputes the power of a whole recording at once, for backfilling history; it is
+vectorized with NumPy when NumPy is installed, and otherwise falls back to the lookup table.
+
+Example
+=======
+.. code-block:: python
+
+    meter = VirtualPowerMeter(POWER_CURVES['kurt_kinetic_road_machine'], wheel_circumference=2.096)
+
+    def on_csc(measurement):
+        power = meter.update(measurement)
+        if power is not None:
+            print(f'{meter.speed:.1f} km/h, {power:.0f} W')
+
+    sensor.set_csc_measurement_handler(on_csc)
+"""
+import time
+from collections import namedtuple
+
+from pycycling.notifications import TimestampedRecord
+
+_MPH = 1.609344  # km/h per mph
+_EVENT_TIME_UNITS = 1024  # per second
+_NANOSECONDS = 1e9
+
+SpeedPower = namedtuple('SpeedPower', ['speed', 'power'])
+
+
+def _numpy():
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return numpy
+
+
+class PowerCurve:
+    """
+    A trainer's power, in watts, as a function of wheel speed, in km/h.
+
+    :param function: Returns the power at a speed. Sampled once, into the lookup table
+    :param resolution: Spacing, in km/h, of the lookup table
+    :param max_speed: The fastest speed in the lookup table. Power above it is extrapolated linearly
+    """
+
+    def __init__(self, function, resolution=0.1, max_speed=100.0):
+        if resolution <= 0 or max_speed <= resolution:
+            raise ValueError('resolution must be positive and less than max_speed')
+        self.resolution = resolution
+        self.max_speed = max_speed
+        count = int(round(max_speed / resolution)) + 1
+        self._table = [max(0.0, float(function(index * resolution))) for index in range(count)]
+        self._last_slope = (self._table[-1] - self._table[-2]) / resolution
+
+    @classmethod
+    def from_polynomial(cls, coefficients, speed_unit=1.0, **kwargs):
+        """
+        Build a curve from a polynomial.
+
+        :param coefficients: Coefficients from the constant term upwards, e.g. ``(0, a, 0, b)`` for ``a v + b v^3``
+        :param speed_unit: The speed unit of the polynomial, in km/h, e.g. 1.609344 for a polynomial in mph
+        """
+        coefficients = tuple(coefficients)
+
+        def function(speed):
+            speed /= speed_unit
+            return sum(coefficient * speed ** power for power, coefficient in enumerate(coefficients))
+
+        return cls(function, **kwargs)
+
+    @classmethod
+    def from_points(cls, points, **kwargs):
+        """
+        Build a curve by linear interpolation between measured points.
+
+        :param points: ``(speed, power)`` pairs, speed in km/h and power in watts. The curve starts from 0 W at
+            0 km/h unless a point at 0 km/h is given
+        """
+        points = sorted(SpeedPower(*point) for point in points)
+        if not points:
+            raise ValueError('at least one point is needed')
+        if points[0].speed > 0:
+            points.insert(0, SpeedPower(0.0, 0.0))
+
+        def function(speed):
+            for start, end in zip(points, points[1:]):
+                if speed <= end.speed:
+                    return start.power + (end.power - start.power) * (speed - start.speed) / (end.speed - start.speed)
+            if len(points) < 2:
+                return points[-1].power
+            start, end = points[-2], points[-1]
+            return end.power + (end.power - start.power) * (speed - end.speed) / (end.speed - start.speed)
+
+        return cls(function, **kwargs)
+
+    def power(self, speed):
+        """Returns the power, in watts, at a speed in km/h"""
+        if speed <= 0:
+            return 0.0
+        position = speed / self.resolution
+        index = int(position)
+        table = self._table
+        if index >= len(table) - 1:
+            return table[-1] + (speed - self.max_speed) * self._last_slope
+        start = table[index]
+        return start + (table[index + 1] - start) * (position - index)
+
+    def powers(self, speeds):
+        """
+        Returns the power at each of a sequence of speeds, as a NumPy array if NumPy is installed, otherwise as a
+        list.
+        """
+        numpy = _numpy()
+        if numpy is None:
+            return [self.power(speed) for speed in speeds]
+        speeds = numpy.asarray(speeds, dtype=float)
+        grid = numpy.arange(len(self._table)) * self.resolution
+        powers = numpy.interp(speeds, grid, self._table)
+        beyond = speeds > self.max_speed
+        powers[beyond] = self._table[-1] + (speeds[beyond] - self.max_speed) * self._last_slope
+        powers[speeds <= 0] = 0.0
+        return powers
+
+
+POWER_CURVES = {
+    'kurt_kinetic_road_machine': PowerCurve.from_polynomial((0, 5.244820, 0, 0.019168), speed_unit=_MPH),
+    'kurt_kinetic_cyclone': PowerCurve.from_polynomial((0, 6.481090, 0, 0.020106), speed_unit=_MPH),
+}
+
+
+class VirtualPowerMeter:
+    """
+    Computes power from the wheel revolution data of a speed sensor on a trainer.
+
+    :param curve: The trainer's :class:`PowerCurve`
+    :param wheel_circumference: Wheel circumference in m
+    :param stop_timeout: Seconds without a new wheel revolution after which the wheel is taken to have stopped
+    :param clock: Function returning the current time in nanoseconds, used when records are not timestamped
+    """
+
+    def __init__(self, curve, wheel_circumference=2.105, stop_timeout=3.0, clock=time.monotonic_ns):
+        self._curve = curve
+        self._wheel_circumference = wheel_circumference
+        self._stop_timeout_ns = stop_timeout * _NANOSECONDS
+        self._clock = clock
+        self._last_revs = None
+        self._last_event_time = None
+        self._last_event_ns = None
+        self.speed = None
+        self.power = None
+
+    def update(self, measurement, timestamp_ns=None):
+        """
+        Account for a new measurement.
+
+        :param measurement: A :obj:`~pycycling.cycling_speed_cadence_service.CSCMeasurement`, or a
+            :obj:`~pycycling.notifications.TimestampedRecord` holding one
+        :return: The power in watts, or `None` until the speed is known
+        """
+        if isinstance(measurement, TimestampedRecord):
+            measurement, timestamp_ns = measurement
+        revs = measurement.cumulative_wheel_revs
+        event_time = measurement.last_wheel_event_time
+        if revs is None or event_time is None:
+            return self.power
+        if timestamp_ns is None:
+            timestamp_ns = self._clock()
+
+        if self._last_revs is None or revs < self._last_revs:
+            # First measurement, or the sensor was reset
+            self._last_event_ns = timestamp_ns
+        elif event_time != self._last_event_time:
+            elapsed = ((event_time - self._last_event_time) & 0xFFFF) / _EVENT_TIME_UNITS
+            if elapsed > 0:
+                self.set_speed((revs - self._last_revs) * self._wheel_circumference / elapsed * 3.6)
+            self._last_event_ns = timestamp_ns
+        elif timestamp_ns - self._last_event_ns > self._stop_timeout_ns:
+            self.set_speed(0.0)
+        self._last_revs = revs
+        self._last_event_time = event_time
+        return self.power
+
+    def set_speed(self, speed):
+        """
+        Set the speed, in km/h, e.g. from the general FE data of a trainer (which is in m/s).
+
+        :return: The power in watts
+        """
+        self.speed = speed
+        self.power = self._curve.power(speed)
+        return self.power
+
+
+def session_power(measurements, curve, wheel_circumference=2.105):
+    """
+    Recompute the power of a recorded session of wheel revolution data.
+
+    :param measurements: A sequence of :obj:`~pycycling.cycling_speed_cadence_service.CSCMeasurement`, in the order
+        received. Measurements without wheel revolution data are skipped over
+    :param curve: The trainer's :class:`PowerCurve`
+    :param wheel_circumference: Wheel circumference in m
+    :return: The power at each measurement, in watts, as a NumPy array if NumPy is installed, otherwise as a list. The
+        power at a measurement without a new wheel revolution is that of the previous revolution, and the power up to
+        and including the first measurement with wheel revolution data is 0
+    """
+    numpy = _numpy()
+    if numpy is None:
+        meter = VirtualPowerMeter(curve, wheel_circumference, stop_timeout=float('inf'), clock=lambda: 0)
+        return [power or 0.0 for power in map(meter.update, measurements)]
+
+    wheel = [(measurement.cumulative_wheel_revs, measurement.last_wheel_event_time) for measurement in measurements]
+    has_wheel = numpy.array([revs is not None and event_time is not None for revs, event_time in wheel], dtype=bool)
+    wheel = numpy.array([entry for entry, present in zip(wheel, has_wheel) if present], dtype=numpy.int64)
+    if len(wheel) < 2:
+        return numpy.zeros(len(has_wheel))
+    revs, event_times = wheel[:, 0], wheel[:, 1]
+    revolutions = numpy.diff(revs)
+    elapsed = (numpy.diff(event_times) & 0xFFFF) / _EVENT_TIME_UNITS
+    new_event = (elapsed > 0) & (revolutions >= 0)
+    speeds = numpy.zeros(len(revolutions))
+    speeds[new_event] = revolutions[new_event] * wheel_circumference / elapsed[new_event] * 3.6
+    powers = numpy.zeros(len(revs))
+    powers[1:] = curve.powers(speeds)
+    # Carry the last revolution's power over measurements without a new revolution
+    last_event = numpy.where(numpy.concatenate(([True], new_event)), numpy.arange(len(revs)), 0)
+    numpy.maximum.accumulate(last_event, out=last_event)
+    # Measurements without wheel revolution data keep the power of the one before
+    previous_wheel = numpy.maximum(numpy.cumsum(has_wheel) - 1, 0)
+    return powers[last_event][previous_wheel]
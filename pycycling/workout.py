@@ -0,0 +1,327 @@
+"""
+Structured workouts, run against one or many trainers with step changes on a shared schedule.
+
+A workout is a list of :obj:`WorkoutStep`, each a duration and the trainer command to send at its start, e.g. a
+target power, a resistance level, a simulated grade or an FTMS time in heart rate zones target. Commands are named
+after the methods of :class:`~pycycling.fitness_machine_service.FitnessMachineService` and
+:class:`~pycycling.tacx_trainer_control.TacxTrainerControl` which send them, and take the same arguments.
+
+A :class:`WorkoutExecutor` runs a workout on several trainers at once, as in a class where every rider must change
+step together:
+
+* each step's command is encoded for each trainer once, when the executor is created, so invalid steps are rejected
+  before the workout starts and no encoding is done at a step change,
+* step changes are scheduled with :meth:`asyncio.loop.call_at <asyncio.loop.call_at>` at deadlines computed from the
+  start time on the event loop's monotonic clock, rather than by a chain of sleeps, which would drift by the time
+  spent between them. Executors in several processes on a host can be given the same start time to stay in step,
+* at a step change, the command is queued for every trainer in the same callback, and each trainer has its own task
+  writing its queue, so a trainer slow to acknowledge a write does not delay the others.
+
+The lag between each step's deadline and the start of its write is recorded per trainer in :attr:`status`.
+
+Commands are written directly to the trainer's client. A trainer supervised by a
+:class:`~pycycling.supervisor.ConnectionSupervisor` has each command recorded as if its method had been called, so the
+current step is restored after a reconnection.
+
+Example
+=======
+.. code-block:: python
+
+    workout = [
+        WorkoutStep(300, 'set_target_power', (120,)),
+        WorkoutStep(60, 'set_target_power', (300,)),
+        WorkoutStep(300, 'set_target_power', (120,)),
+    ]
+    executor = WorkoutExecutor(workout, {'rider-1': trainer_1, 'rider-2': trainer_2})
+    await executor.run()
+"""
+import asyncio
+import bisect
+import logging
+from collections import deque, namedtuple
+
+from pycycling.fitness_machine_service import FitnessMachineService, \
+    ftms_fitness_machine_control_point_characteristic_id
+from pycycling.ftms_parsers import FTMSControlPointOpCode, form_ftms_control_command
+from pycycling.supervisor import SupervisedService
+from pycycling.tacx_trainer_control import TacxTrainerControl, _form_basic_resistance, _form_neo_modes, \
+    _form_target_power, _form_track_resistance, _form_user_configuration, _form_wind_resistance, tacx_uart_rx_id
+
+logger = logging.getLogger(__name__)
+
+
+class WorkoutStep(namedtuple('WorkoutStep', ['duration', 'command', 'args'])):
+    """
+    One step of a workout.
+
+    :param duration: Length of the step, in seconds
+    :param command: Name of the trainer method sending the step's command, e.g. ``'set_target_power'``
+    :param args: Arguments of the command, e.g. ``(200,)``
+    """
+    __slots__ = ()
+
+    def __new__(cls, duration, command, args=()):
+        return super().__new__(cls, duration, command, tuple(args))
+
+
+EncodedCommand = namedtuple('EncodedCommand', ['characteristic', 'data', 'response'])
+
+DeviceStatus = namedtuple('DeviceStatus', ['name', 'sent', 'failed', 'last_lag', 'max_lag'])
+
+_FTMS_OPCODES = {
+    'request_control': FTMSControlPointOpCode.REQUEST_CONTROL,
+    'reset': FTMSControlPointOpCode.RESET,
+    'start_or_resume': FTMSControlPointOpCode.START_OR_RESUME,
+    'stop_or_pause': FTMSControlPointOpCode.STOP_OR_PAUSE,
+    'set_target_speed': FTMSControlPointOpCode.SET_TARGET_SPEED,
+    'set_target_incline': FTMSControlPointOpCode.SET_TARGET_INCLINE,
+    'set_target_resistance_level': FTMSControlPointOpCode.SET_TARGET_RESISTANCE_LEVEL,
+    'set_target_power': FTMSControlPointOpCode.SET_TARGET_POWER,
+    'set_target_heart_rate': FTMSControlPointOpCode.SET_TARGET_HEART_RATE,
+    'set_targeted_expended_energy': FTMSControlPointOpCode.SET_TARGETED_EXPENDED_ENERGY,
+    'set_targeted_distance': FTMSControlPointOpCode.SET_TARGETED_DISTANCE,
+    'set_targeted_training_time': FTMSControlPointOpCode.SET_TARGETED_TRAINING_TIME,
+    'set_targeted_time_in_two_heart_rate_zones': FTMSControlPointOpCode.SET_TARGETED_TIME_IN_TWO_HEART_RATE_ZONES,
+    'set_targeted_time_in_three_heart_rate_zones': FTMSControlPointOpCode.SET_TARGETED_TIME_IN_THREE_HEART_RATE_ZONES,
+    'set_targeted_time_in_five_heart_rate_zones': FTMSControlPointOpCode.SET_TARGETED_TIME_IN_FIVE_HEART_RATE_ZONES,
+    'set_simulation_parameters': FTMSControlPointOpCode.SET_INDOOR_BIKE_SIMULATION_PARAMETERS,
+    'set_targeted_cadence': FTMSControlPointOpCode.SET_TARGETED_CADENCE,
+}
+
+# FTMS commands whose parameters may be negative
+_FTMS_SIGNED = frozenset(['set_target_incline', 'set_simulation_parameters'])
+
+_FTMS_ZONE_COUNTS = {
+    'set_targeted_time_in_two_heart_rate_zones': 2,
+    'set_targeted_time_in_three_heart_rate_zones': 3,
+    'set_targeted_time_in_five_heart_rate_zones': 5,
+}
+
+_TACX_FORMS = {
+    'set_basic_resistance': _form_basic_resistance,
+    'set_target_power': _form_target_power,
+    'set_wind_resistance': _form_wind_resistance,
+    'set_track_resistance': _form_track_resistance,
+    'set_user_configuration': _form_user_configuration,
+    'set_neo_modes': _form_neo_modes,
+}
+
+
+def _encode_ftms_command(command, args):
+    opcode = _FTMS_OPCODES.get(command)
+    if opcode is None:
+        raise ValueError(f'{command} is not a supported fitness machine command')
+    if command == 'stop_or_pause':
+        parameter = 0x02 if args and args[0] else 0x01
+    elif not args:
+        parameter = 0
+    elif len(args) == 1:
+        parameter = args[0]
+    else:
+        parameter = list(args)
+
+    values = parameter if isinstance(parameter, list) else [parameter]
+    if command in _FTMS_ZONE_COUNTS and len(values) != _FTMS_ZONE_COUNTS[command]:
+        raise ValueError(f'{command} takes a list of {_FTMS_ZONE_COUNTS[command]} times')
+    if command not in _FTMS_SIGNED and any(value < 0 for value in values):
+        raise ValueError(f'{command} parameters must be non-negative')
+    try:
+        data = form_ftms_control_command(opcode, parameter)
+    except (OverflowError, IndexError) as error:
+        raise ValueError(f'invalid parameters for {command}: {args}') from error
+    return EncodedCommand(ftms_fitness_machine_control_point_characteristic_id, bytes(data), True)
+
+
+def _encode_tacx_command(command, args):
+    form = _TACX_FORMS.get(command)
+    if form is None:
+        raise ValueError(f'{command} is not a supported Tacx trainer command')
+    return EncodedCommand(tacx_uart_rx_id, form(*args), None)
+
+
+def encode_command(trainer, command, *args):
+    """
+    Encode a trainer command once, to be written later by a :class:`WorkoutExecutor`.
+
+    :param trainer: A :class:`~pycycling.fitness_machine_service.FitnessMachineService` or
+        :class:`~pycycling.tacx_trainer_control.TacxTrainerControl`, or a supervised proxy of one
+    :param command: Name of the trainer method sending the command, e.g. ``'set_target_power'``
+    :param args: Arguments of the command
+    :return: An :obj:`EncodedCommand`
+    :raises ValueError: If the trainer does not support the command or the arguments are invalid
+    """
+    service = trainer.service if isinstance(trainer, SupervisedService) else trainer
+    if isinstance(service, FitnessMachineService):
+        return _encode_ftms_command(command, args)
+    if isinstance(service, TacxTrainerControl):
+        return _encode_tacx_command(command, args)
+    raise ValueError(f'workouts cannot be run on a {type(service).__name__}')
+
+
+class _Device:
+    __slots__ = ('name', 'trainer', 'client', 'commands', 'queue', 'ready', 'idle', 'task', 'sent', 'failed',
+                 'last_lag', 'max_lag')
+
+    def __init__(self, name, trainer, commands):
+        self.name = name
+        self.trainer = trainer
+        self.client = trainer._client  # pylint: disable=protected-access
+        self.commands = commands
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.task = None
+        self.sent = 0
+        self.failed = 0
+        self.last_lag = None
+        self.max_lag = None
+
+
+class WorkoutExecutor:
+    """
+    Runs a workout on a set of trainers.
+
+    :param workout: A list of :obj:`WorkoutStep`
+    :param trainers: A dict of trainers by name, each a
+        :class:`~pycycling.fitness_machine_service.FitnessMachineService` or
+        :class:`~pycycling.tacx_trainer_control.TacxTrainerControl`, or a supervised proxy of one. FTMS trainers
+        should already have been given control with
+        :meth:`~pycycling.fitness_machine_service.FitnessMachineService.request_control`
+    :param on_step: Optional callback, called with the index and :obj:`WorkoutStep` at the start of each step
+    :raises ValueError: If a step's command is not supported by a trainer or its arguments are invalid
+    """
+
+    def __init__(self, workout, trainers, on_step=None):
+        self._workout = list(workout)
+        if any(step.duration < 0 for step in self._workout):
+            raise ValueError('step durations must be non-negative')
+        self._offsets = []
+        offset = 0.0
+        for step in self._workout:
+            self._offsets.append(offset)
+            offset += step.duration
+        self.duration = offset
+        self._on_step = on_step
+        self._devices = [_Device(name, trainer, [encode_command(trainer, step.command, *step.args)
+                                                 for step in self._workout])
+                         for name, trainer in trainers.items()]
+
+        self._loop = None
+        self._start_time = None
+        self._next_step = 0
+        self._handle = None
+        self._finished = None
+        self.step_index = None
+
+    def start(self, start_time=None):
+        """
+        Start the workout on the running event loop.
+
+        :param start_time: The time at which the first step starts, on the event loop's clock (by default
+            :func:`time.monotonic`). Defaults to now
+        """
+        loop = self._loop = asyncio.get_running_loop()
+        self._start_time = loop.time() if start_time is None else start_time
+        self._next_step = 0
+        self._finished = loop.create_future()
+        for device in self._devices:
+            device.task = loop.create_task(self._send(device))
+        self._schedule()
+
+    def stop(self):
+        """Stop the workout. Commands not yet written are discarded"""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for device in self._devices:
+            if device.task is not None:
+                device.task.cancel()
+                device.task = None
+            device.queue.clear()
+        if self._finished is not None and not self._finished.done():
+            self._finished.cancel()
+
+    async def wait(self):
+        """Wait until the last step has ended"""
+        await asyncio.shield(self._finished)
+
+    async def run(self, start_time=None):
+        """Run the workout to its end. See :meth:`start`"""
+        self.start(start_time)
+        try:
+            await self.wait()
+            # Let the last step's commands be written
+            await asyncio.gather(*(device.idle.wait() for device in self._devices))
+        finally:
+            self.stop()
+
+    @property
+    def status(self):
+        """A :obj:`DeviceStatus` for each trainer. Lags are in seconds"""
+        return [DeviceStatus(name=device.name, sent=device.sent, failed=device.failed, last_lag=device.last_lag,
+                             max_lag=device.max_lag)
+                for device in self._devices]
+
+    def _schedule(self):
+        if self._next_step < len(self._workout):
+            deadline = self._start_time + self._offsets[self._next_step]
+            self._handle = self._loop.call_at(deadline, self._dispatch)
+        else:
+            self._handle = self._loop.call_at(self._start_time + self.duration, self._finish)
+
+    def _dispatch(self):
+        # If the loop was held up past later deadlines, skip to the latest step due
+        elapsed = self._loop.time() - self._start_time
+        index = max(self._next_step, bisect.bisect_right(self._offsets, elapsed) - 1)
+        deadline = self._start_time + self._offsets[index]
+        self._next_step = index + 1
+        self._schedule()
+
+        self.step_index = index
+        for device in self._devices:
+            device.queue.append((index, deadline))
+            device.idle.clear()
+            device.ready.set()
+        if self._on_step is not None:
+            self._on_step(index, self._workout[index])
+
+    def _finish(self):
+        self._handle = None
+        if not self._finished.done():
+            self._finished.set_result(None)
+
+    async def _send(self, device):
+        loop = self._loop
+        queue = device.queue
+        write = device.client.write_gatt_char
+        supervised = isinstance(device.trainer, SupervisedService)
+        try:
+            while True:
+                await device.ready.wait()
+                while queue:
+                    index, deadline = queue[0]
+                    characteristic, data, response = device.commands[index]
+                    lag = loop.time() - deadline
+                    device.last_lag = lag
+                    if device.max_lag is None or lag > device.max_lag:
+                        device.max_lag = lag
+                    if supervised:
+                        step = self._workout[index]
+                        device.trainer._state.record(step.command, step.args, {})  # pylint: disable=protected-access
+                    try:
+                        await write(characteristic, data, response)
+                        device.sent += 1
+                    except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                        # Python 3.7 CancelledError is an Exception, so it must not reach the handler below
+                        raise
+                    except Exception as error:  # pylint: disable=broad-except
+                        device.failed += 1
+                        logger.warning('Failed to send step %d to %s: %s', index, device.name, error)
+                    finally:
+                        queue.popleft()
+                device.ready.clear()
+                device.idle.set()
+        finally:
+            # Never leave run() waiting on a sender which has stopped
+            device.idle.set()
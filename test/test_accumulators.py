@@ -0,0 +1,77 @@
+import unittest
+
+from pycycling.accumulators import RolloverAccumulator, cycling_power_accumulators, general_fe_accumulators, \
+    specific_trainer_accumulators
+from pycycling.cycling_power_service import CyclingPowerMeasurement
+from pycycling.notifications import TimestampedRecord
+from pycycling.tacx_trainer_control import GeneralFEData, SpecificTrainerData
+
+_SECOND = 1_000_000_000
+
+
+class TestRolloverAccumulator(unittest.TestCase):
+    def test_rollover(self):
+        accumulator = RolloverAccumulator(1 << 16)
+        self.assertEqual(accumulator.update(65000, 0), 65000)
+        self.assertEqual(accumulator.update(65500, _SECOND), 65500)
+        self.assertEqual(accumulator.update(300, 2 * _SECOND), 65836)
+        self.assertEqual(accumulator.resets, 0)
+
+    def test_reset(self):
+        accumulator = RolloverAccumulator(1 << 8)
+        accumulator.update(200, 0)
+        accumulator.update(210, _SECOND)
+        self.assertEqual(accumulator.update(3, 2 * _SECOND), 213)
+        self.assertEqual(accumulator.resets, 1)
+
+    def test_gap_interpolation(self):
+        # Elapsed time in quarter seconds wraps every 64 s
+        accumulator = RolloverAccumulator(1 << 8, resolution=0.25)
+        for second in range(5):
+            accumulator.update(second, second * _SECOND)
+        self.assertAlmostEqual(accumulator.rate, 1.0)
+        # 70 s without a notification hides a wrap
+        self.assertEqual(accumulator.update((4 + 70) % 64, 74 * _SECOND), 74)
+        self.assertEqual(accumulator.gaps, 1)
+
+    def test_missed_events(self):
+        accumulator = RolloverAccumulator(1 << 8, event_counter=True)
+        for timestamp, count in enumerate([254, 255, 0, 3, 3]):
+            accumulator.update(count, timestamp * _SECOND)
+        self.assertEqual(accumulator.total, 259)
+        self.assertEqual(accumulator.missed_events, 2)
+
+
+def _power(energy, torque):
+    return CyclingPowerMeasurement(200, energy, None, torque, *([None] * 10))
+
+
+def _specific(count, power):
+    return SpecificTrainerData(count, 90, power, 200, None, None, None, None, False, False, False)
+
+
+def _general(elapsed_time, distance):
+    return GeneralFEData(None, elapsed_time, distance, 10.0, None, None, None)
+
+
+class TestRecordAccumulators(unittest.TestCase):
+    def test_cycling_power(self):
+        accumulators = cycling_power_accumulators()
+        accumulators.update(_power(65535, None), 0)
+        totals = accumulators.update(TimestampedRecord(_power(1, 100), _SECOND))
+        self.assertEqual(totals.accumulated_energy, 65537)
+        self.assertEqual(totals.accumulated_torque, 100)
+
+    def test_tacx(self):
+        specific = specific_trainer_accumulators()
+        specific.update(_specific(255, 65500), 0)
+        self.assertEqual(specific.update(_specific(1, 100), _SECOND), (65636, 257))
+        self.assertEqual(specific.accumulators['update_event_count'].missed_events, 1)
+
+        general = general_fe_accumulators()
+        general.update(_general(63.75, 250), 0)
+        self.assertEqual(general.update(_general(0.25, 4), _SECOND), (64.25, 260))
+
+
+if __name__ == '__main__':
+    unittest.main()
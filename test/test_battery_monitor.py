@@ -0,0 +1,69 @@
+import asyncio
+import random
+import unittest
+
+from pycycling.battery_monitor import BatteryMonitor
+from pycycling.battery_service import BatteryService
+
+
+class _FakeClient:
+    def __init__(self, address, level, notify):
+        self.address = address
+        self.level = level
+        self.notify = notify
+        self.reads = 0
+        self.notification_handler = None
+
+    async def read_gatt_char(self, uuid):  # pylint: disable=unused-argument
+        self.reads += 1
+        return bytearray([self.level])
+
+    async def start_notify(self, uuid, handler):  # pylint: disable=unused-argument
+        if not self.notify:
+            raise RuntimeError('Characteristic does not support notifications')
+        self.notification_handler = handler
+
+    async def stop_notify(self, uuid):  # pylint: disable=unused-argument
+        self.notification_handler = None
+
+
+class TestBatteryMonitor(unittest.TestCase):
+    def test_polling_and_notifications(self):
+        polled = _FakeClient('polled', 80, notify=False)
+        notifying = _FakeClient('notifying', 60, notify=True)
+        monitor = BatteryMonitor(interval=0.01, jitter=0.5, startup_spread=0.01, rng=random.Random(1))
+
+        async def run():
+            await monitor.add(BatteryService(polled))
+            await monitor.add(BatteryService(notifying))
+            self.assertIsNone(monitor.get('polled'))
+            monitor.start()
+            await asyncio.sleep(0.1)
+            notifying.notification_handler(None, bytearray([59]))
+            monitor.stop()
+
+        asyncio.run(run())
+        self.assertEqual(monitor.get('polled').level, 80)
+        self.assertEqual(monitor.get('polled').source, 'read')
+        self.assertGreater(polled.reads, 2)
+        self.assertEqual(notifying.reads, 1)
+        self.assertEqual(monitor.get('notifying').level, 59)
+        self.assertEqual(monitor.get('notifying').source, 'notification')
+        self.assertEqual(set(monitor.readings), {'polled', 'notifying'})
+
+    def test_remove(self):
+        client = _FakeClient('device', 50, notify=True)
+        monitor = BatteryMonitor()
+
+        async def run():
+            await monitor.add(BatteryService(client))
+            await monitor.poll('device')
+            await monitor.remove('device')
+
+        asyncio.run(run())
+        self.assertIsNone(monitor.get('device'))
+        self.assertIsNone(client.notification_handler)
+
+
+if __name__ == '__main__':
+    unittest.main()
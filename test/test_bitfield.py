@@ -0,0 +1,53 @@
+import unittest
+from collections import namedtuple
+from enum import Enum
+
+from pycycling.bitfield import BitfieldDecoder, BitfieldField, has_feature
+from pycycling.ftms_parsers import parse_all_features
+
+Mode = Enum('Mode', 'off low high boost')
+Features = namedtuple('Features', ['speed_supported', 'cadence_supported', 'mode'])
+
+
+class TestBitfieldDecoder(unittest.TestCase):
+    def setUp(self):
+        self.decoder = BitfieldDecoder(Features, [
+            BitfieldField('speed_supported', 0),
+            BitfieldField('cadence_supported', 3),
+            BitfieldField('mode', 6, 2, list(Mode)),
+        ])
+
+    def test_decode(self):
+        self.assertEqual(self.decoder.decode(0b10001001), Features(True, True, Mode.high))
+        self.assertEqual(self.decoder.from_bytes(bytes([0b01000000, 0xFF])), Features(False, False, Mode.low))
+        # Records are memoized by raw value
+        self.assertIs(self.decoder.decode(0b10001001), self.decoder.decode(0b10001001))
+        for value in range(256):
+            self.assertEqual(self.decoder.encode(self.decoder.decode(value)), value & 0b11001001)
+
+    def test_has_feature(self):
+        mask = self.decoder.mask('speed_supported', 'cadence_supported')
+        self.assertEqual(mask, 0b1001)
+        self.assertTrue(has_feature(0b1101, mask))
+        self.assertFalse(has_feature(0b0101, mask))
+        with self.assertRaises(ValueError):
+            self.decoder.mask('power_supported')
+
+    def test_invalid_fields(self):
+        with self.assertRaises(ValueError):
+            BitfieldField('mode', 6, 2)
+        with self.assertRaises(ValueError):
+            BitfieldDecoder(Features, [BitfieldField('speed_supported', 0)])
+
+    def test_parse_all_features(self):
+        fitness_machine, target_setting = parse_all_features(bytes([0x86, 0x50, 0, 0, 0x0C, 0x20, 0, 0]))
+        self.assertTrue(fitness_machine.cadence_supported)
+        self.assertTrue(fitness_machine.power_measurement_supported)
+        self.assertFalse(fitness_machine.avg_speed_supported)
+        self.assertTrue(target_setting.power_target_setting_supported)
+        self.assertTrue(target_setting.indoor_bike_simulation_parameters_supported)
+        self.assertFalse(target_setting.speed_target_setting_supported)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# pylint: disable=protected-access
+import asyncio
+import os
+import tempfile
+import unittest
+
+from pycycling.bridge import BridgeSubscriber, RecordBridge
+from pycycling.framing import Topic
+from pycycling.heart_rate_service import HeartRateMeasurement, HeartRateService, encode_hr_measurement
+
+
+class _Client:
+    address = 'AA:BB'
+
+
+def _measurement(bpm):
+    return HeartRateMeasurement(sensor_contact=True, bpm=bpm, rr_interval=[], energy_expended=None)
+
+
+class TestBridge(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'bridge.sock')
+        self.bridge = RecordBridge(self.path, flush_interval=0.01, max_queued_frames=4)
+        await self.bridge.start()
+
+    async def asyncTearDown(self):
+        await self.bridge.stop()
+        self.directory.cleanup()
+
+    async def _wait_for_subscribers(self, count):
+        while len(self.bridge.subscribers) < count:
+            await asyncio.sleep(0.001)
+
+    async def test_publish_to_subscribers(self):
+        everything = await BridgeSubscriber.connect(self.path)
+        trainer_only = await BridgeSubscriber.connect(self.path, ['trainer-*/*'])
+        await self._wait_for_subscribers(2)
+        await asyncio.sleep(0.02)
+
+        self.bridge.publish('hr-1', 'hr_measurement', _measurement(120), received_ns=1)
+        self.bridge.publish('trainer-1', 'indoor_bike_data', 'bike data', received_ns=2)
+        self.assertEqual(await asyncio.wait_for(everything.receive(), 1), [
+            (Topic('hr-1', 'hr_measurement'), 1, _measurement(120)),
+            (Topic('trainer-1', 'indoor_bike_data'), 2, 'bike data'),
+        ])
+        self.assertEqual(await asyncio.wait_for(trainer_only.receive(), 1), [
+            (Topic('trainer-1', 'indoor_bike_data'), 2, 'bike data'),
+        ])
+        await everything.close()
+        await trainer_only.close()
+
+    async def test_attach_service(self):
+        service = HeartRateService(_Client())
+        service.enable_receive_timestamps()
+        self.bridge.attach(service)
+        self.bridge.flush()
+
+        # A subscriber connecting late is sent the topics declared before it connected
+        subscriber = await BridgeSubscriber.connect(self.path)
+        await self._wait_for_subscribers(1)
+        service._hr_measurement_channel.deliver(encode_hr_measurement(_measurement(130)), 5)
+        self.assertEqual(await asyncio.wait_for(subscriber.receive(), 1),
+                         [(Topic('AA:BB', 'hr_measurement'), 5, _measurement(130))])
+
+        await self.bridge.stop()
+        self.assertEqual([record async for record in subscriber], [])
+        await subscriber.close()
+
+    async def test_slow_subscriber_drops_oldest_records(self):
+        await self.bridge.stop()
+        self.bridge = RecordBridge(self.path, flush_interval=3600, max_queued_frames=4)
+        await self.bridge.start()
+        subscriber = await BridgeSubscriber.connect(self.path)
+        await self._wait_for_subscribers(1)
+
+        # Queue frames faster than the writer task can run
+        for bpm in range(60, 70):
+            self.bridge.publish('hr-1', 'hr_measurement', _measurement(bpm), received_ns=bpm)
+            self.bridge.flush()
+        status, = self.bridge.subscribers
+        self.assertEqual(status.queued_frames, 4)
+        self.assertEqual(status.dropped_frames, 7)
+
+        # The topics frame is kept, and the newest records are delivered
+        received = [await asyncio.wait_for(subscriber.receive(), 1) for _ in range(3)]
+        self.assertEqual([batch[0][1] for batch in received], [67, 68, 69])
+        await subscriber.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@ import unittest
 
 from pycycling.cycling_power_service import _parse_sensor_location, _parse_cycling_power_feature, \
     _parse_cycling_power_measurement, SensorLocation, CyclingPowerFeature, SensorMeasurementContext, \
-    DistributeSystemSupport, CyclingPowerMeasurement
+    DistributeSystemSupport, CyclingPowerMeasurement, CyclingPowerVector, InstantaneousMeasurementDirection, \
+    _parse_cycling_power_vector, encode_cycling_power_measurement, encode_cycling_power_vector, \
+    pack_cycling_power_measurement_into
 
 
 class TestCyclingPowerService(unittest.TestCase):
@@ -37,7 +39,7 @@ class TestCyclingPowerService(unittest.TestCase):
                 instantaneous_measurement_direction_supported=True,
                 factory_calibration_date_supported=True,
                 enhanced_offset_compensation_supported=True,
-                distribute_system_support=DistributeSystemSupport.unspecified
+                distribute_system_support=DistributeSystemSupport.rfu
             )
         )
         # device which supports nothing
@@ -67,6 +69,9 @@ class TestCyclingPowerService(unittest.TestCase):
                 distribute_system_support=DistributeSystemSupport.unspecified
             )
         )
+        # distributed system support is a two bit field
+        feature = _parse_cycling_power_feature(bytearray([0b00001000, 0b00000000, 0b00100000, 0b00000000]))
+        self.assertEqual(feature.distribute_system_support, DistributeSystemSupport.distributed_system_support)
 
     def test__parse_cycling_power_measurement(self):
         # Simple case, just power and no bells and whistles
@@ -121,6 +126,64 @@ class TestCyclingPowerService(unittest.TestCase):
             )
         )
 
+    def test_encode_cycling_power_measurement(self):
+        measurement = CyclingPowerMeasurement(
+            instantaneous_power=1234,
+            accumulated_energy=None,
+            pedal_power_balance=None,
+            accumulated_torque=None,
+            cumulative_wheel_revs=4294967295,
+            last_wheel_event_time=16131,
+            cumulative_crank_revs=2047,
+            last_crank_event_time=4071,
+            maximum_force_magnitude=None,
+            minimum_force_magnitude=None,
+            maximum_torque_magnitude=None,
+            minimum_torque_magnitude=None,
+            top_dead_spot_angle=None,
+            bottom_dead_spot_angle=None
+        )
+        self.assertEqual(encode_cycling_power_measurement(measurement), bytes([
+            0b00110000, 0b00000000,
+            0b11010010, 0b00000100,
+            0b11111111, 0b11111111, 0b11111111, 0b11111111,
+            0b00000011, 0b00111111,
+            0b11111111, 0b00000111,
+            0b11100111, 0b00001111,
+        ]))
+
+        measurement = measurement._replace(accumulated_energy=12, pedal_power_balance=100, accumulated_torque=500,
+                                           maximum_force_magnitude=300, minimum_force_magnitude=-20,
+                                           maximum_torque_magnitude=40, minimum_torque_magnitude=1,
+                                           top_dead_spot_angle=10, bottom_dead_spot_angle=190)
+        decoded = _parse_cycling_power_measurement(encode_cycling_power_measurement(measurement))
+        # Read back unsigned, as the parser reads every field
+        self.assertEqual(decoded, measurement._replace(minimum_force_magnitude=65516))
+
+    def test_pack_cycling_power_measurement_into(self):
+        measurement = CyclingPowerMeasurement(250, None, None, None, None, None, None, None, None, None, None, None,
+                                              None, None)
+        buffer = bytearray(8)
+        self.assertEqual(pack_cycling_power_measurement_into(buffer, 2, measurement), 4)
+        self.assertEqual(buffer, bytearray([0, 0, 0, 0, 250, 0, 0, 0]))
+
+    def test_encode_cycling_power_vector(self):
+        vector = CyclingPowerVector(
+            instantaneous_measurement_direction=InstantaneousMeasurementDirection.radial_component,
+            cumulative_crank_revs=100,
+            last_crank_event_time=2048,
+            first_crank_measurement_angle=None,
+            instantaneous_force_magnitudes=[10, -20, 30],
+            instantaneous_torque_magnitudes=[]
+        )
+        data = encode_cycling_power_vector(vector)
+        self.assertEqual(data[0], 0b100101)
+        self.assertEqual(_parse_cycling_power_vector(data), vector)
+
+        vector = vector._replace(first_crank_measurement_angle=90, instantaneous_force_magnitudes=[],
+                                 instantaneous_torque_magnitudes=[-1, 2])
+        self.assertEqual(_parse_cycling_power_vector(encode_cycling_power_vector(vector)), vector)
+
 
 if __name__ == '__main__':
     unittest.main()
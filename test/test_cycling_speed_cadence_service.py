@@ -1,7 +1,7 @@
 import unittest
 
 from pycycling.cycling_speed_cadence_service import _parse_csc_feature, _parse_csc_measurement, CSCFeature, \
-    CSCMeasurement
+    CSCMeasurement, encode_csc_measurement, pack_csc_measurement_into
 
 
 class TestCyclingSpeedCadenceService(unittest.TestCase):
@@ -56,6 +56,21 @@ class TestCyclingSpeedCadenceService(unittest.TestCase):
             )
         )
 
+    def test_encode_csc_measurement(self):
+        measurement = CSCMeasurement(cumulative_wheel_revs=None, last_wheel_event_time=None,
+                                     cumulative_crank_revs=2047, last_crank_event_time=4071)
+        self.assertEqual(encode_csc_measurement(measurement),
+                         bytes([0b00000010, 0b11111111, 0b00000111, 0b11100111, 0b00001111]))
+
+        measurement = measurement._replace(cumulative_wheel_revs=4294967295, last_wheel_event_time=16131)
+        buffer = bytearray(16)
+        self.assertEqual(pack_csc_measurement_into(buffer, 3, measurement), 11)
+        self.assertEqual(_parse_csc_measurement(buffer[3:14]), measurement)
+
+        # A group with only some of its fields set cannot be encoded
+        with self.assertRaisesRegex(ValueError, 'last_wheel_event_time'):
+            encode_csc_measurement(CSCMeasurement(100, None, None, None))
+
 
 if __name__ == '__main__':
     unittest.main()
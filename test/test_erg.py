@@ -0,0 +1,134 @@
+# pylint: disable=protected-access
+import asyncio
+import unittest
+
+from pycycling.erg import ErgController
+from pycycling.fitness_machine_service import FitnessMachineService
+from pycycling.ftms_parsers import IndoorBikeData, encode_indoor_bike_data, parse_indoor_bike_data
+from pycycling.notifications import NotifyingService
+
+
+class _Trainer(NotifyingService):
+    def __init__(self):
+        super().__init__(None)
+        self.indoor_bike_data_channel = self._add_channel('indoor_bike_data', parse_indoor_bike_data)
+        self.commands = []
+
+    async def set_target_power(self, power):
+        self.commands.append(power)
+
+
+class _Client:
+    address = 'AA:BB'
+
+    def __init__(self):
+        self.writes = []
+
+    async def write_gatt_char(self, char_specifier, data, response=None):  # pylint: disable=unused-argument
+        self.writes.append(bytes(data))
+
+
+def _run(controller, start, end, *, power=lambda command: 0.9 * command, cadence=lambda now: 90, interval=0.25):
+    commands = []
+    now = start
+    while now < end:
+        command = controller.step(now)
+        if command is not None:
+            commands.append((now, command))
+        last = controller.status.command
+        controller.feed(power(last), cadence(now))
+        now += interval
+    return commands
+
+
+class TestErgController(unittest.TestCase):
+    def test_removes_steady_state_error(self):
+        controller = ErgController(_Trainer())
+        controller.set_target(200)
+        commands = _run(controller, 0, 60)
+        self.assertAlmostEqual(controller.status.power, 200, delta=2)
+        self.assertAlmostEqual(commands[-1][1], 222, delta=3)
+        # Commands stop once the power has settled
+        self.assertLess(len(commands), 60)
+        self.assertLess(commands[-1][0], 50)
+
+    def test_ramp(self):
+        controller = ErgController(_Trainer(), proportional_gain=0, integral_gain=0, threshold=1)
+        controller.set_target(100)
+        self.assertEqual(controller.step(0.0), 100)
+        controller.set_target(200, ramp_time=10)
+        self.assertEqual(controller.step(1.0), None)
+        self.assertEqual(controller.step(6.0), 150)
+        self.assertEqual(controller.step(11.0), 200)
+        self.assertEqual(controller.status.setpoint, 200)
+        with self.assertRaises(ValueError):
+            controller.set_target(-1)
+
+    def test_cadence_spike_freezes_integral(self):
+        controller = ErgController(_Trainer())
+        controller.set_target(200)
+        _run(controller, 0, 30)
+        settled = controller.status.correction
+
+        # A sprint: cadence jumps and the flywheel reads 150 W high
+        _run(controller, 30, 30.5, power=lambda command: command + 150, cadence=lambda now: 130)
+        self.assertTrue(controller.status.frozen)
+        self.assertAlmostEqual(controller.status.correction, settled, delta=3)
+
+        # Coasting: no correction
+        _run(controller, 30.5, 40, power=lambda command: 0, cadence=lambda now: 0)
+        self.assertEqual(controller.status.correction, 0)
+        self.assertEqual(controller.status.command, 200)
+
+
+class TestErgControllerScheduling(unittest.IsolatedAsyncioTestCase):
+    async def test_ticks_and_feedback(self):
+        trainer = _Trainer()
+        controller = ErgController(trainer, tick_interval=0.01)
+        controller.set_target(150)
+        controller.start()
+        await asyncio.sleep(0.05)
+        self.assertEqual(trainer.commands, [150])
+
+        trainer.indoor_bike_data_channel.publish(IndoorBikeData(*[None] * 15)._replace(instant_power=100,
+                                                                                       instant_cadence=90))
+        await asyncio.sleep(0.05)
+        controller.stop()
+        self.assertGreater(trainer.commands[-1], 150)
+        self.assertEqual(controller.status.commands_sent, len(trainer.commands))
+
+    async def test_fitness_machine_service(self):
+        client = _Client()
+        trainer = FitnessMachineService(client)
+        controller = ErgController(trainer, tick_interval=0.01)
+        controller.set_target(180)
+        controller.start()
+        data = IndoorBikeData(*[None] * 15)._replace(instant_speed=30.0, instant_cadence=90, instant_power=180)
+        trainer._indoor_bike_data_channel.deliver(encode_indoor_bike_data(data))
+        await asyncio.sleep(0.05)
+        controller.stop()
+        self.assertEqual(controller.status.power, 180)
+        self.assertEqual(client.writes, [bytes([0x05, 180, 0])])
+
+    async def test_failed_command_is_resent(self):
+        trainer = _Trainer()
+        failures = [RuntimeError('not connected')]
+
+        async def set_target_power(power):
+            if failures:
+                raise failures.pop()
+            trainer.commands.append(power)
+
+        trainer.set_target_power = set_target_power
+        controller = ErgController(trainer, tick_interval=0.01)
+        controller.set_target(150)
+        with self.assertLogs('pycycling.erg', 'WARNING'):
+            controller.start()
+            await asyncio.sleep(0.05)
+        controller.stop()
+        self.assertEqual(trainer.commands, [150])
+        self.assertEqual(controller.status.commands_sent, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+
+from pycycling.framing import FRAME_RECORDS, FRAME_TOPICS, Frame, FrameReader, Topic, TopicTable, decode_frame, \
+    encode_frame, read_frame
+from pycycling.heart_rate_service import HeartRateMeasurement
+
+
+class TestFraming(unittest.TestCase):
+    def test_encode_decode_frame(self):
+        records = [(0, 1000, HeartRateMeasurement(True, 140, [420], None)),
+                   (1, 2000, HeartRateMeasurement(True, 141, [], None))]
+        data = encode_frame(FRAME_RECORDS, records)
+        self.assertEqual(decode_frame(data), Frame(FRAME_RECORDS, records))
+        with self.assertRaises(ValueError):
+            decode_frame(data[:-1])
+
+    def test_frame_reader(self):
+        data = encode_frame(FRAME_TOPICS, [(0, 'hr-1', 'hr_measurement')]) + encode_frame(FRAME_RECORDS, [])
+        reader = FrameReader()
+        self.assertEqual(reader.feed(data[:3]), [])
+        self.assertEqual(reader.feed(data[3:-2]), [Frame(FRAME_TOPICS, [(0, 'hr-1', 'hr_measurement')])])
+        self.assertEqual(reader.pending, len(encode_frame(FRAME_RECORDS, [])) - 2)
+        self.assertEqual(reader.feed(data[-2:]), [Frame(FRAME_RECORDS, [])])
+        self.assertEqual(reader.pending, 0)
+
+    def test_read_frame(self):
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(encode_frame(FRAME_RECORDS, [(3, 5, None)]))
+            reader.feed_eof()
+            frame = await read_frame(reader)
+            with self.assertRaises(asyncio.IncompleteReadError):
+                await read_frame(reader)
+            return frame
+
+        self.assertEqual(asyncio.run(read()), Frame(FRAME_RECORDS, [(3, 5, None)]))
+
+    def test_topic_table(self):
+        sender = TopicTable()
+        self.assertEqual(sender.topic_id('trainer', 'indoor_bike_data'), 0)
+        self.assertEqual(sender.topic_id('hr', 'hr_measurement'), 1)
+        self.assertEqual(sender.topic_id('trainer', 'indoor_bike_data'), 0)
+        new = sender.take_new()
+        self.assertEqual(new, [(0, 'trainer', 'indoor_bike_data'), (1, 'hr', 'hr_measurement')])
+        self.assertEqual(sender.take_new(), [])
+
+        receiver = TopicTable()
+        receiver.update(new)
+        self.assertEqual(receiver.topic(1), Topic('hr', 'hr_measurement'))
+        self.assertIsNone(receiver.topic(2))
+        self.assertEqual(len(receiver), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
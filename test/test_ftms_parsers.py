@@ -0,0 +1,80 @@
+import unittest
+
+from pycycling.ftms_parsers import FitnessMachineStatus, FitnessMachineStatusMessage, IndoorBikeData, \
+    IndoorBikeSimulationParameters, SpinDownStatusValue, ThreeZoneHR, TrainingStatus, TrainingStatusMessage, \
+    encode_fitness_machine_status, encode_indoor_bike_data, encode_training_status, parse_fitness_machine_status, \
+    parse_indoor_bike_data, parse_training_status, pack_indoor_bike_data_into
+
+
+class TestFTMSParsers(unittest.TestCase):
+    def test_encode_indoor_bike_data(self):
+        data = IndoorBikeData(
+            instant_speed=32.5,
+            average_speed=None,
+            instant_cadence=90.5,
+            average_cadence=None,
+            total_distance=70000,
+            resistance_level=20,
+            instant_power=-5,
+            average_power=None,
+            total_energy=None,
+            energy_per_hour=None,
+            energy_per_minute=None,
+            heart_rate=None,
+            metabolic_equivalent=None,
+            elapsed_time=3600,
+            remaining_time=None,
+        )
+        encoded = encode_indoor_bike_data(data)
+        self.assertEqual(encoded[:2], bytes([0x74, 0x08]))
+        self.assertEqual(parse_indoor_bike_data(encoded), data)
+
+        data = IndoorBikeData(None, 30.25, None, 85.5, None, None, None, 210, 120, 600, 10, 145, 7.5, None, 1200)
+        buffer = bytearray(32)
+        size = pack_indoor_bike_data_into(buffer, 4, data)
+        self.assertEqual(buffer[4] & 0x01, 0x01)
+        self.assertEqual(parse_indoor_bike_data(buffer[4:4 + size]), data)
+
+    def test_encode_fitness_machine_status(self):
+        messages = [
+            FitnessMachineStatusMessage(FitnessMachineStatus.RESET, None, None),
+            FitnessMachineStatusMessage(FitnessMachineStatus.PAUSED_BY_USER, None, None),
+            FitnessMachineStatusMessage(FitnessMachineStatus.NEW_SPEED, 25.5, "km/h"),
+            FitnessMachineStatusMessage(FitnessMachineStatus.NEW_INCLINATION, -2.5, "%"),
+            FitnessMachineStatusMessage(FitnessMachineStatus.NEW_POWER, 250, "W"),
+            FitnessMachineStatusMessage(FitnessMachineStatus.NEW_DISTANCE, 100000, "m"),
+            FitnessMachineStatusMessage(FitnessMachineStatus.NEW_THREE_HEART_RATE_ZONE_TARGET_TIME,
+                                        ThreeZoneHR(60, 120, 300), "bpm"),
+            FitnessMachineStatusMessage(FitnessMachineStatus.NEW_INDOOR_BIKE_SIMULATION_PARAMETERS,
+                                        IndoorBikeSimulationParameters(1.5, 4.0, 0.004, 0.51),
+                                        "m/s, %, unitless, kg/m"),
+            FitnessMachineStatusMessage(FitnessMachineStatus.NEW_SPIN_DOWN_STATUS, SpinDownStatusValue.SUCCESS,
+                                        "unitless"),
+            FitnessMachineStatusMessage(FitnessMachineStatus.CONTROL_PERMISSION_LOST, None, None),
+        ]
+        for message in messages:
+            self.assertEqual(parse_fitness_machine_status(encode_fitness_machine_status(message)), message)
+        self.assertEqual(encode_fitness_machine_status(messages[4]), bytes([0x08, 250, 0]))
+
+    def test_parse_fitness_machine_status(self):
+        self.assertEqual(parse_fitness_machine_status(bytearray([0x09, 120])),
+                         FitnessMachineStatusMessage(FitnessMachineStatus.NEW_HEART_RATE, 120, "bpm"))
+        self.assertEqual(parse_fitness_machine_status(bytearray([0x02, 0x07])),
+                         FitnessMachineStatusMessage(FitnessMachineStatus.RESERVED_FOR_FUTURE_USE, None, None))
+        self.assertEqual(parse_fitness_machine_status(bytearray([0x30, 0x01])),
+                         FitnessMachineStatusMessage(None, None, None))
+        # A truncated parameter reads as if its missing bytes were zero
+        self.assertEqual(parse_fitness_machine_status(bytearray([0x0D, 0x10, 0x27])),
+                         FitnessMachineStatusMessage(FitnessMachineStatus.NEW_DISTANCE, 10000, "m"))
+
+    def test_encode_training_status(self):
+        message = TrainingStatusMessage(TrainingStatus.WATT_CONTROL, None)
+        self.assertEqual(encode_training_status(message), bytes([0x01, 0x0C]))
+        self.assertEqual(parse_training_status(encode_training_status(message)), message)
+
+        message = TrainingStatusMessage(TrainingStatus.WARMING_UP, "Warm up")
+        self.assertEqual(parse_training_status(encode_training_status(message)), message)
+
+
+if __name__ == "__main__":
+    unittest.main()
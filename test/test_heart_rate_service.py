@@ -1,6 +1,7 @@
 import unittest
 
-from pycycling.heart_rate_service import _parse_hr_measurement, HeartRateMeasurement
+from pycycling.heart_rate_service import _parse_hr_measurement, HeartRateMeasurement, encode_hr_measurement, \
+    pack_hr_measurement_into
 
 
 class TestHeartRateServiceService(unittest.TestCase):
@@ -18,6 +19,21 @@ class TestHeartRateServiceService(unittest.TestCase):
             )
         )
 
+    def test_encode_hr_measurement(self):
+        measurement = HeartRateMeasurement(sensor_contact=False, bpm=42, rr_interval=[], energy_expended=None)
+        self.assertEqual(encode_hr_measurement(measurement), bytes([0b00000000, 0b00101010]))
+
+        measurement = HeartRateMeasurement(sensor_contact=True, bpm=300, rr_interval=[800, 810], energy_expended=25)
+        data = encode_hr_measurement(measurement)
+        self.assertEqual(data[0], 0b00011111)
+        self.assertEqual(_parse_hr_measurement(data), measurement)
+
+    def test_pack_hr_measurement_into(self):
+        buffer = bytearray(6)
+        measurement = HeartRateMeasurement(sensor_contact=True, bpm=150, rr_interval=[400], energy_expended=None)
+        self.assertEqual(pack_hr_measurement_into(buffer, 1, measurement), 4)
+        self.assertEqual(_parse_hr_measurement(buffer[1:5]), measurement)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from pycycling.latency import LatencyHistogram
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 10001):
+            histogram.record(value * 1000)
+
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.min, 1000)
+        self.assertEqual(histogram.max, 10000000)
+        self.assertAlmostEqual(histogram.mean, 5000500)
+        self.assertAlmostEqual(histogram.percentile(50), 5000000, delta=5000000 * 0.01)
+        self.assertAlmostEqual(histogram.percentile(99), 9900000, delta=9900000 * 0.01)
+        self.assertEqual(histogram.percentile(100), 10000000)
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        for value in [3, 3, 7, 200]:
+            histogram.record(value)
+        self.assertEqual(histogram.percentile(50), 3)
+        self.assertEqual(histogram.percentile(75), 7)
+        self.assertEqual(histogram.percentile(100), 200)
+
+    def test_merge(self):
+        first = LatencyHistogram()
+        second = LatencyHistogram()
+        first.record(10)
+        second.record(1 << 40)
+        first.merge(second)
+        self.assertEqual(first.count, 2)
+        self.assertEqual(first.max, 1 << 40)
+        self.assertEqual(first.percentile(50), 10)
+
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# pylint: disable=protected-access
+import multiprocessing
+import unittest
+
+from pycycling.heart_rate_service import HeartRateService
+from pycycling.live_state import LiveState, LiveStatePublisher, LiveStateReader, MAX_THREATS
+from pycycling.rear_view_radar import RadarMeasurement, RearViewRadarService
+
+
+class _Client:
+    address = 'AA:BB'
+
+
+def _read_in_child(name, queue):
+    with LiveStateReader(name) as reader:
+        queue.put(reader.read_all())
+
+
+class TestLiveState(unittest.TestCase):
+    def setUp(self):
+        self.publisher = LiveStatePublisher(devices=4, depth=3, clock=lambda: 1000)
+        self.reader = LiveStateReader(self.publisher.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.publisher.close()
+        self.publisher.unlink()
+
+    def test_update_and_read(self):
+        self.assertIsNone(self.reader.read('trainer'))
+        self.publisher.update('trainer', power=250, cadence=90.5)
+        self.publisher.update('trainer', timestamp_ns=2000, heart_rate=140)
+        self.assertEqual(self.reader.devices(), ['trainer'])
+        self.assertEqual(self.reader.read('trainer'),
+                         LiveState('trainer', 2, 2000, 250.0, 90.5, 140.0, None, None, ()))
+        with self.assertRaises(ValueError):
+            self.publisher.update('trainer', torque=3)
+
+    def test_history(self):
+        for power in range(100, 600, 100):
+            self.publisher.update('trainer', power=power)
+        history = self.reader.history('trainer')
+        self.assertEqual([state.power for state in history], [300, 400, 500])
+        self.assertEqual([state.sequence for state in history], [3, 4, 5])
+
+    def test_attach(self):
+        heart_rate = HeartRateService(_Client())
+        radar = RearViewRadarService(_Client())
+        self.publisher.attach(heart_rate)
+        self.publisher.attach(radar, 'radar')
+        heart_rate.enable_receive_timestamps()
+
+        heart_rate._hr_measurement_channel.deliver(bytes([0x00, 150]), received_ns=5000)
+        state = self.reader.read('AA:BB')
+        self.assertEqual((state.heart_rate, state.timestamp_ns), (150, 5000))
+
+        threats = [RadarMeasurement(index, 40, 10 * index) for index in range(MAX_THREATS + 2)]
+        radar._radar_measurement_channel.publish(threats)
+        self.assertEqual(self.reader.read('radar').threats, tuple(threats[:MAX_THREATS]))
+        self.assertIsNone(self.reader.read('radar').power)
+
+    def test_device_limits(self):
+        with self.assertRaises(ValueError):
+            self.publisher.add_device('x' * 33)
+        for index in range(4):
+            self.publisher.add_device(f'device-{index}')
+        with self.assertRaises(ValueError):
+            self.publisher.add_device('device-4')
+
+    def test_read_from_another_process(self):
+        self.publisher.update('trainer', power=210, speed=32.5)
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_read_in_child, args=(self.publisher.name, queue))
+        process.start()
+        states = queue.get(timeout=10)
+        process.join()
+        self.assertEqual(states['trainer'].power, 210)
+        self.assertEqual(states['trainer'].speed, 32.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
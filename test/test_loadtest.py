@@ -0,0 +1,35 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from pycycling.loadtest import main, run_load_test
+
+
+class TestLoadTest(unittest.TestCase):
+    def test_run_load_test(self):
+        result = asyncio.run(run_load_test(devices=4, rate=20, subscribers=2, duration=0.3, warmup=0.1,
+                                           device_type='mixed', seed=1))
+        self.assertGreater(result['notifications'], 0)
+        self.assertGreater(result['delivery_ratio'], 0.5)
+        self.assertIsNotNone(result['latency_ms']['p99'])
+        self.assertIsNotNone(result['loop_lag_ms']['p50'])
+
+    def test_without_subscribers(self):
+        result = asyncio.run(run_load_test(devices=2, rate=20, subscribers=0, duration=0.3, warmup=0.1, seed=1))
+        self.assertGreater(result['notifications'], 0)
+        self.assertGreater(result['delivery_ratio'], 0.5)
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            main(['--devices', '2', '--rate', '10', '--duration', '0.2', '--warmup', '0', '--output', path])
+            with open(path, encoding='utf-8') as report:
+                result = json.load(report)
+        self.assertEqual(result['devices'], 2)
+        self.assertIn('cpu_percent_per_device', result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# pylint: disable=protected-access
+import unittest
+import urllib.request
+
+from pycycling.cycling_power_service import CyclingPowerService
+from pycycling.metrics import MetricsRegistry, default_registry, generate_prometheus_text, start_http_server
+
+
+class _FakeClient:
+    address = 'AA:BB:CC:DD:EE:FF'
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.service = CyclingPowerService(_FakeClient())
+        self.handler = self.service._cycling_power_measurement_channel.notification_handler
+        default_registry.enable()
+
+    def tearDown(self):
+        default_registry.disable()
+        default_registry.reset()
+
+    def _metrics(self):
+        return {m.characteristic: m for m in default_registry.collect() if m.device == _FakeClient.address}
+
+    def test_counters(self):
+        self.handler(None, bytearray([0x00, 0x00, 0xD2, 0x04]))
+        self.service.set_cycling_power_measurement_handler(lambda measurement: None)
+        self.handler(None, bytearray([0x00, 0x00, 0xD2, 0x04]))
+        with self.assertRaises(IndexError):
+            self.handler(None, bytearray([0x01, 0x00, 0xD2, 0x04]))
+
+        metrics = self._metrics()['cycling_power_measurement']
+        self.assertEqual(metrics.service, 'CyclingPowerService')
+        self.assertEqual(metrics.notifications, 3)
+        self.assertEqual(metrics.bytes, 12)
+        self.assertEqual(metrics.dropped, 1)
+        self.assertEqual(metrics.parse_errors, 1)
+        self.assertIsNotNone(metrics.last_seen_ns)
+
+    def test_disabled_registry_collects_nothing(self):
+        default_registry.disable()
+        self.handler(None, bytearray([0x00, 0x00, 0xD2, 0x04]))
+        self.assertEqual(self._metrics()['cycling_power_measurement'].notifications, 0)
+
+    def test_prometheus_text(self):
+        self.handler(None, bytearray([0x00, 0x00, 0xD2, 0x04]))
+        text = generate_prometheus_text()
+        self.assertIn('# TYPE pycycling_notifications_total counter', text)
+        self.assertIn('pycycling_notifications_total{device="AA:BB:CC:DD:EE:FF",service="CyclingPowerService",'
+                      'characteristic="cycling_power_measurement"} 1', text)
+
+    def test_http_server(self):
+        server = start_http_server(0)
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+            with urllib.request.urlopen(url) as response:
+                self.assertIn(b'pycycling_last_seen_age_seconds', response.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_separate_registry(self):
+        registry = MetricsRegistry()
+        registry.register_channel(self.service._cycling_power_vector_channel)
+        registry.enable()
+        self.assertEqual([m.characteristic for m in registry.collect()], ['cycling_power_vector'])
+
+
+if __name__ == '__main__':
+    unittest.main()
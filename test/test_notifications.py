@@ -0,0 +1,179 @@
+# pylint: disable=protected-access
+import asyncio
+import unittest
+
+from pycycling.cycling_speed_cadence_service import CyclingSpeedCadenceService
+from pycycling.heart_rate_service import HeartRateService, HeartRateMeasurement, \
+    heart_rate_measurement_characteristic_id
+from pycycling.metrics import MetricsRegistry
+from pycycling.notifications import Batching, Dedupe, Metrics, Recording, ReceiveTimestamps, TimestampedRecord, \
+    router_for
+
+
+class _Client:
+    address = 'AA:BB'
+
+    def __init__(self):
+        self.handlers = {}
+
+    async def start_notify(self, char_specifier, callback, **kwargs):  # pylint: disable=unused-argument
+        self.handlers[char_specifier] = callback
+
+    async def stop_notify(self, char_specifier):
+        del self.handlers[char_specifier]
+
+
+class TestNotifyingService(unittest.TestCase):
+    def setUp(self):
+        self.records = []
+        self.service = HeartRateService(client=None)
+        self.service.set_hr_measurement_handler(self.records.append)
+        self.handler = self.service._hr_measurement_channel.notification_handler
+
+    def test_records_are_delivered_without_timestamps_by_default(self):
+        self.handler(None, bytearray([0x00, 0x2A]))
+        self.assertEqual(self.records, [HeartRateMeasurement(False, 42, [], None)])
+
+    def test_receive_timestamps(self):
+        self.service.enable_receive_timestamps()
+        self.handler(None, bytearray([0x00, 0x2A]))
+
+        self.assertEqual(len(self.records), 1)
+        record = self.records[0]
+        self.assertIsInstance(record, TimestampedRecord)
+        self.assertEqual(record.record.bpm, 42)
+        self.assertIsInstance(record.received_ns, int)
+
+    def test_latency_histograms(self):
+        self.assertEqual(self.service.get_latency_histograms(), {})
+        self.service.enable_latency_histograms()
+        self.handler(None, bytearray([0x00, 0x2A]))
+        self.handler(None, bytearray([0x00, 0x2B]))
+
+        histograms = self.service.get_latency_histograms()
+        self.assertEqual(list(histograms), ['hr_measurement'])
+        self.assertEqual(histograms['hr_measurement'].count, 2)
+        self.assertEqual([record.bpm for record in self.records], [42, 43])
+
+        self.service.enable_latency_histograms(False)
+        self.assertEqual(self.service.get_latency_histograms(), {})
+
+    def test_subscribers_share_one_parsed_record(self):
+        parsed = []
+        channel = self.service._hr_measurement_channel
+        parser = channel.parser
+        channel.parser = lambda data: parsed.append(data) or parser(data)
+
+        dashboard = []
+        high = []
+        self.service.subscribe('hr_measurement', dashboard.append)
+        self.service.subscribe('hr_measurement', high.append, lambda measurement: measurement.bpm > 100)
+        self.handler(None, bytearray([0x00, 0x2A]))
+        self.handler(None, bytearray([0x00, 0x96]))
+
+        self.assertEqual(len(parsed), 2)
+        self.assertEqual([record.bpm for record in self.records], [42, 150])
+        self.assertIs(dashboard[0], self.records[0])
+        self.assertEqual([record.bpm for record in high], [150])
+
+    def test_unsubscribe(self):
+        extra = []
+        with self.service.subscribe('hr_measurement', extra.append):
+            self.handler(None, bytearray([0x00, 0x2A]))
+        self.handler(None, bytearray([0x00, 0x2B]))
+        self.service.set_hr_measurement_handler(None)
+        self.handler(None, bytearray([0x00, 0x2C]))
+
+        self.assertEqual([record.bpm for record in extra], [42])
+        self.assertEqual([record.bpm for record in self.records], [42, 43])
+        self.assertIsNone(self.service._hr_measurement_channel.callback)
+
+    def test_failing_subscriber_does_not_stop_others(self):
+        def failing(measurement):
+            raise RuntimeError(measurement)
+
+        self.service.subscribe('hr_measurement', failing)
+        with self.assertLogs('pycycling.notifications'):
+            self.handler(None, bytearray([0x00, 0x2A]))
+        self.assertEqual(len(self.records), 1)
+
+    def test_subscribe_unknown_characteristic(self):
+        self.assertEqual(self.service.characteristics, ['hr_measurement'])
+        with self.assertRaises(ValueError):
+            self.service.subscribe('cycling_power_measurement', print)
+
+
+class TestNotificationRouter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = _Client()
+        self.router = router_for(self.client)
+        self.heart_rate = HeartRateService(self.client)
+        self.speed_cadence = CyclingSpeedCadenceService(self.client)
+        self.records = []
+        self.heart_rate.set_hr_measurement_handler(self.records.append)
+
+    async def test_shared_by_services(self):
+        self.assertIs(self.speed_cadence.router, self.router)
+        self.assertIsNot(router_for(_Client()), self.router)
+        self.assertEqual(len(self.router.channels), 2)
+
+        await self.heart_rate.enable_hr_measurement_notifications()
+        handler = self.client.handlers[heart_rate_measurement_characteristic_id]
+        self.assertEqual(self.router.routes, {heart_rate_measurement_characteristic_id: handler})
+        handler(None, bytearray([0x00, 0x2A]))
+        self.assertEqual([record.bpm for record in self.records], [42])
+        await self.heart_rate.disable_hr_measurement_notifications()
+        self.assertEqual(self.router.routes, {})
+
+    def test_middleware(self):
+        recording = []
+        registry = MetricsRegistry()
+        dedupe = Dedupe()
+        self.router.add_middleware(dedupe)
+        self.router.add_middleware(Recording(recording.append))
+        self.router.add_middleware(Metrics(registry))
+        self.router.add_middleware(ReceiveTimestamps())
+        channel = self.heart_rate._hr_measurement_channel
+        for bpm, received_ns in [(42, 10), (42, 20), (43, 30)]:
+            channel.deliver(bytearray([0x00, bpm]), received_ns)
+
+        self.assertEqual(self.records, [TimestampedRecord(HeartRateMeasurement(False, 42, [], None), 10),
+                                        TimestampedRecord(HeartRateMeasurement(False, 43, [], None), 30)])
+        self.assertEqual(dedupe.dropped, 1)
+        self.assertEqual([(notification.characteristic, notification.received_ns) for notification in recording],
+                         [('hr_measurement', 10), ('hr_measurement', 20), ('hr_measurement', 30)])
+        [metrics] = [m for m in registry.collect() if m.characteristic == 'hr_measurement']
+        self.assertEqual(metrics.notifications, 3)
+        # Applies to every service of the client
+        self.assertEqual(len(self.speed_cadence._csc_measurement_channel.middleware), 4)
+
+        for middleware in self.router.middleware:
+            self.router.remove_middleware(middleware)
+        self.assertFalse(channel._instrumented)
+
+    def test_metrics_count_dropped_payloads_without_hiding_them(self):
+        recording = []
+        registry = MetricsRegistry()
+        self.router.add_middleware(Recording(recording.append))
+        channel = self.speed_cadence._csc_measurement_channel
+        channel.set_metrics(registry.metrics_for(channel))
+        channel.deliver(bytearray([0x02, 0x01, 0x00, 0x00, 0x04]), 10)
+
+        self.assertEqual([(notification.characteristic, notification.received_ns) for notification in recording],
+                         [('csc_measurement', 10)])
+        metrics = registry.metrics_for(channel)
+        self.assertEqual(metrics.notifications, 1)
+        self.assertEqual(metrics.dropped, 1)
+
+    async def test_batching(self):
+        self.router.add_middleware(Batching())
+        handler = self.heart_rate._hr_measurement_channel.notification_handler
+        handler(None, bytearray([0x00, 0x2A]))
+        handler(None, bytearray([0x00, 0x2B]))
+        self.assertEqual(self.records, [])
+        await asyncio.sleep(0)
+        self.assertEqual([record.bpm for record in self.records], [42, 43])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# pylint: disable=protected-access
+import time
+import unittest
+
+from pycycling import profiling
+from pycycling.heart_rate_service import HeartRateService
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.service = HeartRateService(client=None)
+        self.handler = self.service._hr_measurement_channel.notification_handler
+
+    def test_slow_callback_detector(self):
+        reports = []
+        detector = profiling.SlowCallbackDetector(budget=0.01, on_slow=reports.append, sample_interval=0.002)
+
+        def slow_consumer(measurement):  # pylint: disable=unused-argument
+            time.sleep(0.05)
+
+        profiling.install_hook(detector)
+        try:
+            self.service.set_hr_measurement_handler(lambda measurement: None)
+            self.handler(None, bytearray([0x00, 0x2A]))
+            self.service.set_hr_measurement_handler(slow_consumer)
+            self.handler(None, bytearray([0x00, 0x2A]))
+        finally:
+            profiling.remove_hook(detector)
+
+        self.assertEqual(detector.slow_callbacks, 1)
+        self.assertEqual(len(reports), 1)
+        report = reports[0]
+        self.assertEqual(report.characteristic, 'hr_measurement')
+        self.assertEqual(report.service, 'HeartRateService')
+        self.assertIn('slow_consumer', report.callback)
+        self.assertGreaterEqual(report.callback_ns, 50_000_000)
+        self.assertTrue(report.stack_samples)
+        self.assertIn('slow_consumer', [frame.name for frame in report.stack_samples[0]])
+
+    def test_hooks_are_removed(self):
+        detector = profiling.SlowCallbackDetector()
+        profiling.install_hook(detector)
+        profiling.remove_hook(detector)
+        self.assertFalse(self.service._hr_measurement_channel._instrumented)
+
+    def test_callback_profiler(self):
+        results = []
+
+        def consumer(measurement):  # pylint: disable=unused-argument
+            sum(range(1000))
+
+        profiler = profiling.CallbackProfiler(duration=0, on_complete=results.append)
+        profiling.install_hook(profiler)
+        self.service.set_hr_measurement_handler(consumer)
+        self.handler(None, bytearray([0x00, 0x2A]))
+
+        self.assertEqual(profiling.get_profiling_hooks(), ())
+        self.assertEqual(len(results), 1)
+        stats = results[0]
+        self.assertIn('consumer', [function for (_, _, function) in stats.stats])
+
+    def test_callback_profiler_without_notifications(self):
+        results = []
+        profiler = profiling.CallbackProfiler(on_complete=results.append)
+        profiling.install_hook(profiler)
+        profiler.stop()
+
+        self.assertEqual(profiling.get_profiling_hooks(), ())
+        self.assertIsNone(profiler.results)
+        self.assertEqual(results, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,13 @@
+# pylint: disable=protected-access
+import asyncio
 import unittest
 
-from pycycling.rear_view_radar import _parse_radar_measurement, RadarMeasurement
+from pycycling.rear_view_radar import _parse_radar_measurement, RadarFrameAssembler, RadarMeasurement, \
+    RadarThreatTracker, RearViewRadarService, ThreatEventType
+
+
+def _packet(identifier, threat_ids):
+    return bytearray([identifier] + [value for threat_id in threat_ids for value in (threat_id, 50, 30)])
 
 
 class TestRearViewRadar(unittest.TestCase):
@@ -27,5 +34,117 @@ class TestRearViewRadar(unittest.TestCase):
                 ]
             )
 
+    def test__parse_radar_measurement_incomplete(self):
+        self.assertIsNone(_parse_radar_measurement(bytearray(b'\x12\x83\x03')))
+        self.assertEqual(_parse_radar_measurement(bytearray(b'\x12')), [])
+
+
+class TestRadarThreatTracker(unittest.TestCase):
+    def test_change_only_events(self):
+        tracker = RadarThreatTracker(smoothing=1)
+        second = 1_000_000_000
+
+        events = tracker.update([RadarMeasurement(threat_id=1, speed=36, distance=100)], 0)
+        self.assertEqual(len(events), 1)
+        appeared = events[0]
+        self.assertEqual(appeared.event, ThreatEventType.appeared)
+        self.assertEqual(appeared.closing_speed, 36)
+        self.assertAlmostEqual(appeared.time_to_reach, 10)
+
+        self.assertEqual(tracker.update([RadarMeasurement(threat_id=1, speed=36, distance=100)], second // 2), [])
+
+        # 20 m closer after 1 s is 72 km/h
+        events = tracker.update([RadarMeasurement(threat_id=1, speed=36, distance=80),
+                                 RadarMeasurement(threat_id=2, speed=20, distance=150)], second)
+        self.assertEqual(len(events), 2)
+        updated, second_appeared = events[0], events[1]
+        self.assertEqual(updated.event, ThreatEventType.updated)
+        self.assertAlmostEqual(updated.closing_speed, 72)
+        self.assertAlmostEqual(updated.time_to_reach, 4)
+        self.assertEqual(second_appeared.event, ThreatEventType.appeared)
+
+        events = tracker.update([RadarMeasurement(threat_id=2, speed=20, distance=150)], 2 * second)
+        self.assertEqual([(event.event, event.threat_id) for event in events],
+                         [(ThreatEventType.disappeared, 1)])
+        self.assertEqual(tracker.threat_ids, [2])
+
+
+class TestRadarFrameAssembler(unittest.TestCase):
+    def test_frames(self):
+        now = [0]
+        assembler = RadarFrameAssembler(timeout=0.5, clock=lambda: now[0])
+
+        # A packet with room to spare is a whole frame
+        [frame] = assembler.add(_packet(1, [1, 2]))
+        self.assertEqual([m.threat_id for m in frame], [1, 2])
+
+        # A full packet is held until the rest of the scan arrives
+        self.assertEqual(assembler.add(_packet(2, range(1, 7))), [])
+        [frame] = assembler.add(_packet(2, [7]))
+        self.assertEqual([m.threat_id for m in frame], list(range(1, 8)))
+
+        # ...or the next scan starts
+        self.assertEqual(assembler.add(_packet(3, range(1, 7))), [])
+        [frame] = assembler.add(_packet(4, range(1, 7)))
+        self.assertEqual(len(frame), 6)
+        self.assertTrue(assembler.pending)
+
+        now[0] = 600_000_000
+        self.assertEqual(len(assembler.expire()), 6)
+        self.assertFalse(assembler.pending)
+        self.assertEqual((assembler.frames, assembler.timed_out_frames), (4, 1))
+
+    def test_full_frame_followed_by_short_frame(self):
+        assembler = RadarFrameAssembler(clock=lambda: 0)
+        self.assertEqual(assembler.add(_packet(1, range(1, 7))), [])
+        frames = assembler.add(_packet(2, [7, 8]))
+        self.assertEqual([[m.threat_id for m in frame] for frame in frames], [list(range(1, 7)), [7, 8]])
+        self.assertEqual(assembler.frames, 2)
+
+    def test_repeated_threat_starts_new_frame(self):
+        assembler = RadarFrameAssembler(clock=lambda: 0)
+        self.assertEqual(assembler.add(_packet(1, range(1, 7))), [])
+        [frame] = assembler.add(_packet(1, range(1, 7)))
+        self.assertEqual([m.threat_id for m in frame], list(range(1, 7)))
+
+
+class _FakeClient:
+    address = 'radar'
+
+
+class TestRearViewRadarService(unittest.TestCase):
+    def test_incomplete_frame_times_out(self):
+        service = RearViewRadarService(_FakeClient())
+        service.set_frame_reassembly(timeout=0.01)
+        frames = []
+        service.set_radar_measurement_handler(frames.append)
+
+        async def run():
+            channel = service._radar_measurement_channel
+            channel.deliver(_packet(1, range(1, 7)))
+            self.assertEqual(frames, [])
+            await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+        self.assertEqual([[m.threat_id for m in frame] for frame in frames], [list(range(1, 7))])
+
+    def test_both_frames_are_delivered(self):
+        service = RearViewRadarService(_FakeClient())
+        service.set_frame_reassembly()
+        frames = []
+        service.set_radar_measurement_handler(frames.append)
+        service._radar_measurement_channel.deliver(_packet(1, range(1, 7)))
+        service._radar_measurement_channel.deliver(_packet(2, [7, 8]))
+        self.assertEqual([[m.threat_id for m in frame] for frame in frames], [list(range(1, 7)), [7, 8]])
+
+    def test_reassembly_disabled_by_default(self):
+        service = RearViewRadarService(_FakeClient())
+        self.assertIsNone(service.frame_assembler)
+        frames = []
+        service.set_radar_measurement_handler(frames.append)
+        service._radar_measurement_channel.deliver(_packet(1, range(1, 7)))
+        self.assertEqual(len(frames), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
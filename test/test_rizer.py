@@ -0,0 +1,86 @@
+# pylint: disable=protected-access
+import asyncio
+import unittest
+
+from pycycling.rizer import AdaptiveRateController, Rizer
+
+_MS = 1_000_000
+
+
+class TestAdaptiveRateController(unittest.TestCase):
+    def test_steps_down_and_up_with_hysteresis(self):
+        controller = AdaptiveRateController(down_after=2, up_after=3)
+        self.assertEqual(controller.rate, 2)
+
+        self.assertIsNone(controller.update(latency_ns=30 * _MS))
+        self.assertEqual(controller.update(latency_ns=30 * _MS), 1)
+
+        # Between the thresholds nothing changes, and the headroom count starts again
+        self.assertIsNone(controller.update(latency_ns=1 * _MS))
+        self.assertIsNone(controller.update(latency_ns=10 * _MS))
+        self.assertIsNone(controller.update(latency_ns=1 * _MS))
+        self.assertIsNone(controller.update(latency_ns=1 * _MS))
+        self.assertEqual(controller.update(latency_ns=1 * _MS), 2)
+        self.assertIsNone(controller.update(latency_ns=1 * _MS))
+
+    def test_queue_depth_and_loop_lag(self):
+        controller = AdaptiveRateController(down_after=1)
+        self.assertEqual(controller.update(queue_depth=20), 1)
+        self.assertEqual(controller.update(loop_lag_ns=100 * _MS), 0)
+        self.assertIsNone(controller.update(loop_lag_ns=100 * _MS))
+
+    def test_idle(self):
+        controller = AdaptiveRateController(up_after=1)
+        self.assertEqual(controller.update(active=False), 0)
+        self.assertIsNone(controller.update(active=False))
+        self.assertEqual(controller.update(active=True), 2)
+
+
+class _FakeClient:
+    address = 'rizer'
+
+    def __init__(self, failures=0):
+        self.writes = []
+        self.failures = failures
+
+    async def write_gatt_char(self, uuid, data):  # pylint: disable=unused-argument
+        if self.failures:
+            self.failures -= 1
+            raise OSError('write failed')
+        self.writes.append(bytes(data))
+
+
+class TestRizerAdaptiveRate(unittest.TestCase):
+    def test_task_sets_rate(self):
+        client = _FakeClient()
+        rizer = Rizer(client)
+
+        async def run():
+            rizer.start_adaptive_transmission_rate(AdaptiveRateController(down_after=1), interval=0.01,
+                                                   queue_depth=lambda: 100)
+            await asyncio.sleep(0.05)
+            rizer.stop_adaptive_transmission_rate()
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(client.writes[:3], [b'\x02\x02', b'\x02\x01', b'\x02\x00'])
+        self.assertIsNone(rizer._steering_measurement_channel.latency_histogram)
+
+    def test_task_retries_failed_writes(self):
+        client = _FakeClient(failures=1)
+        rizer = Rizer(client)
+
+        async def run():
+            rizer.start_adaptive_transmission_rate(AdaptiveRateController(down_after=1), interval=0.01,
+                                                   queue_depth=lambda: 0)
+            await asyncio.sleep(0.03)
+            rizer.stop_adaptive_transmission_rate()
+            await asyncio.sleep(0)
+
+        with self.assertLogs('pycycling.rizer', 'WARNING'):
+            asyncio.run(run())
+        self.assertEqual(client.writes, [b'\x02\x02'])
+
+
+if __name__ == '__main__':
+    unittest.main()
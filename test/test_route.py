@@ -0,0 +1,151 @@
+# pylint: disable=protected-access
+import asyncio
+import io
+import unittest
+
+from pycycling.fitness_machine_service import FitnessMachineService
+from pycycling.ftms_parsers import IndoorBikeData
+from pycycling.route import GradeSegment, RouteProfile, SurfaceSegment, parse_gpx
+from pycycling.tacx_trainer_control import GeneralFEData, RoadSurface, TacxTrainerControl
+
+# Points 0.001 degrees of latitude, about 111.2 m, apart
+_METRES_PER_POINT = 111.195
+
+
+def _gpx(elevations, surfaces=None):
+    points = []
+    for index, elevation in enumerate(elevations):
+        surface = surfaces[index] if surfaces else None
+        extensions = f'<extensions><surface>{surface}</surface></extensions>' if surface else ''
+        points.append(f'<trkpt lat="{45 + index * 0.001:.3f}" lon="6.0"><ele>{elevation}</ele>{extensions}</trkpt>')
+    return io.StringIO('<?xml version="1.0"?><gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+                       f'<trk><trkseg>{"".join(points)}</trkseg></trk></gpx>')
+
+
+class _Client:
+    address = 'AA:BB'
+
+    def __init__(self):
+        self.writes = []
+
+    async def write_gatt_char(self, char_specifier, data, response=None):  # pylint: disable=unused-argument
+        self.writes.append(bytes(data))
+
+
+class _FailingClient(_Client):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    async def write_gatt_char(self, char_specifier, data, response=None):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('not connected')
+        await super().write_gatt_char(char_specifier, data, response)
+
+
+class TestRouteProfile(unittest.TestCase):
+    def setUp(self):
+        # 1 km flat, 1 km at 5%, 1 km flat
+        elevations = [100.0] * 10 + [100.0 + _METRES_PER_POINT * 0.05 * step for step in range(1, 10)] + \
+            [100.0 + _METRES_PER_POINT * 0.45] * 10
+        surfaces = ['asphalt'] * 25 + ['sett'] * 4
+        self.route = RouteProfile.from_gpx(_gpx(elevations, surfaces), smoothing=10)
+
+    def test_parse_gpx(self):
+        points = parse_gpx(_gpx([1.5, 2.5], ['gravel', 'ice']))
+        self.assertEqual(len(points), 2)
+        self.assertEqual(points[0].elevation, 1.5)
+        self.assertEqual([point.surface for point in points], [RoadSurface.GRAVEL, RoadSurface.ICE])
+
+    def test_segments(self):
+        self.assertAlmostEqual(self.route.length, 28 * _METRES_PER_POINT, delta=1)
+        self.assertAlmostEqual(self.route.climbing, _METRES_PER_POINT * 0.45, delta=0.1)
+        # Samples straddling the ends of the climb give short transition segments
+        self.assertEqual([segment.grade for segment in self.route.segments], [0.0, 4.5, 5.0, 1.0, 0.0])
+        self.assertAlmostEqual(self.route.segments[1].start, 9 * _METRES_PER_POINT, delta=10)
+        self.assertEqual(self.route.surfaces, [SurfaceSegment(0.0, RoadSurface.SIMULATION_OFF),
+                                               SurfaceSegment(self.route.surfaces[1].start,
+                                                              RoadSurface.COBBLESTONES_HARD)])
+        self.assertEqual(self.route.grade_at(1500), 5.0)
+        self.assertEqual(self.route.grade_at(-10), 0.0)
+        self.assertEqual(self.route.surface_at(self.route.length), RoadSurface.COBBLESTONES_HARD)
+
+    def test_smoothing(self):
+        # A single noisy point is spread over the smoothing window and mostly rounded away
+        route = RouteProfile.from_gpx(_gpx([100, 100, 100, 101, 100, 100, 100]), smoothing=300, grade_step=1.0)
+        self.assertEqual(route.segments, [GradeSegment(0.0, 0.0)])
+
+    def test_cursor(self):
+        cursor = self.route.cursor()
+        for distance in range(0, int(self.route.length), 7):
+            grade, surface = cursor.move(distance)
+            self.assertEqual(grade.grade, self.route.grade_at(distance))
+            self.assertEqual(surface.surface, self.route.surface_at(distance))
+        self.assertEqual(cursor.move(1500)[0].grade, 5.0)
+
+
+class TestRouteFollower(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        elevations = [0.0] * 5 + [_METRES_PER_POINT * 0.02 * step for step in range(1, 6)]
+        self.route = RouteProfile.from_gpx(_gpx(elevations, ['asphalt'] * 7 + ['gravel'] * 3), smoothing=10)
+
+    async def test_fitness_machine_service(self):
+        client = _Client()
+        trainer = FitnessMachineService(client)
+        # Road surfaces are only sent to Tacx trainers
+        follower = self.route_follower(trainer, road_feel_intensity=30)
+        for distance in range(1000, 2200, 10):
+            data = IndoorBikeData(*[None] * 15)._replace(instant_speed=30.0, total_distance=distance)
+            trainer._indoor_bike_data_channel.publish(data)
+            await asyncio.sleep(0)
+        follower.stop()
+        # One write per segment, each grade as int16 0.01% with 0.004 crr and 0.51 kg/m cw
+        self.assertEqual(client.writes, [bytes([0x11, 0, 0]) + int(segment.grade * 100).to_bytes(2, 'little')
+                                         + bytes([40, 51]) for segment in self.route.segments])
+        self.assertEqual(self.route.segments[-1].grade, 2.0)
+        self.assertTrue(follower.finished)
+
+    async def test_tacx_trainer_control(self):
+        client = _Client()
+        trainer = TacxTrainerControl(client)
+        # Timestamped at the reported speed, as the distance is unwrapped using its rate
+        trainer.enable_receive_timestamps()
+        follower = self.route_follower(trainer, road_feel_intensity=30)
+        for distance in range(0, 1200, 10):
+            data = GeneralFEData(equipment_type=None, elapsed_time=0, distance_travelled=distance % 256, speed=8.0,
+                                 heart_rate=None, fe_state=None, lap_toggle=False)
+            trainer._general_fe_data_page_channel.publish(data, int(distance / 8.0 * 1e9))
+            await asyncio.sleep(0)
+        follower.stop()
+        self.assertAlmostEqual(follower.distance, 1190)
+        track_resistance = [write for write in client.writes if write[4] == 0x33]
+        self.assertEqual([write[9:11] for write in track_resistance],
+                         [int((segment.grade + 200) / 0.01).to_bytes(2, 'little') for segment in self.route.segments])
+        neo_modes = [write for write in client.writes if write[4] == 0xFC]
+        self.assertEqual([write[9] for write in neo_modes],
+                         [RoadSurface.SIMULATION_OFF.value, RoadSurface.GRAVEL.value])
+
+    async def test_failed_grade_is_resent(self):
+        client = _FailingClient(failures=1)
+        trainer = FitnessMachineService(client)
+        follower = self.route_follower(trainer)
+        data = IndoorBikeData(*[None] * 15)._replace(instant_speed=30.0, total_distance=0)
+        with self.assertLogs('pycycling.route', 'WARNING'):
+            trainer._indoor_bike_data_channel.publish(data)
+            await asyncio.sleep(0)
+        trainer._indoor_bike_data_channel.publish(data._replace(total_distance=10))
+        await asyncio.sleep(0)
+        follower.stop()
+        self.assertEqual(len(client.writes), 1)
+        self.assertEqual(follower.commands_sent, 1)
+
+    def route_follower(self, trainer, **kwargs):
+        from pycycling.route import RouteFollower  # pylint: disable=import-outside-toplevel
+        follower = RouteFollower(self.route, trainer, **kwargs)
+        follower.start()
+        return follower
+
+
+if __name__ == '__main__':
+    unittest.main()
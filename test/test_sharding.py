@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from pycycling.sharding import DeviceSpec, ShardedRunner, _Worker, load_manifest, shard_manifest, simulated_client
+
+
+def _manifest(count):
+    services = ['fitness_machine', 'cycling_power', 'heart_rate', 'cycling_speed_cadence']
+    return [DeviceSpec(f'device-{index}', f'sim-{index}', services[index % len(services)])
+            for index in range(count)]
+
+
+def _fast_simulated_client(spec, disconnected_callback):
+    client = simulated_client(spec, disconnected_callback)
+    client.rate = 20.0
+    return client
+
+
+class TestSharding(unittest.TestCase):
+    def test_shard_manifest(self):
+        shards = shard_manifest(_manifest(5), 2)
+        self.assertEqual([[spec.name for spec in shard] for shard in shards],
+                         [['device-0', 'device-2', 'device-4'], ['device-1', 'device-3']])
+
+    def test_load_manifest(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'manifest.json')
+            with open(path, 'w', encoding='utf-8') as manifest:
+                json.dump([{'name': 'hr-1', 'address': 'AA', 'service': 'heart_rate'},
+                           {'name': 'power-1', 'address': 'BB', 'service': 'cycling_power',
+                            'characteristics': ['cycling_power_measurement']}], manifest)
+            self.assertEqual(load_manifest(path), [
+                DeviceSpec('hr-1', 'AA', 'heart_rate'),
+                DeviceSpec('power-1', 'BB', 'cycling_power', ['cycling_power_measurement']),
+            ])
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            ShardedRunner([DeviceSpec('a', 'AA', 'toaster')])
+        with self.assertRaises(ValueError):
+            ShardedRunner([DeviceSpec('a', 'AA', 'heart_rate', ['indoor_bike_data'])])
+        with self.assertRaises(ValueError):
+            ShardedRunner([DeviceSpec('a', 'AA', 'heart_rate'), DeviceSpec('a', 'BB', 'heart_rate')])
+
+    def test_records_aggregated_and_worker_restarted(self):
+        received = {}
+
+        def on_record(topic, received_ns, record):
+            received.setdefault(topic.device, []).append((topic.characteristic, received_ns, record))
+
+        runner = ShardedRunner(_manifest(4), workers=2, on_record=on_record, client_factory=_fast_simulated_client,
+                               flush_interval=0.02, restart_backoff=0.1)
+        with runner:
+            runner.run(1.0)
+            self.assertEqual(sorted(received), ['device-0', 'device-1', 'device-2', 'device-3'])
+            self.assertEqual(received['device-2'][0][0], 'hr_measurement')
+            self.assertTrue(all(status.alive for status in runner.workers))
+
+            os.kill(runner.workers[0].pid, 9)
+            received.clear()
+            deadline = time.monotonic() + 5
+            while 'device-0' not in received and time.monotonic() < deadline:
+                runner.poll(0.1)
+            self.assertIn('device-0', received)
+            self.assertEqual(runner.workers[0].restarts, 1)
+            self.assertEqual(runner.workers[1].restarts, 0)
+        self.assertFalse(any(status.alive for status in runner.workers))
+
+    def test_failed_enable_restored_on_reconnection(self):
+        clients = []
+        frames = []
+
+        class _Connection:
+            send_bytes = frames.append
+
+        def flaky_client(spec, disconnected_callback):
+            client = _fast_simulated_client(spec, disconnected_callback)
+            start_notify = client.start_notify
+            failures = [OSError('Notify failed')]
+
+            async def flaky_start_notify(*args, **kwargs):
+                if failures:
+                    raise failures.pop()
+                await start_notify(*args, **kwargs)
+
+            client.start_notify = flaky_start_notify
+            clients.append(client)
+            return client
+
+        stop_event = threading.Event()
+        worker = _Worker([DeviceSpec('hr-1', 'sim-hr', 'heart_rate')], _Connection(), stop_event, flaky_client, 0.01)
+
+        async def run():
+            task = asyncio.get_running_loop().create_task(worker.run())
+            with self.assertLogs('pycycling.sharding', 'WARNING'):
+                while not clients or not clients[0].is_connected:
+                    await asyncio.sleep(0.01)
+                await asyncio.sleep(0.05)
+            self.assertEqual(clients[0].notifications_sent, 0)
+            clients[0].drop()
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if clients[0].notifications_sent:
+                    break
+            stop_event.set()
+            await task
+
+        asyncio.run(run())
+        self.assertGreater(clients[0].notifications_sent, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
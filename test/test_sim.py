@@ -0,0 +1,123 @@
+import asyncio
+import random
+import unittest
+
+from pycycling.cycling_power_service import CyclingPowerService, _parse_cycling_power_measurement, \
+    cycling_power_measurement_tx_id
+from pycycling.cycling_speed_cadence_service import CyclingSpeedCadenceService
+from pycycling.fitness_machine_service import FitnessMachineService, \
+    ftms_fitness_machine_control_point_characteristic_id
+from pycycling.ftms_parsers import FitnessMachineStatus, FTMSControlPointOpCode, FTMSControlPointResponseResultCode
+from pycycling.heart_rate_service import HeartRateService
+from pycycling.sim import Rider, SimulatedHeartRateMonitor, SimulatedPowerMeter, SimulatedSpeedCadenceSensor, \
+    SimulatedTrainer, steady_state_speed
+
+
+class TestSimulatedTrainer(unittest.TestCase):
+    def test_control_point(self):
+        rider = Rider(power=150, variability=0, rng=random.Random(1))
+        client = SimulatedTrainer('trainer', rider, rate=100)
+        trainer = FitnessMachineService(client)
+        responses = []
+        statuses = []
+        data = []
+        trainer.set_control_point_response_handler(responses.append)
+        trainer.set_fitness_machine_status_handler(statuses.append)
+        trainer.set_indoor_bike_data_handler(data.append)
+
+        async def run():
+            async with client:
+                await trainer.enable_control_point_indicate()
+                await trainer.enable_fitness_machine_status_notify()
+                await trainer.enable_indoor_bike_data_notify()
+                await trainer.set_target_power(250)
+                await trainer.request_control()
+                await trainer.set_target_power(250)
+                features = await trainer.get_all_features()
+                for _ in range(20):
+                    client.advance(0.5)
+                await asyncio.sleep(0.05)
+                return features
+
+        features = asyncio.run(run())
+        self.assertEqual([(response.request_code_enum, response.result_code_enum) for response in responses], [
+            (FTMSControlPointOpCode.SET_TARGET_POWER, FTMSControlPointResponseResultCode.CONTROL_NOT_PERMITTED),
+            (FTMSControlPointOpCode.REQUEST_CONTROL, FTMSControlPointResponseResultCode.SUCCESS),
+            (FTMSControlPointOpCode.SET_TARGET_POWER, FTMSControlPointResponseResultCode.SUCCESS),
+        ])
+        self.assertEqual([(status.status, status.value) for status in statuses],
+                         [(FitnessMachineStatus.NEW_POWER, 250)])
+        self.assertTrue(features[1].power_target_setting_supported)
+        self.assertGreater(len(data), 20)
+        self.assertEqual(data[-1].instant_power, 249)
+        self.assertGreater(data[-1].instant_speed, 0)
+        self.assertGreater(data[-1].total_distance, 0)
+
+    def test_simulation_parameters_slow_the_rider(self):
+        rider = Rider(power=200, variability=0, rng=random.Random(1))
+        flat = SimulatedTrainer('flat', rider)
+        climb = SimulatedTrainer('climb', rider)
+
+        async def configure():
+            await climb.connect()
+            await climb.write_gatt_char(ftms_fitness_machine_control_point_characteristic_id, bytes([0x00]))
+            # 0 wind, 8% grade, crr 0.004, cw 0.51
+            await climb.write_gatt_char(ftms_fitness_machine_control_point_characteristic_id,
+                                        bytes([0x11, 0, 0, 0x20, 0x03, 40, 51]))
+
+        asyncio.run(configure())
+        for _ in range(600):
+            flat.advance(0.5)
+            climb.advance(0.5)
+        self.assertAlmostEqual(flat.speed, steady_state_speed(200, rider.mass), places=1)
+        self.assertLess(climb.speed, flat.speed / 2)
+
+
+class TestSimulatedSensors(unittest.TestCase):
+    def test_sensors(self):
+        rider = Rider(power=200, cadence=90, variability=0, rng=random.Random(1))
+        power_client = SimulatedPowerMeter('power', rider, rate=50)
+        hr_client = SimulatedHeartRateMonitor('hr', rider, rate=50)
+        csc_client = SimulatedSpeedCadenceSensor('csc', rider, rate=50)
+        power, hr, csc = [], [], []
+
+        async def run():
+            for client in (power_client, hr_client, csc_client):
+                await client.connect()
+            power_meter = CyclingPowerService(power_client)
+            power_meter.set_cycling_power_measurement_handler(power.append)
+            await power_meter.enable_cycling_power_measurement_notifications()
+            heart_rate = HeartRateService(hr_client)
+            heart_rate.set_hr_measurement_handler(hr.append)
+            await heart_rate.enable_hr_measurement_notifications()
+            speed_cadence = CyclingSpeedCadenceService(csc_client)
+            speed_cadence.set_csc_measurement_handler(csc.append)
+            await speed_cadence.enable_csc_measurement_notifications()
+            await asyncio.sleep(0.2)
+            self.assertTrue((await speed_cadence.get_csc_feature()).crank_rev_supported)
+            for client in (power_client, hr_client, csc_client):
+                await client.disconnect()
+
+        asyncio.run(run())
+        self.assertGreater(len(power), 3)
+        self.assertEqual(power[-1].instantaneous_power, 200)
+        self.assertIsNotNone(power[-1].cumulative_crank_revs)
+        self.assertEqual(hr[-1].bpm, 60)
+        self.assertTrue(hr[-1].sensor_contact)
+        self.assertGreater(len(csc), 3)
+        self.assertIsNotNone(csc[-1].last_wheel_event_time)
+
+    def test_revolution_data(self):
+        rider = Rider(power=200, cadence=60, variability=0, rng=random.Random(1))
+        client = SimulatedPowerMeter('power', rider)
+        payloads = []
+        client.set_notification_handler(cycling_power_measurement_tx_id, lambda sender, data: payloads.append(data))
+        for _ in range(10):
+            client.advance(0.25)
+        measurement = _parse_cycling_power_measurement(payloads[-1])
+        self.assertEqual(measurement.cumulative_crank_revs, 2)
+        self.assertEqual(measurement.last_crank_event_time, 2048)
+
+
+if __name__ == '__main__':
+    unittest.main()
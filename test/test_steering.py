@@ -0,0 +1,65 @@
+# pylint: disable=protected-access
+import struct
+import unittest
+
+from pycycling.rizer import Rizer
+from pycycling.steering import Smoothing, SteeringConditioner
+
+_MS = 1_000_000
+
+
+class TestSteeringConditioner(unittest.TestCase):
+    def test_deadband(self):
+        conditioner = SteeringConditioner(deadband=1.0, clock=lambda: 0)
+        self.assertEqual(conditioner(0.5), 0.0)
+        self.assertEqual(conditioner(-0.9), 0.0)
+        self.assertEqual(conditioner(3.0), 3.0)
+
+    def test_exponential_smoothing(self):
+        conditioner = SteeringConditioner(smoothing=Smoothing.exponential, alpha=0.5)
+        self.assertEqual(conditioner(10.0, 0), 10.0)
+        self.assertEqual(conditioner(20.0, 31 * _MS), 15.0)
+
+    def test_one_euro_smoothing(self):
+        conditioner = SteeringConditioner(smoothing=Smoothing.one_euro, min_cutoff=1.0, beta=0.0)
+        conditioner(0.0, 0)
+        value = conditioner(10.0, 31 * _MS)
+        self.assertGreater(value, 0.0)
+        self.assertLess(value, 10.0)
+
+    def test_outlier_rejection(self):
+        conditioner = SteeringConditioner(max_rate=200, max_rejections=1)
+        self.assertEqual(conditioner(0.0, 0), 0.0)
+        self.assertIsNone(conditioner(45.0, 31 * _MS))
+        self.assertEqual(conditioner(1.0, 62 * _MS), 1.0)
+        self.assertIsNone(conditioner(45.0, 93 * _MS))
+        # A sustained change is accepted after max_rejections
+        self.assertEqual(conditioner(45.0, 124 * _MS), 45.0)
+        self.assertEqual(conditioner.rejected, 2)
+
+    def test_decimation(self):
+        conditioner = SteeringConditioner(output_rate=10)
+        delivered = [conditioner(float(i), i * 31 * _MS) for i in range(10)]
+        self.assertEqual([value for value in delivered if value is not None], [0.0, 4.0, 7.0])
+
+
+class _FakeClient:
+    address = 'rizer'
+
+
+class TestRizerConditioning(unittest.TestCase):
+    def test_conditioner_on_service(self):
+        rizer = Rizer(_FakeClient())
+        angles = []
+        rizer.set_steering_measurement_callback(angles.append)
+        rizer.set_steering_conditioner(SteeringConditioner(deadband=2.0))
+        channel = rizer._steering_measurement_channel
+        channel.deliver(struct.pack('<f', 1.0))
+        channel.deliver(struct.pack('<f', 5.0))
+        rizer.set_steering_conditioner(None)
+        channel.deliver(struct.pack('<f', 1.0))
+        self.assertEqual(angles, [0.0, 5.0, 1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import random
+import unittest
+
+from pycycling.fitness_machine_service import FitnessMachineService
+from pycycling.supervisor import ConnectionState, ConnectionSupervisor
+
+
+class _FakeClient:
+    address = 'trainer'
+
+    def __init__(self, failed_connections=0):
+        self.is_connected = True
+        self.failed_connections = failed_connections
+        self.connections = 0
+        self.notifying = set()
+        self.writes = []
+        self.disconnected_callback = None
+
+    async def connect(self):
+        if self.failed_connections:
+            self.failed_connections -= 1
+            raise OSError('Device not found')
+        self.connections += 1
+        self.is_connected = True
+
+    def drop(self):
+        self.is_connected = False
+        self.notifying.clear()
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def start_notify(self, uuid, handler):  # pylint: disable=unused-argument
+        self.notifying.add(uuid)
+
+    async def stop_notify(self, uuid):
+        self.notifying.discard(uuid)
+
+    async def write_gatt_char(self, uuid, data, response=False):  # pylint: disable=unused-argument
+        self.writes.append(bytes(data))
+
+
+class TestConnectionSupervisor(unittest.TestCase):
+    def test_reconnect_and_restore(self):
+        client = _FakeClient(failed_connections=2)
+        states = []
+        supervisor = ConnectionSupervisor(client, initial_backoff=0.001, check_interval=10,
+                                          on_state_change=states.append, rng=random.Random(1))
+        client.disconnected_callback = supervisor.disconnected_callback
+        trainer = supervisor.supervise(FitnessMachineService(client))
+
+        async def run():
+            await trainer.enable_indoor_bike_data_notify()
+            await trainer.enable_training_status_notify()
+            await trainer.disable_training_status_notify()
+            await trainer.enable_control_point_indicate()
+            await trainer.request_control()
+            await trainer.set_target_resistance_level(10)
+            await trainer.set_target_power(200)
+            supervisor.start()
+            await asyncio.sleep(0)
+            notifying = set(client.notifying)
+            client.writes.clear()
+
+            client.drop()
+            for _ in range(100):
+                await asyncio.sleep(0.001)
+                if supervisor.state is ConnectionState.connected and client.writes:
+                    break
+            supervisor.stop()
+            return notifying
+
+        with self.assertLogs('pycycling.supervisor', 'WARNING') as logs:
+            notifying = asyncio.run(run())
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(client.notifying, notifying)
+        self.assertEqual(len(client.notifying), 2)
+        # Control is requested before the target, and the replaced resistance target is not restored
+        self.assertEqual(client.writes, [b'\x00', b'\x05\xc8\x00'])
+        self.assertEqual(supervisor.reconnections, 1)
+        self.assertEqual(client.connections, 1)
+        self.assertEqual(states[:4], [ConnectionState.connected, ConnectionState.reconnecting,
+                                      ConnectionState.restoring, ConnectionState.connected])
+
+    def test_restore_gives_up(self):
+        class _RejectingClient(_FakeClient):
+            async def write_gatt_char(self, uuid, data, response=False):  # pylint: disable=unused-argument
+                raise RuntimeError('Write rejected')
+
+        client = _RejectingClient()
+        states = []
+        supervisor = ConnectionSupervisor(client, initial_backoff=0.001, max_restore_attempts=3,
+                                          on_state_change=states.append)
+        trainer = supervisor.supervise(FitnessMachineService(client))
+
+        async def run():
+            try:
+                await trainer.set_target_power(200)
+            except RuntimeError:
+                pass
+            with self.assertRaises(RuntimeError):
+                await supervisor.reconnect()
+
+        with self.assertLogs('pycycling.supervisor', 'WARNING') as logs:
+            asyncio.run(run())
+        self.assertEqual(len(logs.output), 3)
+        self.assertIs(supervisor.state, ConnectionState.failed)
+        self.assertIsInstance(supervisor.last_error, RuntimeError)
+        self.assertEqual(states[-1], ConnectionState.failed)
+
+    def test_proxy_passes_through(self):
+        client = _FakeClient()
+        trainer = ConnectionSupervisor(client).supervise(FitnessMachineService(client))
+        self.assertIn('indoor_bike_data', trainer.characteristics)
+        self.assertIsInstance(trainer.service, FitnessMachineService)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from pycycling.tacx_trainer_control import CommandStatus, CommandStatusData, EquipmentType, FEState, GeneralFEData, \
+    SpecificTrainerData, TargetPowerLimit, _parse_command_status_data_page, _parse_general_fe_data_page, \
+    _parse_specific_trainer_data_page, encode_command_status_data_page, encode_fec_message, \
+    encode_general_fe_data_page, encode_specific_trainer_data_page, pack_general_fe_data_page_into
+
+
+class TestTacxTrainerControl(unittest.TestCase):
+    def test_encode_general_fe_data_page(self):
+        data = GeneralFEData(equipment_type=EquipmentType.trainer, elapsed_time=12.75, distance_travelled=200,
+                             speed=8.333, heart_rate=None, fe_state=FEState.in_use, lap_toggle=True)
+        encoded = encode_general_fe_data_page(data)
+        self.assertEqual(encoded, bytes([16, 25, 51, 200, 0x8D, 0x20, 0xFF, 0xB0]))
+        self.assertEqual(_parse_general_fe_data_page(encoded), data)
+
+        buffer = bytearray(10)
+        self.assertEqual(pack_general_fe_data_page_into(buffer, 2, data._replace(speed=None, heart_rate=140)), 8)
+        self.assertEqual(_parse_general_fe_data_page(buffer[2:]), data._replace(speed=None, heart_rate=140))
+
+    def test_encode_specific_trainer_data_page(self):
+        data = SpecificTrainerData(update_event_count=7, instantaneous_cadence=92, accumulated_power=65000,
+                                   instantaneous_power=2050, trainer_status=None,
+                                   target_power_limits=TargetPowerLimit.user_speed_too_low, fe_state=FEState.ready,
+                                   lap_toggle=False, power_calibration_required=False,
+                                   resistance_calibration_required=True, user_configuration_required=False)
+        self.assertEqual(_parse_specific_trainer_data_page(encode_specific_trainer_data_page(data)), data)
+
+        data = data._replace(instantaneous_cadence=None, instantaneous_power=None)
+        self.assertEqual(_parse_specific_trainer_data_page(encode_specific_trainer_data_page(data)), data)
+
+    def test_encode_command_status_data_page(self):
+        data = CommandStatusData(last_received_command=0x31, command_status=CommandStatus.success,
+                                 data=bytes([0xFF, 0xFF, 0x20, 0x03]))
+        encoded = encode_command_status_data_page(data, sequence_number=4)
+        self.assertEqual(encoded, bytes([71, 0x31, 4, 0, 0xFF, 0xFF, 0x20, 0x03]))
+        self.assertEqual(_parse_command_status_data_page(encoded), data)
+
+    def test_encode_fec_message(self):
+        page = bytes([16, 25, 0, 0, 0, 0, 0xFF, 0x20])
+        message = encode_fec_message(page)
+        self.assertEqual(message[:4], bytes([0xA4, 0x09, 0x4E, 0x05]))
+        self.assertEqual(message[4:12], page)
+        self.assertEqual(message[12], sum(message[1:12]) & 0xFF)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from pycycling.heart_rate_service import HeartRateMeasurement
+from pycycling.time_alignment import StreamAligner, Interpolation
+
+SECOND = 1_000_000_000
+
+
+class TestStreamAligner(unittest.TestCase):
+    def setUp(self):
+        self.rows = []
+        self.aligner = StreamAligner(rate=1, lookahead=2, max_lateness=0.5)
+        self.aligner.add_stream('power', {'instantaneous_power': Interpolation.LINEAR})
+        self.aligner.add_stream('hr', {'bpm': Interpolation.HOLD})
+        self.aligner.set_row_handler(self.rows.append)
+
+    def test_interpolate_and_hold(self):
+        self.aligner.push('power', int(0.5 * SECOND), 100)
+        self.aligner.push('hr', int(0.8 * SECOND), HeartRateMeasurement(True, 120, [], None))
+        self.aligner.push('power', int(1.5 * SECOND), 200)
+        self.aligner.push('hr', int(1.8 * SECOND), HeartRateMeasurement(True, 130, [], None))
+        self.aligner.push('power', int(2.5 * SECOND), 300)
+        self.aligner.push('hr', int(2.9 * SECOND), HeartRateMeasurement(True, 140, [], None))
+        self.aligner.push('power', int(3.5 * SECOND), 400)
+
+        # Ticks 1s and 2s have samples on both sides for both streams
+        self.assertEqual(len(self.rows), 2)
+        self.assertEqual(self.rows[0].timestamp, SECOND)
+        self.assertAlmostEqual(self.rows[0].power_instantaneous_power, 150)
+        self.assertEqual(self.rows[0].hr_bpm, 120)
+        self.assertAlmostEqual(self.rows[1].power_instantaneous_power, 250)
+        self.assertEqual(self.rows[1].hr_bpm, 130)
+
+    def test_out_of_order_samples_are_merged(self):
+        self.aligner.push('power', int(0.5 * SECOND), 100)
+        self.aligner.push('power', int(1.5 * SECOND), 200)
+        self.aligner.push('hr', int(1.2 * SECOND), 120)
+        self.aligner.flush()
+
+        self.assertEqual(self.aligner.late_samples, 0)
+        self.assertEqual(self.rows[0].hr_bpm, None)
+        self.assertAlmostEqual(self.rows[0].power_instantaneous_power, 150)
+
+    def test_late_samples_are_dropped(self):
+        self.aligner.push('power', 5 * SECOND, 100)
+        self.aligner.push('hr', 1 * SECOND, 120)
+        self.assertEqual(self.aligner.late_samples, 1)
+
+    def test_lookahead_holds_missing_streams(self):
+        self.aligner.push('hr', int(0.5 * SECOND), 120)
+        for i in range(1, 6):
+            self.aligner.push('power', i * SECOND, 100 * i)
+
+        # hr never reaches tick 1, so it is held once power is more than lookahead + max_lateness ahead
+        self.assertEqual([row.timestamp for row in self.rows], [SECOND, 2 * SECOND])
+        self.assertEqual([row.hr_bpm for row in self.rows], [120, 120])
+        self.assertEqual([row.power_instantaneous_power for row in self.rows], [100, 200])
+
+    def test_stale_values_are_dropped(self):
+        aligner = StreamAligner(rate=1, stale_after=1.2)
+        aligner.add_stream('hr', {'bpm': Interpolation.HOLD})
+        aligner.set_row_handler(self.rows.append)
+        aligner.push('hr', int(0.5 * SECOND), 120)
+        aligner.push('hr', int(3.5 * SECOND), 130)
+        aligner.flush()
+
+        self.assertEqual([row.hr_bpm for row in self.rows], [120, None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
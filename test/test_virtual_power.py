@@ -0,0 +1,94 @@
+import unittest
+
+from pycycling.cycling_speed_cadence_service import CSCMeasurement
+from pycycling.notifications import TimestampedRecord
+from pycycling.virtual_power import POWER_CURVES, PowerCurve, VirtualPowerMeter, session_power
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _measurements(speeds, wheel_circumference=2.0, interval=1.0):
+    """One measurement per `interval` seconds at each speed in km/h, with whole revolutions only"""
+    measurements = []
+    position = 0.0
+    elapsed = 0.0
+    for speed in speeds:
+        elapsed += interval
+        position += speed / 3.6 / wheel_circumference * interval
+        # Time of the last whole revolution
+        rate = speed / 3.6 / wheel_circumference
+        event = elapsed - (position % 1) / rate if rate else None
+        last_event = measurements[-1].last_wheel_event_time if measurements else 0
+        measurements.append(CSCMeasurement(
+            cumulative_wheel_revs=int(position),
+            last_wheel_event_time=int(round(event * 1024)) & 0xFFFF if event is not None else last_event,
+            cumulative_crank_revs=None,
+            last_crank_event_time=None,
+        ))
+    return measurements
+
+
+class TestPowerCurve(unittest.TestCase):
+    def test_from_polynomial(self):
+        curve = POWER_CURVES['kurt_kinetic_road_machine']
+        for speed in [0.0, 12.34, 30.0, 55.55, 99.9]:
+            mph = speed / 1.609344
+            self.assertAlmostEqual(curve.power(speed), 5.244820 * mph + 0.019168 * mph ** 3, delta=0.1)
+        self.assertEqual(curve.power(-5), 0)
+        # Extrapolated beyond the table
+        self.assertGreater(curve.power(120), curve.power(100))
+
+    def test_from_points(self):
+        curve = PowerCurve.from_points([(20, 100), (40, 300)], resolution=0.5, max_speed=60)
+        self.assertEqual(curve.power(10), 50)
+        self.assertEqual(curve.power(30), 200)
+        self.assertAlmostEqual(curve.power(50), 400)
+        self.assertAlmostEqual(curve.power(70), 600)
+        self.assertEqual(list(curve.powers([10, 30])), [50, 200])
+        with self.assertRaises(ValueError):
+            PowerCurve.from_points([])
+
+
+class TestVirtualPowerMeter(unittest.TestCase):
+    def test_update(self):
+        curve = PowerCurve.from_points([(36, 360)])
+        meter = VirtualPowerMeter(curve, wheel_circumference=2.0, stop_timeout=3.0)
+        measurements = _measurements([36.0] * 5, wheel_circumference=2.0)
+        self.assertIsNone(meter.update(TimestampedRecord(measurements[0], 0)))
+        for second, measurement in enumerate(measurements[1:], 1):
+            power = meter.update(measurement, timestamp_ns=second * 1_000_000_000)
+        self.assertAlmostEqual(meter.speed, 36.0, delta=0.1)
+        self.assertAlmostEqual(power, 360, delta=1)
+
+        # The wheel stops: no new revolutions
+        self.assertAlmostEqual(meter.update(measurements[-1], timestamp_ns=6_000_000_000), 360, delta=1)
+        self.assertEqual(meter.update(measurements[-1], timestamp_ns=8_000_000_000), 0)
+        self.assertEqual(meter.set_speed(18.0), 180)
+
+    def test_session_power(self):
+        curve = PowerCurve.from_points([(36, 360)])
+        measurements = _measurements([36.0] * 3 + [18.0] * 3, wheel_circumference=2.0)
+        powers = list(session_power(measurements, curve, wheel_circumference=2.0))
+        self.assertEqual(powers[0], 0)
+        for power, expected in zip(powers[1:], [360, 360, 180, 180, 180]):
+            self.assertAlmostEqual(power, expected, delta=25)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_session_power_matches_meter(self):
+        curve = POWER_CURVES['kurt_kinetic_cyclone']
+        measurements = _measurements([20.0, 25.0, 30.0, 35.0, 35.0, 40.0, 0.0, 0.0], interval=0.5)
+        # Crank-only measurements, e.g. from a combined sensor, carry no wheel revolution data
+        crank_only = CSCMeasurement(cumulative_wheel_revs=None, last_wheel_event_time=None,
+                                    cumulative_crank_revs=10, last_crank_event_time=1024)
+        measurements = [crank_only] + measurements[:4] + [crank_only] + measurements[4:]
+        meter = VirtualPowerMeter(curve, stop_timeout=float('inf'), clock=lambda: 0)
+        expected = [meter.update(measurement) or 0.0 for measurement in measurements]
+        numpy.testing.assert_allclose(session_power(measurements, curve), expected)
+        numpy.testing.assert_allclose(curve.powers([10.0, 50.0]), [curve.power(10.0), curve.power(50.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+
+from pycycling.fitness_machine_service import FitnessMachineService
+from pycycling.supervisor import ConnectionSupervisor
+from pycycling.tacx_trainer_control import TacxTrainerControl
+from pycycling.workout import WorkoutExecutor, WorkoutStep, encode_command
+
+
+class _Client:
+    address = 'AA:BB'
+    is_connected = True
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.writes = []
+
+    async def write_gatt_char(self, char_specifier, data, response=None):  # pylint: disable=unused-argument
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.writes.append((asyncio.get_running_loop().time(), bytes(data)))
+
+
+class _WriteError(Exception):
+    pass
+
+
+class _FailingClient(_Client):
+    async def write_gatt_char(self, char_specifier, data, response=None):
+        raise _WriteError('not connected')
+
+
+async def _setter_bytes(service_class, command, *args):
+    client = _Client()
+    await getattr(service_class(client), command)(*args)
+    return client.writes[0][1]
+
+
+class TestEncodeCommand(unittest.IsolatedAsyncioTestCase):
+    async def test_matches_setters(self):
+        for service_class, command, args in [
+            (FitnessMachineService, 'set_target_power', (250,)),
+            (FitnessMachineService, 'set_target_resistance_level', (40,)),
+            (FitnessMachineService, 'set_simulation_parameters', (-500, -250, 40, 51)),
+            (FitnessMachineService, 'set_targeted_time_in_five_heart_rate_zones', ([60, 120, 300, 120, 30],)),
+            (FitnessMachineService, 'stop_or_pause', (True,)),
+            (TacxTrainerControl, 'set_target_power', (251.5,)),
+            (TacxTrainerControl, 'set_track_resistance', (-3.4, 0.004)),
+            (TacxTrainerControl, 'set_basic_resistance', (37,)),
+        ]:
+            encoded = encode_command(service_class(_Client()), command, *args)
+            self.assertEqual(encoded.data, await _setter_bytes(service_class, command, *args))
+
+    def test_invalid_commands(self):
+        trainer = FitnessMachineService(_Client())
+        with self.assertRaises(ValueError):
+            encode_command(trainer, 'set_target_power', -1)
+        with self.assertRaises(ValueError):
+            encode_command(trainer, 'set_targeted_time_in_two_heart_rate_zones', [1, 2, 3])
+        with self.assertRaises(ValueError):
+            encode_command(trainer, 'set_basic_resistance', 10)
+        with self.assertRaises(ValueError):
+            encode_command(TacxTrainerControl(_Client()), 'set_target_power', 5000)
+        with self.assertRaises(ValueError):
+            WorkoutExecutor([WorkoutStep(1, 'set_target_power', (5000,))], {'tacx': TacxTrainerControl(_Client())})
+
+
+class TestWorkoutExecutor(unittest.IsolatedAsyncioTestCase):
+    async def test_run(self):
+        fast, slow, tacx = _Client(), _Client(delay=0.03), _Client()
+        supervisor = ConnectionSupervisor(fast)
+        trainers = {
+            'fast': supervisor.supervise(FitnessMachineService(fast)),
+            'slow': FitnessMachineService(slow),
+            'tacx': TacxTrainerControl(tacx),
+        }
+        workout = [
+            WorkoutStep(0.05, 'set_target_power', (100,)),
+            WorkoutStep(0.05, 'set_target_power', (300,)),
+            WorkoutStep(0.05, 'set_target_power', (150,)),
+        ]
+        steps = []
+        executor = WorkoutExecutor(workout, trainers, on_step=lambda index, step: steps.append(index))
+        loop = asyncio.get_running_loop()
+        start_time = loop.time() + 0.02
+        await executor.run(start_time)
+        self.assertGreaterEqual(loop.time(), start_time + executor.duration)
+
+        self.assertEqual(steps, [0, 1, 2])
+        self.assertEqual([data for _, data in fast.writes], [b'\x05\x64\x00', b'\x05\x2c\x01', b'\x05\x96\x00'])
+        self.assertEqual([data for _, data in slow.writes], [data for _, data in fast.writes])
+        self.assertEqual([data for _, data in tacx.writes],
+                         [await _setter_bytes(TacxTrainerControl, 'set_target_power', step.args[0])
+                          for step in workout])
+
+        # Step changes start on their deadlines, independent of the slow trainer
+        for index, (time, _) in enumerate(fast.writes):
+            self.assertAlmostEqual(time, start_time + 0.05 * index, delta=0.02)
+        status = {device.name: device for device in executor.status}
+        self.assertEqual(status['slow'].sent, 3)
+        self.assertLess(status['fast'].max_lag, 0.02)
+
+        # The supervisor restores the current step after a reconnection
+        fast.writes.clear()
+        await supervisor.restore()
+        self.assertEqual([data for _, data in fast.writes], [b'\x05\x96\x00'])
+
+    async def test_failing_writes(self):
+        client = _FailingClient()
+        workout = [WorkoutStep(0.01, 'set_target_power', (100,)), WorkoutStep(0.01, 'set_target_power', (200,))]
+        executor = WorkoutExecutor(workout, {'trainer': FitnessMachineService(client)})
+        with self.assertLogs('pycycling.workout', 'WARNING'):
+            await asyncio.wait_for(executor.run(), 1)
+        [status] = executor.status
+        self.assertEqual((status.sent, status.failed), (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()